@@ -0,0 +1,765 @@
+"""
+Benchmarks del Sistema de Archivos
+Mide las optimizaciones con árboles grandes
+
+Ejecutar con: python benchmark.py <nombre> [cantidad]
+Ejemplo:      python benchmark.py autosave 1000000
+Sin argumentos lista los benchmarks disponibles.
+"""
+
+import gc
+import sys
+import os
+import random
+import subprocess
+import time
+import tempfile
+import tracemalloc
+sys.path.insert(0, os.path.dirname(__file__))
+
+from filesystem import ArbolGeneral, ArbolMapeado, ArbolParticionado, Nodo, AutoGuardado, resolver_ruta_absoluta, parsear_consulta
+
+
+def construir_arbol(cantidad, por_carpeta=1000, indexar=True):
+    """Arma un árbol de ~`cantidad` nodos: carpetas en root con `por_carpeta` archivos cada una."""
+    fs = ArbolGeneral()
+    creados = 1
+    c = 0
+    while creados < cantidad:
+        carpeta = Nodo(f"carpeta_{c:04d}", "folder")
+        fs.root.hijos.append(carpeta)
+        creados += 1
+        for i in range(min(por_carpeta, cantidad - creados)):
+            carpeta.hijos.append(Nodo(f"archivo_{c:04d}_{i:05d}.txt", "file", f"Contenido {c}-{i}"))
+            creados += 1
+        c += 1
+    if indexar:
+        fs._indexar_trie_recursivamente(fs.root)
+    return fs
+
+
+def construir_arbol_profundo(cantidad, ramas=100, indexar=True):
+    """Árbol de 3 niveles (root/carpeta/sub/archivo) con fan-out acotado por `ramas`."""
+    fs = ArbolGeneral()
+    creados = 1
+    c = 0
+    while creados < cantidad:
+        carpeta = Nodo(f"carpeta_{c:03d}", "folder")
+        fs.root.hijos.append(carpeta)
+        creados += 1
+        for s in range(ramas):
+            if creados >= cantidad: break
+            sub = Nodo(f"sub_{c:03d}_{s:03d}", "folder")
+            carpeta.hijos.append(sub)
+            creados += 1
+            for i in range(min(ramas, cantidad - creados)):
+                sub.hijos.append(Nodo(f"archivo_{c:03d}_{s:03d}_{i:03d}.txt", "file", f"Contenido {c}-{s}-{i}"))
+                creados += 1
+        c += 1
+    if indexar:
+        fs._indexar_trie_recursivamente(fs.root)
+    return fs
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def bench_autosave(cantidad=1_000_000):
+    """Latencia máxima de la consola mientras un autoguardado corre en segundo plano."""
+    print(f"Construyendo árbol de {cantidad} nodos...")
+    fs = construir_arbol(cantidad, indexar=False)
+    archivo = os.path.join(tempfile.mkdtemp(), "bench_autosave.json")
+
+    inicio = time.perf_counter()
+    fs.guardar_arbol(archivo)
+    sincrono = time.perf_counter() - inicio
+    print(f"  ⏱️  Guardado síncrono (consola congelada): {sincrono:.3f}s")
+
+    auto = AutoGuardado(fs, archivo, intervalo=3600)
+    fs.crear_nodo("root", "forzar_cambio", "folder")
+    carpetas = len(fs.root.hijos) - 1
+    contador = [0]
+
+    def comando():
+        t0 = time.perf_counter()
+        with auto.candado:
+            auto.soltar_terminada()
+            i = contador[0]
+            fs.crear_nodo(f"root/carpeta_{i % carpetas:04d}", f"nuevo_{i}.txt", "file", "x")
+            fs.listar_directorio("root/forzar_cambio")
+        contador[0] += 1
+        return time.perf_counter() - t0
+
+    inicio = time.perf_counter()
+    auto.guardar_ahora()
+    toma = time.perf_counter() - inicio
+    latencias = []
+    while auto.guardando():
+        latencias.append(comando())
+    total = time.perf_counter() - inicio
+
+    # Referencia: los mismos comandos sin ningún guardado corriendo
+    referencia = []
+    fin = time.perf_counter() + total
+    while time.perf_counter() < fin:
+        referencia.append(comando())
+
+    print(f"  ⏱️  Tomar instantánea: {toma * 1000:.3f}ms")
+    print(f"  ⏱️  Guardado en segundo plano: {total:.3f}s ({len(latencias)} comandos ejecutados mientras tanto)")
+    for titulo, muestras in (("con guardado", latencias), ("sin guardado", referencia)):
+        if muestras:
+            print(f"  ⏱️  Latencia de comando {titulo}: p50 {percentil(muestras, 50) * 1000:.3f}ms"
+                  f" | p99 {percentil(muestras, 99) * 1000:.3f}ms | máx {max(muestras) * 1000:.3f}ms")
+    os.remove(archivo)
+
+
+def bench_versiones(cantidad=100_000, versiones=10_000):
+    """Memoria de miles de versiones (path copying) frente al tamaño del árbol."""
+    tracemalloc.start()
+    fs = construir_arbol_profundo(cantidad)
+    arbol, _ = tracemalloc.get_traced_memory()
+    subs = [f"{c.nombre}/{s.nombre}" for c in fs.root.hijos for s in c.hijos]
+    print(f"  📦 Árbol de {fs.calcular_tamano()} nodos (con índices): {arbol / 2**20:.1f} MiB")
+
+    inicio = time.perf_counter()
+    for v in range(versiones):
+        ruta = f"root/{subs[v % len(subs)]}"
+        fs.crear_nodo(ruta, f"v{v}.txt", "file", "x")
+        fs.crear_version()
+    total = time.perf_counter() - inicio
+    con_versiones, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    extra = con_versiones - arbol
+    print(f"  ⏱️  {versiones} cambios + versiones: {total:.3f}s ({total / versiones * 1e6:.1f}µs c/u)")
+    print(f"  📦 Memoria extra por {versiones} versiones: {extra / 2**20:.1f} MiB"
+          f" ({extra / versiones:.0f} bytes por versión, {extra / arbol * 100:.0f}% del árbol)")
+    print(f"  📦 Copia completa por versión costaría ~{arbol * versiones / 2**30:.0f} GiB")
+
+    inicio = time.perf_counter()
+    ok, cambios = fs.diferencias_versiones(0, versiones - 1)
+    print(f"  ⏱️  diff 0 {versiones - 1}: {len(cambios)} cambios en {(time.perf_counter() - inicio) * 1000:.1f}ms")
+    inicio = time.perf_counter()
+    fs.checkout_version(versiones // 2)
+    print(f"  ⏱️  checkout {versiones // 2}: {(time.perf_counter() - inicio) * 1000:.1f}ms")
+
+
+def bench_dedup(cantidad=100_000, distintos=100):
+    """Ratio de deduplicación y bytes ahorrados con contenidos repetidos."""
+    fs = ArbolGeneral()
+    plantillas = [f"Reporte mensual {k}\n" + "línea de datos repetida\n" * 40 for k in range(distintos)]
+    inicio = time.perf_counter()
+    for c in range(cantidad // 1000 + 1):
+        fs.crear_nodo("root", f"carpeta_{c:04d}", "folder")
+        for i in range(min(1000, cantidad - c * 1000)):
+            fs.crear_nodo(f"root/carpeta_{c:04d}", f"doc_{i:05d}.txt", "file", plantillas[(c * 1000 + i) % distintos])
+    print(f"  ⏱️  Creación de {cantidad} archivos: {time.perf_counter() - inicio:.3f}s")
+    r = fs.almacen.reporte()
+    print(f"  🧬 {r['referencias']} archivos / {r['unicos']} contenidos únicos = ratio {r['ratio']:.1f}x")
+    print(f"  📦 Memoria ahorrada: {r['memoria_ahorrada'] / 2**20:.1f} MiB")
+    archivo = os.path.join(tempfile.mkdtemp(), "bench_dedup.json")
+    fs.guardar_arbol(archivo)
+    print(f"  📦 Guardado: {os.path.getsize(archivo) / 2**20:.1f} MiB (ahorro estimado {r['disco_ahorrado'] / 2**20:.1f} MiB)")
+    os.remove(archivo)
+
+
+def bench_compresion(cantidad=100_000):
+    """Tamaño de guardado vs tiempo de carga (json, gzip, xz) y costo de leer blobs comprimidos."""
+    fs = construir_arbol(cantidad, indexar=False)
+    directorio = tempfile.mkdtemp()
+    print(f"  {'formato':<10}{'tamaño':>12}{'guardar':>10}{'cargar':>10}")
+    for extension in ("json", "json.gz", "json.xz"):
+        archivo = os.path.join(directorio, f"bench.{extension}")
+        inicio = time.perf_counter()
+        fs.guardar_arbol(archivo)
+        guardar = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        ArbolGeneral().cargar_arbol(archivo)
+        cargar = time.perf_counter() - inicio
+        print(f"  {extension:<10}{os.path.getsize(archivo) / 2**20:>10.1f}MiB{guardar:>9.2f}s{cargar:>9.2f}s")
+        os.remove(archivo)
+
+    texto = "2025-12-01 INFO petición atendida en 12ms ruta=/api/items\n" * 200
+    for algoritmo in ("zlib", "lzma"):
+        fs = ArbolGeneral()
+        fs.configurar_compresion(1024, algoritmo)
+        for i in range(1000):
+            fs.crear_nodo("root", f"log_{i:04d}.txt", "file", f"{i}\n{texto}")
+        nodos = fs.root.hijos
+        memoria = sum(len(n._contenido.datos) for n in nodos)
+        inicio = time.perf_counter()
+        for n in nodos:
+            n.contenido
+        lectura = (time.perf_counter() - inicio) / len(nodos)
+        print(f"  📦 Blobs {algoritmo}: {memoria / 2**20:.2f} MiB (sin comprimir {len(texto) * 1000 / 2**20:.2f} MiB),"
+              f" leer un contenido: {lectura * 1e6:.0f}µs")
+
+
+def bench_fragmentos(cantidad=1_000_000, carpetas=100):
+    """Tiempo de arranque del guardado fragmentado vs el monolítico al crecer el árbol."""
+    directorio = tempfile.mkdtemp()
+    print(f"  {'nodos':>10}{'monolítico':>13}{'fragmentado':>13}{'primer cd':>11}")
+    tamano = cantidad // 100
+    while tamano <= cantidad:
+        fs = construir_arbol(tamano, por_carpeta=max(1, tamano // carpetas), indexar=False)
+        archivo = os.path.join(directorio, "bench.json")
+        fragmentos = os.path.join(directorio, f"frag_{tamano}") + "/"
+        fs.guardar_arbol(archivo)
+        fs.guardar_arbol(fragmentos, umbral_fragmento=max(2, tamano // carpetas // 2))
+        del fs
+
+        inicio = time.perf_counter()
+        ArbolGeneral().cargar_arbol(archivo)
+        monolitico = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        perezoso = ArbolGeneral()
+        perezoso.cargar_arbol(fragmentos)
+        fragmentado = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        perezoso.listar_directorio("root/carpeta_0000")
+        primer_cd = time.perf_counter() - inicio
+        print(f"  {tamano:>10}{monolitico:>12.3f}s{fragmentado:>12.3f}s{primer_cd:>10.3f}s")
+        tamano *= 10
+
+
+def bench_mapeado(cantidad=1_000_000):
+    """Apertura y consultas de la instantánea mapeada (mmap) frente a cargar el JSON."""
+    fs = construir_arbol(cantidad, indexar=False)
+    directorio = tempfile.mkdtemp()
+    archivo = os.path.join(directorio, "bench.json")
+    mapa = os.path.join(directorio, "bench.fsmap")
+    fs.guardar_arbol(archivo)
+    inicio = time.perf_counter()
+    fs.exportar_mapeado(mapa)
+    print(f"  ⏱️  Exportar instantánea: {time.perf_counter() - inicio:.2f}s ({os.path.getsize(mapa) / 2**20:.1f} MiB)")
+    del fs
+
+    inicio = time.perf_counter()
+    ro = ArbolMapeado(mapa)
+    print(f"  ⏱️  Abrir con mmap: {(time.perf_counter() - inicio) * 1000:.3f}ms ({ro.calcular_tamano()} nodos)")
+    for titulo, consulta in (("find", lambda: ro.buscar_exacto("archivo_0500_00500.txt")),
+                             ("search", lambda: ro.buscar_autocompletado("archivo_0999_0099")),
+                             ("ls", lambda: ro.listar_directorio("root/carpeta_0500"))):
+        inicio = time.perf_counter()
+        consulta()
+        print(f"  ⏱️  {titulo}: {(time.perf_counter() - inicio) * 1000:.3f}ms")
+    ro.cerrar()
+    if cantidad <= 100_000:
+        inicio = time.perf_counter()
+        ArbolGeneral().cargar_arbol(archivo)
+        print(f"  ⏱️  Cargar el JSON (referencia): {time.perf_counter() - inicio:.2f}s")
+    os.remove(archivo)
+    os.remove(mapa)
+
+
+def bench_rutas(cantidad=1_000_000):
+    """Memoria del HashMap (nodos en vez de rutas) y costo de find tras mv/ren."""
+    fs = construir_arbol_profundo(cantidad)
+    nombres = fs.indices["nombres"]
+    nombres.vaciar()
+    tracemalloc.start()
+    pila = [fs.root]
+    while pila:
+        nodo = pila.pop()
+        if nodo.nombre != "root":
+            nombres.al_crear(nodo)
+        pila.extend(nodo.hijos)
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  📦 HashMap de {len(fs.hash_map)} nombres: {memoria / 2**20:.1f} MiB")
+
+    nombre = "archivo_005_005_005.txt"
+    for titulo in ("find", "find (caché)"):
+        inicio = time.perf_counter()
+        rutas = fs.buscar_exacto(nombre)
+        print(f"  ⏱️  {titulo}: {(time.perf_counter() - inicio) * 1e6:.1f}µs -> {rutas}")
+    inicio = time.perf_counter()
+    fs.mover_nodo("root/carpeta_005/sub_005_005", "root/carpeta_001")
+    fs.renombrar_nodo("root/carpeta_001", "movida")
+    print(f"  ⏱️  mv + ren de carpetas: {(time.perf_counter() - inicio) * 1000:.2f}ms")
+    inicio = time.perf_counter()
+    rutas = fs.buscar_exacto(nombre)
+    print(f"  ⏱️  find tras mv/ren: {(time.perf_counter() - inicio) * 1e6:.1f}µs -> {rutas}")
+
+
+def bench_cache(cantidad=1_000_000, comandos=100_000):
+    """Comandos repetidos (cd/ls sobre carpetas calientes) con y sin la caché de rutas."""
+    fs = construir_arbol_profundo(cantidad)
+    calientes = [(f"root/carpeta_{c:03d}", f"sub_{c:03d}_{s:03d}") for c in range(90, 100) for s in range(90, 100)]
+    for titulo, limite in (("sin caché", 0), ("con caché", 1024)):
+        fs._LIMITE_CACHE_RESOLUCION = limite
+        resolver_ruta_absoluta.cache_clear()
+        inicio = time.perf_counter()
+        for i in range(comandos):
+            actual, entrada = calientes[i % len(calientes)]
+            ruta = resolver_ruta_absoluta(entrada, actual)
+            fs.validar_ruta(ruta)
+            fs.listar_directorio(ruta)
+        total = time.perf_counter() - inicio
+        print(f"  ⏱️  {comandos} cd+ls {titulo}: {total:.2f}s ({total / comandos * 1e6:.1f}µs por comando)")
+    c = fs.estadisticas_cache()
+    print(f"  ⚡ {c['aciertos']} aciertos / {c['fallos']} fallos")
+
+
+def bench_lote(cantidad=10_000):
+    """rm de `cantidad` archivos archivo_perf_*: uno por uno vs un solo lote con comodín."""
+    nombres = [f"root/archivo_perf_{i:05d}_test.txt" for i in range(cantidad)]
+    for titulo, orden in (("uno por uno (en orden)", nombres), ("uno por uno (al revés)", nombres[::-1]), ("en lote", None)):
+        fs = ArbolGeneral()
+        fs.generar_carga_prueba(cantidad)
+        gc.collect()
+        inicio = time.perf_counter()
+        if orden is None:
+            fs.eliminar_varios(fs.expandir_patron("root/archivo_perf_*"))
+        else:
+            for ruta in orden:
+                fs.eliminar_nodo(ruta)
+        total = time.perf_counter() - inicio
+        print(f"  ⏱️  rm {titulo}: {total:.3f}s ({len(fs.papelera)} en papelera, quedan {len(fs.root.hijos)})")
+
+
+def bench_papelera(cantidad=100_000, restauraciones=1_000):
+    """restore por id y por ruta con la papelera llena, listado paginado y guardado con retención."""
+    fs = ArbolGeneral()
+    fs.papelera.max_elementos = None
+    fs.generar_carga_prueba(cantidad)
+    fs.eliminar_varios(fs.expandir_patron("root/archivo_perf_*"))
+    ids = random.sample([item["id"] for item in fs.papelera], restauraciones)
+    inicio = time.perf_counter()
+    for id_elemento in ids[::2]:
+        fs.restaurar_nodo(id_elemento)
+    for id_elemento in ids[1::2]:
+        fs.restaurar_nodo(fs.papelera.obtener(id_elemento)["path_origen"])
+    total = time.perf_counter() - inicio
+    print(f"  ⏱️  {restauraciones} restore con {cantidad} en papelera: {total / restauraciones * 1e6:.1f}µs c/u")
+    inicio = time.perf_counter()
+    fs.ver_papelera(len(fs.papelera) // 40)
+    print(f"  ⏱️  trash (página del medio): {(time.perf_counter() - inicio) * 1e3:.2f}ms")
+    with tempfile.TemporaryDirectory() as temp:
+        archivo = os.path.join(temp, "fs.json")
+        for limite in (None, 10_000):
+            fs.configurar_papelera("items", str(limite) if limite else "off")
+            inicio = time.perf_counter()
+            fs.guardar_arbol(archivo)
+            print(f"  ⏱️  guardar con límite {limite}: {time.perf_counter() - inicio:.3f}s, "
+                  f"{len(fs.papelera)} en papelera, {os.path.getsize(archivo) / 2**20:.1f} MiB")
+
+def bench_metadatos(cantidad=200_000, grandes=100):
+    """find -size/-mmin por los índices ordenados frente a recorrer el árbol entero."""
+    fs = ArbolGeneral()
+    fs.generar_carga_prueba(cantidad)
+    inicio = time.perf_counter()
+    fs._indice("metadatos")
+    print(f"  ⏱️  Armar índices de tamaño y mtime ({cantidad} nodos): {time.perf_counter() - inicio:.2f}s")
+    corte = time.time()
+    inicio = time.perf_counter()
+    for i in range(grandes):
+        fs.modificar_contenido(f"root/archivo_perf_{i * (cantidad // grandes):05d}_test.txt", "x" * 4096)
+    print(f"  ⏱️  modificar con índices al día: {(time.perf_counter() - inicio) / grandes * 1e6:.1f}µs c/u")
+    # Los cambios dejan viejas las etiquetas de intervalo; se reetiqueta una vez fuera de la medición
+    fs.buscar_por_metadatos(tamano_min=1025)
+    for titulo, criterios in (("-size +1k", {"tamano_min": 1025}), ("-mmin (recientes)", {"mtime_min": corte}),
+                              ("-size +1k -mmin", {"tamano_min": 1025, "mtime_min": corte})):
+        inicio = time.perf_counter()
+        rutas = fs.buscar_por_metadatos(**criterios)
+        indexado = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        pila, recorrido = list(fs.root.hijos), 0
+        while pila:
+            nodo = pila.pop()
+            if nodo.tamano_bytes >= criterios.get("tamano_min", 0) and nodo.mtime >= criterios.get("mtime_min", 0):
+                recorrido += 1
+            pila.extend(nodo._hijos)
+        total = time.perf_counter() - inicio
+        print(f"  ⏱️  find {titulo}: {indexado * 1e3:.2f}ms por índice vs {total * 1e3:.0f}ms recorriendo "
+              f"({len(rutas)}/{recorrido} resultados)")
+    inicio = time.perf_counter()
+    fs.mas_grandes(10)
+    print(f"  ⏱️  largest 10: {(time.perf_counter() - inicio) * 1e3:.2f}ms")
+
+def bench_consultas(cantidad=200_000, marcados=50):
+    """query con varios predicados por el planificador frente a recorrer el subárbol a mano."""
+    fs = construir_arbol(cantidad)
+    for i in range(marcados):
+        fs.modificar_contenido(f"root/carpeta_{i % 5:04d}/archivo_{i % 5:04d}_{i:05d}.txt", "TODO revisar")
+    inicio = time.perf_counter()
+    fs._indice("contenido")
+    print(f"  ⏱️  Armar índice invertido ({cantidad} nodos): {time.perf_counter() - inicio:.2f}s")
+    fs.es_ancestro(fs.root, fs.root)  # reetiquetar después de los cambios, fuera de la medición
+    consultas = (["under:carpeta_0001", "name:archivo_0001_000*", "content:todo", "type:f"],
+                 ["name:archivo_*_0000?.txt", "content:todo"],
+                 ["under:carpeta_0002", "type:f"])
+    for condiciones in consultas:
+        predicados = parsear_consulta(condiciones, "root")
+        inicio = time.perf_counter()
+        rutas = fs.consultar(predicados)
+        planificado = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        filtros = [fs._filtro(campo, valor)[0] for campo, valor in predicados]
+        pila, recorrido = list(fs.root.hijos), 0
+        while pila:
+            nodo = pila.pop()
+            if all(f(nodo) for f in filtros):
+                recorrido += 1
+            pila.extend(nodo.hijos)
+        total = time.perf_counter() - inicio
+        print(f"  ⏱️  query {' '.join(condiciones)}: {planificado * 1e3:.2f}ms vs {total * 1e3:.0f}ms recorriendo "
+              f"({len(rutas)}/{recorrido} resultados)")
+        print("       " + " | ".join(fs.explicar_consulta(predicados)))
+
+def bench_indice_paralelo(cantidad=300_000):
+    """Carga de un guardado grande: índices en serie (con y sin pausar el GC) y en un pool de procesos."""
+    fs = construir_arbol(cantidad, indexar=False)
+    with tempfile.TemporaryDirectory() as temp:
+        archivo = os.path.join(temp, "fs.json")
+        fs.guardar_arbol(archivo)
+        del fs
+        nucleos = os.cpu_count() or 1
+        print(f"  Núcleos disponibles: {nucleos}")
+        # Referencia: como se cargaba antes, con el GC disparándose durante todo el armado
+        fs = ArbolGeneral()
+        fs.cargar_arbol(archivo)
+        fs._reiniciar_indices()
+        inicio = time.perf_counter()
+        fs._indexar_trie_recursivamente(fs.root)
+        referencia = time.perf_counter() - inicio
+        print(f"  ⏱️  Índices en serie con GC activo: {referencia:.2f}s")
+        del fs
+        base = None
+        for procesos in sorted({1, 2, 4, nucleos}):
+            gc.collect()
+            fs = ArbolGeneral()
+            inicio = time.perf_counter()
+            fs.cargar_arbol(archivo, procesos=procesos)
+            total = time.perf_counter() - inicio
+            base = base or total
+            print(f"  ⏱️  cargar con {procesos} proceso(s): {total:.2f}s (x{base / total:.2f} contra 1 proceso)")
+            del fs
+
+def bench_copiar(cantidad=100_000):
+    """cp de una carpeta de `cantidad` nodos: tiempo y memoria del cp, y de buscar sin expandirla."""
+    fs = construir_arbol(cantidad, por_carpeta=cantidad)
+    fs.crear_nodo("root", "copias", "folder")
+    fs.es_ancestro(fs.root, fs.root)  # etiquetas al día antes de medir
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    fs.copiar_nodo("root/carpeta_0000", "root/copias")
+    total = time.perf_counter() - inicio
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"  ⏱️  cp de {cantidad} nodos: {total * 1e3:.2f}ms, {memoria / 1024:.1f} KiB")
+    inicio = time.perf_counter()
+    fs.modificar_contenido("root/carpeta_0000/archivo_0000_00000.txt", "cambiado")
+    print(f"  ⏱️  Modificar el original (copia el camino congelado): {(time.perf_counter() - inicio) * 1e3:.2f}ms")
+    inicio = time.perf_counter()
+    fs.buscar_exacto("archivo_0000_00001.txt")
+    total = time.perf_counter() - inicio
+    gc.collect()
+    tracemalloc.start()
+    fs.buscar_exacto("archivo_0000_00001.txt")
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"  ⏱️  Búsqueda (lee el original sin expandir la copia): {total:.2f}s, {memoria / 1024:.1f} KiB retenidos")
+
+
+def bench_deshacer(cantidad=200_000):
+    """Latencia de undo/redo y memoria por entrada, con árboles de distinto tamaño."""
+    for total in (cantidad // 100, cantidad // 10, cantidad):
+        fs = construir_arbol(total)
+        fs.es_ancestro(fs.root, fs.root)  # etiquetas al día antes de medir
+        fs.crear_nodo("root", "tmp", "folder")
+        gc.collect()
+        tracemalloc.start()
+        for i in range(100):
+            fs.modificar_contenido("root/carpeta_0000/archivo_0000_00000.txt", f"v{i}")
+            fs.mover_nodo("root/carpeta_0000/archivo_0000_00001.txt", "root/tmp")
+            fs.mover_nodo("root/tmp/archivo_0000_00001.txt", "root/carpeta_0000")
+        memoria = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        inicio = time.perf_counter()
+        for _ in range(300):
+            fs.deshacer()
+        deshacer = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        for _ in range(300):
+            fs.rehacer()
+        rehacer = time.perf_counter() - inicio
+        print(f"  ⏱️  {total:>8} nodos: undo {deshacer / 300 * 1e6:.0f}µs, redo {rehacer / 300 * 1e6:.0f}µs, "
+              f"{memoria / 300:.0f} bytes por operación registrada")
+
+
+def bench_indices(cantidad=200_000):
+    """Ingesta con `cantidad` touch según qué índices se mantienen, y primer search con el Trie perezoso."""
+    configuraciones = [
+        ("todos activos", {"prefijos": "activo", "metadatos": "activo", "contenido": "activo"}),
+        ("por defecto", {}),
+        ("Trie perezoso", {"prefijos": "perezoso"}),
+        ("Trie apagado", {"prefijos": "apagado"}),
+    ]
+    base = None
+    for titulo, modos in configuraciones:
+        gc.collect()
+        fs = ArbolGeneral()
+        for nombre, modo in modos.items():
+            fs.configurar_indice(nombre, modo)
+        inicio = time.perf_counter()
+        for c in range(-(-cantidad // 1000)):
+            carpeta = f"carpeta_{c:04d}"
+            fs.crear_nodo("root", carpeta, "folder")
+            for i in range(min(1000, cantidad - c * 1000)):
+                fs.crear_nodo(f"root/{carpeta}", f"archivo_{c:04d}_{i:05d}.txt", "file", f"Contenido {c}-{i}")
+        total = time.perf_counter() - inicio
+        base = base or total
+        inicio = time.perf_counter()
+        fs.buscar_autocompletado("archivo_0001_0001")
+        busqueda = time.perf_counter() - inicio
+        print(f"  ⏱️  {titulo:<14} ingesta {total:.2f}s ({total / base:.0%}), primer search {busqueda * 1e3:.1f}ms")
+
+
+def bench_listado(cantidad=100_000):
+    """ls de una carpeta con `cantidad` entradas: todo junto contra páginas ordenadas."""
+    fs = construir_arbol(cantidad, por_carpeta=cantidad)
+    ruta = "root/carpeta_0000"
+    inicio = time.perf_counter()
+    fs.listar_directorio(ruta)
+    print(f"  ⏱️  ls entero (un string con todo): {(time.perf_counter() - inicio) * 1e3:.1f}ms")
+    for titulo, modo in (("mantenido", "activo"), ("apagado (ordena cada vez)", "apagado")):
+        fs.configurar_indice("listados", modo)
+        inicio = time.perf_counter()
+        list(fs.paginar_directorio(ruta, "size", 0, 50)[2])
+        primera = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        for pagina in range(100):
+            list(fs.paginar_directorio(ruta, "size", pagina * 500, 50)[2])
+        paginas = (time.perf_counter() - inicio) / 100
+        inicio = time.perf_counter()
+        for i in range(100):
+            fs.modificar_contenido(f"{ruta}/archivo_0000_{i:05d}.txt", "z" * i)
+            list(fs.paginar_directorio(ruta, "size", cantidad // 2, 50)[2])
+        tras_cambio = (time.perf_counter() - inicio) / 100
+        print(f"  ⏱️  ls -s size --limit 50, {titulo}: primera {primera * 1e3:.1f}ms, "
+              f"otra página {paginas * 1e3:.2f}ms, editar + página {tras_cambio * 1e3:.2f}ms")
+
+
+def bench_sqlite(cantidad=1_000_000, operaciones=200):
+    """Motor SQLite: arranque, búsqueda sin cargar y costo de dejar cada operación en disco, contra JSON."""
+    fs = construir_arbol(cantidad, indexar=False)
+    directorio = tempfile.mkdtemp()
+    archivo = os.path.join(directorio, "bench.json")
+    base = os.path.join(directorio, "bench.db")
+    fs.guardar_arbol(archivo)
+    inicio = time.perf_counter()
+    fs.guardar_arbol(base)
+    print(f"  ⏱️  Exportar {cantidad:,} nodos a SQLite: {time.perf_counter() - inicio:.2f}s")
+    del fs
+    gc.collect()
+
+    inicio = time.perf_counter()
+    ArbolGeneral().cargar_arbol(archivo)
+    print(f"  ⏱️  Arranque con JSON: {time.perf_counter() - inicio:.3f}s")
+    gc.collect()
+    fs = ArbolGeneral()
+    inicio = time.perf_counter()
+    fs.cargar_arbol(base)
+    print(f"  ⏱️  Arranque con SQLite: {(time.perf_counter() - inicio) * 1e3:.1f}ms")
+    inicio = time.perf_counter()
+    rutas = fs.buscar_exacto("archivo_0500_00500.txt")
+    print(f"  ⏱️  find sin cargar nada: {(time.perf_counter() - inicio) * 1e3:.2f}ms ({len(rutas)} resultado)")
+
+    inicio = time.perf_counter()
+    for i in range(operaciones):
+        fs.crear_nodo("root/carpeta_0000", f"nuevo_{i}.txt", "file", "x")
+        fs.renombrar_nodo(f"root/carpeta_0000/nuevo_{i}.txt", f"renombrado_{i}.txt")
+    por_op = (time.perf_counter() - inicio) / (2 * operaciones)
+    print(f"  ⏱️  touch/rename confirmados en SQLite: {por_op * 1e3:.2f}ms por operación")
+    inicio = time.perf_counter()
+    fs.guardar_arbol(archivo)
+    print(f"  ⏱️  Un save a JSON del mismo árbol: {time.perf_counter() - inicio:.2f}s")
+
+
+def bench_particiones(cantidad=50_000, maximo=None):
+    """Ops/seg agregadas de touch en lotes según cuántas particiones (procesos) hay, y costo de un mv entre particiones."""
+    maximo = maximo or max(4, os.cpu_count() or 1)
+    carpetas = [f"carpeta_{c:03d}" for c in range(64)]
+    operaciones = [("crear_nodo", f"root/{carpetas[i % 64]}", f"archivo_{i:07d}.txt", "file", "x") for i in range(cantidad)]
+    print(f"  Núcleos: {os.cpu_count()}")
+    fs = ArbolGeneral()
+    for carpeta in carpetas:
+        fs.crear_nodo("root", carpeta, "folder")
+    inicio = time.perf_counter()
+    for metodo, *args in operaciones:
+        getattr(fs, metodo)(*args)
+    print(f"  ⏱️  Un solo ArbolGeneral: {cantidad / (time.perf_counter() - inicio):,.0f} ops/s")
+    del fs
+    particiones = 1
+    while particiones <= maximo:
+        with ArbolParticionado(particiones) as fs:
+            fs.aplicar([("crear_nodo", "root", carpeta, "folder") for carpeta in carpetas])
+            inicio = time.perf_counter()
+            for i in range(0, cantidad, 10_000):
+                fs.aplicar(operaciones[i:i + 10_000])
+            por_segundo = cantidad / (time.perf_counter() - inicio)
+            if particiones > 1:
+                inicio = time.perf_counter()
+                for i in range(200):
+                    destino = next(c for c in carpetas if fs._duena(f"root/{c}") != fs._duena(f"root/{carpetas[i % 64]}"))
+                    fs.mover_nodo(f"root/{carpetas[i % 64]}/archivo_{i:07d}.txt", f"root/{destino}")
+                extra = f", mv entre particiones {(time.perf_counter() - inicio) / 200 * 1e3:.2f}ms"
+            else:
+                extra = ""
+            print(f"  ⏱️  {particiones} partición(es): {por_segundo:,.0f} ops/s{extra}")
+        particiones *= 2
+
+
+def bench_memoria(cantidad=300_000, accesos=2_000):
+    """Presupuesto de memoria: memoria medida antes y después de desalojar, y costo de entrar a lo caliente y a lo desalojado."""
+    gc.collect()
+    tracemalloc.start()
+    fs = construir_arbol_profundo(cantidad)
+    completo = tracemalloc.get_traced_memory()[0]
+    print(f"  Árbol de {cantidad:,} nodos: {completo / 2**20:.0f} MB medidos ({completo / cantidad:,.0f} bytes por nodo)")
+    limite = completo // 4
+    fs.configurar_memoria(limite)
+    gc.collect()
+    quedan = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # El tiempo, sin tracemalloc (lo hace varias veces más lento)
+    del fs
+    gc.collect()
+    fs = construir_arbol_profundo(cantidad)
+    inicio = time.perf_counter()
+    fs.configurar_memoria(limite)
+    duracion = time.perf_counter() - inicio
+    m = fs.estado_memoria()
+    print(f"  ⏱️  Desalojar hasta el 80% de {limite / 2**20:.0f} MB: {duracion:.2f}s ({m['desalojos']} subárboles, "
+          f"archivo de {m['archivo'] / 2**20:.1f} MB); quedan {quedan / 2**20:.0f} MB medidos")
+
+    # 90% de los accesos a unas pocas carpetas (las que quedaron en memoria), 10% a cualquiera
+    random.seed(1)
+    carpetas = [c.nombre for c in fs.root.hijos]
+    calientes = [c.nombre for c in fs.root.hijos if c._hijos is not None][:max(1, len(carpetas) // 10)]
+    tiempos = {True: [], False: []}
+    for _ in range(accesos):
+        carpeta = random.choice(calientes if random.random() < 0.9 else carpetas)
+        numero = carpeta.split("_")[1]
+        s, i = random.randrange(100), random.randrange(100)
+        antes = fs.estado_memoria()["recargas"]
+        inicio = time.perf_counter()
+        fs._buscar_nodo_y_padre(f"root/{carpeta}/sub_{numero}_{s:03d}/archivo_{numero}_{s:03d}_{i:03d}.txt")
+        fs.ajustar_memoria()
+        tiempos[fs.estado_memoria()["recargas"] == antes].append(time.perf_counter() - inicio)
+    m = fs.estado_memoria()
+    for en_memoria, nombre in ((True, "en memoria"), (False, "con recarga")):
+        if tiempos[en_memoria]:
+            print(f"  ⏱️  Acceso {nombre}: {sum(tiempos[en_memoria]) / len(tiempos[en_memoria]) * 1e3:.3f}ms promedio "
+                  f"({len(tiempos[en_memoria])} accesos)")
+    print(f"  Desalojos: {m['desalojos']}, recargas: {m['recargas']}, uso estimado al final: "
+          f"{m['uso'] / 2**20:.0f} MB de {m['limite'] / 2**20:.0f} MB")
+
+
+def bench_analisis(cantidad=1_000_000):
+    """analyze: exportar a columnas de NumPy y calcular las estadísticas, contra los recorridos recursivos de `info`."""
+    fs = construir_arbol_profundo(cantidad, indexar=False)
+    inicio = time.perf_counter()
+    fs.calcular_altura()
+    fs.calcular_tamano()
+    print(f"  ⏱️  info (altura y tamaño, recursivos): {(time.perf_counter() - inicio) * 1e3:.0f}ms")
+    ok, analisis = fs.analizar()
+    if not ok:
+        print(f"  {analisis}")
+        return
+    ok, analisis = fs.analizar()  # La primera vez incluye importar NumPy
+    print(f"  ⏱️  Exportar {len(analisis):,} nodos a columnas: {analisis.segundos_exportar * 1e3:.0f}ms")
+    for nombre, calcular in (("histograma de profundidad", analisis.histograma_profundidad),
+                             ("fan-out", analisis.distribucion_fanout),
+                             ("percentiles por carpeta de root", analisis.percentiles_por_carpeta),
+                             ("10 subárboles más pesados", analisis.mayores_subarboles)):
+        inicio = time.perf_counter()
+        calcular()
+        print(f"  ⏱️  {nombre}: {(time.perf_counter() - inicio) * 1e3:.1f}ms")
+
+
+def _tiempo_hasta_prompt(archivo, arranque):
+    """Lanza la consola sobre `archivo` y mide cuánto tarda en mostrar el primer prompt."""
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "filesystem.py"),
+                                archivo, "--indices", arranque],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    leido = b""
+    try:
+        while b"fs:root>" not in leido:
+            trozo = os.read(proceso.stdout.fileno(), 4096)
+            if not trozo: return None
+            leido += trozo
+        return time.perf_counter() - inicio
+    finally:
+        proceso.kill()
+        proceso.wait()
+
+def bench_arranque(cantidad=1_000_000):
+    """Tiempo hasta el primer prompt con un guardado grande: índices en un hilo, al usarse o antes del prompt."""
+    fs = construir_arbol(cantidad, indexar=False)
+    with tempfile.TemporaryDirectory() as temp:
+        archivo = os.path.join(temp, "fs.json")
+        fs.guardar_arbol(archivo)
+        del fs
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, sys.argv[1]); import filesystem",
+                        os.path.dirname(os.path.abspath(__file__))], check=True)
+        print(f"  ⏱️  Importar filesystem (proceso nuevo): {(time.perf_counter() - inicio) * 1e3:.0f}ms")
+        for arranque in ("completo", "fondo", "perezoso"):
+            segundos = _tiempo_hasta_prompt(archivo, arranque)
+            print(f"  ⏱️  Primer prompt con --indices {arranque}: {segundos:.2f}s")
+        gc.collect()
+        fs = ArbolGeneral()
+        fs.cargar_arbol(archivo, diferir_indices=True)
+        inicio = time.perf_counter()
+        fs.buscar_exacto("archivo_0000_00000.txt")
+        print(f"  ⏱️  Primer find (arma el HashMap): {time.perf_counter() - inicio:.2f}s")
+        inicio = time.perf_counter()
+        fs.buscar_autocompletado("archivo_0001_0000")
+        print(f"  ⏱️  Primer TAB/search (arma el Trie): {time.perf_counter() - inicio:.2f}s")
+        inicio = time.perf_counter()
+        fs.buscar_autocompletado("archivo_0002_0000")
+        print(f"  ⏱️  Segundo TAB/search: {(time.perf_counter() - inicio) * 1e3:.2f}ms")
+
+
+BENCHMARKS = {
+    "autosave": bench_autosave,
+    "versiones": bench_versiones,
+    "dedup": bench_dedup,
+    "compresion": bench_compresion,
+    "fragmentos": bench_fragmentos,
+    "mapeado": bench_mapeado,
+    "rutas": bench_rutas,
+    "cache": bench_cache,
+    "lote": bench_lote,
+    "papelera": bench_papelera,
+    "metadatos": bench_metadatos,
+    "consultas": bench_consultas,
+    "indice_paralelo": bench_indice_paralelo,
+    "copiar": bench_copiar,
+    "deshacer": bench_deshacer,
+    "indices": bench_indices,
+    "listado": bench_listado,
+    "sqlite": bench_sqlite,
+    "particiones": bench_particiones,
+    "memoria": bench_memoria,
+    "analisis": bench_analisis,
+    "arranque": bench_arranque,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Uso: python benchmark.py <nombre> [cantidad]")
+        for nombre, funcion in BENCHMARKS.items():
+            print(f"  {nombre:<12} {funcion.__doc__}")
+        sys.exit(1)
+    funcion = BENCHMARKS[sys.argv[1]]
+    if len(sys.argv) > 2:
+        funcion(int(sys.argv[2]))
+    else:
+        funcion()
@@ -1,21 +1,121 @@
 import json
+import gc
+import contextlib
 import uuid
+import hashlib
+import heapq
+import zlib
+import lzma
+import gzip
+import io
+import math
+import itertools
+import bisect
+import fnmatch
+import functools
+import mmap
+import struct
 import os
+import re
 import sys
-
-# --- PARTE NUEVA: LIBRERÍA PARA EL TAB ---
-try:
-    import readline
-except ImportError:
-    print("AVISO: Para usar autocompletado con TAB en Windows, instala: pip install pyreadline3")
-    class readline:
-        @staticmethod
-        def set_completer(f): pass
-        @staticmethod
-        def parse_and_bind(s): pass
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+# sqlite3, multiprocessing y concurrent.futures (~30 ms juntos) y readline se importan donde
+# se usan: la mayoría de las sesiones no los necesita y retrasan el primer prompt
 
 # --- PARTE 4: LA CONSOLA ---
 
+def es_patron(texto):
+    """True si el texto usa comodines de glob (`*`, `?`, `[...]`)."""
+    return any(c in texto for c in "*?[")
+
+_UNIDADES = {"": 1, "c": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+def parsear_tamano(texto):
+    """'+1k' -> ('+', 1024): signo ('+' más de, '-' menos de, '' exacto) y bytes (k, M, G = 1024^n)."""
+    signo = texto[0] if texto[:1] in ("+", "-") else ""
+    numero = texto[len(signo):]
+    unidad = numero[-1:].lower() if numero[-1:].isalpha() else ""
+    if unidad not in _UNIDADES: raise ValueError(f"Unidad desconocida: {texto}")
+    return signo, int(float(numero[:len(numero) - len(unidad)]) * _UNIDADES[unidad])
+
+def rango_tamano(texto):
+    """'+1k' -> (1025, None): límites inclusivos en bytes (None = sin límite)."""
+    signo, n = parsear_tamano(texto)
+    if signo == "+": return n + 1, None
+    if signo == "-": return None, n - 1
+    return n, n
+
+def parsear_predicados(opciones, fs, ruta_actual):
+    """Traduce `-type f|d -size [+-]N[kMG] -newer <ruta> -mmin [+-]N` a argumentos de
+    `buscar_por_metadatos`. Lanza ValueError con un mensaje para el usuario."""
+    criterios = {}
+    i = 0
+    while i < len(opciones):
+        opcion = opciones[i]
+        if i + 1 >= len(opciones): raise ValueError(f"A {opcion} le falta el valor.")
+        valor = opciones[i + 1]
+        i += 2
+        if opcion == "-type":
+            if valor not in ("f", "d"): raise ValueError("-type es f (archivo) o d (carpeta).")
+            criterios["tipo"] = "file" if valor == "f" else "folder"
+        elif opcion == "-size":
+            minimo, maximo = rango_tamano(valor)
+            if minimo is not None: criterios["tamano_min"] = minimo
+            if maximo is not None: criterios["tamano_max"] = maximo
+        elif opcion == "-newer":
+            ref, _ = fs._buscar_nodo_y_padre(resolver_ruta_absoluta(valor, ruta_actual))
+            if ref is None: raise ValueError(f"No existe {valor} para comparar fechas.")
+            criterios["mtime_min"] = math.nextafter(ref.mtime, math.inf)
+        elif opcion == "-mmin":
+            signo = valor[0] if valor[:1] in ("+", "-") else "-"
+            limite = time.time() - float(valor.lstrip("+-")) * 60
+            criterios["mtime_max" if signo == "+" else "mtime_min"] = limite
+        else:
+            raise ValueError(f"Predicado desconocido: {opcion}")
+    return criterios
+
+_PALABRA = re.compile(r"\w+")
+
+def palabras_de(texto):
+    """Palabras (en minúsculas) de un contenido, para el índice invertido."""
+    return set(_PALABRA.findall(texto.lower())) if texto else set()
+
+def parsear_consulta(condiciones, ruta_actual):
+    """Traduce `name:rep* type:f under:docs content:TODO size:+1k` a [(campo, valor)]
+    para `ArbolGeneral.consultar`. Lanza ValueError con un mensaje para el usuario."""
+    predicados = []
+    for condicion in condiciones:
+        campo, separador, valor = condicion.partition(":")
+        if not separador or not valor: raise ValueError(f"Condición inválida: {condicion} (se escribe campo:valor)")
+        campo = campo.lower()
+        if campo == "name":
+            if not es_patron(valor):
+                predicados.append(("name", valor))
+            elif valor.endswith("*") and len(valor) > 1 and not es_patron(valor[:-1]):
+                predicados.append(("prefix", valor[:-1]))
+            else:
+                predicados.append(("glob", valor))
+        elif campo == "type":
+            if valor not in ("f", "d"): raise ValueError("type es f (archivo) o d (carpeta).")
+            predicados.append(("type", "file" if valor == "f" else "folder"))
+        elif campo == "under":
+            predicados.append(("under", resolver_ruta_absoluta(valor, ruta_actual)))
+        elif campo == "content":
+            palabras = sorted(palabras_de(valor))
+            if not palabras: raise ValueError(f"content necesita al menos una palabra: {condicion}")
+            predicados.extend(("content", p) for p in palabras)
+        elif campo == "size":
+            predicados.append(("size", rango_tamano(valor)))
+        else:
+            raise ValueError(f"Campo desconocido: {campo} (usa name, type, under, content o size)")
+    if not predicados: raise ValueError("La consulta está vacía.")
+    return predicados
+
+@functools.lru_cache(maxsize=4096)
 def resolver_ruta_absoluta(ruta_input, ruta_actual):
     if ruta_input == "root" or ruta_input.startswith("root/"):
         ruta_final = ruta_input
@@ -44,6 +144,8 @@ def normalizar_ruta(ruta):
     
     return "/".join(partes_resueltas)
 
+PAGINA_LS = 200  # Entradas que muestra `ls` si no se pide otro --limit
+
 def limpiarpantalla():
     if os.name == 'nt':
         os.system('cls')
@@ -54,38 +156,93 @@ def imprimir_ayuda():
     print("\n=== COMANDOS DISPONIBLES ===")
     print("\n📁 Navegación y Visualización:")
     print("  cd <carpeta>         : Cambiar de directorio")
-    print("  ls [carpeta]         : Listar contenido")
+    print("  ls [-R] [carpeta]    : Listar contenido (-R recursivo, acepta * ? **)")
+    print(f"  ls -s name|type|size [-r] [--offset N] [--limit N] : Ordenado y por páginas ({PAGINA_LS} por defecto)")
     print("  [TAB]                : Autocompletar nombres")
     
     print("\n📝 Creación y Gestión:")
     print("  mkdir <nombre>       : Crear carpeta")
     print("  touch <nombre> [txt] : Crear archivo")
-    print("  mv <origen> <dest>   : Mover archivo/carpeta")
+    print("  mv <origen...> <dest>: Mover archivo/carpeta (acepta * ? **)")
     print("  ren <viejo> <nuevo>  : Renombrar")
-    print("  rm <nombre>          : Eliminar (a papelera)")
+    print("  cp <origen> <dest>   : Copiar archivo/carpeta (copy-on-write)")
+    print("  rm [-r] <nombre...>  : Eliminar (a papelera; con comodines, -r incluye carpetas)")
     
     print("\n🗑️  Papelera:")
-    print("  trash                : Ver papelera")
-    print("  restore <índice>     : Restaurar elemento")
+    print("  trash [página]       : Ver papelera (más recientes primero)")
+    print("  restore <id|ruta>    : Restaurar elemento")
+    print("  trash_limit <items|bytes|dias> <valor|off>: Retención de la papelera")
     print("  empty                : Vaciar papelera")
     
     print("\n🔍 Búsqueda:")
     print("  search <prefijo>     : Búsqueda por prefijo (Trie)")
-    print("  find <nombre>        : Búsqueda exacta (HashMap)")
+    print("  find <nombre> [dir]  : Búsqueda exacta (HashMap) o con comodines")
+    print("  find [patrón] [dir] -size +1k -mmin -60 -newer <ruta> -type f|d: Por tamaño/fecha")
+    print("  largest [N] [dir]    : Los N archivos más grandes")
+    print("  stat <ruta>          : Tamaño y fechas de creación/modificación")
+    print("  query name:rep* type:f under:<dir> content:TODO size:+1k: Consulta combinada")
+    print("  explain <condiciones>: Ver qué índices usaría la consulta")
+    
+    print("\n↩️  Deshacer:")
+    print("  undo / redo          : Deshacer o rehacer la última operación")
+    print("  history [límite]     : Ver el historial (o cambiar cuántas operaciones guarda)")
+    
+    print("\n🕒 Versiones:")
+    print("  snapshot [etiqueta]  : Guardar versión actual")
+    print("  versions             : Listar versiones")
+    print("  checkout <versión>   : Volver a una versión")
+    print("  diff <v1> <v2>       : Cambios entre versiones ('actual' = árbol vivo)")
+    print("  diff <arch_a> <arch_b>: Cambios entre dos guardados JSON")
+    print("  merge <arch_a> <arch_b>: Aplicar al árbol los cambios de A a B")
     
     print("\n📊 Información y Análisis:")
     print("  info                 : Ver estadísticas del árbol")
+    print("  analyze [k]          : Profundidades, fan-out, tamaños por carpeta y los k subárboles más pesados (NumPy)")
     print("  tree                 : Mostrar árbol en consola")
     print("  export               : Exportar recorrido preorden")
+    print("  export_map [archivo] : Exportar instantánea de solo lectura (mmap)")
+    print("  dedup                : Reporte de deduplicación de contenidos")
+    print("  cache                : Aciertos/fallos de la caché de rutas")
+    print("  index [nombre on|off|lazy] : Ver los índices o elegir cuáles se mantienen")
     
     print("\n⚙️  Sistema:")
-    print("  save                 : Guardar manualmente")
-    print("  load                 : Cargar desde archivo")
+    print("  save [archivo]       : Guardar (sin nombre, en el último cargado o guardado; .gz/.xz = comprimido, dir/ = fragmentado, .db = SQLite)")
+    print("  autosave [seg|off]   : Ver/configurar autoguardado")
+    print("  load [archivo] [-j N]: Cargar desde archivo, directorio fragmentado o base .db (-j: índices en N procesos)")
+    print("  compress <bytes|off> [zlib|lzma]: Comprimir contenidos grandes")
+    print("  memory [tamaño|off]  : Límite de memoria (p. ej. 512M); lo más frío baja a disco")
     print("  perf_test [cant]     : Prueba de rendimiento")
     print("  cls                  : Limpiar pantalla")
     print("  help                 : Mostrar esta ayuda")
     print("  exit                 : Guardar y salir")
 
+@contextlib.contextmanager
+def _sin_gc():
+    """Pausa el recolector cíclico mientras se crean millones de objetos (nodos, Trie) que
+    no dejan ciclos basura: si no, lo dispara cada pocos miles de objetos y triplica el tiempo."""
+    activo = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if activo:
+            gc.enable()
+
+def _operacion(metodo):
+    """Marca una mutación pública del árbol. Al terminar la más externa (una operación puede
+    llamar a otras: `undo` a `rm`, `merge` a `mv`) se avisa `al_terminar_operacion`; el
+    motor SQLite confirma ahí, en una sola transacción, lo que escribió la operación."""
+    @functools.wraps(metodo)
+    def envuelto(self, *args, **kwargs):
+        self._operaciones_abiertas += 1
+        try:
+            return metodo(self, *args, **kwargs)
+        finally:
+            self._operaciones_abiertas -= 1
+            if not self._operaciones_abiertas:
+                self._avisar("al_terminar_operacion")
+    return envuelto
+
 # --- PARTE 1: EL BUSCADOR INTELIGENTE (Trie) ---
 class TrieNode:
     def __init__(self):
@@ -110,12 +267,67 @@ class Trie:
         node = self.root
         name_lower = name.lower()
         for char in name_lower:
-            if char not in node.children:
+            hijo = node.children.get(char)
+            if hijo is None:
                 return
-            node = node.children[char]
             # Borramos el nombre de TODOS los nodos del camino, no solo del último.
-            if name in node.terminating_names:
-                node.terminating_names.remove(name)
+            hijo.terminating_names.discard(name)
+            if not hijo.terminating_names:
+                # Ningún nombre pasa por acá: la rama entera sobra
+                del node.children[char]
+                return
+            node = hijo
+
+    def eliminar_varios(self, names):
+        """Como `eliminar` para muchos nombres: ordenados, los que comparten prefijo forman
+        un rango contiguo y se quitan juntos de cada nodo (un difference_update por nodo)."""
+        ordenados = sorted((name.lower(), name) for name in names)
+        claves = [clave for clave, _ in ordenados]
+        originales = [name for _, name in ordenados]
+        pila = [(self.root, 0, 0, len(claves))]
+        while pila:
+            node, nivel, i, j = pila.pop()
+            if j - i == 1:
+                # Un solo nombre en el rango: se baja directo, como en `eliminar`
+                name = originales[i]
+                for char in claves[i][nivel:]:
+                    hijo = node.children.get(char)
+                    if hijo is None:
+                        break
+                    hijo.terminating_names.discard(name)
+                    if not hijo.terminating_names:
+                        del node.children[char]
+                        break
+                    node = hijo
+                continue
+            # Los que terminan en este nivel quedan primero (son prefijos del resto)
+            while i < j and len(claves[i]) <= nivel:
+                i += 1
+            while i < j:
+                char = claves[i][nivel]
+                fin = bisect.bisect_left(claves, claves[i][:nivel] + chr(ord(char) + 1), i, j)
+                hijo = node.children.get(char)
+                if hijo is not None:
+                    hijo.terminating_names.difference_update(originales[i:fin])
+                    if hijo.terminating_names:
+                        pila.append((hijo, nivel + 1, i, fin))
+                    else:
+                        del node.children[char]
+                i = fin
+
+    def unir(self, raiz):
+        """Suma al Trie otro Trie (su raíz). Los subárboles que solo están en el otro se
+        cuelgan tal cual; donde ambos tienen el mismo carácter se unen los conjuntos."""
+        pila = [(self.root, raiz)]
+        while pila:
+            destino, origen = pila.pop()
+            for char, hijo in origen.children.items():
+                propio = destino.children.get(char)
+                if propio is None:
+                    destino.children[char] = hijo
+                else:
+                    propio.terminating_names |= hijo.terminating_names
+                    pila.append((propio, hijo))
 
     def buscar_por_prefijo(self, prefix):
         node = self.root
@@ -127,90 +339,1135 @@ class Trie:
         return sorted(list(node.terminating_names))
 
 
+def _trie_parcial(nombres):
+    """Trabajo de cada proceso en la indexación paralela: arma un Trie con `nombres` y
+    devuelve su raíz para que el proceso principal la una con `Trie.unir`."""
+    with _sin_gc():
+        trie = Trie()
+        for nombre in nombres:
+            trie.insertar(nombre)
+    return trie.root
+
+
+class ListaOrdenada:
+    """Lista ordenada en baldes de hasta 2*_CARGA elementos (índices de tamaño y fecha).
+
+    Insertar o quitar cuesta un bisect sobre los máximos de cada balde más mover un
+    balde chico, en vez de correr una lista de millones de elementos. Los elementos
+    son tuplas (clave, id(nodo), nodo): el id de Python desempata y nunca se comparan nodos.
+    """
+    _CARGA = 1000
+
+    def __init__(self, elementos=()):
+        ordenados = sorted(elementos)
+        c = self._CARGA
+        self._listas = [ordenados[i:i + c] for i in range(0, len(ordenados), c)]
+        self._maximos = [lista[-1] for lista in self._listas]
+        self._largo = len(ordenados)
+
+    def __len__(self):
+        return self._largo
+
+    def agregar(self, x):
+        """Inserta `x` si no estaba. Devuelve True si lo agregó."""
+        listas, maximos = self._listas, self._maximos
+        if not listas:
+            listas.append([x])
+            maximos.append(x)
+            self._largo = 1
+            return True
+        i = bisect.bisect_left(maximos, x)
+        if i == len(listas):
+            i -= 1
+            lista = listas[i]
+            lista.append(x)
+            maximos[i] = x
+        else:
+            lista = listas[i]
+            j = bisect.bisect_left(lista, x)
+            if lista[j] == x:
+                return False
+            lista.insert(j, x)
+        self._largo += 1
+        if len(lista) > 2 * self._CARGA:
+            c = self._CARGA
+            listas[i:i + 1] = [lista[:c], lista[c:]]
+            maximos[i:i + 1] = [lista[c - 1], lista[-1]]
+        return True
+
+    def quitar(self, x):
+        """Saca `x` si está. Devuelve True si lo sacó."""
+        listas, maximos = self._listas, self._maximos
+        i = bisect.bisect_left(maximos, x)
+        if i == len(listas):
+            return False
+        lista = listas[i]
+        j = bisect.bisect_left(lista, x)
+        if lista[j] != x:
+            return False
+        del lista[j]
+        self._largo -= 1
+        if not lista:
+            del listas[i]
+            del maximos[i]
+        elif j == len(lista):
+            maximos[i] = lista[-1]
+        return True
+
+    def _posicion(self, x, derecha=False):
+        buscar = bisect.bisect_right if derecha else bisect.bisect_left
+        i = buscar(self._maximos, x)
+        if i == len(self._listas):
+            return i, 0
+        return i, buscar(self._listas[i], x)
+
+    def _limites(self, minimo, maximo):
+        inicio = self._posicion((minimo,)) if minimo is not None else (0, 0)
+        fin = self._posicion((maximo, math.inf), derecha=True) if maximo is not None else (len(self._listas), 0)
+        return inicio, fin
+
+    def _tramos(self, minimo, maximo):
+        """(balde, desde, hasta) de los elementos con clave en [minimo, maximo]."""
+        (i0, j0), (i1, j1) = self._limites(minimo, maximo)
+        for i in range(i0, min(i1 + 1, len(self._listas))):
+            lista = self._listas[i]
+            yield lista, j0 if i == i0 else 0, j1 if i == i1 else len(lista)
+
+    def rango(self, minimo=None, maximo=None, reverso=False):
+        """Elementos con clave en [minimo, maximo] (None = sin límite), en orden o al revés."""
+        tramos = self._tramos(minimo, maximo)
+        if not reverso:
+            for lista, desde, hasta in tramos:
+                yield from lista[desde:hasta]
+        else:
+            for lista, desde, hasta in reversed(list(tramos)):
+                yield from reversed(lista[desde:hasta])
+
+    def contar(self, minimo=None, maximo=None):
+        """Cuántos elementos caen en el rango, sin recorrerlos (O(baldes))."""
+        return sum(hasta - desde for _, desde, hasta in self._tramos(minimo, maximo))
+
+    def desde_posicion(self, inicio, reverso=False):
+        """Los elementos a partir del `inicio`-ésimo (contando desde el final si `reverso`).
+        Saltar hasta ahí cuesta O(baldes): no se recorre lo anterior."""
+        listas = reversed(self._listas) if reverso else self._listas
+        for lista in listas:
+            if inicio >= len(lista):
+                inicio -= len(lista)
+                continue
+            if reverso:
+                yield from reversed(lista[:len(lista) - inicio])
+            else:
+                yield from lista[inicio:]
+            inicio = 0
+
+
 # --- PARTE 2: LOS "LADRILLOS" DEL SISTEMA (Carpetas y Archivos) ---
 class Nodo:
+    # Carpetas "stub" de un guardado fragmentado (o clones de `cp`): _hijos es None hasta
+    # que alguien los pide y entonces `_cargador.cargar_hijos(nodo)` los trae.
+    _cargador = None
+    _fragmento = None
+    _tamano_fragmento = None
+    # Clones de `cp` sin expandir: la carpeta original de la que salen los hijos
+    _origen = None
+    # Último uso (tic del Desalojador) para elegir qué subárboles bajar a disco
+    _uso = 0
+
     def __init__(self, nombre, tipo_nodo, contenido=None, id_existente=None):
-        self.id = id_existente if id_existente else str(uuid.uuid4())[:8]
+        # uuid4 entero: con 8 caracteres (los guardados viejos) los ids chocan pasando las
+        # decenas de miles de nodos, y la base SQLite y los índices necesitan que no choquen
+        self.id = id_existente if id_existente else uuid.uuid4().hex
         self.nombre = nombre
         self.tipo_nodo = tipo_nodo
-        self.contenido = contenido
-        self.hijos = []
+        # Texto crudo o un Blob compartido del AlmacenContenido del árbol
+        self._contenido = contenido
+        self._hijos = []
+        # Época en la que se creó esta versión del nodo (para copy-on-write)
+        self.epoca = 0
+        # Hash Merkle del subárbol; None = hay que recalcularlo
+        self._hash = None
+        # Enlace al padre y etiquetas de intervalo (_pre, _post) del árbol vivo; las
+        # mantiene ArbolGeneral (ver `es_ancestro`). Las versiones no las usan.
+        self.padre = None
+        self._pre = None
+        self._post = None
+        # Fechas de creación y de última modificación (segundos epoch; 0 = desconocida)
+        self.ctime = self.mtime = time.time()
+
+    @property
+    def hijos(self):
+        hijos = self._hijos
+        if hijos is None:
+            hijos = self._cargador.cargar_hijos(self)
+        return hijos
+
+    @hijos.setter
+    def hijos(self, valor):
+        self._hijos = valor
+
+    def hijos_sin_cargar(self):
+        """Los hijos sin engancharlos al árbol si aún están en disco (para serializar desde otro hilo)."""
+        if self._hijos is not None:
+            return self._hijos
+        return self._cargador.leer_hijos(self)
+
+    @property
+    def contenido(self):
+        c = self._contenido
+        return c.valor() if isinstance(c, Blob) else c
+
+    @contenido.setter
+    def contenido(self, valor):
+        self._contenido = valor
+
+    @property
+    def tamano_bytes(self):
+        """Tamaño del contenido en bytes (sin comprimir); las carpetas miden 0."""
+        c = self._contenido
+        if isinstance(c, Blob): return c.tamano
+        return len(c.encode()) if isinstance(c, str) else 0
+
+    def copiar(self, epoca):
+        """Copia superficial: mismos hijos (compartidos), lista propia."""
+        copia = Nodo(self.nombre, self.tipo_nodo, self._contenido, self.id)
+        copia.hijos = list(self.hijos)
+        copia.epoca = epoca
+        copia.padre, copia._pre, copia._post = self.padre, self._pre, self._post
+        copia.ctime, copia.mtime = self.ctime, self.mtime
+        return copia
+
+    def calcular_hash(self):
+        """Hash Merkle del subárbol (id, nombre, tipo, contenido e hijos). Se cachea hasta que algo cambie."""
+        if self._hash is None:
+            h = hashlib.blake2b(digest_size=8)
+            h.update(json.dumps([self.id, self.nombre, self.tipo_nodo, self.contenido]).encode())
+            for hijo in self.hijos_sin_cargar():
+                h.update(hijo.calcular_hash().encode())
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def datos_propios(self):
+        """Campos del nodo sin los hijos (lo que se serializa de cada nodo)."""
+        data = {"id": self.id, "name": self.nombre, "type": self.tipo_nodo}
+        if isinstance(self._contenido, Blob):
+            data["content_ref"] = self._contenido.hash
+        else:
+            data["content"] = self._contenido
+        data["ctime"] = self.ctime
+        data["mtime"] = self.mtime
+        data["hash"] = self.calcular_hash()
+        return data
 
     def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.nombre,
-            "type": self.tipo_nodo,
-            "content": self.contenido,
-            "children": [hijo.to_dict() for hijo in self.hijos]
-        }
+        data = self.datos_propios()
+        data["children"] = [hijo.to_dict() for hijo in self.hijos]
+        return data
 
     @classmethod
-    def from_dict(cls, data):
-        nuevo = cls(data["name"], data["type"], data["content"], data["id"])
-        for hijo_data in data["children"]:
-            nuevo.hijos.append(cls.from_dict(hijo_data))
+    def from_dict(cls, data, almacen=None, blobs=None, cargador=None):
+        """Reconstruye el subárbol. Con `almacen`, los contenidos se deduplican al cargar;
+        `blobs` es la tabla {hash: texto} del guardado para resolver los content_ref.
+        Los nodos con "shard" quedan como stubs que `cargador` completa al entrar."""
+        ref = data.get("content_ref")
+        contenido = blobs[ref] if ref is not None else data["content"]
+        if almacen is not None:
+            contenido = almacen.adquirir(contenido, ref)
+        nuevo = cls(data["name"], data["type"], contenido, data["id"])
+        nuevo.ctime = data.get("ctime", 0.0)
+        nuevo.mtime = data.get("mtime", 0.0)
+        if "shard" in data:
+            nuevo._hijos = None
+            nuevo._cargador = cargador
+            nuevo._fragmento = data["shard"]
+            nuevo._tamano_fragmento = data.get("size")
+        else:
+            for hijo_data in data["children"]:
+                nuevo._hijos.append(cls.from_dict(hijo_data, almacen, blobs, cargador))
+        nuevo._hash = data.get("hash")
         return nuevo
 
 
+# --- ALMACÉN DE CONTENIDOS (deduplicación por hash) ---
+_COMPRESORES = {"zlib": zlib.compress, "lzma": lzma.compress}
+_DESCOMPRESORES = {"zlib": zlib.decompress, "lzma": lzma.decompress}
+
+class Blob:
+    """Un contenido guardado una sola vez y compartido por todos los archivos que lo tienen.
+
+    Si `algoritmo` no es None, `datos` son los bytes comprimidos y `valor()`
+    los descomprime en cada acceso.
+    """
+    __slots__ = ("hash", "datos", "refs", "algoritmo", "tamano")
+
+    def __init__(self, clave, datos, algoritmo=None, tamano=None):
+        self.hash = clave
+        self.datos = datos
+        self.refs = 0
+        self.algoritmo = algoritmo
+        self.tamano = len(datos.encode()) if tamano is None else tamano  # bytes sin comprimir
+
+    def valor(self):
+        if self.algoritmo is None:
+            return self.datos
+        return _DESCOMPRESORES[self.algoritmo](self.datos).decode()
+
+
+class AlmacenContenido:
+    """Tabla {hash: Blob} con conteo de referencias del árbol vivo y la papelera.
+
+    Con `umbral_compresion` (bytes), los contenidos nuevos de ese tamaño o más
+    se guardan comprimidos con `algoritmo` ("zlib" o "lzma").
+    """
+    def __init__(self, umbral_compresion=None, algoritmo="zlib"):
+        self.blobs = {}
+        self.umbral_compresion = umbral_compresion
+        self.algoritmo = algoritmo
+
+    def _crear_blob(self, clave, texto):
+        crudo = texto.encode()
+        if self.umbral_compresion is not None and len(crudo) >= self.umbral_compresion:
+            comprimido = _COMPRESORES[self.algoritmo](crudo)
+            if len(comprimido) < len(crudo):
+                return Blob(clave, comprimido, self.algoritmo, len(crudo))
+        return Blob(clave, texto, None, len(crudo))
+
+    @staticmethod
+    def calcular_clave(texto):
+        return hashlib.blake2b(texto.encode(), digest_size=8).hexdigest()
+
+    def adquirir(self, contenido, clave=None):
+        """Devuelve el Blob compartido para `contenido` (o el valor tal cual si no es texto)."""
+        if isinstance(contenido, Blob):
+            return self.adquirir_blob(contenido)
+        if not isinstance(contenido, str):
+            return contenido
+        if clave is None:
+            clave = self.calcular_clave(contenido)
+        blob = self.blobs.get(clave)
+        if blob is None:
+            blob = self.blobs[clave] = self._crear_blob(clave, contenido)
+        blob.refs += 1
+        return blob
+
+    def adquirir_blob(self, blob):
+        """Suma una referencia a un Blob que ya tiene un nodo (p. ej. de una versión vieja)."""
+        actual = self.blobs.get(blob.hash)
+        if actual is None:
+            actual = self.blobs[blob.hash] = blob
+            blob.refs = 0
+        actual.refs += 1
+        return actual
+
+    def soltar(self, contenido):
+        if not isinstance(contenido, Blob): return
+        blob = self.blobs.get(contenido.hash)
+        if blob is None: return
+        blob.refs -= 1
+        if blob.refs <= 0:
+            del self.blobs[blob.hash]
+
+    def contar_subarbol(self, nodo, adquirir=True):
+        """Suma (o resta) las referencias de todos los contenidos de un subárbol."""
+        pila = [nodo]
+        while pila:
+            actual = pila.pop()
+            if isinstance(actual._contenido, Blob):
+                if adquirir: self.adquirir_blob(actual._contenido)
+                else: self.soltar(actual._contenido)
+            pila.extend(actual._hijos or ())  # Lo que sigue en disco todavía no cuenta
+
+    def reporte(self):
+        """Estadísticas de deduplicación: referencias, blobs únicos y bytes ahorrados."""
+        referencias = sum(b.refs for b in self.blobs.values())
+        unicos = len(self.blobs)
+        vacio = sys.getsizeof("")
+        memoria_sin = sum(b.refs * (vacio + b.tamano) for b in self.blobs.values())
+        memoria_con = sum(sys.getsizeof(b.datos) + sys.getsizeof(b) for b in self.blobs.values())
+        comprimidos = [b for b in self.blobs.values() if b.algoritmo]
+        # En disco cada archivo guarda '"content_ref": "<16 hex>"' en vez del texto
+        # y el texto va una sola vez en la tabla "blobs"
+        disco_sin = sum(b.refs * (b.tamano + 13) for b in self.blobs.values())
+        disco_con = sum(b.tamano + 39 + b.refs * 8 for b in self.blobs.values())
+        return {
+            "referencias": referencias,
+            "unicos": unicos,
+            "ratio": referencias / unicos if unicos else 1.0,
+            "memoria_ahorrada": memoria_sin - memoria_con,
+            "disco_ahorrado": disco_sin - disco_con,
+            "comprimidos": len(comprimidos),
+            "compresion_ahorrada": sum(b.tamano - len(b.datos) for b in comprimidos),
+        }
+
+
+class VistaPapelera:
+    """La papelera tal como estaba al tomar una instantánea, sin copiarla.
+
+    Es la `base` de la que partió el registro de la papelera más los primeros `largo`
+    eventos de ese registro, que solo crece; recorrerla los rehace en orden. Tomarla
+    cuesta O(1) y todas las versiones comparten la misma base y el mismo registro.
+    """
+    __slots__ = ("base", "registro", "largo")
+
+    def __init__(self, base, registro, largo):
+        self.base = base
+        self.registro = registro
+        self.largo = largo
+
+    def __iter__(self):
+        vivos = OrderedDict((elemento["id"], elemento) for elemento in self.base)
+        for evento in itertools.islice(self.registro, self.largo):
+            if isinstance(evento, dict): vivos[evento["id"]] = evento
+            else: vivos.pop(evento, None)
+        return iter(vivos.values())
+
+
+class Papelera:
+    """Papelera indexada: {id: elemento} en orden de borrado más un índice por ruta de origen.
+
+    Cada elemento es un dict {"id", "path_origen", "path_padre", "nodo", "fecha", "bytes"}
+    que no se modifica después de creado (las versiones lo comparten). Los ids crecen y
+    no se reutilizan, así que `restore <id>` no cambia de significado al restaurar otros.
+    La retención (máximo de elementos, de bytes y de antigüedad) descarta los más viejos;
+    `al_descartar(elemento)` avisa para soltar sus contenidos.
+
+    Además se anota cada alta (el elemento) y cada baja (su id) en `_registro`, que solo
+    crece, sobre la tupla `_base`; `vista()` lo congela en O(1) para las instantáneas.
+    Cuando el registro pasa del doble de los elementos vivos se compacta en una base
+    nueva y un registro nuevo; las vistas viejas conservan los suyos.
+    """
+
+    def __init__(self, al_descartar=None, max_elementos=10_000, max_bytes=256 * 2**20, max_edad=None):
+        self._elementos = OrderedDict()
+        self._por_ruta = {}
+        self._siguiente = 0
+        self.bytes = 0
+        self.al_descartar = al_descartar
+        self.max_elementos = max_elementos
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad  # segundos
+        self._base = ()
+        self._registro = []
+
+    def __len__(self):
+        return len(self._elementos)
+
+    def __iter__(self):
+        return iter(self._elementos.values())
+
+    def __contains__(self, id_elemento):
+        return id_elemento in self._elementos
+
+    @staticmethod
+    def _bytes_subarbol(nodo):
+        total, pila = 0, [nodo]
+        while pila:
+            actual = pila.pop()
+            total += actual.tamano_bytes
+            pila.extend(actual._hijos or ())
+        return total
+
+    def _indexar(self, elemento):
+        self._elementos[elemento["id"]] = elemento
+        self._por_ruta.setdefault(elemento["path_origen"], []).append(elemento["id"])
+        self.bytes += elemento["bytes"]
+        self._anotar(elemento)
+
+    def _anotar(self, evento):
+        self._registro.append(evento)
+        if len(self._registro) > 2 * len(self._elementos) + 64: self._compactar()
+
+    def _compactar(self):
+        # Lista nueva: el registro viejo queda intacto para las vistas que lo usan
+        self._base = tuple(self._elementos.values())
+        self._registro = []
+
+    def vista(self):
+        """La papelera actual congelada en O(1) (ver VistaPapelera)."""
+        return VistaPapelera(self._base, self._registro, len(self._registro))
+
+    def agregar_varios(self, entradas):
+        """`entradas` son (ruta_origen, nodo). Devuelve los elementos creados."""
+        ahora = time.time()
+        creados = []
+        for ruta, nodo in entradas:
+            elemento = {"id": self._siguiente, "path_origen": ruta, "path_padre": ruta.rsplit('/', 1)[0],
+                        "nodo": nodo, "fecha": ahora, "bytes": self._bytes_subarbol(nodo)}
+            self._siguiente += 1
+            self._indexar(elemento)
+            creados.append(elemento)
+        self.aplicar_retencion()
+        return creados
+
+    def agregar(self, ruta, nodo):
+        return self.agregar_varios([(ruta, nodo)])[0]
+
+    def quitar(self, id_elemento):
+        """Saca un elemento por id en O(1) (o None si no está)."""
+        elemento = self._elementos.pop(id_elemento, None)
+        if elemento is None: return None
+        ids = self._por_ruta[elemento["path_origen"]]
+        ids.remove(id_elemento)
+        if not ids: del self._por_ruta[elemento["path_origen"]]
+        self.bytes -= elemento["bytes"]
+        self._anotar(id_elemento)
+        return elemento
+
+    def obtener(self, id_elemento):
+        return self._elementos.get(id_elemento)
+
+    def buscar_por_ruta(self, ruta):
+        """El elemento más reciente que vino de `ruta`, o None."""
+        ids = self._por_ruta.get(ruta)
+        return self._elementos[ids[-1]] if ids else None
+
+    def _descartar_mas_viejo(self):
+        elemento = self.quitar(next(iter(self._elementos)))
+        if self.al_descartar: self.al_descartar(elemento)
+        return elemento
+
+    def aplicar_retencion(self):
+        """Descarta desde el más viejo hasta cumplir los límites. Devuelve cuántos salieron."""
+        descartados = 0
+        limite_fecha = time.time() - self.max_edad if self.max_edad is not None else None
+        while self._elementos:
+            mas_viejo = next(iter(self._elementos.values()))
+            if ((self.max_elementos is not None and len(self._elementos) > self.max_elementos) or
+                    (self.max_bytes is not None and self.bytes > self.max_bytes) or
+                    (limite_fecha is not None and mas_viejo["fecha"] < limite_fecha)):
+                self._descartar_mas_viejo()
+                descartados += 1
+            else:
+                break
+        return descartados
+
+    def vaciar(self):
+        c = len(self._elementos)
+        while self._elementos:
+            self._descartar_mas_viejo()
+        return c
+
+    def reemplazar(self, elementos):
+        """Carga otra lista de elementos (load/checkout); los ids nuevos siguen después del mayor."""
+        self._elementos = OrderedDict()
+        self._por_ruta = {}
+        self.bytes = 0
+        self._registro = []
+        for elemento in elementos:
+            self._indexar(elemento)
+        self._compactar()
+        self._siguiente = max(self._siguiente, max(self._elementos, default=-1) + 1)
+        return self.aplicar_retencion()
+
+    def pagina(self, numero=1, por_pagina=20):
+        """Elementos de la página `numero` (1 = los más recientes) y el total de páginas."""
+        paginas = max(1, -(-len(self._elementos) // por_pagina))
+        inicio = (numero - 1) * por_pagina
+        elementos = list(itertools.islice(reversed(self._elementos.values()), inicio, inicio + por_pagina))
+        return elementos, paginas
+
+
+class Historial:
+    """Pilas de deshacer/rehacer. Cada entrada es un dict {"tipo", ...} con lo mínimo para
+    invertir la operación (rutas, ids de papelera, el contenido anterior), nunca una copia
+    del árbol, así que la memoria crece con el tamaño de los cambios. Se guardan a lo sumo
+    `limite` entradas: las más viejas se descartan.
+    """
+
+    def __init__(self, limite=1000):
+        self.deshacer = deque(maxlen=limite)
+        self.rehacer = []
+        self.pausado = False  # Mientras se deshace/rehace, las operaciones no se registran
+
+    @property
+    def limite(self):
+        return self.deshacer.maxlen
+
+    @limite.setter
+    def limite(self, valor):
+        self.deshacer = deque(self.deshacer, maxlen=valor)
+
+    def registrar(self, entrada):
+        if self.pausado: return
+        self.deshacer.append(entrada)
+        self.rehacer.clear()
+
+    def olvidar(self):
+        """Después de algo que no se puede invertir (load, checkout, empty...)."""
+        self.deshacer.clear()
+        self.rehacer.clear()
+
+
+# --- ÍNDICES ENCHUFABLES ---
+# El árbol avisa cada cambio (crear, quitar, renombrar, copiar por COW, modificar) a
+# los índices suscritos. Cada índice elige qué avisos le interesan.
+
+class Indice:
+    """Un índice secundario del árbol. Las subclases redefinen `vaciar`, los avisos que
+    les importan y, si conviene, `construir`. Se crean con (arbol, modo).
+
+    `modo` dice cuándo se arma. "activo" se mantiene desde el principio, "perezoso" se
+    arma en el primer uso y desde ahí se mantiene, y "apagado" no se mantiene: cada
+    consulta que lo necesita arma uno temporal, y en `query` el predicado se filtra nodo
+    por nodo. Solo reciben avisos los índices `listo`s, y solo los que redefine la
+    subclase (ver ArbolGeneral._suscribir): un índice sin armar no cuesta nada por cambio.
+    """
+    nombre = ""
+    obligatorio = False  # No se puede apagar
+
+    def __init__(self, arbol, modo="perezoso"):
+        self.arbol = arbol
+        self.modo = modo
+        self.listo = False
+
+    def vaciar(self):
+        """Deja el índice sin datos."""
+
+    def construir(self):
+        """Arma el índice desde cero con un aviso de creación por nodo en memoria. Lo que
+        falta cargar no entra: las consultas lo leen aparte (ver ArbolGeneral._sin_cargar)."""
+        arbol = self.arbol
+        self.vaciar()
+        pila = list(arbol.root._hijos or ())
+        while pila:
+            nodo = pila.pop()
+            self.al_crear(nodo)
+            pila.extend(nodo._hijos or ())
+        self.listo = True
+
+    def entradas(self):
+        return 0
+
+    def construir_aparte(self, candado):
+        """Para ConstructorIndices: lo arma con `candado` tomado si sigue pendiente (activo y
+        sin armar). Devuelve True si lo armó. Las subclases pueden soltar el candado mientras
+        arman, si después saben ponerse al día con lo que cambió."""
+        with candado:
+            if self.listo or self.modo != "activo" or self.arbol.indices.get(self.nombre) is not self:
+                return False
+            self.arbol._indice(self.nombre)
+            return True
+
+    def temporal(self):
+        """Para consultar estando apagado: uno armado de cero que no recibe avisos."""
+        otro = type(self)(self.arbol, "apagado")
+        otro.construir()
+        return otro
+
+    def al_crear(self, nodo): pass
+    def al_quitar(self, nodo, diferidos=None): pass
+    def al_renombrar(self, nodo, anterior): pass
+    def al_reemplazar(self, nodo, copia): pass  # Copia COW: mismo id, otro objeto
+    def antes_de_modificar(self, nodo, contenido): pass  # contenido=False: solo cambia mtime
+    def al_modificar(self, nodo, contenido): pass
+    def al_cerrar_lote(self, diferidos): pass  # Fin de un rm en lote (ver IndicePrefijos)
+    # Una entrada entra a `carpeta` o sale de ella (también antes y después de cambiarle
+    # el nombre o el contenido, porque cambian sus claves de orden)
+    def al_colgar(self, carpeta, nodo): pass
+    def al_descolgar(self, carpeta, nodo): pass
+    def al_cambiar_version(self): pass  # checkout: el árbol vivo pasa a ser otro
+    def al_terminar_operacion(self): pass  # Fin de una operación pública (ver `_operacion`)
+
+
+class IndiceNombres(Indice):
+    """El HashMap {nombre: nodo | {id: nodo}}: `search` exacto, `find` y comodines.
+
+    Guarda nodos, no rutas: la ruta se arma subiendo por los padres (obtener_ruta).
+    Un nombre único apunta directo a su nodo; uno repetido, a un dict {id: nodo}.
+    Es obligatorio: el Trie, el planificador y `rm` con comodines se apoyan en él.
+    """
+    nombre = "nombres"
+    obligatorio = True
+
+    def __init__(self, arbol, modo="activo"):
+        super().__init__(arbol, modo)
+        self.mapa = {}
+
+    def vaciar(self):
+        self.mapa = {}
+
+    def entradas(self):
+        return len(self.mapa)
+
+    def al_crear(self, nodo):
+        mapa, nombre = self.mapa, nodo.nombre
+        actual = mapa.get(nombre)
+        if actual is None or (isinstance(actual, Nodo) and actual.id == nodo.id):
+            mapa[nombre] = nodo
+        elif isinstance(actual, Nodo):
+            mapa[nombre] = {actual.id: actual, nodo.id: nodo}
+        else:
+            actual[nodo.id] = nodo
+
+    def _sacar(self, nombre, nodo):
+        actual = self.mapa.get(nombre)
+        if isinstance(actual, Nodo):
+            if actual.id == nodo.id:
+                del self.mapa[nombre]
+        elif actual is not None:
+            actual.pop(nodo.id, None)
+            if len(actual) == 1:
+                self.mapa[nombre] = next(iter(actual.values()))
+
+    def al_quitar(self, nodo, diferidos=None):
+        self._sacar(nodo.nombre, nodo)
+
+    def al_renombrar(self, nodo, anterior):
+        self._sacar(anterior, nodo)
+        self.al_crear(nodo)
+
+    def al_reemplazar(self, nodo, copia):
+        indexados = self.mapa.get(nodo.nombre)
+        if indexados is nodo:
+            self.mapa[nodo.nombre] = copia
+        elif isinstance(indexados, dict) and indexados.get(nodo.id) is nodo:
+            indexados[nodo.id] = copia
+
+
+class IndicePrefijos(Indice):
+    """El Trie de `search` (autocompletado) y de los predicados `prefix` de `query`.
+
+    Guarda nombres distintos, no nodos, y mira el HashMap (que recibe los avisos antes)
+    para saber si un nombre es nuevo o si ya no lo lleva ningún nodo.
+    """
+    nombre = "prefijos"
+
+    # Debajo de esta cantidad de nombres distintos no vale la pena levantar procesos
+    _UMBRAL_PARALELO = 50_000
+
+    def __init__(self, arbol, modo="activo"):
+        super().__init__(arbol, modo)
+        self.trie = Trie()
+
+    def vaciar(self):
+        self.trie = Trie()
+
+    def entradas(self):
+        return len(self.arbol.indices["nombres"].mapa) if self.listo else 0
+
+    def construir(self, procesos=1):
+        """Inserta los nombres del HashMap. Con `procesos` > 1 los nombres distintos se
+        ordenan y se cortan en tramos contiguos, así que los Tries parciales solo se pisan
+        en los caminos de los cortes. Vuelven serializados y deserializarlos cuesta casi lo
+        mismo que armarlos: solo gana con varios núcleos libres
+        (ver `python benchmark.py indice_paralelo`)."""
+        self.vaciar()
+        nombres = self.arbol.hash_map
+        if procesos <= 1 or len(nombres) < self._UMBRAL_PARALELO:
+            for nombre in nombres:
+                self.trie.insertar(nombre)
+        else:
+            nombres = sorted(nombres, key=str.lower)
+            tramo = -(-len(nombres) // procesos)
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                for raiz in pool.map(_trie_parcial, [nombres[i:i + tramo] for i in range(0, len(nombres), tramo)]):
+                    self.trie.unir(raiz)
+        self.listo = True
+
+    def construir_aparte(self, candado):
+        """Arma el Trie sin el candado: copia los nombres del HashMap, inserta en un Trie
+        nuevo y, con el candado otra vez, agrega y quita lo que cambió mientras tanto (una
+        diferencia de conjuntos) antes de suscribirse. La consola sigue atendiendo comandos."""
+        with candado:
+            if self.listo or self.modo != "activo" or self.arbol.indices.get(self.nombre) is not self:
+                return False
+            nombres = list(self.arbol.hash_map)  # Si falta, el HashMap se arma aquí
+        trie = Trie()
+        with _sin_gc():
+            for nombre in nombres:
+                trie.insertar(nombre)
+        with candado:
+            if self.listo or self.modo != "activo" or self.arbol.indices.get(self.nombre) is not self:
+                return False
+            actuales, vistos = self.arbol.hash_map, set(nombres)
+            for nombre in actuales:
+                if nombre not in vistos:
+                    trie.insertar(nombre)
+            trie.eliminar_varios(vistos.difference(actuales))
+            self.trie = trie
+            self.listo = True
+            self.arbol._suscribir()
+        return True
+
+    def temporal(self):
+        return self  # Apagado, `buscar` recorre el HashMap: más barato que armar un Trie
+
+    def buscar(self, prefijo):
+        if not self.listo:
+            prefijo = prefijo.lower()
+            return sorted(nombre for nombre in self.arbol.hash_map if nombre.lower().startswith(prefijo))
+        return self.trie.buscar_por_prefijo(prefijo)
+
+    def al_crear(self, nodo):
+        # Si el HashMap ya tenía el nombre, el Trie también (lo comparten todos sus nodos)
+        if self.arbol.hash_map.get(nodo.nombre) is nodo:
+            self.trie.insertar(nodo.nombre)
+
+    def _olvidar(self, nombre, diferidos=None):
+        """Con `diferidos` (un set) el nombre se junta ahí para quitarlos todos al cerrar el lote."""
+        if nombre in self.arbol.hash_map: return
+        if diferidos is not None:
+            diferidos.add(nombre)
+        else:
+            self.trie.eliminar(nombre)
+
+    def al_quitar(self, nodo, diferidos=None):
+        self._olvidar(nodo.nombre, diferidos)
+
+    def al_renombrar(self, nodo, anterior):
+        self._olvidar(anterior)
+        self.al_crear(nodo)
+
+    def al_cerrar_lote(self, diferidos):
+        self.trie.eliminar_varios(diferidos)
+
+
+class IndiceMetadatos(Indice):
+    """Índices por tamaño (solo archivos) y por mtime (todo menos root), como ListaOrdenada
+    de (clave, id(nodo), nodo). Los usan `find` con predicados, `largest` y `query -size`."""
+    nombre = "metadatos"
+
+    def __init__(self, arbol, modo="perezoso"):
+        super().__init__(arbol, modo)
+        self.listas = {"tamano": ListaOrdenada(), "mtime": ListaOrdenada()}
+
+    def vaciar(self):
+        self.listas = {"tamano": ListaOrdenada(), "mtime": ListaOrdenada()}
+
+    def entradas(self):
+        return len(self.listas["mtime"])
+
+    def construir(self):
+        # Ordenar una vez sale más barato que insertar de a uno
+        arbol = self.arbol
+        tamanos, fechas = [], []
+        pila = list(arbol.root._hijos or ())
+        while pila:
+            nodo = pila.pop()
+            fechas.append((nodo.mtime, id(nodo), nodo))
+            if nodo.tipo_nodo == "file":
+                tamanos.append((nodo.tamano_bytes, id(nodo), nodo))
+            pila.extend(nodo._hijos or ())
+        self.listas = {"tamano": ListaOrdenada(tamanos), "mtime": ListaOrdenada(fechas)}
+        self.listo = True
+
+    def al_crear(self, nodo):
+        if nodo is self.arbol.root: return
+        self.listas["mtime"].agregar((nodo.mtime, id(nodo), nodo))
+        if nodo.tipo_nodo == "file":
+            self.listas["tamano"].agregar((nodo.tamano_bytes, id(nodo), nodo))
+
+    def al_quitar(self, nodo, diferidos=None):
+        self.listas["mtime"].quitar((nodo.mtime, id(nodo), nodo))
+        if nodo.tipo_nodo == "file":
+            self.listas["tamano"].quitar((nodo.tamano_bytes, id(nodo), nodo))
+
+    def al_reemplazar(self, nodo, copia):
+        if copia is self.arbol.root: return
+        self.al_quitar(nodo)
+        self.al_crear(copia)
+
+    def antes_de_modificar(self, nodo, contenido):
+        self.al_quitar(nodo)
+
+    def al_modificar(self, nodo, contenido):
+        self.al_crear(nodo)
+
+
+class IndiceContenido(Indice):
+    """Índice invertido de contenidos {palabra: {id(nodo): nodo}} para `query content=`.
+
+    Se indexa por identidad del objeto y no por `nodo.id`: los ids de guardados viejos
+    (8 caracteres) pueden repetirse, y una copia COW comparte el id con su original."""
+    nombre = "contenido"
+
+    def __init__(self, arbol, modo="perezoso"):
+        super().__init__(arbol, modo)
+        self.palabras = {}
+
+    def vaciar(self):
+        self.palabras = {}
+
+    def entradas(self):
+        return len(self.palabras)
+
+    def al_crear(self, nodo):
+        if nodo.tipo_nodo != "file": return
+        for palabra in palabras_de(nodo.contenido):
+            self.palabras.setdefault(palabra, {})[id(nodo)] = nodo
+
+    def al_quitar(self, nodo, diferidos=None):
+        if nodo.tipo_nodo != "file": return
+        for palabra in palabras_de(nodo.contenido):
+            nodos = self.palabras.get(palabra)
+            if nodos is None: continue
+            nodos.pop(id(nodo), None)
+            if not nodos:
+                del self.palabras[palabra]
+
+    def al_reemplazar(self, nodo, copia):
+        self.al_quitar(nodo)
+        self.al_crear(copia)
+
+    def antes_de_modificar(self, nodo, contenido):
+        if contenido: self.al_quitar(nodo)
+
+    def al_modificar(self, nodo, contenido):
+        if contenido: self.al_crear(nodo)
+
+
+class IndiceListados(Indice):
+    """El orden de las entradas de cada carpeta para `ls -s`: {id de carpeta: {orden:
+    ListaOrdenada}} de (clave, nombre, tipo). Cada orden de cada carpeta se arma la primera
+    vez que se lista así y desde ahí se mantiene con los avisos de colgar y descolgar, así
+    que la página N cuesta recorrer los baldes más la página, no ordenar la carpeta entera.
+    Apagado, cada `ls -s` ordena la carpeta de cero."""
+    nombre = "listados"
+
+    CLAVES = {
+        "name": lambda n: n.nombre.lower(),
+        "type": lambda n: (n.tipo_nodo != "folder", n.nombre.lower()),
+        "size": lambda n: (n.tamano_bytes, n.nombre.lower()),
+    }
+
+    def __init__(self, arbol, modo="activo"):
+        super().__init__(arbol, modo)
+        self.ordenes = {}
+
+    def vaciar(self):
+        self.ordenes = {}
+
+    def construir(self):
+        self.vaciar()  # Se arma por carpeta, al listarla
+        self.listo = True
+
+    def temporal(self):
+        return type(self)(self.arbol, "apagado")
+
+    def entradas(self):
+        return len(self.ordenes)
+
+    def orden(self, carpeta, clave):
+        ordenes = self.ordenes.setdefault(carpeta.id, {})
+        lista = ordenes.get(clave)
+        if lista is None:
+            f = self.CLAVES[clave]
+            lista = ordenes[clave] = ListaOrdenada((f(h), h.nombre, h.tipo_nodo) for h in carpeta.hijos)
+        return lista
+
+    def al_colgar(self, carpeta, nodo):
+        for clave, lista in self.ordenes.get(carpeta.id, {}).items():
+            lista.agregar((self.CLAVES[clave](nodo), nodo.nombre, nodo.tipo_nodo))
+
+    def al_descolgar(self, carpeta, nodo):
+        for clave, lista in self.ordenes.get(carpeta.id, {}).items():
+            lista.quitar((self.CLAVES[clave](nodo), nodo.nombre, nodo.tipo_nodo))
+
+    def al_quitar(self, nodo, diferidos=None):
+        if nodo.tipo_nodo == "folder":
+            self.ordenes.pop(nodo.id, None)
+
+    def al_cambiar_version(self):
+        self.vaciar()
+
+
 # --- PARTE 3: EL CEREBRO (El Árbol General) ---
 class ArbolGeneral:
     def __init__(self):
         self.root = Nodo("root", "folder")
-        self.papelera = [] 
-        self.trie = Trie()
-        # NUEVO: HashMap para búsqueda exacta O(1)
-        self.hash_map = {}  # {nombre: [rutas completas]}
+        self.papelera = Papelera(al_descartar=self._soltar_de_papelera)
+        self.historial = Historial()
+        # Copy-on-write: los nodos con epoca <= _epoca_congelada están
+        # compartidos con alguna instantánea viva y no se tocan en sitio.
+        self._epoca = 1
+        self._epoca_congelada = -1
+        self._instantaneas_vivas = {}  # {epoca: cuántas instantáneas la usan}
+        self._cambios = 0  # Contador de mutaciones (para saber si hay algo sin guardar)
+        self.versiones = []  # Instantáneas que el usuario pidió conservar
+        self.almacen = AlmacenContenido()  # Contenidos deduplicados (árbol + papelera)
+        self._fragmentos = None  # AlmacenFragmentado (o AlmacenSQLite) con lo que falta cargar
+        self._sqlite = None  # AlmacenSQLite si el árbol vive en una base (ver `load x.db`)
+        self._desalojo = None  # Desalojador si hay un presupuesto de memoria (ver `configurar_memoria`)
+        self._operaciones_abiertas = 0  # Anidamiento de `_operacion`
+        self._clones = ClonadorPerezoso(self)  # Carpetas copiadas con `cp` aún sin expandir
+        self._etiquetas_ok = False  # Enlaces al padre y etiquetas de intervalo al día
+        self._cache_rutas = {}  # {nodo: ruta}; se vacía cuando cambia la forma del árbol
+        # Caché LRU ruta absoluta -> (nodo, padre). Cada entrada lleva la generación en
+        # que se guardó; rename/move/rm/restore y las copias (COW) suben la generación.
+        self._cache_resolucion = OrderedDict()
+        self._generacion = 0
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+        # Índices suscritos a los cambios, en el orden en que reciben los avisos (el
+        # HashMap primero: el Trie lo consulta). Metadatos y contenido se arman en la
+        # primera consulta que los usa y desde ahí se mantienen en cada cambio.
+        self.indices = {}
+        self._avisos = {}
+        for indice in (IndiceNombres(self), IndicePrefijos(self), IndiceMetadatos(self), IndiceContenido(self),
+                       IndiceListados(self)):
+            self.registrar_indice(indice)
+
+    @property
+    def hash_map(self):
+        """{nombre: nodo | {id: nodo}} para búsqueda exacta O(1) (ver IndiceNombres). Tras
+        un `load` con `diferir_indices` se arma aquí, en el primer uso."""
+        return self._indice("nombres").mapa
+
+    # --- ÍNDICES (bus de avisos) ---
+
+    _AVISOS = ("al_crear", "al_quitar", "al_renombrar", "al_reemplazar",
+               "antes_de_modificar", "al_modificar", "al_cerrar_lote",
+               "al_colgar", "al_descolgar", "al_cambiar_version", "al_terminar_operacion")
+    _MODOS = ("activo", "perezoso", "apagado")
+
+    def registrar_indice(self, indice):
+        """Suma un índice (una subclase de Indice). Si es activo se arma ya."""
+        self.indices[indice.nombre] = indice
+        if indice.modo == "activo" and not indice.listo:
+            indice.construir()
+        self._suscribir()
+
+    def _suscribir(self):
+        """Arma, por aviso, la lista de métodos a llamar: los de los índices listos que lo redefinen."""
+        self._avisos = {aviso: [getattr(indice, aviso) for indice in self.indices.values()
+                                if indice.listo and getattr(type(indice), aviso) is not getattr(Indice, aviso)]
+                        for aviso in self._AVISOS}
+
+    def _avisar(self, aviso, *args):
+        for metodo in self._avisos[aviso]:
+            metodo(*args)
+
+    def _indice(self, nombre):
+        """El índice listo para consultar. Si es perezoso y nunca se usó, se arma y queda
+        suscrito; si está apagado se arma uno temporal que no se suscribe. Los índices
+        cubren lo que está en memoria (ver `_sin_cargar` para lo demás)."""
+        indice = self.indices[nombre]
+        if indice.listo:
+            return indice
+        if indice.modo == "apagado":
+            return indice.temporal()
+        with _sin_gc():
+            indice.construir()
+        self._suscribir()
+        return indice
+
+    def _reiniciar_indices(self, diferir=False):
+        """Vacía todos los índices antes de indexar el árbol entero otra vez: los activos
+        quedan listos para llenarse con ese recorrido, los demás esperan a que se usen.
+        Con `diferir` no hay recorrido y ninguno queda listo: cada uno se arma en la primera
+        consulta que lo necesita (ver `_indice`) o antes, desde un ConstructorIndices."""
+        for indice in self.indices.values():
+            indice.vaciar()
+            indice.listo = indice.modo == "activo" and not diferir
+        self._suscribir()
+
+    def configurar_indice(self, nombre, modo):
+        """Cambia el modo de un índice ("activo", "perezoso" o "apagado"). Pasar a perezoso
+        también lo desarma: se vuelve a armar en la próxima consulta que lo use."""
+        indice = self.indices.get(nombre)
+        if indice is None: return False, f"No hay un índice '{nombre}' (hay: {', '.join(self.indices)})."
+        if modo not in self._MODOS: return False, f"Modo inválido: {modo} (usa {', '.join(self._MODOS)})."
+        if indice.obligatorio and modo != "activo": return False, f"El índice '{nombre}' es obligatorio."
+        indice.modo = modo
+        if modo != "activo" and indice.listo:
+            indice.listo = False
+            indice.vaciar()
+        elif modo == "activo" and not indice.listo:
+            indice.construir()
+        self._suscribir()
+        return True, f"Índice '{nombre}': {modo}"
+
+    def estado_indices(self):
+        lineas = []
+        for indice in self.indices.values():
+            estado = f"listo, {indice.entradas()} entradas" if indice.listo else "sin armar"
+            extra = " (obligatorio)" if indice.obligatorio else ""
+            lineas.append(f"  └─ {indice.nombre:<10} {indice.modo:<9} {estado}{extra}")
+        return "\n".join(lineas)
 
     # --- HERRAMIENTAS INTERNAS (Auxiliares) ---
     
-    def _indexar_trie_recursivamente(self, start_node, ruta_actual="root"):
-        """Indexa tanto el Trie como el HashMap recursivamente."""
-        if start_node.nombre != "root":
-            self.trie.insertar(start_node.nombre)
-            # Indexar en HashMap
-            if start_node.nombre not in self.hash_map:
-                self.hash_map[start_node.nombre] = []
-            self.hash_map[start_node.nombre].append(ruta_actual)
+    def _indexar_trie_recursivamente(self, start_node):
+        """Avisa a los índices de cada nodo del subárbol, recursivamente. La raíz no se
+        indexa; una carpeta que también se llame "root", sí."""
+        if start_node is not self.root:
+            self._avisar("al_crear", start_node)
         
-        for hijo in start_node.hijos:
-            nueva_ruta = f"{ruta_actual}/{hijo.nombre}"
-            self._indexar_trie_recursivamente(hijo, nueva_ruta)
-
-    def _actualizar_trie(self, operation, name_old=None, name_new=None, ruta=None):
-        """Mantiene el Trie y HashMap actualizados."""
-        if operation == "create":
-            self.trie.insertar(name_new)
-            if name_new not in self.hash_map:
-                self.hash_map[name_new] = []
-            if ruta:
-                self.hash_map[name_new].append(ruta)
-        elif operation == "rename":
-            if name_old: 
-                self.trie.eliminar(name_old)
-                # Actualizar HashMap
-                if name_old in self.hash_map and ruta in self.hash_map[name_old]:
-                    self.hash_map[name_old].remove(ruta)
-                    if not self.hash_map[name_old]:
-                        del self.hash_map[name_old]
-            self.trie.insertar(name_new)
-            if name_new not in self.hash_map:
-                self.hash_map[name_new] = []
-            if ruta:
-                nueva_ruta = "/".join(ruta.split('/')[:-1]) + "/" + name_new
-                self.hash_map[name_new].append(nueva_ruta)
-        elif operation == "delete":
-            if name_old: 
-                self.trie.eliminar(name_old)
-                if name_old in self.hash_map and ruta in self.hash_map[name_old]:
-                    self.hash_map[name_old].remove(ruta)
-                    if not self.hash_map[name_old]:
-                        del self.hash_map[name_old]
+        # Los subárboles aún en disco no se tocan: los cubren los resúmenes de cada fragmento
+        for hijo in start_node._hijos or ():
+            self._indexar_trie_recursivamente(hijo)
+
+    def _indexar_en_paralelo(self, procesos):
+        """Como `_indexar_trie_recursivamente(self.root)` sobre índices recién reiniciados,
+        con el Trie repartido entre `procesos` procesos (ver IndicePrefijos.construir).
+
+        El HashMap guarda nodos, que no pueden salir de este proceso: se llena aquí en la
+        misma pasada que junta los nombres. Los demás índices activos se arman después.
+        """
+        nombres, prefijos = self.indices["nombres"], self.indices["prefijos"]
+        pila = list(self.root._hijos or ())
+        while pila:
+            nodo = pila.pop()
+            nombres.al_crear(nodo)
+            pila.extend(nodo._hijos or ())
+        if prefijos.listo:
+            prefijos.construir(procesos)
+        for indice in self.indices.values():
+            if indice.listo and indice not in (nombres, prefijos):
+                indice.construir()
+
+    def _nodos_con_nombre(self, nombre):
+        actual = self.hash_map.get(nombre)
+        if actual is None:
+            return ()
+        return (actual,) if isinstance(actual, Nodo) else actual.values()
+
+    _LIMITE_CACHE_RESOLUCION = 1024
 
     def _buscar_nodo_y_padre(self, ruta_partes):
         if isinstance(ruta_partes, str):
-            ruta_partes = normalizar_ruta(ruta_partes).split('/')
-            
+            nodo, padre = self._resolver(normalizar_ruta(ruta_partes))
+        else:
+            nodo, padre = self._caminar(ruta_partes)
+        if self._desalojo is not None:
+            self._desalojo.marcar(nodo, padre)
+        return nodo, padre
+
+    def _resolver(self, ruta):
+        """Busca una ruta ya normalizada pasando por la caché LRU. Los fallos no se guardan:
+        una ruta que no existe puede aparecer con un mkdir sin cambiar la generación."""
+        cache = self._cache_resolucion
+        entrada = cache.get(ruta)
+        if entrada is not None and entrada[0] == self._generacion:
+            cache.move_to_end(ruta)
+            self.cache_aciertos += 1
+            return entrada[1], entrada[2]
+        self.cache_fallos += 1
+        nodo, padre = self._caminar(ruta.split('/'))
+        if nodo is not None:
+            cache[ruta] = (self._generacion, nodo, padre)
+            cache.move_to_end(ruta)
+            if len(cache) > self._LIMITE_CACHE_RESOLUCION:
+                cache.popitem(last=False)
+        return nodo, padre
+
+    def _invalidar_rutas(self):
+        """La forma del árbol cambió: las rutas resueltas y armadas ya no valen."""
+        self._generacion += 1
+        self._cache_rutas.clear()
+
+    def estadisticas_cache(self):
+        total = self.cache_aciertos + self.cache_fallos
+        return {
+            "aciertos": self.cache_aciertos,
+            "fallos": self.cache_fallos,
+            "tasa": self.cache_aciertos / total if total else 0.0,
+            "entradas": len(self._cache_resolucion),
+            "generacion": self._generacion,
+        }
+
+    def _caminar(self, ruta_partes):
         ruta_partes = [p for p in ruta_partes if p]
 
         if not ruta_partes or (len(ruta_partes) == 1 and ruta_partes[0] == "root"):
@@ -234,6 +1491,168 @@ class ArbolGeneral:
             actual = encontrado
         return actual, padre
 
+    def _buscar_camino(self, ruta):
+        """Devuelve la lista de nodos desde root hasta la ruta, o None."""
+        partes = normalizar_ruta(ruta).split('/')[1:]
+        actual = self.root
+        camino = [actual]
+        for nombre_parte in partes:
+            encontrado = None
+            for hijo in actual.hijos:
+                if hijo.nombre == nombre_parte:
+                    encontrado = hijo
+                    break
+            if encontrado is None:
+                return None
+            actual = encontrado
+            camino.append(actual)
+        return camino
+
+    def _hacer_escribible(self, camino, hasta=None):
+        """Prepara el camino para modificarlo: invalida los hashes Merkle y copia
+        (path copying) los nodos congelados.
+
+        Solo se copian los nodos que comparte una instantánea viva o, dentro del original
+        de un `cp` sin expandir, un clon (ver ClonadorPerezoso.congelado); sin ninguna de
+        las dos no se copia nada. Modifica `camino` en sitio y lo devuelve.
+        """
+        if hasta is None:
+            hasta = len(camino)
+        clones = self._clones
+        en_region = False
+        for i in range(hasta):
+            nodo = camino[i]
+            if clones.regiones:
+                en_region = en_region or id(nodo) in clones.regiones
+            if nodo.epoca > self._epoca_congelada and not (en_region and clones.congelado(nodo)):
+                nodo._hash = None
+                continue
+            copia = nodo.copiar(self._epoca)
+            if en_region:
+                clones.proteger(copia)  # Sus hijos viejos siguen siendo los del original
+            if i == 0:
+                self.root = copia
+            else:
+                hermanos = camino[i - 1].hijos
+                hermanos[hermanos.index(nodo)] = copia
+                copia.padre = camino[i - 1]
+            for hijo in copia._hijos or ():
+                hijo.padre = copia
+            self._avisar("al_reemplazar", nodo, copia)
+            camino[i] = copia
+            # La ruta sigue igual pero ahora lleva a la copia
+            self._generacion += 1
+        return camino
+
+    # --- ANCESTROS (enlaces al padre + etiquetas de intervalo) ---
+    # Cada nodo vivo tiene un intervalo [_pre, _post] que contiene los de sus
+    # descendientes: `a` es ancestro de `b` si su intervalo contiene al de `b`.
+    # Los intervalos dejan huecos grandes, así que crear o mover solo etiqueta el
+    # subárbol que llega; si el hueco se agota, se reetiqueta todo en la próxima consulta.
+
+    _PASO_ETIQUETA = 1 << 64
+    _PASO_CARPETA = 1 << 48
+    _PASO_HOJA = 1 << 32
+
+    def _asignar_etiquetas(self, raiz, padre, inicio, paso):
+        """Recorre el subárbol de `raiz` fijando padre, _pre y _post. Devuelve la última etiqueta."""
+        contador = inicio
+        pila = [(raiz, padre, False)]
+        while pila:
+            nodo, padre, cerrando = pila.pop()
+            contador += paso
+            if cerrando:
+                nodo._post = contador
+                continue
+            nodo.padre = padre
+            nodo._pre = contador
+            pila.append((nodo, padre, True))
+            pila.extend((h, nodo, False) for h in reversed(nodo._hijos or ()))
+        return contador
+
+    def _reetiquetar(self):
+        self._asignar_etiquetas(self.root, None, 0, self._PASO_ETIQUETA)
+        self._etiquetas_ok = True
+
+    def _enlazar(self, padre, nodo):
+        """Enlaza `nodo` (recién colgado como último hijo de `padre`): fija el padre, avisa
+        a los índices y lo etiqueta dentro del hueco libre."""
+        nodo.padre = padre
+        self._avisar("al_colgar", padre, nodo)
+        if not self._etiquetas_ok:
+            return
+        hermanos = padre.hijos
+        bajo = hermanos[-2]._post if len(hermanos) > 1 else padre._pre
+        hueco = padre._post - bajo
+        if nodo.tipo_nodo == "file":
+            paso = min(hueco // 3, self._PASO_HOJA)
+        else:
+            # Una carpeta se lleva a lo sumo la mitad del hueco para que le quepan hijos después
+            nodos, pila = 0, [nodo]
+            while pila:
+                actual = pila.pop()
+                nodos += 1
+                pila.extend(actual._hijos or ())
+            paso = min(hueco // 2 // (2 * nodos), self._PASO_CARPETA)
+        if paso < 1:
+            self._etiquetas_ok = False
+            return
+        self._asignar_etiquetas(nodo, padre, bajo, paso)
+
+    def es_ancestro(self, a, b):
+        """True si el nodo `a` es ancestro de `b` (o el mismo) en el árbol vivo. O(1)."""
+        if not self._etiquetas_ok:
+            self._reetiquetar()
+        return a._pre <= b._pre and b._post <= a._post
+
+    def ancestro_comun(self, a, b):
+        """Ancestro común más profundo de dos nodos vivos: sube desde `a` con chequeos O(1)."""
+        while not self.es_ancestro(a, b):
+            a = a.padre
+        return a
+
+    _LIMITE_CACHE_RUTAS = 4096
+
+    def obtener_ruta(self, nodo):
+        """Arma la ruta de un nodo vivo subiendo por los padres. O(profundidad), con caché acotada."""
+        cache = self._cache_rutas
+        ruta = cache.get(nodo)
+        if ruta is not None:
+            return ruta
+        if not self._etiquetas_ok:
+            self._reetiquetar()
+        partes = []
+        actual = nodo
+        while actual is not None:
+            previa = cache.get(actual)
+            if previa is not None:
+                partes.append(previa)
+                break
+            partes.append(actual.nombre)
+            actual = actual.padre
+        ruta = "/".join(reversed(partes))
+        if len(cache) >= self._LIMITE_CACHE_RUTAS:
+            cache.clear()
+        cache[nodo] = ruta
+        return ruta
+
+    def _camino_escribible(self, ruta):
+        camino = self._buscar_camino(ruta)
+        return self._hacer_escribible(camino) if camino else None
+
+    def _desprender(self, camino, nodo):
+        """`nodo` sale de la carpeta del final de `camino` (ya escribible) hacia otra parte
+        del árbol o a la papelera: si lo comparte el original de un clon, sigue protegido."""
+        clones = self._clones
+        if clones.regiones and clones.congelado(nodo) and any(id(n) in clones.regiones for n in camino):
+            clones.proteger(nodo)
+
+    def _nuevo_nodo(self, nombre, tipo, contenido=None):
+        """Crea un nodo del árbol vivo con su contenido deduplicado en el almacén."""
+        nuevo = Nodo(nombre, tipo, self.almacen.adquirir(contenido))
+        nuevo.epoca = self._epoca
+        return nuevo
+
     def _obtener_hijos_formato(self, nodo):
         return [f"{h.nombre} ({h.tipo_nodo})" for h in nodo.hijos]
 
@@ -269,6 +1688,13 @@ class ArbolGeneral:
         
         return tamano
 
+    def analizar(self):
+        """Exporta el árbol a columnas de NumPy para `analyze` (ver AnalisisArbol)."""
+        try:
+            return True, AnalisisArbol(self.root)
+        except ImportError:
+            return False, "analyze necesita NumPy: pip install numpy"
+
     def recorrido_preorden(self, nodo=None, nivel=0):
         """Realiza un recorrido en preorden del árbol."""
         if nodo is None:
@@ -300,39 +1726,52 @@ class ArbolGeneral:
             return False, f"Error al exportar: {str(e)}"
 
     def buscar_exacto(self, nombre):
-        """Búsqueda exacta usando HashMap - O(1)."""
-        if nombre in self.hash_map:
-            return self.hash_map[nombre]
-        return []
+        """Búsqueda exacta usando HashMap - O(1) más O(profundidad) por ruta armada."""
+        rutas = [self.obtener_ruta(n) for n in self._nodos_con_nombre(nombre)]
+        for almacen in self._perezosos():
+            rutas = rutas + almacen.buscar_exacto(nombre)
+        return rutas
 
     # --- ACCIONES PRINCIPALES ---
 
+    @_operacion
     def generar_carga_prueba(self, cantidad):
         """Genera archivos para pruebas de rendimiento."""
-        padre = self.root
+        padre = self._hacer_escribible([self.root])[0]
+        self._cambios += 1
+        self.historial.olvidar()
         for i in range(cantidad):
             nombre = f"archivo_perf_{i:05d}_test.txt" 
-            nuevo = Nodo(nombre, "file", f"Contenido del archivo de prueba {i}")
+            nuevo = self._nuevo_nodo(nombre, "file", f"Contenido del archivo de prueba {i}")
             padre.hijos.append(nuevo)
-            ruta = f"root/{nombre}"
-            self._actualizar_trie("create", name_new=nombre, ruta=ruta)
+            self._enlazar(padre, nuevo)
+            self._avisar("al_crear", nuevo)
+        self._tocar(padre)
         return True, f"Generados {cantidad} archivos para prueba de performance."
 
+    @_operacion
     def crear_nodo(self, ruta_padre, nombre, tipo, contenido=None):
-        padre, _ = self._buscar_nodo_y_padre(ruta_padre)
-        if not padre: return False, "Error: La carpeta donde quieres crear esto no existe."
+        camino = self._buscar_camino(ruta_padre)
+        if not camino: return False, "Error: La carpeta donde quieres crear esto no existe."
+        padre = camino[-1]
         if padre.tipo_nodo == 'file': return False, "Error: No puedes meter cosas dentro de un archivo."
         
         for hijo in padre.hijos:
             if hijo.nombre == nombre: return False, f"Error: Ya existe '{nombre}' aquí."
                 
-        nuevo = Nodo(nombre, tipo, contenido)
+        padre = self._hacer_escribible(camino)[-1]
+        nuevo = self._nuevo_nodo(nombre, tipo, contenido)
         padre.hijos.append(nuevo)
-        ruta_completa = f"{ruta_padre}/{nombre}" if ruta_padre != "root" else f"root/{nombre}"
-        self._actualizar_trie("create", name_new=nombre, ruta=ruta_completa)
+        self._enlazar(padre, nuevo)
+        self._tocar(padre, nuevo.mtime)
+        self._cambios += 1
+        self._avisar("al_crear", nuevo)
+        self.historial.registrar({"tipo": "crear", "ruta": f"{normalizar_ruta(ruta_padre)}/{nombre}", "nodo": None})
         return True, f"Listo, creado: {nombre}"
 
+    @_operacion
     def mover_nodo(self, ruta_origen, ruta_destino):
+        self._materializar_bajo(ruta_origen, mover=True)
         nodo_mov, padre_orig = self._buscar_nodo_y_padre(ruta_origen)
         nuevo_padre, _ = self._buscar_nodo_y_padre(ruta_destino)
 
@@ -341,20 +1780,30 @@ class ArbolGeneral:
             
         for hijo in nuevo_padre.hijos:
             if hijo.nombre == nodo_mov.nombre: return False, "Ya hay algo con ese nombre en el destino."
+        if self.es_ancestro(nodo_mov, nuevo_padre):
+            return False, "No puedes mover una carpeta dentro de sí misma."
 
-        # Actualizar HashMap antes de mover
-        self._actualizar_trie("delete", name_old=nodo_mov.nombre, ruta=ruta_origen)
-        
+        # Si hay instantáneas vivas, los padres se copian antes de tocarlos
+        camino_orig = self._buscar_camino(ruta_origen)
+        padre_orig = self._hacer_escribible(camino_orig, len(camino_orig) - 1)[-2]
+        self._desprender(camino_orig[:-1], nodo_mov)
+        nuevo_padre = self._camino_escribible(ruta_destino)[-1]
         padre_orig.hijos.remove(nodo_mov)
+        self._avisar("al_descolgar", padre_orig, nodo_mov)
         nuevo_padre.hijos.append(nodo_mov)
-        
-        # Actualizar HashMap después de mover
-        nueva_ruta = f"{ruta_destino}/{nodo_mov.nombre}"
-        self._actualizar_trie("create", name_new=nodo_mov.nombre, ruta=nueva_ruta)
+        self._enlazar(nuevo_padre, nodo_mov)
+        self._tocar(padre_orig)
+        self._tocar(nuevo_padre)
+        self._cambios += 1
+        # Los índices guardan nodos: basta con olvidar las rutas ya armadas
+        self._invalidar_rutas()
+        self.historial.registrar({"tipo": "mover", "pares": [(normalizar_ruta(ruta_origen), normalizar_ruta(ruta_destino))]})
         
         return True, f"Movido exitosamente a {ruta_destino}"
 
+    @_operacion
     def renombrar_nodo(self, ruta_nodo, nuevo_nombre):
+        self._materializar_bajo(ruta_nodo, mover=True)
         nodo, padre = self._buscar_nodo_y_padre(ruta_nodo)
         if not nodo or not padre: return False, "No encuentro el archivo."
             
@@ -362,120 +1811,3653 @@ class ArbolGeneral:
             if hermano.nombre == nuevo_nombre: return False, "Ya existe ese nombre aquí."
         
         nombre_anterior = nodo.nombre
+        camino = self._camino_escribible(ruta_nodo)
+        nodo = camino[-1]
+        self._avisar("al_descolgar", camino[-2], nodo)
         nodo.nombre = nuevo_nombre
-        self._actualizar_trie("rename", name_old=nombre_anterior, name_new=nuevo_nombre, ruta=ruta_nodo)
+        self._avisar("al_colgar", camino[-2], nodo)
+        self._tocar(camino[-2])
+        self._cambios += 1
+        self._avisar("al_renombrar", nodo, nombre_anterior)
+        self._invalidar_rutas()
+        self.historial.registrar({"tipo": "renombrar", "carpeta": normalizar_ruta(ruta_nodo).rsplit('/', 1)[0],
+                                  "antes": nombre_anterior, "despues": nuevo_nombre})
         return True, f"Renombrado a {nuevo_nombre}"
     
-    def buscar_autocompletado(self, prefix):
-        return self.trie.buscar_por_prefijo(prefix)
-    
-    def listar_directorio(self, ruta):
-        nodo, _ = self._buscar_nodo_y_padre(ruta)
-        if not nodo: return False, "Ruta no encontrada."
-        if nodo.tipo_nodo == 'file':
-            return True, f"Es un archivo: {nodo.nombre} (Tiene {len(str(nodo.contenido))} letras)"
-        
-        if not nodo.hijos:
-            return True, "(carpeta vacía)"
-        return True, "\n".join(self._obtener_hijos_formato(nodo))
+    @_operacion
+    def copiar_nodo(self, ruta_origen, ruta_destino):
+        """`cp`: si el destino es una carpeta, la copia entra con el mismo nombre; si no existe,
+        se crea con ese nombre en su carpeta padre. Las carpetas se copian perezosamente
+        (ver `ClonadorPerezoso`): cuesta O(profundidad) sin importar el tamaño del subárbol."""
+        origen, padre_origen = self._buscar_nodo_y_padre(ruta_origen)
+        if not origen or not padre_origen: return False, "No encuentro lo que quieres copiar."
+        destino, _ = self._buscar_nodo_y_padre(ruta_destino)
+        if destino is None:
+            ruta_padre, _, nombre = normalizar_ruta(ruta_destino).rpartition('/')
+        elif destino.tipo_nodo == 'folder':
+            ruta_padre, nombre = normalizar_ruta(ruta_destino), origen.nombre
+        else:
+            return False, "Ya existe un archivo con ese nombre en el destino."
+        camino = self._buscar_camino(ruta_padre) if ruta_padre else None
+        if not camino or camino[-1].tipo_nodo == 'file': return False, "El destino no es válido."
+        for hijo in camino[-1].hijos:
+            if hijo.nombre == nombre: return False, "Ya hay algo con ese nombre en el destino."
+        if self.es_ancestro(origen, camino[-1]):
+            return False, "No puedes copiar una carpeta dentro de sí misma."
 
-    # --- PAPELERA ---
+        # Primero se congela el original; recién después se copia el camino del destino
+        clon = self._clones.clonar(origen, nombre)
+        padre = self._hacer_escribible(camino)[-1]
+        padre.hijos.append(clon)
+        self._enlazar(padre, clon)
+        self._tocar(padre, clon.mtime)
+        self._cambios += 1
+        self._avisar("al_crear", clon)
+        self.historial.registrar({"tipo": "crear", "ruta": f"{ruta_padre}/{nombre}", "nodo": None})
+        return True, f"Copiado a {ruta_padre}/{nombre}"
 
+    @_operacion
+    def modificar_contenido(self, ruta_nodo, contenido):
+        camino = self._buscar_camino(ruta_nodo)
+        if not camino: return False, "No encuentro el archivo."
+        if camino[-1].tipo_nodo != 'file': return False, "Solo los archivos tienen contenido."
+        nodo = self._hacer_escribible(camino)[-1]
+        self._avisar("al_descolgar", camino[-2], nodo)
+        self._avisar("antes_de_modificar", nodo, True)
+        anterior = nodo._contenido
+        self.almacen.soltar(anterior)
+        nodo.contenido = self.almacen.adquirir(contenido)
+        # Se guardan los Blobs (compartidos), no copias del texto
+        self.historial.registrar({"tipo": "modificar", "ruta": normalizar_ruta(ruta_nodo),
+                                  "antes": anterior, "despues": nodo._contenido})
+        nodo.mtime = time.time()
+        self._avisar("al_modificar", nodo, True)
+        self._avisar("al_colgar", camino[-2], nodo)
+        self._cambios += 1
+        return True, "Contenido actualizado."
+
+    def _insertar_subarbol(self, ruta_padre, nodo):
+        """Cuelga un subárbol ya armado (mismos ids) e indexa todos sus nodos."""
+        camino = self._buscar_camino(ruta_padre)
+        if not camino or camino[-1].tipo_nodo == 'file': return False, "El destino no es válido."
+        for hijo in camino[-1].hijos:
+            if hijo.nombre == nodo.nombre: return False, "Ya hay algo con ese nombre en el destino."
+        padre = self._hacer_escribible(camino)[-1]
+        padre.hijos.append(nodo)
+        self._enlazar(padre, nodo)
+        self._tocar(padre)
+        pila = [nodo]
+        while pila:
+            actual = pila.pop()
+            actual.contenido = self.almacen.adquirir(actual._contenido)
+            pila.extend(actual._hijos or ())
+        self._clones.recolgar(nodo)
+        self._indexar_trie_recursivamente(nodo)
+        self._cambios += 1
+        return True, f"Insertado en {ruta_padre}"
+
+    def buscar_autocompletado(self, prefix):
+        nombres = self._indice("prefijos").buscar(prefix)
+        perezosos = self._perezosos()
+        if perezosos:
+            nombres = sorted(set(nombres).union(*(almacen.buscar_prefijo(prefix) for almacen in perezosos)))
+        return nombres
+
+    def buscar_patron(self, patron, ruta_base=None):
+        """`find` con comodines: casa el patrón contra los nombres del HashMap (una pasada
+        por nombre distinto, no por nodo). Con `ruta_base` solo cuenta lo que está debajo."""
+        regex = re.compile(fnmatch.translate(patron))
+        nodos = [n for nombre in self.hash_map if regex.match(nombre) for n in self._nodos_con_nombre(nombre)]
+        if ruta_base is not None:
+            base, _ = self._buscar_nodo_y_padre(ruta_base)
+            if base is None: return []
+            nodos = [n for n in nodos if n is not base and self.es_ancestro(base, n)]
+        rutas = [self.obtener_ruta(n) for n in nodos]
+        for almacen in self._perezosos():
+            extra = almacen.buscar_patron(regex)
+            if ruta_base is not None:
+                extra = [r for r in extra if r.startswith(normalizar_ruta(ruta_base) + "/")]
+            rutas.extend(extra)
+        return sorted(rutas)
+
+    def _expandir(self, patron):
+        """(nodo, ruta) de todo lo que casa con un patrón absoluto. Cada carpeta se recorre
+        una vez por segmento; `**` baja a cualquier profundidad (incluida ninguna)."""
+        actuales = [(self.root, "root")]
+        for parte in normalizar_ruta(patron).split('/')[1:]:
+            siguientes = {}
+            if parte == "**":
+                pila = list(actuales)
+                while pila:
+                    nodo, ruta = pila.pop()
+                    siguientes[id(nodo)] = (nodo, ruta)
+                    pila.extend((h, f"{ruta}/{h.nombre}") for h in nodo.hijos if h.tipo_nodo == "folder")
+            elif not es_patron(parte):
+                for nodo, ruta in actuales:
+                    for hijo in nodo.hijos:
+                        if hijo.nombre == parte:
+                            siguientes[id(hijo)] = (hijo, f"{ruta}/{parte}")
+                            break
+            else:
+                regex = re.compile(fnmatch.translate(parte))
+                for nodo, ruta in actuales:
+                    for hijo in nodo.hijos:
+                        if regex.match(hijo.nombre):
+                            siguientes[id(hijo)] = (hijo, f"{ruta}/{hijo.nombre}")
+            actuales = list(siguientes.values())
+        return actuales
+
+    def expandir_patron(self, patron, carpetas=True):
+        """Rutas que casan con el patrón, en orden. Con carpetas=False solo archivos."""
+        return sorted(ruta for nodo, ruta in self._expandir(patron)
+                      if ruta != "root" and (carpetas or nodo.tipo_nodo == "file"))
+
+    def listar_recursivo(self, ruta):
+        """`ls -R`: cada carpeta del subárbol con su contenido, en preorden."""
+        nodo, _ = self._buscar_nodo_y_padre(ruta)
+        if not nodo: return False, "Ruta no encontrada."
+        if nodo.tipo_nodo == 'file': return self.listar_directorio(ruta)
+        salida = []
+        pila = [(nodo, normalizar_ruta(ruta))]
+        while pila:
+            actual, ruta_actual = pila.pop()
+            salida.append(f"{ruta_actual}:")
+            salida.extend(f"  {linea}" for linea in self._obtener_hijos_formato(actual) or ["(carpeta vacía)"])
+            pila.extend((h, f"{ruta_actual}/{h.nombre}") for h in reversed(actual.hijos) if h.tipo_nodo == "folder")
+        return True, "\n".join(salida)
+
+    @staticmethod
+    def _raices_de_lote(rutas):
+        """Quita repetidas y las que ya van dentro de otra carpeta del mismo lote."""
+        elegidas = []
+        for ruta in sorted({normalizar_ruta(r) for r in rutas}, key=lambda r: r.split('/')):
+            if ruta == "root" or (elegidas and ruta.startswith(elegidas[-1] + "/")):
+                continue
+            elegidas.append(ruta)
+        return elegidas
+
+    def _sacar_de_padres(self, rutas):
+        """Desengancha un lote de nodos: cada padre se copia (COW) y se filtra una sola vez.
+        Devuelve [(ruta, nodo)] de lo que se sacó, en el orden de `rutas`."""
+        por_padre = {}
+        for ruta in rutas:
+            padre, nombre = ruta.rsplit('/', 1)
+            por_padre.setdefault(padre, set()).add(nombre)
+        sacados = {}
+        for ruta_padre, nombres in por_padre.items():
+            camino = self._buscar_camino(ruta_padre)
+            if not camino: continue
+            padre = self._hacer_escribible(camino)[-1]
+            quedan = []
+            for hijo in padre.hijos:
+                if hijo.nombre in nombres:
+                    self._desprender(camino, hijo)
+                    sacados[f"{ruta_padre}/{hijo.nombre}"] = hijo
+                    self._avisar("al_descolgar", padre, hijo)
+                else:
+                    quedan.append(hijo)
+            padre.hijos = quedan
+            self._tocar(padre)
+        return [(ruta, sacados[ruta]) for ruta in rutas if ruta in sacados]
+
+    @_operacion
+    def eliminar_varios(self, rutas):
+        """`rm` en lote: un filtrado por carpeta, una invalidación y un solo extend de la papelera."""
+        rutas = self._raices_de_lote(rutas)
+        for ruta in rutas:
+            self._materializar_bajo(ruta)
+            self._expandir_clones(ruta)
+        sacados = self._sacar_de_padres(rutas)
+        if not sacados: return False, "No encontré nada que eliminar."
+        diferidos = set()
+        for _, nodo in sacados:
+            self._desindexar_subarbol(nodo, diferidos)
+        self._avisar("al_cerrar_lote", diferidos)
+        elementos = self.papelera.agregar_varios(sacados)
+        self.historial.registrar({"tipo": "eliminar", "rutas": [e["path_origen"] for e in elementos],
+                                  "ids": [e["id"] for e in elementos]})
+        self._cambios += 1
+        self._invalidar_rutas()
+        return True, f"{len(sacados)} elemento(s) enviados a papelera."
+
+    @_operacion
+    def mover_varios(self, rutas, ruta_destino):
+        """`mv` en lote hacia una carpeta. Lo que choca (nombre repetido, destino adentro
+        de lo que se mueve) se salta y se informa; el resto se mueve en una sola pasada."""
+        rutas = self._raices_de_lote(rutas)
+        destino, _ = self._buscar_nodo_y_padre(ruta_destino)
+        if not destino or destino.tipo_nodo == 'file': return False, "El destino no es válido."
+        ocupados = {h.nombre for h in destino.hijos}
+        validas, saltadas = [], []
+        for ruta in rutas:
+            nodo, _ = self._buscar_nodo_y_padre(ruta)
+            if nodo is None or nodo.nombre in ocupados or self.es_ancestro(nodo, destino):
+                saltadas.append(ruta)
+                continue
+            ocupados.add(nodo.nombre)
+            validas.append(ruta)
+        if not validas: return False, f"No se pudo mover nada ({len(saltadas)} conflicto(s))."
+        for ruta in validas:
+            self._materializar_bajo(ruta, mover=True)
+        sacados = self._sacar_de_padres(validas)
+        destino = self._camino_escribible(ruta_destino)[-1]
+        for _, nodo in sacados:
+            destino.hijos.append(nodo)
+            self._enlazar(destino, nodo)
+        self._tocar(destino)
+        self._cambios += 1
+        self._invalidar_rutas()
+        ruta_destino = normalizar_ruta(ruta_destino)
+        self.historial.registrar({"tipo": "mover", "pares": [(ruta, ruta_destino) for ruta, _ in sacados]})
+        msg = f"{len(sacados)} elemento(s) movidos a {ruta_destino}"
+        if saltadas: msg += f" ({len(saltadas)} saltados por conflicto: {', '.join(saltadas[:3])}{'...' if len(saltadas) > 3 else ''})"
+        return True, msg
+
+    def _expandir_clones(self, ruta="root"):
+        """Expande los clones de `cp` pendientes en `ruta` o debajo, para `rm` (la papelera
+        no guarda stubs) y `checkout`. Las búsquedas no lo necesitan (ver `_sin_cargar`)."""
+        if self._clones.pendientes:
+            self._clones.expandir(normalizar_ruta(ruta))
+
+    def _perezosos(self):
+        """Los almacenes con subárboles aún fuera de memoria: fragmentos (o la base SQLite),
+        desalojados y clones sin expandir."""
+        return [almacen for almacen in (self._fragmentos, self._desalojo, self._clones)
+                if almacen is not None and almacen.pendientes]
+
+    def _materializar_bajo(self, ruta, mover=False):
+        """Carga los fragmentos pendientes dentro de `ruta` antes de mover/renombrar/borrar ese
+        subárbol. Los clones no: sus stubs sacan la ruta del árbol y siguen al nodo. Con
+        `mover` tampoco los almacenes que buscan por id (`sigue_al_arbol`): en SQLite mover
+        o renombrar es un UPDATE de una fila."""
+        for almacen in self._perezosos():
+            if almacen is not self._clones and not (mover and almacen.sigue_al_arbol):
+                almacen.materializar(normalizar_ruta(ruta))
+
+    def _sin_cargar(self, base, predicados=()):
+        """(ruta, nodo) de lo que está debajo de `base` pero fuera de memoria, leído de cada
+        almacén perezoso sin cargarlo. Los almacenes aplican los predicados de nombre, tipo
+        y `under`; quien llama verifica el resto."""
+        for almacen in self._perezosos():
+            yield from almacen.recorrer(base, predicados)
+    
+    def listar_directorio(self, ruta, orden=None, desde=0, limite=None, reverso=False):
+        ok, total, lineas = self.paginar_directorio(ruta, orden, desde, limite, reverso)
+        if not ok: return False, lineas
+        if not total: return True, "(carpeta vacía)"
+        return True, "\n".join(lineas)
+
+    def paginar_directorio(self, ruta, orden=None, desde=0, limite=None, reverso=False):
+        """`ls` por páginas: (ok, total de entradas, generador de líneas | mensaje de error).
+
+        Sin `orden` sale el orden de creación; con "name", "type" o "size" el de
+        IndiceListados, que salta hasta `desde` sin ordenar ni recorrer lo anterior. Las
+        líneas se generan de a una, así que se pueden imprimir mientras salen.
+        """
+        nodo, _ = self._buscar_nodo_y_padre(ruta)
+        if not nodo: return False, 0, "Ruta no encontrada."
+        if nodo.tipo_nodo == 'file':
+            return True, 1, iter([f"Es un archivo: {nodo.nombre} (Tiene {len(str(nodo.contenido))} letras)"])
+        if orden is not None and orden not in IndiceListados.CLAVES:
+            return False, 0, f"Orden inválido: {orden} (usa {', '.join(IndiceListados.CLAVES)})."
+        hijos = nodo.hijos
+        if orden is None:
+            entradas = ((None, h.nombre, h.tipo_nodo) for h in (reversed(hijos) if reverso else hijos))
+            entradas = itertools.islice(entradas, desde, None if limite is None else desde + limite)
+        else:
+            lista = self._indice("listados").orden(nodo, orden)
+            entradas = itertools.islice(lista.desde_posicion(desde, reverso), limite)
+        if orden == "size":
+            lineas = (f"{nombre} ({tipo}, {clave[0]:,} B)" for clave, nombre, tipo in entradas)
+        else:
+            lineas = (f"{nombre} ({tipo})" for _, nombre, tipo in entradas)
+        return True, len(hijos), lineas
+
+    # --- METADATOS (tamaño y fechas) ---
+
+    def _tocar(self, nodo, instante=None):
+        """Marca un nodo ya escribible como modificado (una carpeta, cuando cambian sus entradas)."""
+        self._avisar("antes_de_modificar", nodo, False)
+        nodo.mtime = time.time() if instante is None else instante
+        self._avisar("al_modificar", nodo, False)
+
+    def buscar_por_metadatos(self, tamano_min=None, tamano_max=None, mtime_min=None, mtime_max=None,
+                             tipo=None, patron=None, ruta_base=None):
+        """`find` con predicados: recorre solo el rango del índice más angosto (tamaño o mtime)
+        y filtra el resto. Los límites son inclusivos; None = sin límite. Lo que sigue fuera de
+        memoria se lee sin cargarlo (ver `_sin_cargar`). Devuelve rutas ordenadas."""
+        # La base primero: llegar a ella puede cargar carpetas que el índice tiene que ver
+        base = None
+        if ruta_base is not None:
+            base, _ = self._buscar_nodo_y_padre(ruta_base)
+            if base is None: return []
+        indices = self._indice("metadatos").listas
+        por_tamano = tamano_min is not None or tamano_max is not None
+        por_fecha = mtime_min is not None or mtime_max is not None
+        if por_tamano and (tipo == "folder" or (por_fecha and indices["mtime"].contar(mtime_min, mtime_max)
+                                                <= indices["tamano"].contar(tamano_min, tamano_max))):
+            por_tamano = False
+        if por_tamano:
+            candidatos = indices["tamano"].rango(tamano_min, tamano_max)
+        else:
+            candidatos = indices["mtime"].rango(mtime_min, mtime_max)
+        regex = re.compile(fnmatch.translate(patron)) if patron else None
+        def cumple(nodo):
+            if tipo is not None and nodo.tipo_nodo != tipo: return False
+            if tamano_min is not None or tamano_max is not None:
+                if nodo.tipo_nodo != "file": return False
+                t = nodo.tamano_bytes
+                if (tamano_min is not None and t < tamano_min) or (tamano_max is not None and t > tamano_max): return False
+            if (mtime_min is not None and nodo.mtime < mtime_min) or (mtime_max is not None and nodo.mtime > mtime_max):
+                return False
+            return regex is None or regex.match(nodo.nombre) is not None
+
+        resultado = []
+        for _, _, nodo in candidatos:
+            if not cumple(nodo): continue
+            if base is not None and (nodo is base or not self.es_ancestro(base, nodo)): continue
+            resultado.append(self.obtener_ruta(nodo))
+        predicados = [("glob", patron)] if patron else []
+        if tamano_min is not None or tamano_max is not None: predicados.append(("type", "file"))
+        elif tipo is not None: predicados.append(("type", tipo))
+        resultado.extend(ruta for ruta, nodo in self._sin_cargar(base or self.root, predicados) if cumple(nodo))
+        return sorted(resultado)
+
+    def mas_grandes(self, cantidad=10, ruta_base=None):
+        """Los `cantidad` archivos más grandes como [(ruta, bytes)], recorriendo el índice desde arriba."""
+        base = None
+        if ruta_base is not None:
+            base, _ = self._buscar_nodo_y_padre(ruta_base)
+            if base is None: return []
+        resultado = []
+        for tamano, _, nodo in self._indice("metadatos").listas["tamano"].rango(reverso=True):
+            if len(resultado) >= cantidad: break
+            if base is None or self.es_ancestro(base, nodo):
+                resultado.append((self.obtener_ruta(nodo), tamano))
+        # Lo que sigue fuera de memoria compite con los de memoria sin cargarse
+        resultado.extend(heapq.nlargest(cantidad, ((ruta, nodo.tamano_bytes) for ruta, nodo in
+                                                   self._sin_cargar(base or self.root, [("type", "file")])),
+                                        key=lambda r: r[1]))
+        return sorted(resultado, key=lambda r: -r[1])[:cantidad]
+
+    def info_nodo(self, ruta):
+        """Metadatos de un nodo para `stat`."""
+        nodo, _ = self._buscar_nodo_y_padre(ruta)
+        if not nodo: return False, "Ruta no encontrada."
+        def fecha(t):
+            return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) if t else "desconocida"
+        lineas = [f"Nombre: {nodo.nombre} ({nodo.tipo_nodo})", f"Id: {nodo.id}"]
+        if nodo.tipo_nodo == "file":
+            lineas.append(f"Tamaño: {nodo.tamano_bytes} bytes")
+        else:
+            lineas.append(f"Entradas: {len(nodo.hijos)}")
+        lineas.append(f"Creado: {fecha(nodo.ctime)}")
+        lineas.append(f"Modificado: {fecha(nodo.mtime)}")
+        return True, "\n".join(lineas)
+
+    # --- CONSULTAS COMBINADAS (planificador) ---
+
+    # Predicados que dependen de un índice que se puede apagar
+    _INDICE_DE_CAMPO = {"prefix": "prefijos", "content": "contenido", "size": "metadatos"}
+
+    def _campo_indexado(self, campo):
+        if campo == "name": return True
+        nombre = self._INDICE_DE_CAMPO.get(campo)
+        return nombre is not None and self.indices[nombre].modo != "apagado"
+
+    def _fuente_indexada(self, campo, valor):
+        """Para un predicado con índice: (estimación, generador de {id(nodo): nodo}, descripción).
+        None si el predicado solo se puede verificar nodo por nodo (o si su índice está apagado)."""
+        if campo in self._INDICE_DE_CAMPO and not self._campo_indexado(campo):
+            return None
+        if campo == "name":
+            nodos = self._nodos_con_nombre(valor)
+            return len(nodos), lambda: {id(n): n for n in nodos}, f"HashMap exacto '{valor}'"
+        if campo in ("prefix", "glob"):
+            if campo == "prefix":
+                nombres = self._indice("prefijos").buscar(valor)
+                desc = f"Trie prefijo '{valor}' ({len(nombres)} nombres)"
+            else:
+                regex = re.compile(fnmatch.translate(valor))
+                nombres = [n for n in self.hash_map if regex.match(n)]
+                desc = f"HashMap con comodines '{valor}' ({len(self.hash_map)} nombres revisados)"
+            total = sum(len(self._nodos_con_nombre(n)) for n in nombres)
+            return total, lambda: {id(n): n for nombre in nombres for n in self._nodos_con_nombre(nombre)}, desc
+        if campo == "content":
+            nodos = self._indice("contenido").palabras.get(valor, {})
+            return len(nodos), lambda: dict(nodos), f"Índice invertido de contenido '{valor}'"
+        if campo == "size":
+            indice = self._indice("metadatos").listas["tamano"]
+            minimo, maximo = valor
+            return (indice.contar(minimo, maximo), lambda: {id(n): n for _, _, n in indice.rango(minimo, maximo)},
+                    f"Índice de tamaño [{minimo if minimo is not None else 0}, {maximo if maximo is not None else '∞'}] bytes")
+        return None
+
+    def _filtro(self, campo, valor):
+        """(función nodo -> bool, descripción) para verificar un predicado sobre un candidato."""
+        if campo == "name":
+            return (lambda n: n.nombre == valor), f"nombre = '{valor}'"
+        if campo == "prefix":
+            return (lambda n: n.nombre.startswith(valor)), f"nombre empieza con '{valor}'"
+        if campo == "glob":
+            regex = re.compile(fnmatch.translate(valor))
+            return (lambda n: regex.match(n.nombre) is not None), f"nombre casa con '{valor}'"
+        if campo == "type":
+            return (lambda n: n.tipo_nodo == valor), f"tipo = {valor}"
+        if campo == "under":
+            base, exacto = self._hasta_sin_cargar(valor)
+            if base is None:
+                return (lambda n: False), f"dentro de {valor} (no existe)"
+            if not exacto:
+                return (lambda n: False), f"dentro de {valor} (sin cargar: nada en memoria)"
+            return (lambda n: n is not base and self.es_ancestro(base, n)), f"dentro de {valor} (intervalos, O(1))"
+        if campo == "content":
+            return (lambda n: n.tipo_nodo == "file" and valor in palabras_de(n.contenido)), f"contenido tiene '{valor}'"
+        minimo, maximo = valor
+        return (lambda n: n.tipo_nodo == "file" and (minimo is None or n.tamano_bytes >= minimo)
+                and (maximo is None or n.tamano_bytes <= maximo)), f"tamaño entre {minimo} y {maximo} bytes"
+
+    # Un segundo índice se intersecta por identidad de nodo si no trae más de este múltiplo de candidatos;
+    # si trae más, sale más barato verificar el predicado en cada candidato.
+    _FACTOR_INTERSECCION = 8
+
+    def _planificar(self, predicados):
+        """Arma el plan: el índice más selectivo da los candidatos, los índices que traen
+        pocos nodos se intersectan por id y el resto se verifica nodo por nodo. Sin ningún
+        índice aplicable se recorre solo el subárbol de `under` (o todo el árbol). Cubre lo
+        que está en memoria; lo demás lo agrega `_consultar_sin_cargar`. No carga nada."""
+        fuentes, filtros = [], []
+        # Estimar un patrón con comodines revisa todos los nombres distintos: solo se usa
+        # como índice si ningún otro predicado tiene uno
+        tiene_indice = any(self._campo_indexado(campo) for campo, _ in predicados)
+        for campo, valor in predicados:
+            fuente = None if campo == "glob" and tiene_indice else self._fuente_indexada(campo, valor)
+            if fuente is None:
+                filtros.append((campo, valor))
+            else:
+                fuentes.append((fuente, campo, valor))
+        fuentes.sort(key=lambda f: f[0][0])
+        plan = {"fuente": None, "intersecciones": [], "filtros": [], "alcance": None}
+        if fuentes:
+            plan["fuente"] = fuentes[0][0]
+            for fuente, campo, valor in fuentes[1:]:
+                if fuente[0] <= self._FACTOR_INTERSECCION * max(plan["fuente"][0], 1):
+                    plan["intersecciones"].append(fuente)
+                else:
+                    filtros.append((campo, valor))
+        else:
+            alcances = [valor for campo, valor in filtros if campo == "under"]
+            plan["alcance"] = alcances[0] if alcances else "root"
+            if alcances:
+                filtros.remove(("under", alcances[0]))
+        # Los filtros baratos primero: leer contenidos es lo más caro
+        orden = {"type": 0, "name": 1, "prefix": 1, "under": 2, "glob": 3, "size": 4, "content": 5}
+        plan["filtros"] = [self._filtro(campo, valor) for campo, valor in sorted(filtros, key=lambda p: orden[p[0]])]
+        return plan
+
+    def explicar_consulta(self, predicados):
+        """El plan elegido, paso por paso, sin ejecutar la consulta (comando `explain`)."""
+        plan = self._planificar(predicados)
+        pasos = []
+        if plan["fuente"] is not None:
+            estimacion, _, desc = plan["fuente"]
+            pasos.append(f"{desc}: ~{estimacion} candidatos")
+            pasos.extend(f"∩ con {desc}: ~{estimacion}" for estimacion, _, desc in plan["intersecciones"])
+        else:
+            pasos.append(f"Sin índice aplicable: recorrido de {plan['alcance']}")
+        pasos.extend(f"Filtro: {desc}" for _, desc in plan["filtros"])
+        perezosos = self._perezosos()
+        base = self._alcance_sin_cargar(predicados) if perezosos else None
+        if base is not None:
+            for almacen in perezosos:
+                pasos.append(f"∪ {almacen.descripcion}: ~{almacen.estimar(base, predicados)} candidatos")
+        return [f"{i}. {paso}" for i, paso in enumerate(pasos, 1)]
+
+    def consultar(self, predicados):
+        """Ejecuta una consulta de `parsear_consulta` y devuelve las rutas que cumplen todo."""
+        plan = self._planificar(predicados)
+        if plan["fuente"] is not None:
+            candidatos = plan["fuente"][1]()
+            for _, generar, _ in plan["intersecciones"]:
+                if not candidatos: break
+                otros = generar()
+                candidatos = {i: n for i, n in candidatos.items() if i in otros}
+            candidatos = candidatos.values()
+        else:
+            base, exacto = self._hasta_sin_cargar(plan["alcance"])
+            candidatos = []
+            if base is not None and exacto:
+                pila = list(base._hijos or ())
+                while pila:
+                    nodo = pila.pop()
+                    candidatos.append(nodo)
+                    pila.extend(nodo._hijos or ())
+        filtros = [f for f, _ in plan["filtros"]]
+        rutas = [self.obtener_ruta(n) for n in candidatos if all(f(n) for f in filtros)]
+        return sorted(rutas + self._consultar_sin_cargar(predicados))
+
+    def _alcance_sin_cargar(self, predicados):
+        """Desde dónde buscar fuera de memoria: el `under` más profundo, o el stub donde se
+        corta su camino (los almacenes verifican cada `under` por la ruta). None si no existe."""
+        bajo = sorted({normalizar_ruta(valor) for campo, valor in predicados if campo == "under"}, key=len)
+        if not bajo: return self.root
+        return self._hasta_sin_cargar(bajo[-1])[0]
+
+    def _hasta_sin_cargar(self, ruta):
+        """(nodo, exacto): el nodo de `ruta` o, si el camino entra en una carpeta sin cargar,
+        ese stub con exacto False. Solo mira lo que está en memoria: planificar no carga
+        nada. (None, False) si la ruta no existe."""
+        actual = self.root
+        for nombre in normalizar_ruta(ruta).split('/')[1:]:
+            if actual._hijos is None:
+                return actual, False
+            actual = next((h for h in actual._hijos if h.nombre == nombre), None)
+            if actual is None:
+                return None, False
+        return actual, True
+
+    def _consultar_sin_cargar(self, predicados):
+        """Las rutas que cumplen la consulta entre lo que sigue fuera de memoria (clones sin
+        expandir y stubs de los almacenes perezosos), sin cargarlo."""
+        if not self._perezosos(): return []
+        base = self._alcance_sin_cargar(predicados)
+        if base is None: return []
+        filtros = [self._filtro(campo, valor)[0] for campo, valor in predicados if campo != "under"]
+        return [ruta for ruta, nodo in self._sin_cargar(base, predicados) if all(f(nodo) for f in filtros)]
+
+    # --- PAPELERA ---
+
+    @_operacion
     def eliminar_nodo(self, ruta_nodo):
+        self._materializar_bajo(ruta_nodo)
+        self._expandir_clones(ruta_nodo)
         nodo, padre = self._buscar_nodo_y_padre(ruta_nodo)
         if not nodo or not padre: return False, "No se puede eliminar (¿es root o no existe?)."
             
+        camino = self._buscar_camino(ruta_nodo)
+        padre = self._hacer_escribible(camino, len(camino) - 1)[-2]
+        self._desprender(camino[:-1], nodo)
         padre.hijos.remove(nodo)
-        self._actualizar_trie("delete", name_old=nodo.nombre, ruta=ruta_nodo)
+        self._avisar("al_descolgar", padre, nodo)
+        self._tocar(padre)
+        self._cambios += 1
+        self._desindexar_subarbol(nodo)
+        self._invalidar_rutas()
         
-        item_papelera = {
-            "path_origen": ruta_nodo,
-            "path_padre": "/".join(ruta_nodo.split('/')[:-1]),
-            "nodo": nodo
+        elemento = self.papelera.agregar(normalizar_ruta(ruta_nodo), nodo)
+        self.historial.registrar({"tipo": "eliminar", "rutas": [elemento["path_origen"]], "ids": [elemento["id"]]})
+        return True, "Enviado a papelera."
+
+    def _soltar_de_papelera(self, item):
+        """La retención (o `empty`) descartó un elemento: sus contenidos dejan de contar."""
+        self.almacen.contar_subarbol(item["nodo"], adquirir=False)
+        self._cambios += 1
+
+    def ver_papelera(self, pagina=1, por_pagina=20):
+        self.papelera.aplicar_retencion()
+        if not self.papelera: return "La papelera está vacía."
+        try:
+            pagina = int(pagina)
+        except ValueError: return "Debes darme el número de página."
+        items, paginas = self.papelera.pagina(pagina, por_pagina)
+        if not items: return f"Esa página no existe (hay {paginas})."
+        salida = [f"Página {pagina}/{paginas} ({len(self.papelera)} elementos, {self.papelera.bytes / 1024:.1f} KiB)"]
+        for item in items:
+            salida.append(f"[{item['id']}] {item['nodo'].nombre} (Venía de: {item['path_origen']})")
+        return "\n".join(salida)
+
+    @_operacion
+    def restaurar_nodo(self, indice):
+        """Restaura por id (`restore 3`) o por la ruta de donde vino (`restore root/a.txt`)."""
+        try:
+            item = self.papelera.obtener(int(indice))
+            if item is None: return False, "Número inválido."
+        except ValueError:
+            item = self.papelera.buscar_por_ruta(normalizar_ruta(str(indice)))
+            if item is None: return False, "No hay nada en la papelera que viniera de esa ruta."
+
+        nodo_a_restaurar = item['nodo']
+        path_padre_str = item['path_padre']
+
+        camino = self._buscar_camino(path_padre_str)
+        if not camino: return False, "La carpeta original ya no existe, no sé dónde ponerlo."
+        padre = camino[-1]
+        if padre.tipo_nodo == 'file': return False, "Donde estaba la carpeta original ahora hay un archivo."
+
+        for hijo in padre.hijos:
+            if hijo.nombre == nodo_a_restaurar.nombre: return False, "Conflicto: Ya hay un archivo con ese nombre ahí."
+
+        padre = self._hacer_escribible(camino)[-1]
+        padre.hijos.append(nodo_a_restaurar)
+        self._enlazar(padre, nodo_a_restaurar)
+        self._tocar(padre)
+        self.papelera.quitar(item["id"])
+        self._cambios += 1
+        self._invalidar_rutas()
+        self._indexar_trie_recursivamente(nodo_a_restaurar)
+        self.historial.registrar({"tipo": "restaurar", "ruta": item["path_origen"]})
+        return True, f"Restaurado en {path_padre_str}"
+
+    @_operacion
+    def vaciar_papelera(self):
+        c = self.papelera.vaciar()
+        self.historial.olvidar()
+        self._cambios += 1
+        return True, f"Se eliminaron {c} elementos para siempre."
+
+    @_operacion
+    def configurar_papelera(self, limite, valor):
+        """Cambia un límite de retención: "items", "bytes" o "dias" ("off" = sin límite)."""
+        atributos = {"items": "max_elementos", "bytes": "max_bytes", "dias": "max_edad"}
+        if limite not in atributos: return False, "El límite debe ser items, bytes o dias."
+        try:
+            numero = None if valor == "off" else float(valor) if limite == "dias" else int(valor)
+        except ValueError: return False, "El valor debe ser un número u 'off'."
+        if numero is not None and numero < 0: return False, "El valor no puede ser negativo."
+        setattr(self.papelera, atributos[limite], numero * 86400 if limite == "dias" and numero is not None else numero)
+        descartados = self.papelera.aplicar_retencion()
+        return True, f"Límite de {limite}: {valor} ({descartados} elementos viejos descartados)"
+
+    # --- DESHACER / REHACER ---
+
+    def _desenganchar(self, ruta):
+        """Saca un nodo del árbol sin pasar por la papelera (deshacer mkdir/touch/cp). Un
+        clon sin expandir sale así, sin expandirse."""
+        self._materializar_bajo(ruta)
+        camino = self._buscar_camino(ruta)
+        if not camino or len(camino) < 2: return None
+        nodo = camino[-1]
+        padre = self._hacer_escribible(camino, len(camino) - 1)[-2]
+        self._desprender(camino[:-1], nodo)
+        padre.hijos.remove(nodo)
+        self._avisar("al_descolgar", padre, nodo)
+        self._tocar(padre)
+        self._desindexar_subarbol(nodo)
+        self._clones.soltar(nodo)
+        self.almacen.contar_subarbol(nodo, adquirir=False)
+        self._cambios += 1
+        self._invalidar_rutas()
+        return nodo
+
+    def _mover_por_destino(self, pares):
+        """Mueve [(ruta, carpeta destino)] con un mover_varios por cada destino."""
+        por_destino = {}
+        for ruta, destino in pares:
+            por_destino.setdefault(destino, []).append(ruta)
+        for destino, rutas in por_destino.items():
+            ok, msg = self.mover_varios(rutas, destino)
+            if not ok: return False, msg
+        return True, f"{len(pares)} elemento(s) movidos"
+
+    def _aplicar_historial(self, entrada, deshacer):
+        """Aplica una entrada del historial hacia atrás (`deshacer`) o hacia adelante."""
+        tipo = entrada["tipo"]
+        if tipo == "crear":
+            if deshacer:
+                entrada["nodo"] = self._desenganchar(entrada["ruta"])
+                return entrada["nodo"] is not None, f"Se quitó {entrada['ruta']}"
+            return self._insertar_subarbol(entrada["ruta"].rsplit('/', 1)[0], entrada["nodo"])
+        if tipo == "mover":
+            if deshacer:
+                return self._mover_por_destino([(f"{destino}/{origen.rsplit('/', 1)[1]}", origen.rsplit('/', 1)[0])
+                                                for origen, destino in entrada["pares"]])
+            return self._mover_por_destino(entrada["pares"])
+        if tipo == "renombrar":
+            actual, otro = (entrada["despues"], entrada["antes"]) if deshacer else (entrada["antes"], entrada["despues"])
+            return self.renombrar_nodo(f"{entrada['carpeta']}/{actual}", otro)
+        if tipo == "modificar":
+            return self.modificar_contenido(entrada["ruta"], entrada["antes"] if deshacer else entrada["despues"])
+        if tipo == "eliminar":
+            if deshacer:
+                for id_elemento in reversed(entrada["ids"]):
+                    if id_elemento not in self.papelera:
+                        return False, "Lo borrado ya salió de la papelera (retención o empty)."
+                    ok, msg = self.restaurar_nodo(id_elemento)
+                    if not ok: return False, msg
+                return True, f"{len(entrada['ids'])} elemento(s) restaurados"
+            ok, msg = self.eliminar_varios(entrada["rutas"])
+            if ok:
+                entrada["ids"] = [self.papelera.buscar_por_ruta(r)["id"] for r in entrada["rutas"]]
+            return ok, msg
+        if tipo == "restaurar":
+            if deshacer:
+                return self.eliminar_nodo(entrada["ruta"])
+            return self.restaurar_nodo(entrada["ruta"])
+        return False, f"Entrada desconocida: {tipo}"
+
+    def _recorrer_historial(self, desde, hacia, deshacer):
+        if not desde: return False, f"No hay nada para {'deshacer' if deshacer else 'rehacer'}."
+        entrada = desde.pop()
+        self.historial.pausado = True
+        try:
+            ok, msg = self._aplicar_historial(entrada, deshacer)
+        finally:
+            self.historial.pausado = False
+        if ok:
+            hacia.append(entrada)
+        else:
+            # El árbol ya no coincide con lo que esperan las entradas que quedan
+            self.historial.olvidar()
+            msg += " (historial descartado)"
+        return ok, f"{'Deshecho' if deshacer else 'Rehecho'} {entrada['tipo']}: {msg}"
+
+    @_operacion
+    def deshacer(self):
+        return self._recorrer_historial(self.historial.deshacer, self.historial.rehacer, True)
+
+    @_operacion
+    def rehacer(self):
+        return self._recorrer_historial(self.historial.rehacer, self.historial.deshacer, False)
+
+    def ver_historial(self, cantidad=10):
+        h = self.historial
+        salida = [f"{len(h.deshacer)} para deshacer (límite {h.limite}), {len(h.rehacer)} para rehacer"]
+        for entrada in list(h.deshacer)[-cantidad:][::-1]:
+            detalle = entrada.get("ruta") or entrada.get("carpeta") or f"{len(entrada.get('pares') or entrada.get('rutas'))} elemento(s)"
+            salida.append(f"  └─ {entrada['tipo']} {detalle}")
+        return "\n".join(salida)
+
+    # --- PERSISTENCIA ---
+
+    def guardar_arbol(self, nombre_archivo=None, compresion=None, umbral_fragmento=1000):
+        """`compresion` puede ser "gzip" o "lzma"; por defecto se deduce de la extensión (.gz/.xz).
+
+        Si `nombre_archivo` es un directorio (o termina en '/'), se guarda fragmentado:
+        un manifiesto y un archivo por cada subárbol de `umbral_fragmento` nodos o más.
+        Con extensión .db/.sqlite se exporta a una base SQLite (que se abre con `load`).
+        Sin nombre se guarda en ./root/mi_filesystem.json, salvo que el árbol viva en una
+        base: ahí cada operación ya quedó escrita y solo se confirma lo pendiente.
+        """
+        try:
+            if nombre_archivo is None:
+                if self._sqlite:
+                    self._sqlite.confirmar()
+                    return True, f"Base SQLite al día: {self._sqlite.ruta}"
+                nombre_archivo = "./root/mi_filesystem.json"
+            if nombre_archivo.lower().endswith(_EXTENSIONES_SQLITE):
+                if self._sqlite and os.path.exists(nombre_archivo) and os.path.samefile(self._sqlite.ruta, nombre_archivo):
+                    self._sqlite.confirmar()
+                    return True, f"Base SQLite al día: {nombre_archivo}"
+                escritos = AlmacenSQLite.exportar(self.root, self.papelera, nombre_archivo)
+                return True, f"Exportado a la base SQLite {nombre_archivo} ({escritos} nodos)"
+            if os.path.isdir(nombre_archivo) or nombre_archivo.endswith(("/", os.sep)):
+                # Los stubs sin cargar solo se reutilizan si el destino es el mismo directorio
+                origen = self._fragmentos if isinstance(self._fragmentos, AlmacenFragmentado) else None
+                if origen and not (os.path.isdir(nombre_archivo) and os.path.samefile(origen.directorio, nombre_archivo)):
+                    origen = None
+                escritos = AlmacenFragmentado.guardar(self.root, self.papelera, nombre_archivo, umbral_fragmento, origen)
+                return True, f"Guardado fragmentado en {nombre_archivo} ({escritos} fragmentos escritos)"
+            _guardar_estado_atomico(self.root, self.papelera, nombre_archivo, compresion)
+            return True, f"Guardado correctamente en {nombre_archivo}"
+        except Exception as e: return False, str(e)
+
+    def exportar_mapeado(self, nombre_archivo="./root/mi_filesystem.fsmap"):
+        """Escribe una instantánea binaria de solo lectura para abrir con `ArbolMapeado`."""
+        try:
+            _escribir_archivo_atomico(nombre_archivo, lambda f: ArbolMapeado.escribir(f, self.root), binario=True)
+            return True, f"Instantánea de solo lectura exportada a '{nombre_archivo}'"
+        except Exception as e:
+            return False, f"Error al exportar: {str(e)}"
+
+    def configurar_compresion(self, umbral, algoritmo="zlib"):
+        """Comprime los contenidos nuevos de `umbral` bytes o más (None = no comprimir)."""
+        if algoritmo not in _COMPRESORES: return False, f"Algoritmo desconocido: {algoritmo}"
+        self.almacen.umbral_compresion = umbral
+        self.almacen.algoritmo = algoritmo
+        if umbral is None: return True, "Compresión de contenidos desactivada."
+        return True, f"Contenidos de {umbral} bytes o más se comprimen con {algoritmo}."
+
+    def cargar_arbol(self, nombre_archivo="./root/mi_filesystem.json", procesos=1, diferir_indices=False):
+        """Carga un guardado y reconstruye los índices; con `procesos` > 1 el Trie se arma
+        repartido en un pool de procesos (ver `_indexar_en_paralelo`). Con `diferir_indices`
+        vuelve apenas el árbol está en memoria y los índices se arman al usarse."""
+        if not os.path.exists(nombre_archivo): return False, "No encuentro el archivo de guardado."
+        try:
+            if os.path.isfile(nombre_archivo) and _es_base_sqlite(nombre_archivo):
+                return self._abrir_sqlite(nombre_archivo, diferir_indices)
+            fragmentos = None
+            if os.path.isdir(nombre_archivo):
+                fragmentos = AlmacenFragmentado(self, nombre_archivo)
+                abrir = lambda: fragmentos.abrir(AlmacenFragmentado.MANIFIESTO)
+            else:
+                abrir = lambda: _abrir_guardado(nombre_archivo)
+            with abrir() as f, _sin_gc():
+                data = json.load(f)
+                if "filesystem" in data:
+                    root_data, trash_data = data["filesystem"], data.get("trash", [])
+                else: root_data, trash_data = data, []
+
+                blobs = data.get("blobs", {})
+                self._soltar_sqlite()
+                self.almacen = AlmacenContenido(self.almacen.umbral_compresion, self.almacen.algoritmo)
+                self.root = Nodo.from_dict(root_data, self.almacen, blobs, fragmentos)
+                self._fragmentos = fragmentos
+                self._clones.descartar()
+                self.historial.olvidar()
+                self._etiquetas_ok = False
+                self._invalidar_rutas()
+                self._cambios += 1
+                ahora = time.time()
+                elementos = []
+                for i, item in enumerate(trash_data):
+                    nodo = Nodo.from_dict(item["nodo"], self.almacen, blobs)
+                    elementos.append({
+                        "id": item.get("id", i),
+                        "path_origen": item["path_origen"],
+                        "path_padre": item["path_padre"],
+                        "nodo": nodo,
+                        "fecha": item.get("fecha", ahora),
+                        "bytes": Papelera._bytes_subarbol(nodo),
+                    })
+                self.papelera.reemplazar(elementos)
+                # Reconstruir índices
+                self._reiniciar_indices(diferir_indices)
+                if diferir_indices:
+                    pass  # Los arma `_indice` en el primer uso (o un ConstructorIndices)
+                elif procesos > 1:
+                    self._indexar_en_paralelo(procesos)
+                else:
+                    self._indexar_trie_recursivamente(self.root)
+                if fragmentos:
+                    fragmentos.registrar(self.root, "root")
+            self.ajustar_memoria()
+            return True, "Sistema cargado correctamente."
+        except Exception as e: return False, str(e)
+
+    def _abrir_sqlite(self, nombre_archivo, diferir_indices=False):
+        """`load` de una base SQLite: se leen la raíz, sus hijos y la papelera, y el resto
+        llega carpeta por carpeta (ver AlmacenSQLite). Desde ahí cada operación se escribe
+        en la base con su propia transacción (ver EspejoSQLite)."""
+        self._soltar_sqlite()
+        self.almacen = AlmacenContenido(self.almacen.umbral_compresion, self.almacen.algoritmo)
+        motor = AlmacenSQLite(self, nombre_archivo)
+        try:
+            self.root, elementos = motor.abrir()
+        except Exception:
+            motor.cerrar()
+            raise
+        self._fragmentos = self._sqlite = motor
+        self._clones.descartar()
+        self.historial.olvidar()
+        self._etiquetas_ok = False
+        self._invalidar_rutas()
+        self._cambios += 1
+        self.papelera.reemplazar(elementos)
+        self._reiniciar_indices(diferir_indices)
+        if not diferir_indices:
+            self._indexar_trie_recursivamente(self.root)
+        self.registrar_indice(EspejoSQLite(self, motor))
+        self.ajustar_memoria()
+        return True, f"Base SQLite abierta: {nombre_archivo} ({len(self.root.hijos)} entradas en root, el resto se carga al entrar)"
+
+    def _soltar_sqlite(self):
+        """Deja de escribir en la base abierta (antes de cargar otro árbol encima)."""
+        if self._sqlite is None: return
+        self.indices.pop(EspejoSQLite.nombre, None)
+        self._suscribir()
+        self._sqlite.cerrar()
+        self._sqlite = self._fragmentos = None
+
+    # --- PRESUPUESTO DE MEMORIA ---
+
+    def configurar_memoria(self, limite_bytes):
+        """Fija cuánta memoria puede ocupar el árbol vivo (None = sin límite). Pasado el
+        límite, los subárboles que hace más tiempo no se usan bajan a disco y vuelven solos
+        cuando alguien entra (ver Desalojador)."""
+        if limite_bytes is None:
+            if self._desalojo is None: return True, "El árbol no tiene límite de memoria."
+            self._desalojo.materializar("root")
+            self.indices.pop(Desalojador.nombre, None)
+            self._suscribir()
+            self._desalojo.cerrar()
+            self._desalojo = None
+            return True, "Sin límite de memoria: todo el árbol volvió a memoria."
+        if limite_bytes <= 0: return False, "El límite de memoria tiene que ser positivo."
+        if self._desalojo is None:
+            self._desalojo = Desalojador(self, limite_bytes)
+            self.registrar_indice(self._desalojo)
+        self._desalojo.limite = limite_bytes
+        self.ajustar_memoria()
+        aviso = self._desalojo.aviso()
+        return True, f"Límite de memoria: {limite_bytes / 2**20:.1f} MB" + (f" (⚠️ {aviso})" if aviso else "")
+
+    def ajustar_memoria(self):
+        """Desaloja lo más frío si el árbol pasó su límite. Se hace solo al terminar cada
+        operación; la consola lo pide además antes de cada comando (las lecturas recargan
+        stubs sin desalojar, para no soltar nodos que alguien todavía recorre)."""
+        if self._desalojo is None or self._operaciones_abiertas: return 0
+        return self._desalojo.ajustar()
+
+    def estado_memoria(self):
+        """{limite, uso, nodos, desalojados, desalojos, recargas, archivo, aviso} o None sin límite."""
+        return self._desalojo.estado() if self._desalojo is not None else None
+
+
+    # --- INSTANTÁNEAS (copy-on-write) ---
+
+    def _congelar(self):
+        """Congela los nodos existentes (las mutaciones pasan a copiar) y devuelve la época."""
+        epoca = self._epoca
+        self._instantaneas_vivas[epoca] = self._instantaneas_vivas.get(epoca, 0) + 1
+        self._epoca_congelada = epoca
+        self._epoca += 1
+        return epoca
+
+    def _descongelar(self, epoca):
+        restantes = self._instantaneas_vivas.get(epoca, 0) - 1
+        if restantes > 0:
+            self._instantaneas_vivas[epoca] = restantes
+        else:
+            self._instantaneas_vivas.pop(epoca, None)
+        self._epoca_congelada = max(self._instantaneas_vivas, default=-1)
+
+    def tomar_instantanea(self):
+        """Congela el estado actual en O(1): desde aquí las mutaciones copian en vez de modificar."""
+        inst = Instantanea(self.root, self.papelera.vista(), self._epoca, self._cambios)
+        self._congelar()
+        return inst
+
+    def liberar_instantanea(self, inst):
+        """Suelta una instantánea; si no queda ninguna viva se deja de copiar."""
+        self._descongelar(inst.epoca)
+
+    # --- VERSIONES (historia persistente con path copying) ---
+
+    def crear_version(self, etiqueta=""):
+        """Guarda el estado actual como versión. Cuesta O(1); cada cambio posterior copia solo su camino."""
+        inst = self.tomar_instantanea()
+        inst.etiqueta = etiqueta
+        self.versiones.append(inst)
+        return True, f"Versión {len(self.versiones) - 1} creada."
+
+    def ver_versiones(self):
+        if not self.versiones: return "No hay versiones guardadas."
+        salida = []
+        for idx, inst in enumerate(self.versiones):
+            etiqueta = f" - {inst.etiqueta}" if inst.etiqueta else ""
+            salida.append(f"[{idx}] {inst.fecha}{etiqueta}")
+        return "\n".join(salida)
+
+    def _raiz_version(self, version):
+        """'actual' es el árbol vivo; un número es una versión guardada."""
+        if str(version).lower() == "actual":
+            return self.root
+        try:
+            idx = int(version)
+        except ValueError:
+            return None
+        if idx < 0 or idx >= len(self.versiones): return None
+        return self.versiones[idx].root
+
+    def diferencias_versiones(self, v1, v2):
+        raiz_a, raiz_b = self._raiz_version(v1), self._raiz_version(v2)
+        if raiz_a is None or raiz_b is None: return False, "Versión inválida."
+        return True, comparar_arboles(raiz_a, raiz_b)
+
+    @_operacion
+    def checkout_version(self, version):
+        """Vuelve el árbol vivo a una versión. Los índices solo se tocan en lo que cambió."""
+        raiz = self._raiz_version(version)
+        if raiz is None or str(version).lower() == "actual": return False, "Versión inválida."
+        inst = self.versiones[int(version)]
+        self._materializar_bajo("root")
+        self._expandir_clones()
+        # El árbol vivo pasa a compartir los nodos de la versión, que ya están
+        # congelados: cualquier cambio posterior los copia y la versión no se altera.
+        quitar, poner = [], []
+        self._sincronizar_indices(self.root, inst.root, quitar, poner)
+        # Primero se quita y después se pone: un nodo movido sale de un lado y entra en otro
+        for nodo, subarbol in quitar:
+            if subarbol: self._desindexar_subarbol(nodo)
+            else: self._avisar("al_quitar", nodo)
+        for nodo, subarbol in poner:
+            if subarbol: self._indexar_trie_recursivamente(nodo)
+            else: self._avisar("al_crear", nodo)
+        self.root = inst.root
+        self._avisar("al_cambiar_version")
+        self._etiquetas_ok = False
+        self._invalidar_rutas()
+        # La papelera cambia entera; se ajustan las referencias del almacén
+        nueva = list(inst.papelera)
+        ids_nueva = {id(item) for item in nueva}
+        ids_vieja = {id(item) for item in self.papelera}
+        for item in self.papelera:
+            if id(item) not in ids_nueva: self.almacen.contar_subarbol(item["nodo"], adquirir=False)
+        for item in nueva:
+            if id(item) not in ids_vieja: self.almacen.contar_subarbol(item["nodo"])
+        self.papelera.reemplazar(nueva)
+        self.historial.olvidar()
+        self._cambios += 1
+        return True, f"Árbol en la versión {version} (los cambios sin versionar se descartaron)."
+
+    def _sincronizar_indices(self, a, b, quitar, poner):
+        """Anota qué sale (`quitar`) y qué entra (`poner`) a los índices al pasar del subárbol
+        `a` al `b`, como (nodo, es_subárbol), saltando lo compartido. El almacén se ajusta aquí."""
+        if a is b:
+            return
+        if a is not self.root:
+            quitar.append((a, False))
+            poner.append((b, False))
+        if a._contenido is not b._contenido:
+            self.almacen.soltar(a._contenido)
+            if isinstance(b._contenido, Blob): self.almacen.adquirir_blob(b._contenido)
+        hijos_a = {h.id: h for h in a.hijos}
+        ids_b = set()
+        for hijo in b.hijos:
+            ids_b.add(hijo.id)
+            previo = hijos_a.get(hijo.id)
+            if previo is None:
+                poner.append((hijo, True))
+                self.almacen.contar_subarbol(hijo)
+            else:
+                self._sincronizar_indices(previo, hijo, quitar, poner)
+        for hijo in a.hijos:
+            if hijo.id not in ids_b:
+                quitar.append((hijo, True))
+                self.almacen.contar_subarbol(hijo, adquirir=False)
+
+    def _desindexar_subarbol(self, nodo, diferidos=None):
+        pila = [nodo]
+        while pila:
+            actual = pila.pop()
+            if actual is not self.root:
+                self._avisar("al_quitar", actual, diferidos)
+            pila.extend(actual._hijos or ())
+
+    # --- DIFF Y MERGE ENTRE GUARDADOS ---
+
+    def diferencias_archivos(self, archivo_a, archivo_b):
+        """Compara dos guardados JSON usando los hashes Merkle guardados en cada nodo."""
+        try:
+            return True, comparar_arboles(_leer_vista(archivo_a), _leer_vista(archivo_b))
+        except (OSError, ValueError, KeyError) as e:
+            return False, f"No pude leer los guardados: {e}"
+
+    @_operacion
+    def fusionar_archivos(self, archivo_a, archivo_b):
+        """Aplica al árbol actual los cambios que llevan del guardado A al B.
+
+        Los nodos se ubican por id, así que el árbol actual puede tener sus propios
+        cambios; lo que no encaja se reporta como conflicto. Los eliminados van a
+        la papelera, como un `rm` normal.
+        """
+        try:
+            cambios = _diferencias(_leer_vista(archivo_a), _leer_vista(archivo_b))
+        except (OSError, ValueError, KeyError) as e:
+            return False, f"No pude leer los guardados: {e}"
+        if not cambios: return True, "Sin diferencias: no hay nada que fusionar."
+
+        padre_de, nombre_de = {}, {}
+        pila = [(self.root, None)]
+        while pila:
+            nodo, padre = pila.pop()
+            padre_de[nodo.id], nombre_de[nodo.id] = padre, nodo.nombre
+            pila.extend((hijo, nodo.id) for hijo in nodo.hijos)
+
+        def ruta_de(id_nodo):
+            if id_nodo not in nombre_de: return None
+            partes = []
+            while id_nodo is not None:
+                partes.append(nombre_de[id_nodo])
+                id_nodo = padre_de[id_nodo]
+            return "/".join(reversed(partes))
+
+        aplicados, conflictos = 0, []
+        movidos = {c["nodo_b"].id for c in cambios if c["tipo"] == "movido"}
+        orden = ["creado", "movido", "renombrado", "modificado", "eliminado"]
+        for cambio in sorted(cambios, key=lambda c: orden.index(c["tipo"])):
+            tipo, nodo_a, nodo_b = cambio["tipo"], cambio["nodo_a"], cambio["nodo_b"]
+            ok, msg = False, "el nodo ya no existe en el árbol actual"
+            if tipo == "creado":
+                ruta_padre = ruta_de(cambio["padre_b"].id)
+                if ruta_padre:
+                    nuevo = nodo_b.a_nodo(excluir=movidos)
+                    ok, msg = self._insertar_subarbol(ruta_padre, nuevo)
+                    if ok:
+                        pila = [(nuevo, cambio["padre_b"].id)]
+                        while pila:
+                            nodo, padre = pila.pop()
+                            padre_de[nodo.id], nombre_de[nodo.id] = padre, nodo.nombre
+                            pila.extend((hijo, nodo.id) for hijo in nodo.hijos)
+            elif tipo == "movido":
+                ruta, ruta_padre = ruta_de(nodo_a.id), ruta_de(cambio["padre_b"].id)
+                if ruta and ruta_padre:
+                    ok, msg = self.mover_nodo(ruta, ruta_padre)
+                    if ok: padre_de[nodo_a.id] = cambio["padre_b"].id
+            elif tipo == "renombrado":
+                ruta = ruta_de(nodo_a.id)
+                if ruta:
+                    ok, msg = self.renombrar_nodo(ruta, nodo_b.nombre)
+                    if ok: nombre_de[nodo_a.id] = nodo_b.nombre
+            elif tipo == "modificado":
+                ruta = ruta_de(nodo_a.id)
+                if ruta: ok, msg = self.modificar_contenido(ruta, nodo_b.contenido)
+            elif tipo == "eliminado":
+                ruta = ruta_de(nodo_a.id)
+                if ruta: ok, msg = self.eliminar_nodo(ruta)
+            if ok:
+                aplicados += 1
+            else:
+                conflictos.append(f"{tipo} {cambio['ruta_a'] or cambio['ruta_b']}: {msg}")
+
+        # Los subárboles insertados no pasan por el historial: lo anterior ya no se puede deshacer
+        self.historial.olvidar()
+        resumen = f"Fusionados {aplicados} de {len(cambios)} cambios."
+        if conflictos:
+            resumen += "\nConflictos:\n" + "\n".join(f"  └─ {c}" for c in conflictos)
+        return not conflictos, resumen
+
+# --- SERIALIZACIÓN POR STREAMING ---
+# Produce exactamente lo mismo que json.dump(data, f, indent=4) sobre
+# {"filesystem": ..., "trash": [...]}, pero sin armar el diccionario gigante:
+# con 10^6 nodos esos millones de dicts disparan pausas largas del GC.
+
+_TROZO_ESCRITURA = 8192  # piezas acumuladas antes de escribir al archivo
+
+def _json_nodo(partes, f, nodo, ind, blobs, corte=None, extra=None):
+    """Escribe un nodo. `corte(hijo)` puede devolver campos extra para escribir ese
+    hijo como stub (sin hijos); `extra` son esos campos para este nodo."""
+    interior = ind + "    "
+    if isinstance(nodo._contenido, Blob):
+        blobs[nodo._contenido.hash] = nodo._contenido
+    partes.append("{")
+    for clave, valor in nodo.datos_propios().items():
+        partes.append(f"\n{interior}\"{clave}\": {json.dumps(valor)},")
+    if extra:
+        for clave, valor in extra.items():
+            partes.append(f"\n{interior}\"{clave}\": {json.dumps(valor)},")
+        partes.append(f"\n{interior}\"children\": []\n{ind}}}")
+        return
+    hijos = nodo.hijos_sin_cargar()
+    if not hijos:
+        partes.append(f"\n{interior}\"children\": []\n{ind}}}")
+        return
+    sangria_hijo = interior + "    "
+    partes.append(f"\n{interior}\"children\": [")
+    primero = True
+    for hijo in hijos:
+        partes.append(f"\n{sangria_hijo}" if primero else f",\n{sangria_hijo}")
+        primero = False
+        _json_nodo(partes, f, hijo, sangria_hijo, blobs, corte, corte(hijo) if corte else None)
+    partes.append(f"\n{interior}]\n{ind}}}")
+    if len(partes) > _TROZO_ESCRITURA:
+        f.write("".join(partes))
+        partes.clear()
+
+def _escribir_estado_json(f, root, papelera, corte=None):
+    # Los blobs se juntan mientras se recorre: así el guardado de una instantánea
+    # no toca el almacén vivo (que la consola sigue modificando).
+    blobs = {}
+    partes = ['{\n    "filesystem": ']
+    _json_nodo(partes, f, root, "    ", blobs, corte)
+    if not papelera:
+        partes.append(',\n    "trash": []')
+    else:
+        partes.append(',\n    "trash": [')
+        for i, item in enumerate(papelera):
+            partes.append(f"{',' if i else ''}\n        {{")
+            partes.append(f'\n            "path_origen": {json.dumps(item["path_origen"])},')
+            partes.append(f'\n            "path_padre": {json.dumps(item["path_padre"])},')
+            if "id" in item:
+                partes.append(f'\n            "id": {item["id"]},\n            "fecha": {json.dumps(item["fecha"])},')
+            partes.append('\n            "nodo": ')
+            _json_nodo(partes, f, item["nodo"], "            ", blobs)
+            partes.append("\n        }")
+        partes.append("\n    ]")
+    if not blobs:
+        partes.append(',\n    "blobs": {}\n}')
+    else:
+        partes.append(',\n    "blobs": {')
+        partes.append(",".join(f"\n        {json.dumps(clave)}: {json.dumps(blob.valor())}" for clave, blob in blobs.items()))
+        partes.append("\n    }\n}")
+    f.write("".join(partes))
+
+def _escribir_archivo_atomico(nombre_archivo, escribir, binario=False):
+    """Llama a `escribir(f)` sobre un temporal (de texto, o binario) y lo renombra al terminar."""
+    directorio = os.path.dirname(nombre_archivo) or "."
+    fd, temporal = tempfile.mkstemp(prefix=".guardando_", suffix=".tmp", dir=directorio)
+    try:
+        with (os.fdopen(fd, 'wb') if binario else os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, nombre_archivo)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def _compresion_por_extension(nombre_archivo):
+    if nombre_archivo.endswith(".gz"): return "gzip"
+    if nombre_archivo.endswith(".xz"): return "lzma"
+    return None
+
+def _guardar_estado_atomico(root, papelera, nombre_archivo, compresion=None):
+    """Escribe en un temporal del mismo directorio y lo renombra: nunca queda un JSON a medias.
+
+    Con compresión, los trozos del JSON pasan directo por el compresor a medida
+    que se generan; nunca existe el texto completo sin comprimir en memoria.
+    """
+    if compresion is None:
+        compresion = _compresion_por_extension(nombre_archivo)
+    directorio = os.path.dirname(nombre_archivo) or "."
+    os.makedirs(directorio, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(prefix=".guardando_", suffix=".tmp", dir=directorio)
+    try:
+        with os.fdopen(fd, 'wb') as crudo:
+            if compresion == "gzip":
+                comprimido = gzip.GzipFile(fileobj=crudo, mode='wb', compresslevel=6, mtime=0)
+            elif compresion == "lzma":
+                comprimido = lzma.LZMAFile(crudo, 'wb', preset=6)
+            elif compresion is None:
+                comprimido = None
+            else:
+                raise ValueError(f"Compresión desconocida: {compresion}")
+            with io.TextIOWrapper(comprimido or crudo, encoding='utf-8') as f:
+                _escribir_estado_json(f, root, papelera)
+                f.flush()
+                if comprimido: comprimido.close()
+                crudo.flush()
+                os.fsync(crudo.fileno())
+        os.replace(temporal, nombre_archivo)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+# --- GUARDADO FRAGMENTADO (carga perezosa por subárbol) ---
+
+class AlmacenFragmentado:
+    """Guardado en un directorio: `manifest.json` con los niveles de arriba y un
+    archivo por cada subárbol grande, que se lee la primera vez que alguien entra.
+
+    Cada fragmento trae un resumen aparte (`*.idx.json`, {nombre: [rutas relativas]})
+    para que `find`/`search` cubran lo que todavía no se cargó sin cargarlo.
+    """
+    MANIFIESTO = "manifest.json"
+    descripcion = "Fragmentos sin cargar"
+    sigue_al_arbol = False  # Cada stub recuerda su ruta: mover lo que cuelga obliga a cargarlo
+
+    def __init__(self, arbol, directorio):
+        self.arbol = arbol
+        self.directorio = directorio
+        self.pendientes = {}    # {id del stub: {"nodo", "ruta", "resumen"}}
+        self.conocidos = set()  # Fragmentos referenciados por lo que ya leímos
+        self.cargados = 0
+
+    def abrir(self, archivo):
+        return _abrir_guardado(os.path.join(self.directorio, archivo))
+
+    def _leer(self, archivo):
+        with self.abrir(archivo) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _archivo_resumen(fragmento):
+        return fragmento[:-len(".json")] + ".idx.json"
+
+    def leer_hijos(self, stub):
+        """Lee los hijos de un stub sin engancharlos ni indexarlos."""
+        data = self._leer(stub._fragmento)
+        blobs = data.get("blobs", {})
+        return [Nodo.from_dict(h, None, blobs, self) for h in data["filesystem"]["children"]]
+
+    def cargar_hijos(self, stub):
+        """Trae un fragmento al árbol vivo: engancha los hijos y los indexa."""
+        data = self._leer(stub._fragmento)
+        blobs = data.get("blobs", {})
+        hijos = [Nodo.from_dict(h, self.arbol.almacen, blobs, self) for h in data["filesystem"]["children"]]
+        stub._hijos = hijos
+        self.arbol._etiquetas_ok = False
+        self.cargados += 1
+        entrada = self.pendientes.pop(stub.id, None)
+        if entrada is not None:
+            for hijo in hijos:
+                self.arbol._indexar_trie_recursivamente(hijo)
+            self.registrar(stub, entrada["ruta"])
+        return hijos
+
+    def registrar(self, nodo, ruta):
+        """Anota como pendientes los stubs sin cargar que cuelgan de `nodo`."""
+        pila = [(nodo, ruta)]
+        while pila:
+            actual, ruta_actual = pila.pop()
+            for hijo in actual._hijos or ():
+                ruta_hijo = f"{ruta_actual}/{hijo.nombre}"
+                if hijo._hijos is None:
+                    self.pendientes[hijo.id] = {"nodo": hijo, "ruta": ruta_hijo, "resumen": None}
+                    self.conocidos.add(hijo._fragmento)
+                else:
+                    pila.append((hijo, ruta_hijo))
+
+    def materializar(self, ruta):
+        """Carga todos los fragmentos pendientes en `ruta` o debajo (incluidos los anidados)."""
+        prefijo = ruta + "/"
+        while True:
+            afectados = [e["nodo"] for e in self.pendientes.values()
+                         if ruta == "root" or e["ruta"] == ruta or e["ruta"].startswith(prefijo)]
+            if not afectados:
+                return
+            for stub in afectados:
+                stub.hijos
+
+    def _casan(self, entrada, predicados):
+        """Rutas del resumen de un fragmento que cumplen los predicados de nombre y los
+        `under`, sin leer el fragmento."""
+        nombres, _ = self._resumen(entrada)
+        acepta = _filtro_de_nombres(predicados)
+        dentro, _ = _alcance_de_under(predicados)
+        exactos = [valor for campo, valor in predicados if campo == "name"]
+        if exactos:
+            elegidos = [(exactos[0], nombres.get(exactos[0], ()))]
+        else:
+            elegidos = nombres.items()
+        for nombre, relativas in elegidos:
+            if acepta is None or acepta(nombre):
+                for rel in relativas:
+                    ruta = f"{entrada['ruta']}/{rel}"
+                    if dentro is None or dentro(ruta):
+                        yield ruta
+
+    def recorrer(self, base, predicados=()):
+        """(ruta, nodo) de lo que cuelga de los stubs pendientes en `base` o debajo, leído
+        sin cargarlo. Aplica los predicados de nombre, tipo y `under`: los fragmentos cuyo
+        resumen no tiene nada que case no se leen, y adentro solo se baja hacia el `under`."""
+        acepta = _filtro_nombre_y_tipo(self.arbol, predicados)
+        dentro, hacia = _alcance_de_under(predicados)
+        podar = any(campo in ("name", "prefix", "glob", "under") for campo, _ in predicados)
+        for stub in _stubs_bajo(self.arbol, [e["nodo"] for e in self.pendientes.values()], base):
+            entrada = self.pendientes[stub.id]
+            if podar and next(self._casan(entrada, predicados), None) is None:
+                continue
+            yield from _recorrer_sin_cargar(stub, entrada["ruta"], acepta, dentro, hacia)
+
+    def estimar(self, base, predicados=()):
+        """Lo que dice el resumen de cada fragmento del alcance (el tipo no está ahí)."""
+        stubs = _stubs_bajo(self.arbol, [e["nodo"] for e in self.pendientes.values()], base)
+        return sum(1 for stub in stubs for _ in self._casan(self.pendientes[stub.id], predicados))
+
+    def _resumen(self, entrada):
+        if entrada["resumen"] is None:
+            nombres = self._leer(self._archivo_resumen(entrada["nodo"]._fragmento))["nombres"]
+            entrada["resumen"] = (nombres, sorted((n.lower(), n) for n in nombres))
+        return entrada["resumen"]
+
+    def buscar_exacto(self, nombre):
+        rutas = []
+        for entrada in self.pendientes.values():
+            nombres, _ = self._resumen(entrada)
+            rutas.extend(f"{entrada['ruta']}/{rel}" for rel in nombres.get(nombre, ()))
+        return rutas
+
+    def buscar_patron(self, regex):
+        rutas = []
+        for entrada in self.pendientes.values():
+            nombres, _ = self._resumen(entrada)
+            for nombre, relativas in nombres.items():
+                if regex.match(nombre):
+                    rutas.extend(f"{entrada['ruta']}/{rel}" for rel in relativas)
+        return rutas
+
+    def buscar_prefijo(self, prefijo):
+        prefijo = prefijo.lower()
+        encontrados = set()
+        for entrada in self.pendientes.values():
+            _, ordenados = self._resumen(entrada)
+            i = bisect.bisect_left(ordenados, (prefijo,))
+            while i < len(ordenados) and ordenados[i][0].startswith(prefijo):
+                encontrados.add(ordenados[i][1])
+                i += 1
+        return encontrados
+
+    # --- escritura ---
+
+    @classmethod
+    def guardar(cls, root, papelera, directorio, umbral, origen=None):
+        """Escribe el árbol fragmentado. Devuelve cuántos fragmentos se escribieron.
+
+        Con `origen` (el almacén del que se cargó, mismo directorio), los stubs que
+        nunca se cargaron se conservan tal cual sin leerlos. Los archivos llevan la
+        generación en el nombre y el manifiesto se reemplaza al final: si el guardado
+        se corta, el manifiesto viejo sigue apuntando a fragmentos completos.
+        """
+        os.makedirs(directorio, exist_ok=True)
+        generacion = f"{time.time_ns():x}"
+        referenciados = set()
+        tamanos = {}
+        escritos = [0]
+
+        def conservado(nodo):
+            return origen is not None and nodo._hijos is None and nodo._tamano_fragmento is not None
+
+        def tamano(nodo):
+            clave = id(nodo)
+            if clave not in tamanos:
+                if conservado(nodo):
+                    tamanos[clave] = nodo._tamano_fragmento
+                else:
+                    tamanos[clave] = 1 + sum(tamano(h) for h in nodo.hijos_sin_cargar())
+            return tamanos[clave]
+
+        def nombres_de(nodo):
+            """{nombre: [rutas relativas a `nodo`]} de todo su subárbol."""
+            nombres = {}
+            pila = [(h, h.nombre) for h in nodo.hijos_sin_cargar()] if not conservado(nodo) else []
+            if conservado(nodo):
+                with origen.abrir(cls._archivo_resumen(nodo._fragmento)) as f:
+                    return json.load(f)["nombres"]
+            while pila:
+                actual, rel = pila.pop()
+                nombres.setdefault(actual.nombre, []).append(rel)
+                if conservado(actual):
+                    for nombre, rutas in nombres_de(actual).items():
+                        nombres.setdefault(nombre, []).extend(f"{rel}/{r}" for r in rutas)
+                else:
+                    pila.extend((h, f"{rel}/{h.nombre}") for h in actual.hijos_sin_cargar())
+            return nombres
+
+        def corte(nodo):
+            if conservado(nodo):
+                referenciados.add(nodo._fragmento)
+                return {"shard": nodo._fragmento, "size": nodo._tamano_fragmento}
+            if nodo.tipo_nodo != "folder" or tamano(nodo) < umbral:
+                return None
+            archivo = f"fragmento_{nodo.id}_{generacion}.json"
+            _escribir_archivo_atomico(os.path.join(directorio, archivo),
+                                      lambda f: _escribir_estado_json(f, nodo, [], corte))
+            _escribir_archivo_atomico(os.path.join(directorio, cls._archivo_resumen(archivo)),
+                                      lambda f: json.dump({"nombres": nombres_de(nodo)}, f))
+            referenciados.add(archivo)
+            escritos[0] += 1
+            return {"shard": archivo, "size": tamano(nodo)}
+
+        _escribir_archivo_atomico(os.path.join(directorio, cls.MANIFIESTO),
+                                  lambda f: _escribir_estado_json(f, root, papelera, corte))
+        if origen is not None:
+            for archivo in origen.conocidos - referenciados:
+                for ruta in (archivo, cls._archivo_resumen(archivo)):
+                    if os.path.exists(os.path.join(directorio, ruta)):
+                        os.remove(os.path.join(directorio, ruta))
+            origen.conocidos = referenciados
+        return escritos[0]
+
+
+# --- MOTOR SQLITE (el árbol vive en una base; carga perezosa por carpeta) ---
+
+_EXTENSIONES_SQLITE = (".db", ".sqlite", ".sqlite3")
+
+def _es_base_sqlite(nombre_archivo):
+    """True si el archivo es una base SQLite (por sus bytes mágicos, o por la extensión si aún no existe)."""
+    if os.path.isfile(nombre_archivo):
+        with open(nombre_archivo, 'rb') as f:
+            return f.read(16) == b"SQLite format 3\x00"
+    return nombre_archivo.lower().endswith(_EXTENSIONES_SQLITE)
+
+def _materializar_stubs(arbol, pendientes, ruta):
+    """Carga los stubs de `pendientes` ({id: stub}) que están en `ruta` o debajo, incluidos
+    los que aparecen al cargar. Para almacenes cuyos stubs sacan la ruta del árbol."""
+    if ruta == "root":
+        pila = list(pendientes.values())
+    else:
+        base, _ = arbol._buscar_nodo_y_padre(ruta)
+        if base is None: return
+        pila = [base] if base._hijos is None else [s for s in pendientes.values() if arbol.es_ancestro(base, s)]
+    while pila:
+        stub = pila.pop()
+        if stub._hijos is None:
+            pila.extend(h for h in stub.hijos if h._hijos is None)
+
+def _stubs_bajo(arbol, stubs, base):
+    """Los stubs (nodos del árbol vivo) que son `base` o cuelgan de ella."""
+    if base is arbol.root: return list(stubs)
+    return [s for s in stubs if s is base or arbol.es_ancestro(base, s)]
+
+def _recorrer_sin_cargar(nodo, ruta, acepta=None, dentro=None, hacia=None):
+    """(ruta, nodo) de todo lo que cuelga de `nodo`, leído con `hijos_sin_cargar` (sin
+    engancharlo al árbol ni indexarlo). Con `acepta` y `dentro` (ver `_alcance_de_under`)
+    solo sale lo que cumple; con `hacia` solo se baja a las carpetas que pueden tener algo."""
+    pila = [(nodo, ruta)]
+    while pila:
+        actual, ruta_actual = pila.pop()
+        for hijo in actual.hijos_sin_cargar():
+            ruta_hijo = f"{ruta_actual}/{hijo.nombre}"
+            if (acepta is None or acepta(hijo)) and (dentro is None or dentro(ruta_hijo)):
+                yield ruta_hijo, hijo
+            if hijo.tipo_nodo == "folder" and (hacia is None or hacia(ruta_hijo)):
+                pila.append((hijo, ruta_hijo))
+
+def _filtro_nombre_y_tipo(arbol, predicados):
+    """nodo -> bool con los predicados de `query` que un almacén puede verificar sin leer
+    contenidos (name, prefix, glob, type); None si no hay ninguno."""
+    filtros = [arbol._filtro(campo, valor)[0] for campo, valor in predicados
+               if campo in ("name", "prefix", "glob", "type")]
+    if not filtros: return None
+    return lambda n: all(f(n) for f in filtros)
+
+def _filtro_de_nombres(predicados):
+    """nombre -> bool con los predicados name, prefix y glob; None si no hay ninguno."""
+    filtros = []
+    for campo, valor in predicados:
+        if campo == "name":
+            filtros.append(valor.__eq__)
+        elif campo == "prefix":
+            filtros.append(lambda nombre, prefijo=valor: nombre.startswith(prefijo))
+        elif campo == "glob":
+            filtros.append(re.compile(fnmatch.translate(valor)).match)
+    if not filtros: return None
+    return lambda nombre: all(f(nombre) for f in filtros)
+
+def _alcance_de_under(predicados):
+    """(dentro, hacia) para los `under` de una consulta: `dentro(ruta)` dice si la ruta
+    está debajo de todos y `hacia(ruta)` si una carpeta queda en el camino o ya adentro
+    (si vale la pena bajar). (None, None) sin `under`."""
+    bajo = [normalizar_ruta(valor) + "/" for campo, valor in predicados if campo == "under"]
+    if not bajo: return None, None
+    def dentro(ruta):
+        return all(ruta.startswith(b) for b in bajo)
+    def hacia(ruta):
+        ruta += "/"
+        return all(ruta.startswith(b) or b.startswith(ruta) for b in bajo)
+    return dentro, hacia
+
+class AlmacenSQLite:
+    """El árbol guardado en una base SQLite: una fila por nodo en `nodos` (con el id del
+    padre), más `papelera` y `meta`. Al abrir solo se leen la raíz, sus hijos y la papelera;
+    cada carpeta es un stub que trae sus hijos con un SELECT por (padre, nombre) la primera
+    vez que alguien entra. `find`/`search` cubren lo que aún no se cargó preguntando por el
+    índice de nombres y subiendo por los padres hasta la raíz.
+
+    Las escrituras las hace EspejoSQLite, suscrito a los avisos del árbol: cada operación
+    pública queda confirmada en su propia transacción, sin reescribir el archivo entero.
+    Los nodos en la papelera conservan su fila con padre NULL.
+    """
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS nodos (
+            id TEXT PRIMARY KEY, padre TEXT, nombre TEXT COLLATE NOCASE NOT NULL,
+            tipo TEXT NOT NULL, contenido TEXT, ctime REAL, mtime REAL, orden INTEGER);
+        CREATE INDEX IF NOT EXISTS nodos_por_padre ON nodos (padre, nombre);
+        CREATE INDEX IF NOT EXISTS nodos_por_nombre ON nodos (nombre);
+        CREATE TABLE IF NOT EXISTS papelera (
+            id INTEGER PRIMARY KEY, nodo TEXT NOT NULL, path_origen TEXT, path_padre TEXT,
+            fecha REAL, bytes INTEGER);
+        CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+    """
+    _COLUMNAS = "id, nombre, tipo, contenido, ctime, mtime"
+    descripcion = "Filas de la base sin cargar"
+    sigue_al_arbol = True  # Los stubs cargan por id y sacan la ruta del árbol
+    _LOTE = 5000  # Filas por executemany al exportar
+
+    def __init__(self, arbol, ruta):
+        self.arbol = arbol
+        self.ruta = ruta
+        self.pendientes = {}  # {id del stub: stub}
+        self.cargados = 0
+        # El autoguardado y las versiones pueden leer desde otro hilo (ver `leer_hijos`)
+        self._candado = threading.RLock()
+        self.conexion = self._conectar(ruta)
+        self.id_raiz = None
+        self._orden = self._orden_confirmado = 0
+
+    @classmethod
+    def _conectar(cls, ruta):
+        import sqlite3
+        conexion = sqlite3.connect(ruta, check_same_thread=False)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript(cls.ESQUEMA)
+        return conexion
+
+    def sql(self, consulta, parametros=()):
+        with self._candado:
+            return self.conexion.execute(consulta, parametros).fetchall()
+
+    def cerrar(self):
+        with self._candado:
+            self.conexion.commit()
+            self.conexion.close()
+
+    # --- lectura ---
+
+    def _nodo(self, fila, almacen, perezoso=True):
+        id_nodo, nombre, tipo, contenido, ctime, mtime = fila
+        if almacen is not None:
+            contenido = almacen.adquirir(contenido)
+        nodo = Nodo(nombre, tipo, contenido, id_nodo)
+        nodo.ctime, nodo.mtime = ctime or 0.0, mtime or 0.0
+        if tipo == "folder" and perezoso:
+            nodo._hijos = None
+            nodo._cargador = self
+        return nodo
+
+    def _filas_hijos(self, id_padre):
+        return self.sql(f"SELECT {self._COLUMNAS} FROM nodos WHERE padre = ? ORDER BY orden", (id_padre,))
+
+    def _subarbol(self, id_nodo, almacen):
+        """Un subárbol entero ya cargado (la papelera no guarda stubs)."""
+        filas = self.sql(f"SELECT {self._COLUMNAS} FROM nodos WHERE id = ?", (id_nodo,))
+        if not filas: return None
+        raiz = self._nodo(filas[0], almacen, perezoso=False)
+        pila = [raiz]
+        while pila:
+            actual = pila.pop()
+            if actual.tipo_nodo == "folder":
+                actual._hijos = [self._nodo(f, almacen, perezoso=False) for f in self._filas_hijos(actual.id)]
+                pila.extend(actual._hijos)
+        return raiz
+
+    def abrir(self):
+        """Lee la raíz con sus hijos y la papelera. Devuelve (raíz, elementos de la papelera)."""
+        almacen = self.arbol.almacen
+        fila = self.sql("SELECT valor FROM meta WHERE clave = 'raiz'")
+        if not fila: raise ValueError(f"{self.ruta} no tiene un árbol guardado.")
+        self.id_raiz = fila[0][0]
+        # El contador de `orden` va en meta: sacarlo con MAX(orden) recorrería la tabla entera
+        fila = self.sql("SELECT valor FROM meta WHERE clave = 'orden'")
+        self._orden = self._orden_confirmado = int(fila[0][0]) if fila else self.sql("SELECT COALESCE(MAX(orden), 0) FROM nodos")[0][0]
+        root = self._nodo(self.sql(f"SELECT {self._COLUMNAS} FROM nodos WHERE id = ?", (self.id_raiz,))[0], almacen)
+        self.cargar_hijos(root)
+        elementos = []
+        for id_elemento, id_nodo, path_origen, path_padre, fecha, tamano in self.sql(
+                "SELECT id, nodo, path_origen, path_padre, fecha, bytes FROM papelera ORDER BY id"):
+            nodo = self._subarbol(id_nodo, almacen)
+            if nodo is None: continue
+            elementos.append({"id": id_elemento, "path_origen": path_origen, "path_padre": path_padre,
+                              "nodo": nodo, "fecha": fecha, "bytes": tamano})
+        return root, elementos
+
+    def leer_hijos(self, stub):
+        """Los hijos de un stub sin engancharlos ni indexarlos."""
+        return [self._nodo(f, None) for f in self._filas_hijos(stub.id)]
+
+    def cargar_hijos(self, stub):
+        """Trae los hijos de una carpeta al árbol vivo, los indexa y deja sus carpetas como stubs."""
+        hijos = [self._nodo(f, self.arbol.almacen) for f in self._filas_hijos(stub.id)]
+        stub._hijos = hijos
+        self.arbol._etiquetas_ok = False
+        self.cargados += 1
+        vivo = self.pendientes.pop(stub.id, None) is not None
+        for hijo in hijos:
+            hijo.padre = stub
+            if hijo._hijos is None:
+                self.pendientes[hijo.id] = hijo
+            if vivo:
+                self.arbol._avisar("al_crear", hijo)
+        return hijos
+
+    def materializar(self, ruta):
+        """Carga todo lo pendiente en `ruta` o debajo (incluidas las carpetas anidadas)."""
+        _materializar_stubs(self.arbol, self.pendientes, ruta)
+
+    # --- búsqueda en lo no cargado ---
+
+    def _filas_sin_cargar(self, base, predicados, contar=False):
+        """(ruta, fila) de lo que cuelga de los stubs pendientes en `base` o debajo, o cuántas
+        son con `contar`. Name, prefix y type van en el WHERE. Con un nombre o un prefijo se
+        pregunta al índice por nombre y se sube por los padres; si no, un CTE recursivo baja
+        solo desde los stubs del alcance, y adentro solo por las carpetas hacia cada `under`."""
+        arbol = self.arbol
+        stubs = _stubs_bajo(arbol, list(self.pendientes.values()), base)
+        if not stubs: return 0 if contar else []
+        condiciones, parametros, por_nombre = [], [], False
+        for campo, valor in predicados:
+            if campo == "name":
+                condiciones.append("n.nombre = ?")
+                parametros.append(valor)
+            elif campo == "prefix":
+                condiciones.append("n.nombre LIKE ? ESCAPE '\\'")
+                parametros.append(self._patron_prefijo(valor))
+            elif campo == "type":
+                condiciones.append("n.tipo = ?")
+                parametros.append(valor)
+            por_nombre = por_nombre or campo in ("name", "prefix")
+        donde = " AND ".join(condiciones) or "1"
+        columnas = ", ".join(f"n.{c}" for c in self._COLUMNAS.split(", "))
+        # NOCASE y LIKE no distinguen mayúsculas, y los comodines no van al SQL
+        acepta = _filtro_nombre_y_tipo(arbol, predicados)
+        bajo = [normalizar_ruta(valor) + "/" for campo, valor in predicados if campo == "under"]
+        if base is not arbol.root:
+            bajo.append(arbol.obtener_ruta(base) + "/")
+        if por_nombre:
+            filas = self.sql(f"SELECT n.padre, {columnas} FROM nodos n WHERE {donde}", parametros)
+            memo, encontradas = {}, []
+            for fila in filas:
+                ruta, pendiente = self._ubicar(fila[0], memo) if fila[0] is not None else (None, False)
+                if ruta is None or not pendiente: continue
+                ruta = f"{ruta}/{fila[2]}"
+                if all(ruta.startswith(b) for b in bajo) and (acepta is None or acepta(self._nodo(fila[1:], None))):
+                    encontradas.append((ruta, fila[1:]))
+            return len(encontradas) if contar else encontradas
+        semillas = json.dumps([[stub.id, arbol.obtener_ruta(stub)] for stub in stubs])
+        hacia = " AND ".join("(substr(sub.ruta || '/', 1, ?) = ? OR substr(?, 1, length(sub.ruta) + 1) = sub.ruta || '/')"
+                             for _ in bajo) or "1"
+        dentro = "".join(" AND substr(sub.ruta, 1, ?) = ?" for _ in bajo)
+        parametros = ([semillas] + [p for b in bajo for p in (len(b), b, b)] + parametros
+                      + [p for b in bajo for p in (len(b), b)])
+        debajo = f"""
+            WITH RECURSIVE sub(id, ruta) AS (
+                SELECT n.id, json_extract(s.value, '$[1]') || '/' || n.nombre
+                FROM json_each(?) s JOIN nodos n ON n.padre = json_extract(s.value, '$[0]')
+                UNION ALL
+                SELECT n.id, sub.ruta || '/' || n.nombre FROM sub JOIN nodos n ON n.padre = sub.id WHERE {hacia})
+            SELECT {{}} FROM sub JOIN nodos n ON n.id = sub.id WHERE {donde}{dentro}"""
+        if contar and acepta is None:
+            return self.sql(debajo.format("COUNT(*)"), parametros)[0][0]
+        filas = self.sql(debajo.format(f"sub.ruta, {columnas}"), parametros)
+        encontradas = [(f[0], f[1:]) for f in filas if acepta is None or acepta(self._nodo(f[1:], None))]
+        return len(encontradas) if contar else encontradas
+
+    def recorrer(self, base, predicados=()):
+        """(ruta, nodo) de lo no cargado en `base` o debajo, leído de la base sin cargarlo.
+        Aplica los predicados de nombre, tipo y `under` (ver `_filas_sin_cargar`)."""
+        for ruta, fila in self._filas_sin_cargar(base, predicados):
+            yield ruta, self._nodo(fila, None)
+
+    def estimar(self, base, predicados=()):
+        return self._filas_sin_cargar(base, predicados, contar=True)
+
+    def _ubicar(self, id_nodo, memo):
+        """(ruta, bajo_pendiente) de un nodo según la tabla: ruta None si no cuelga de la raíz
+        (está en la papelera), y bajo_pendiente si él o un ancestro es un stub sin cargar."""
+        cadena = []
+        while id_nodo not in memo:
+            if id_nodo == self.id_raiz:
+                memo[id_nodo] = ("root", False)
+                break
+            fila = self.sql("SELECT padre, nombre FROM nodos WHERE id = ?", (id_nodo,))
+            if not fila or fila[0][0] is None:
+                memo[id_nodo] = (None, False)
+                break
+            cadena.append((id_nodo, fila[0][1]))
+            id_nodo = fila[0][0]
+        ruta, pendiente = memo[id_nodo]
+        for id_actual, nombre in reversed(cadena):
+            if ruta is not None: ruta = f"{ruta}/{nombre}"
+            pendiente = pendiente or id_actual in self.pendientes
+            memo[id_actual] = (ruta, pendiente)
+        return memo[cadena[0][0]] if cadena else memo[id_nodo]
+
+    def _rutas_sin_cargar(self, filas):
+        """Rutas de las filas (padre, nombre) que están en el árbol vivo pero aún no se cargaron."""
+        memo, rutas = {}, []
+        for padre, nombre in filas:
+            if padre is None: continue
+            ruta, pendiente = self._ubicar(padre, memo)
+            if ruta is not None and pendiente:
+                rutas.append(f"{ruta}/{nombre}")
+        return rutas
+
+    def buscar_exacto(self, nombre):
+        filas = self.sql("SELECT padre, nombre FROM nodos WHERE nombre = ?", (nombre,))
+        return self._rutas_sin_cargar(f for f in filas if f[1] == nombre)
+
+    def buscar_patron(self, regex):
+        # Una pasada por el índice (padre, nombre), que cubre la consulta sin leer la tabla
+        return self._rutas_sin_cargar(f for f in self.sql("SELECT padre, nombre FROM nodos") if regex.match(f[1]))
+
+    @staticmethod
+    def _patron_prefijo(prefijo):
+        """El patrón LIKE de un prefijo, con los comodines de LIKE escapados."""
+        return re.sub(r"([\\%_])", r"\\\1", prefijo.lower()) + "%"
+
+    def buscar_prefijo(self, prefijo):
+        prefijo = prefijo.lower()
+        filas = self.sql("SELECT padre, nombre FROM nodos WHERE nombre LIKE ? ESCAPE '\\'", (self._patron_prefijo(prefijo),))
+        encontrados = set()
+        for ruta in self._rutas_sin_cargar(f for f in filas if f[1].lower().startswith(prefijo)):
+            encontrados.add(ruta.rsplit('/', 1)[1])
+        return encontrados
+
+    # --- escritura (la llama EspejoSQLite) ---
+
+    def _fila(self, nodo, id_padre):
+        self._orden += 1
+        return (nodo.id, id_padre, nodo.nombre, nodo.tipo_nodo, nodo.contenido, nodo.ctime, nodo.mtime, self._orden)
+
+    def insertar_subarbol(self, nodo, id_padre):
+        """Escribe un subárbol que la base no tiene. Los clones de `cp` se expanden para
+        escribirlos; los stubs propios ya tienen sus filas."""
+        filas, pila = [], [(nodo, id_padre)]
+        while pila:
+            actual, padre = pila.pop()
+            filas.append(self._fila(actual, padre))
+            if actual._cargador is self and actual._hijos is None:
+                continue
+            # Al revés en la pila para que el orden de las filas siga al de los hijos
+            pila.extend((h, actual.id) for h in reversed(actual.hijos))
+        with self._candado:
+            self.conexion.executemany("INSERT INTO nodos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+
+    def colgar(self, nodo, id_padre):
+        """Cuelga (o vuelve a colgar) una fila. Solo pasa al final de la carpeta si cambió de padre."""
+        with self._candado:
+            self._orden += 1
+            cursor = self.conexion.execute(
+                "UPDATE nodos SET nombre = ?, orden = CASE WHEN padre IS ? THEN orden ELSE ? END, padre = ? WHERE id = ?",
+                (nodo.nombre, id_padre, self._orden, id_padre, nodo.id))
+            if cursor.rowcount == 0:
+                self.insertar_subarbol(nodo, id_padre)
+
+    def borrar_subarbol(self, id_nodo):
+        with self._candado:
+            self.conexion.execute("""
+                WITH RECURSIVE sub(id) AS (SELECT ? UNION ALL SELECT n.id FROM nodos n JOIN sub ON n.padre = sub.id)
+                DELETE FROM nodos WHERE id IN sub""", (id_nodo,))
+
+    def reescribir(self, root):
+        """Reemplaza el árbol entero (checkout). La papelera también cambia: se vacía aquí y
+        EspejoSQLite vuelve a escribir la nueva al terminar la operación."""
+        with self._candado:
+            self.conexion.execute("DELETE FROM nodos")
+            self.conexion.execute("DELETE FROM papelera")
+        self.id_raiz = root.id
+        self.insertar_subarbol(root, None)
+        self.sql("INSERT OR REPLACE INTO meta VALUES ('raiz', ?)", (root.id,))
+
+    def confirmar(self):
+        with self._candado:
+            if self._orden != self._orden_confirmado:
+                self.conexion.execute("INSERT OR REPLACE INTO meta VALUES ('orden', ?)", (str(self._orden),))
+                self._orden_confirmado = self._orden
+            self.conexion.commit()
+
+    # --- exportar ---
+
+    @classmethod
+    def exportar(cls, root, papelera, nombre_archivo):
+        """Escribe una base nueva con el árbol y la papelera. Devuelve cuántos nodos escribió.
+
+        Se arma en un temporal del mismo directorio y se renombra al terminar, como los JSON.
+        Dos nodos con el mismo id (posible en guardados viejos) no se pisan: falla y el
+        archivo de destino queda como estaba.
+        """
+        import sqlite3
+        directorio = os.path.dirname(nombre_archivo) or "."
+        os.makedirs(directorio, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(prefix=".guardando_", suffix=".db", dir=directorio)
+        os.close(fd)
+        conexion = None
+        try:
+            conexion = sqlite3.connect(temporal)
+            conexion.executescript(cls.ESQUEMA)
+            total, orden, filas = 0, itertools.count(1), []
+            raices = [(root, None)] + [(e["nodo"], None) for e in papelera]
+            for raiz, id_padre in raices:
+                pila = [(raiz, id_padre)]
+                while pila:
+                    nodo, padre = pila.pop()
+                    filas.append((nodo.id, padre, nodo.nombre, nodo.tipo_nodo, nodo.contenido,
+                                  nodo.ctime, nodo.mtime, next(orden)))
+                    pila.extend((h, nodo.id) for h in reversed(nodo.hijos_sin_cargar()))
+                    if len(filas) >= cls._LOTE:
+                        total += cls._insertar_nodos(conexion, filas)
+                        filas = []
+            total += cls._insertar_nodos(conexion, filas)
+            conexion.executemany("INSERT INTO papelera VALUES (?, ?, ?, ?, ?, ?)",
+                                 [(e["id"], e["nodo"].id, e["path_origen"], e["path_padre"], e["fecha"], e["bytes"])
+                                  for e in papelera])
+            conexion.executemany("INSERT INTO meta VALUES (?, ?)", [("raiz", root.id), ("orden", str(next(orden)))])
+            conexion.commit()
+            conexion.close()
+            conexion = None
+            for sufijo in ("-wal", "-shm"):
+                if os.path.exists(nombre_archivo + sufijo):
+                    os.remove(nombre_archivo + sufijo)
+            os.replace(temporal, nombre_archivo)
+        except BaseException:
+            if conexion is not None:
+                conexion.close()
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        return total
+
+    @staticmethod
+    def _insertar_nodos(conexion, filas):
+        """INSERT de un lote; devuelve las filas escritas. Un id repetido es un error."""
+        import sqlite3
+        try:
+            return conexion.executemany("INSERT INTO nodos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas).rowcount
+        except sqlite3.IntegrityError:
+            vistos, repetido = set(), "repetido"
+            for fila in filas:
+                if fila[0] in vistos:
+                    repetido = fila[0]
+                    break
+                vistos.add(fila[0])
+            raise ValueError(f"Dos nodos tienen el id {repetido} (¿guardado viejo?); la base no se escribió.") from None
+
+
+class EspejoSQLite(Indice):
+    """Mantiene la base de un AlmacenSQLite al día con los avisos del árbol.
+
+    Lo que sale de una carpeta no se toca hasta el final de la operación: rename y edit
+    avisan salida y entrada del mismo nodo, y mv sale de un lado para entrar en otro. Al
+    terminar, lo que no volvió a entrar queda con padre NULL si está en la papelera y se
+    borra si no (deshacer un mkdir); después se ajusta la tabla `papelera` y se confirma.
+    """
+    nombre = "sqlite"
+    obligatorio = True
+
+    def __init__(self, arbol, almacen):
+        super().__init__(arbol, "activo")
+        self.almacen = almacen
+        self._sueltos = {}  # {id: nodo} que salieron de su carpeta en esta operación
+        self._en_papelera = dict(almacen.sql("SELECT id, nodo FROM papelera"))  # {id elemento: id nodo}
+        self._firma_papelera = None
+        self.escrituras = 0  # Operaciones confirmadas
+
+    def construir(self):
+        # La base ya es el estado: no hay nada que armar
+        self.listo = True
+
+    def entradas(self):
+        return self.almacen.sql("SELECT COUNT(*) FROM nodos")[0][0]
+
+    def al_colgar(self, carpeta, nodo):
+        self._sueltos.pop(nodo.id, None)
+        self.almacen.colgar(nodo, carpeta.id)
+
+    def al_descolgar(self, carpeta, nodo):
+        self._sueltos[nodo.id] = nodo
+
+    def al_modificar(self, nodo, contenido):
+        if contenido:
+            self.almacen.sql("UPDATE nodos SET contenido = ?, mtime = ? WHERE id = ?",
+                             (nodo.contenido, nodo.mtime, nodo.id))
+        else:
+            self.almacen.sql("UPDATE nodos SET mtime = ? WHERE id = ?", (nodo.mtime, nodo.id))
+
+    def al_cambiar_version(self):
+        self._sueltos.clear()
+        self.almacen.reescribir(self.arbol.root)
+        self._en_papelera = {}  # Se reescribe entera al terminar la operación
+        self._firma_papelera = None
+
+    def _sincronizar_papelera(self):
+        papelera = self.arbol.papelera
+        firma = (papelera._siguiente, len(papelera), papelera.bytes)
+        if firma == self._firma_papelera:
+            return
+        self._firma_papelera = firma
+        actuales = {e["id"]: e for e in papelera}
+        almacen = self.almacen
+        for id_elemento in self._en_papelera.keys() - actuales.keys():
+            id_nodo = self._en_papelera.pop(id_elemento)
+            almacen.sql("DELETE FROM papelera WHERE id = ?", (id_elemento,))
+            if id_nodo not in self._sueltos and almacen.sql("SELECT 1 FROM nodos WHERE id = ? AND padre IS NULL", (id_nodo,)):
+                almacen.borrar_subarbol(id_nodo)
+        for id_elemento in actuales.keys() - self._en_papelera.keys():
+            e = actuales[id_elemento]
+            nodo = e["nodo"]
+            self._en_papelera[id_elemento] = nodo.id
+            almacen.sql("INSERT INTO papelera VALUES (?, ?, ?, ?, ?, ?)",
+                        (id_elemento, nodo.id, e["path_origen"], e["path_padre"], e["fecha"], e["bytes"]))
+            if nodo.id not in self._sueltos and not almacen.sql("SELECT 1 FROM nodos WHERE id = ?", (nodo.id,)):
+                almacen.insertar_subarbol(nodo, None)
+
+    def al_terminar_operacion(self):
+        self._sincronizar_papelera()
+        if self._sueltos:
+            en_papelera = set(self._en_papelera.values())
+            for id_nodo in self._sueltos:
+                if id_nodo in en_papelera:
+                    self.almacen.sql("UPDATE nodos SET padre = NULL WHERE id = ?", (id_nodo,))
+                else:
+                    self.almacen.borrar_subarbol(id_nodo)
+            self._sueltos.clear()
+        self.almacen.confirmar()
+        self.escrituras += 1
+
+
+# --- PRESUPUESTO DE MEMORIA (desalojo de subárboles fríos a disco) ---
+
+class Desalojador(Indice):
+    """Presupuesto de memoria del árbol vivo (ver `configurar_memoria`).
+
+    Cuenta los nodos y los bytes de contenido con los avisos de creación y borrado (uso ≈
+    nodos × BYTES_NODO + contenidos + lo que queda por nombre desalojado). Cuando el uso pasa el `limite`, las carpetas que hace
+    más tiempo nadie usa (entre dos igual de frías, la más chica, que cuesta menos volver a
+    traer) quedan como stubs hasta bajar al 80% del límite: sus hijos van a
+    un archivo temporal (listas anidadas en JSON con zlib, en bloques que comparten las
+    carpetas chicas hermanas) y salen de los índices. Si el
+    árbol vive en una base SQLite no hace falta escribir nada: el stub se recarga de la base.
+    Un stub vuelve la primera vez que alguien pide sus hijos, como los de un fragmento.
+
+    El uso de una carpeta es un tic de reloj que marca `_buscar_nodo_y_padre` (LRU); el de
+    un subárbol, el más reciente de los suyos. Se desaloja solo entre operaciones, nunca a
+    mitad de una mutación. No se desaloja lo congelado por una instantánea o por un clon sin
+    expandir, ni lo que tiene stubs de otro almacén (clones de `cp`, fragmentos); la
+    papelera no entra en la cuenta.
+    """
+    nombre = "memoria"
+    obligatorio = True
+    descripcion = "Registros desalojados"
+    sigue_al_arbol = True
+    BYTES_NODO = 3584  # Nodo, sus entradas en los índices y su lugar en la lista del padre (medido)
+    BYTES_NOMBRE = 160  # Lo que queda en memoria por cada nombre desalojado (para buscar sin leer disco)
+    MINIMO = 32        # Nodos: un subárbol más chico no vale un registro propio (va con sus hermanas)
+    OBJETIVO = 0.8     # Al desalojar se baja hasta esta fracción del límite
+
+    def __init__(self, arbol, limite, directorio=None):
+        super().__init__(arbol, "activo")
+        self.limite = limite
+        self.directorio = directorio
+        self.pendientes = {}  # {id del stub: stub}
+        self.registros = {}   # {id del stub: (posición, largo, nombres)} de su bloque en el archivo
+        self._vivos = {}      # {posición de un bloque: cuántos stubs lo usan todavía}
+        self.nombres = {}     # {nombre: id del stub | {ids}} de lo que está en el archivo
+        self.nodos = 0
+        self.bytes_contenido = 0
+        self.desalojos = 0
+        self.recargas = 0
+        self._reloj = 0
+        self._candado = threading.Lock()  # El autoguardado lee stubs desde otro hilo
+        self._archivo = tempfile.TemporaryFile(prefix="desalojo_", dir=directorio)
+        self._fin = 0
+        self._basura = 0
+        self.inalcanzable = False  # El último ajuste no pudo bajar del límite (ver `aviso`)
+
+    # --- cuenta (avisos) ---
+
+    def vaciar(self):
+        """Otro árbol (load): lo desalojado del anterior ya no sirve."""
+        self.nodos = self.bytes_contenido = 0
+        self.pendientes.clear()
+        self.registros.clear()
+        self.nombres.clear()
+        self._vivos.clear()
+        with self._candado:
+            self._archivo.truncate(0)
+            self._fin = self._basura = 0
+
+    def construir(self):
+        # Solo se recuenta lo que está en memoria: los stubs siguen valiendo
+        self.nodos = self.bytes_contenido = 0
+        pila = list(self.arbol.root._hijos or ())
+        while pila:
+            nodo = pila.pop()
+            self.al_crear(nodo)
+            pila.extend(nodo._hijos or ())
+        self.listo = True
+
+    def entradas(self):
+        return len(self.pendientes)
+
+    def al_crear(self, nodo):
+        self.nodos += 1
+        self.bytes_contenido += nodo.tamano_bytes
+
+    def al_quitar(self, nodo, diferidos=None):
+        self.nodos -= 1
+        self.bytes_contenido -= nodo.tamano_bytes
+
+    def antes_de_modificar(self, nodo, contenido):
+        if contenido: self.bytes_contenido -= nodo.tamano_bytes
+
+    def al_modificar(self, nodo, contenido):
+        if contenido: self.bytes_contenido += nodo.tamano_bytes
+
+    def al_cambiar_version(self):
+        self.construir()
+
+    def al_terminar_operacion(self):
+        self.ajustar()
+
+    def uso(self):
+        return self.nodos * self.BYTES_NODO + self.bytes_contenido + len(self.nombres) * self.BYTES_NOMBRE
+
+    def marcar(self, *nodos):
+        self._reloj += 1
+        for nodo in nodos:
+            if nodo is not None:
+                nodo._uso = self._reloj
+
+    def estado(self):
+        return {
+            "limite": self.limite,
+            "uso": self.uso(),
+            "nodos": self.nodos,
+            "desalojados": len(self.pendientes),
+            "desalojos": self.desalojos,
+            "recargas": self.recargas,
+            "archivo": self._fin - self._basura,
+            "aviso": self.aviso(),
+        }
+
+    # --- archivo temporal ---
+
+    def _escribir(self, datos):
+        """Escribe un bloque {id del stub: datos} y devuelve (posición, largo). Las carpetas
+        chicas de una misma carpeta comparten bloque (ver `_candidatos`)."""
+        bloque = zlib.compress(json.dumps(datos, separators=(",", ":")).encode(), 1)
+        with self._candado:
+            self._archivo.seek(self._fin)
+            self._archivo.write(bloque)
+            posicion, self._fin = self._fin, self._fin + len(bloque)
+            self._vivos[posicion] = len(datos)
+        return posicion, len(bloque)
+
+    def _leer(self, id_stub):
+        with self._candado:
+            posicion, largo, _ = self.registros[id_stub]
+            self._archivo.seek(posicion)
+            bloque = self._archivo.read(largo)
+        return json.loads(zlib.decompress(bloque))[id_stub]
+
+    def _olvidar(self, id_stub):
+        """Saca un stub de la cuenta (se recargó o quedó dentro de otro desalojo). Su bloque
+        pasa a ser basura cuando no queda ningún stub que lo use."""
+        self.pendientes.pop(id_stub, None)
+        registro = self.registros.pop(id_stub, None)
+        if registro is None: return
+        posicion, largo, nombres = registro
+        self._vivos[posicion] -= 1
+        if not self._vivos[posicion]:
+            del self._vivos[posicion]
+            self._basura += largo
+        for nombre in nombres:
+            stubs = self.nombres[nombre]
+            if isinstance(stubs, set):
+                stubs.discard(id_stub)
+                if len(stubs) == 1: self.nombres[nombre] = stubs.pop()
+            else:
+                del self.nombres[nombre]
+
+    def _stubs_con(self, nombre):
+        stubs = self.nombres.get(nombre)
+        if stubs is None: return ()
+        return stubs if isinstance(stubs, set) else (stubs,)
+
+    def _compactar(self):
+        """Reescribe el archivo solo con los registros vivos."""
+        nuevo = tempfile.TemporaryFile(prefix="desalojo_", dir=self.directorio)
+        fin, movidos = 0, {}  # {posición vieja: nueva}
+        with self._candado:
+            for id_stub, (posicion, largo, nombres) in self.registros.items():
+                if posicion not in movidos:
+                    self._archivo.seek(posicion)
+                    nuevo.write(self._archivo.read(largo))
+                    movidos[posicion] = fin
+                    fin += largo
+                self.registros[id_stub] = (movidos[posicion], largo, nombres)
+            self._vivos = {movidos[posicion]: vivos for posicion, vivos in self._vivos.items()}
+            self._archivo.close()
+            self._archivo, self._fin, self._basura = nuevo, fin, 0
+
+    def cerrar(self):
+        with self._candado:
+            self._archivo.close()
+
+    # --- stubs ---
+
+    @staticmethod
+    def _construir(datos, almacen, stub):
+        """Los nodos de un registro colgados de `stub`, sin indexar. Sin `almacen` los
+        contenidos quedan como texto (para leer desde otro hilo)."""
+        raices = []
+        pila = [(datos, stub, raices)]
+        while pila:
+            lista, padre, salida = pila.pop()
+            for id_nodo, nombre, tipo, contenido, ctime, mtime, hijos in lista:
+                if almacen is not None:
+                    contenido = almacen.adquirir(contenido)
+                nodo = Nodo(nombre, tipo, contenido, id_nodo)
+                nodo.ctime, nodo.mtime, nodo.epoca, nodo.padre = ctime, mtime, stub.epoca, padre
+                salida.append(nodo)
+                if hijos:
+                    pila.append((hijos, nodo, nodo._hijos))
+        return raices
+
+    def leer_hijos(self, stub):
+        """Los hijos de un stub sin engancharlos ni indexarlos (para serializar)."""
+        if self.arbol._sqlite is not None and stub.id not in self.registros:
+            return self.arbol._sqlite.leer_hijos(stub)
+        try:
+            datos = self._leer(stub.id)
+        except KeyError:
+            return stub._hijos  # Se recargó mientras tanto
+        return self._construir(datos, None, stub)
+
+    def cargar_hijos(self, stub):
+        """Recarga un subárbol desalojado: lo reconstruye y lo indexa."""
+        arbol = self.arbol
+        self.recargas += 1
+        self.marcar(stub)
+        if stub.id not in self.registros:
+            # Desalojado de una base SQLite: la base lo trae, carpeta por carpeta
+            self.pendientes.pop(stub.id, None)
+            stub._cargador = arbol._sqlite
+            return arbol._sqlite.cargar_hijos(stub)
+        hijos = stub._hijos = self._construir(self._leer(stub.id), arbol.almacen, stub)
+        self._olvidar(stub.id)
+        arbol._etiquetas_ok = False
+        for hijo in hijos:
+            arbol._indexar_trie_recursivamente(hijo)
+        return hijos
+
+    def materializar(self, ruta):
+        _materializar_stubs(self.arbol, self.pendientes, ruta)
+
+    # --- búsqueda en lo desalojado (lo de una base SQLite lo cubre la base) ---
+
+    def _rutas(self, id_stub, acepta):
+        """Rutas de lo que hay en el registro de un stub cuyo nombre cumple `acepta`."""
+        encontradas = []
+        pila = [(self._leer(id_stub), self.arbol.obtener_ruta(self.pendientes[id_stub]))]
+        while pila:
+            lista, base = pila.pop()
+            for _, nombre, _, _, _, _, hijos in lista:
+                if acepta(nombre):
+                    encontradas.append(f"{base}/{nombre}")
+                if hijos:
+                    pila.append((hijos, f"{base}/{nombre}"))
+        return encontradas
+
+    def recorrer(self, base, predicados=()):
+        """(ruta, nodo) de lo que está en los registros de los stubs en `base` o debajo,
+        leído sin recargarlo. Aplica los predicados de nombre, tipo y `under`."""
+        arbol = self.arbol
+        acepta = _filtro_nombre_y_tipo(arbol, predicados)
+        ids = self.registros
+        for campo, valor in predicados:
+            # Los nombres de cada registro están en memoria: solo se leen los que pueden casar
+            if campo in ("name", "prefix", "glob"):
+                if campo == "name":
+                    casan = [valor] if valor in self.nombres else []
+                elif campo == "prefix":
+                    casan = [n for n in self.nombres if n.startswith(valor)]
+                else:
+                    regex = re.compile(fnmatch.translate(valor))
+                    casan = [n for n in self.nombres if regex.match(n)]
+                ids = {id_stub for nombre in casan for id_stub in self._stubs_con(nombre)}.intersection(ids)
+        dentro, hacia = _alcance_de_under(predicados)
+        for stub in _stubs_bajo(arbol, [self.pendientes[id_stub] for id_stub in ids], base):
+            yield from _recorrer_sin_cargar(stub, arbol.obtener_ruta(stub), acepta, dentro, hacia)
+
+    def estimar(self, base, predicados=()):
+        return sum(1 for _ in self.recorrer(base, predicados))
+
+    def buscar_exacto(self, nombre):
+        return [r for id_stub in self._stubs_con(nombre) for r in self._rutas(id_stub, nombre.__eq__)]
+
+    def buscar_patron(self, regex):
+        stubs = {id_stub for nombre in self.nombres if regex.match(nombre) for id_stub in self._stubs_con(nombre)}
+        return [r for id_stub in stubs for r in self._rutas(id_stub, regex.match)]
+
+    def buscar_prefijo(self, prefijo):
+        prefijo = prefijo.lower()
+        return {nombre for nombre in self.nombres if nombre.lower().startswith(prefijo)}
+
+    # --- desalojo ---
+
+    def ajustar(self):
+        """Si el uso pasa el límite, desaloja los subárboles más fríos hasta el objetivo.
+        Una pasada puede quedarse corta (un grupo elegido tapa a la carpeta que lo
+        contiene): se repite mientras quede qué desalojar. Devuelve cuántos desalojó."""
+        total = 0
+        while self.uso() > self.limite * (self.OBJETIVO if total else 1):
+            desalojados = self._ajustar_una_vez()
+            if not desalojados: break
+            total += desalojados
+        self.inalcanzable = self.uso() > self.limite
+        return total
+
+    def _ajustar_una_vez(self):
+        sobra = self.uso() - self.limite * self.OBJETIVO
+        elegidos, inicios, liberado = [], [], 0
+        # En orden (uso, nodos) lo de adentro sale antes que lo de afuera: un candidato
+        # choca con lo ya elegido solo si alguna de sus carpetas contiene a algo elegido
+        for _, _, carpetas, intervalos, libera in sorted(self._candidatos(), key=lambda c: c[:2]):
+            if any(i < len(inicios) and inicios[i] <= post
+                   for i, post in ((bisect.bisect_left(inicios, pre), post) for pre, post in intervalos)):
+                continue
+            for pre, _ in intervalos:
+                bisect.insort(inicios, pre)
+            elegidos.append(carpetas)
+            liberado += libera
+            if liberado >= sobra:
+                break
+        for carpetas in elegidos:
+            self._desalojar(carpetas)
+        if elegidos:
+            self.arbol._invalidar_rutas()
+            self.arbol._cache_resolucion.clear()
+        if self._basura > max(self._fin - self._basura, 2**26):
+            self._compactar()
+        return sum(len(carpetas) for carpetas in elegidos)
+
+    def aviso(self):
+        """Por qué el límite no se alcanzó en el último ajuste, o None si se alcanzó."""
+        if not self.inalcanzable: return None
+        return (f"El límite no se alcanza ({self.uso() / 2**20:.1f} MB en uso): lo que queda no se "
+                "puede desalojar (los stubs mismos, archivos sueltos, carpetas chicas sin hermanas "
+                "para juntar, lo congelado por versiones o clones de cp).")
+
+    def _candidatos(self):
+        """(uso, nodos, carpetas, [(pre, post)], bytes que liberan) de cada carpeta
+        desalojable, en una pasada en postorden por lo que está en memoria. Las carpetas
+        de MINIMO nodos o menos no valen un registro solas: las hermanas se juntan, de la
+        más fría a la más usada, en grupos de más de MINIMO que comparten uno."""
+        arbol = self.arbol
+        congelada = arbol._epoca_congelada
+        clones = arbol._clones
+        propios = (self, arbol._sqlite) if arbol._sqlite is not None else (self,)
+        candidatos, info, contador = [], {}, 0
+        pila = [(arbol.root, None, False)]
+        while pila:
+            nodo, pre, en_region = pila.pop()
+            if pre is None:
+                # Lo que comparte un clon sin expandir tampoco se desaloja
+                en_region = en_region or id(nodo) in clones.regiones
+                pila.append((nodo, contador, en_region))
+                contador += 1
+                pila.extend((h, None, en_region) for h in nodo._hijos or ())
+                continue
+            uso, peso, tamano = nodo._uso, 1, nodo.tamano_bytes
+            ok = (nodo.epoca > congelada and not (en_region and clones.congelado(nodo))
+                  and (nodo._hijos is not None or nodo._cargador in propios))
+            chicas = []
+            for hijo in nodo._hijos or ():
+                u, p, t, o, intervalo = info.pop(id(hijo))
+                uso, peso, tamano, ok = max(uso, u), peso + p, tamano + t, ok and o
+                if o and hijo._hijos and p <= self.MINIMO:
+                    chicas.append((u, p, hijo, intervalo, self._libera(p, t)))
+            info[id(nodo)] = (uso, peso, tamano, ok, (pre, contador))
+            propio = ok and peso > self.MINIMO and nodo._hijos and nodo is not arbol.root
+            if propio:
+                candidatos.append((uso, peso, [nodo], [(pre, contador)], self._libera(peso, tamano)))
+            grupos, peso_grupo = [[]], 0
+            for chica in sorted(chicas, key=lambda c: c[:2]):
+                grupos[-1].append(chica)
+                peso_grupo += chica[1]
+                if peso_grupo > self.MINIMO:
+                    grupos.append([])
+                    peso_grupo = 0
+            if len(grupos) > 1:
+                grupos[-2].extend(grupos.pop())  # Las que sobran van con el último grupo
+                if propio and len(grupos[0]) == len(nodo._hijos):
+                    grupos = []  # Un grupo con todas las hijas es la carpeta misma
+                for grupo in grupos:
+                    candidatos.append((max(c[0] for c in grupo), sum(c[1] for c in grupo), [c[2] for c in grupo],
+                                       [c[3] for c in grupo], sum(c[4] for c in grupo)))
+            contador += 1
+        return candidatos
+
+    def _libera(self, peso, tamano):
+        """Bytes que libera desalojar una carpeta de `peso` nodos y `tamano` bytes de contenido."""
+        return (peso - 1) * (self.BYTES_NODO - self.BYTES_NOMBRE) + tamano
+
+    def _serializar(self, carpeta):
+        """Los hijos de `carpeta` como listas anidadas [id, nombre, tipo, contenido, ctime,
+        mtime, hijos | None] y sus nombres. Los stubs propios de adentro se leen."""
+        datos, nombres = [], set()
+        pila = [(carpeta, datos)]
+        while pila:
+            nodo, salida = pila.pop()
+            for h in nodo.hijos_sin_cargar():
+                hijos = [] if h.tipo_nodo == "folder" else None
+                salida.append([h.id, h.nombre, h.tipo_nodo, h.contenido, h.ctime, h.mtime, hijos])
+                nombres.add(h.nombre)
+                if hijos is not None:
+                    pila.append((h, hijos))
+        return datos, nombres
+
+    def _desalojar(self, carpetas):
+        """Deja como stubs `carpetas` (una sola o un grupo de hermanas chicas), con sus hijos
+        en un mismo bloque del archivo."""
+        arbol = self.arbol
+        sqlite = arbol._sqlite
+        # Los stubs de adentro quedan incluidos en los nuevos
+        anidados, pila = [], [h for carpeta in carpetas for h in carpeta._hijos]
+        while pila:
+            nodo = pila.pop()
+            if nodo._hijos is None:
+                anidados.append(nodo)
+            pila.extend(nodo._hijos or ())
+        if sqlite is None:
+            serializadas = {carpeta.id: self._serializar(carpeta) for carpeta in carpetas}
+            posicion, largo = self._escribir({id_stub: datos for id_stub, (datos, _) in serializadas.items()})
+            for id_stub, (_, nombres) in serializadas.items():
+                self.registros[id_stub] = (posicion, largo, tuple(nombres))
+                for nombre in nombres:
+                    stubs = self.nombres.get(nombre)
+                    if stubs is None:
+                        self.nombres[nombre] = id_stub
+                    elif isinstance(stubs, set):
+                        stubs.add(id_stub)
+                    else:
+                        self.nombres[nombre] = {stubs, id_stub}
+        else:
+            for carpeta in carpetas:
+                sqlite.pendientes[carpeta.id] = carpeta  # Así sus búsquedas cubren el stub
+        for stub in anidados:
+            self._olvidar(stub.id)
+            if sqlite is not None:
+                sqlite.pendientes.pop(stub.id, None)
+        diferidos = set()
+        for carpeta in carpetas:
+            for hijo in carpeta._hijos:
+                arbol._desindexar_subarbol(hijo, diferidos)
+                pila = [hijo]
+                while pila:
+                    nodo = pila.pop()
+                    arbol.almacen.soltar(nodo._contenido)
+                    pila.extend(nodo._hijos or ())
+            carpeta._hijos = None
+            carpeta._cargador = self
+            self.pendientes[carpeta.id] = carpeta
+            self.desalojos += 1
+        arbol._avisar("al_cerrar_lote", diferidos)
+
+
+# --- CLONES PEREZOSOS (cp con copy-on-write) ---
+
+def _id_clon(id_stub, id_origen):
+    """Id de la copia de `id_origen` dentro del clon `id_stub`: siempre el mismo, así un
+    guardado del clon sin expandir y la expansión posterior dan los mismos ids. Son 16
+    bytes para que no choquen aunque un árbol tenga millones de copias."""
+    return hashlib.blake2b(f"{id_stub}/{id_origen}".encode(), digest_size=16).hexdigest()
+
+class ClonadorPerezoso:
+    """Carpetas copiadas con `cp` que todavía no se expandieron.
+
+    Un clon empieza como stub (`_hijos` None) que apunta a la carpeta original. Solo el
+    subárbol original queda congelado, no el árbol entero: su carpeta entra a `regiones`
+    y, mientras haya stubs, un cambio que pasa por una región copia (path copying) los
+    nodos de antes de `epoca` en vez de tocarlos; las copias (y lo que sale de una región
+    con mv o rm) entran también, porque sus hijos viejos siguen siendo los del original.
+    Lo que cuelga fuera de las regiones se modifica en sitio, como sin clones.
+
+    La primera vez que alguien pide los hijos de un stub se crea un nivel de copias:
+    contenidos compartidos en el almacén y carpetas que son stubs a su vez. Las búsquedas
+    no expanden: recorren el original y traducen las rutas. Cuando no queda ningún stub
+    (ni uno suelto que el historial guarda para rehacer) se sueltan las regiones.
+    """
+    descripcion = "Clones sin expandir (leídos del original)"
+    sigue_al_arbol = True
+
+    def __init__(self, arbol):
+        self.arbol = arbol
+        self.pendientes = {}  # {id del stub: stub}
+        # Stubs que salieron del árbol sin expandirse (deshacer un `cp`): siguen congelando
+        # el original mientras alguien los tenga, por si se rehace
+        self.sueltos = weakref.WeakValueDictionary()
+        self.regiones = {}    # {id(nodo): nodo} cuyos nodos viejos comparte algún clon
+        self.epoca = None     # Los nodos de hasta esta época dentro de una región no se tocan
+        self.expandidos = 0
+
+    def _copia(self, origen, id_nodo, nombre, almacen, epoca):
+        contenido = almacen.adquirir(origen._contenido) if almacen is not None else origen._contenido
+        copia = Nodo(nombre, origen.tipo_nodo, contenido, id_nodo)
+        copia.epoca = epoca
+        copia.ctime, copia.mtime = origen.ctime, origen.mtime
+        if origen.tipo_nodo == "folder":
+            copia._hijos = None
+            copia._cargador = self
+            copia._origen = origen
+        return copia
+
+    def congelado(self, nodo):
+        """Si `nodo` existía al hacer el último `cp` (dentro de una región, no se toca)."""
+        return self.epoca is not None and nodo.epoca <= self.epoca
+
+    def proteger(self, nodo):
+        self.regiones[id(nodo)] = nodo
+
+    def clonar(self, origen, nombre):
+        """Clon de `origen` llamado `nombre`, sin colgar ni indexar. O(1)."""
+        arbol = self.arbol
+        if origen.tipo_nodo == "folder":
+            # Lo de hasta aquí queda congelado dentro del original; lo nuevo va después
+            self.epoca = arbol._epoca
+            arbol._epoca += 1
+            self.proteger(origen)
+        clon = self._copia(origen, uuid.uuid4().hex, nombre, arbol.almacen, arbol._epoca)
+        clon.ctime = clon.mtime = time.time()
+        if clon._hijos is None:
+            self.pendientes[clon.id] = clon
+        return clon
+
+    def leer_hijos(self, stub):
+        """Las copias de un nivel sin engancharlas ni indexarlas (para serializar desde otro hilo)."""
+        return [self._copia(h, _id_clon(stub.id, h.id), h.nombre, None, stub.epoca) for h in stub._origen.hijos_sin_cargar()]
+
+    def cargar_hijos(self, stub):
+        """Expande un stub: crea las copias de sus hijos, las cuelga y las indexa. Las copias
+        llevan la época del stub: si una versión lo comparte, también quedan congeladas."""
+        almacen = self.arbol.almacen
+        hijos = [self._copia(h, _id_clon(stub.id, h.id), h.nombre, almacen, stub.epoca) for h in stub._origen.hijos]
+        stub._hijos = hijos
+        stub._origen = None
+        self.arbol._etiquetas_ok = False
+        self.expandidos += 1
+        self.pendientes.pop(stub.id, None)
+        for hijo in hijos:
+            hijo.padre = stub
+            if hijo._hijos is None:
+                self.pendientes[hijo.id] = hijo
+            self.arbol._avisar("al_crear", hijo)
+        self._soltar_si_no_quedan()
+        return hijos
+
+    def _soltar_si_no_quedan(self):
+        if not self.pendientes and not self.sueltos:
+            self.regiones.clear()
+            self.epoca = None
+
+    def expandir(self, ruta):
+        """Expande del todo los clones pendientes en `ruta` o debajo."""
+        if ruta == "root":
+            pila = list(self.pendientes.values())
+        else:
+            base, _ = self.arbol._buscar_nodo_y_padre(ruta)
+            if base is None: return
+            pila = [s for s in self.pendientes.values() if self.arbol.es_ancestro(base, s)]
+        while pila:
+            stub = pila.pop()
+            if stub._hijos is None:
+                pila.extend(h for h in stub.hijos if h._hijos is None)
+
+    def _stubs_de(self, nodo):
+        """Los clones sin expandir del subárbol en memoria de `nodo` (él incluido)."""
+        stubs, pila = [], [nodo]
+        while pila:
+            actual = pila.pop()
+            if actual._hijos is None:
+                if actual._cargador is self: stubs.append(actual)
+            else:
+                pila.extend(actual._hijos)
+        return stubs
+
+    def soltar(self, nodo):
+        """`nodo` sale del árbol sin pasar por la papelera: sus clones pendientes dejan de
+        buscarse sin expandirse."""
+        for stub in self._stubs_de(nodo):
+            if self.pendientes.pop(stub.id, None) is not None:
+                self.sueltos[stub.id] = stub
+        self._soltar_si_no_quedan()
+
+    def recolgar(self, nodo):
+        """`nodo` vuelve al árbol (rehacer un `cp`): sus clones se buscan otra vez."""
+        for stub in self._stubs_de(nodo):
+            self.sueltos.pop(stub.id, None)
+            self.pendientes[stub.id] = stub
+
+    def descartar(self):
+        """Olvida los pendientes (el árbol vivo se reemplazó entero con `load`)."""
+        self.pendientes.clear()
+        self.sueltos.clear()
+        self._soltar_si_no_quedan()
+
+    # --- búsqueda en lo no expandido (desde el original, traduciendo las rutas) ---
+
+    def recorrer(self, base, predicados=()):
+        """(ruta, nodo) de lo que van a tener los clones pendientes en `base` o debajo, sin
+        expandirlos. Los nodos son los del original (mismos nombres, contenidos y fechas que
+        sus copias); solo se cambia la ruta. Aplica los predicados de nombre, tipo y `under`."""
+        arbol = self.arbol
+        acepta = _filtro_nombre_y_tipo(arbol, predicados)
+        dentro, hacia = _alcance_de_under(predicados)
+        for stub in _stubs_bajo(arbol, list(self.pendientes.values()), base):
+            yield from _recorrer_sin_cargar(stub._origen, arbol.obtener_ruta(stub), acepta, dentro, hacia)
+
+    def estimar(self, base, predicados=()):
+        return sum(1 for _ in self.recorrer(base, predicados))
+
+    def buscar_exacto(self, nombre):
+        return [ruta for ruta, _ in self.recorrer(self.arbol.root, [("name", nombre)])]
+
+    def buscar_patron(self, regex):
+        return [ruta for ruta, nodo in self.recorrer(self.arbol.root) if regex.match(nodo.nombre)]
+
+    def buscar_prefijo(self, prefijo):
+        prefijo = prefijo.lower()
+        return {nodo.nombre for _, nodo in self.recorrer(self.arbol.root) if nodo.nombre.lower().startswith(prefijo)}
+
+
+# --- INSTANTÁNEA MAPEADA (solo lectura con mmap) ---
+
+class ArbolMapeado:
+    """Árbol de solo lectura consultado directamente sobre el archivo con `mmap`.
+
+    Formato (little-endian): cabecera, tabla de nodos en preorden (registros fijos),
+    arreglo de hijos (índices uint32), dos índices de nombres ordenados (exacto y en
+    minúsculas) y un pool de cadenas UTF-8. Abrir solo lee la cabecera; cada consulta
+    desempaqueta los pocos registros que toca.
+    """
+    MAGIA = b"FSMAP\x00\x00\x01"
+    CABECERA = struct.Struct("<8sIIQQQQQ")
+    # id (off, len), nombre (off, len), contenido (off, len), padre, primer hijo, n° hijos, tipo
+    REGISTRO = struct.Struct("<QIQIQIIIIB3x")
+    SIN_CONTENIDO = 0xFFFFFFFF
+    SIN_PADRE = 0xFFFFFFFF
+
+    def __init__(self, nombre_archivo):
+        self._archivo = open(nombre_archivo, "rb")
+        self._mm = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        (magia, self.total, self._n_indice, self._off_nodos, self._off_hijos,
+         self._off_exacto, self._off_minusculas, self._off_pool) = self.CABECERA.unpack_from(self._mm, 0)
+        if magia != self.MAGIA:
+            self.cerrar()
+            raise ValueError("No es una instantánea mapeada")
+
+    def cerrar(self):
+        self._mm.close()
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    # --- escritura ---
+
+    @classmethod
+    def escribir(cls, f, root):
+        orden = []        # nodos en preorden
+        padres = []
+        hijos_de = []     # índices de los hijos de cada nodo, en orden
+        pila = [(root, cls.SIN_PADRE)]
+        while pila:
+            nodo, padre = pila.pop()
+            indice = len(orden)
+            orden.append(nodo)
+            padres.append(padre)
+            hijos_de.append([])
+            if padre != cls.SIN_PADRE:
+                hijos_de[padre].append(indice)
+            pila.extend((h, indice) for h in reversed(nodo.hijos_sin_cargar()))
+
+        pool = bytearray()
+        cadenas = {}
+
+        def internar(texto):
+            datos = texto.encode("utf-8")
+            if datos not in cadenas:
+                cadenas[datos] = len(pool)
+                pool.extend(datos)
+            return cadenas[datos], len(datos)
+
+        nodos = bytearray()
+        hijos = []
+        for i, nodo in enumerate(orden):
+            id_off, id_len = internar(nodo.id)
+            nombre_off, nombre_len = internar(nodo.nombre)
+            contenido = nodo.contenido
+            if contenido is None:
+                cont_off, cont_len = 0, cls.SIN_CONTENIDO
+            else:
+                cont_off, cont_len = internar(str(contenido))
+            nodos += cls.REGISTRO.pack(id_off, id_len, nombre_off, nombre_len, cont_off, cont_len,
+                                       padres[i], len(hijos), len(hijos_de[i]), 0 if nodo.tipo_nodo == "folder" else 1)
+            hijos.extend(hijos_de[i])
+
+        # root no se indexa (igual que el Trie/HashMap del árbol vivo)
+        indexados = range(1, len(orden))
+        exacto = sorted(indexados, key=lambda i: orden[i].nombre)
+        minusculas = sorted(indexados, key=lambda i: orden[i].nombre.lower())
+
+        off_nodos = cls.CABECERA.size
+        off_hijos = off_nodos + len(nodos)
+        off_exacto = off_hijos + 4 * len(hijos)
+        off_minusculas = off_exacto + 4 * len(exacto)
+        off_pool = off_minusculas + 4 * len(minusculas)
+        f.write(cls.CABECERA.pack(cls.MAGIA, len(orden), len(exacto), off_nodos, off_hijos,
+                                  off_exacto, off_minusculas, off_pool))
+        f.write(nodos)
+        for arreglo in (hijos, exacto, minusculas):
+            f.write(struct.pack(f"<{len(arreglo)}I", *arreglo))
+        f.write(pool)
+
+    # --- lectura ---
+
+    def _registro(self, i):
+        return self.REGISTRO.unpack_from(self._mm, self._off_nodos + i * self.REGISTRO.size)
+
+    def _cadena(self, off, largo):
+        inicio = self._off_pool + off
+        return self._mm[inicio:inicio + largo].decode("utf-8")
+
+    def _nombre(self, i):
+        r = self._registro(i)
+        return self._cadena(r[2], r[3])
+
+    def _hijos(self, i):
+        r = self._registro(i)
+        return struct.unpack_from(f"<{r[8]}I", self._mm, self._off_hijos + 4 * r[7])
+
+    def _es_carpeta(self, i):
+        return self._registro(i)[9] == 0
+
+    def _ruta(self, i):
+        partes = []
+        while i != self.SIN_PADRE:
+            r = self._registro(i)
+            partes.append(self._cadena(r[2], r[3]))
+            i = r[6]
+        return "/".join(reversed(partes))
+
+    def _buscar(self, ruta):
+        partes = normalizar_ruta(ruta).split('/')[1:]
+        actual = 0
+        for nombre_parte in partes:
+            for hijo in self._hijos(actual):
+                if self._nombre(hijo) == nombre_parte:
+                    actual = hijo
+                    break
+            else:
+                return None
+        return actual
+
+    def _indice(self, off, k):
+        return struct.unpack_from("<I", self._mm, off + 4 * k)[0]
+
+    def _bisect(self, off, clave, objetivo):
+        bajo, alto = 0, self._n_indice
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if clave(self._nombre(self._indice(off, medio))) < objetivo:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
+
+    def calcular_tamano(self):
+        return self.total
+
+    def validar_ruta(self, ruta):
+        i = self._buscar(ruta)
+        if i is None:
+            return False, "Esa ruta no existe."
+        if not self._es_carpeta(i):
+            return False, "Eso es un archivo, no una carpeta. No puedes entrar ahí."
+        return True, "OK"
+
+    def leer_contenido(self, ruta):
+        i = self._buscar(ruta)
+        if i is None: return None
+        r = self._registro(i)
+        return None if r[5] == self.SIN_CONTENIDO else self._cadena(r[4], r[5])
+
+    def listar_directorio(self, ruta):
+        i = self._buscar(ruta)
+        if i is None: return False, "Ruta no encontrada."
+        if not self._es_carpeta(i):
+            contenido = self.leer_contenido(ruta)
+            return True, f"Es un archivo: {self._nombre(i)} (Tiene {len(str(contenido))} letras)"
+        hijos = self._hijos(i)
+        if not hijos:
+            return True, "(carpeta vacía)"
+        return True, "\n".join(f"{self._nombre(h)} ({'folder' if self._es_carpeta(h) else 'file'})" for h in hijos)
+
+    def buscar_exacto(self, nombre):
+        k = self._bisect(self._off_exacto, lambda n: n, nombre)
+        rutas = []
+        while k < self._n_indice:
+            i = self._indice(self._off_exacto, k)
+            if self._nombre(i) != nombre:
+                break
+            rutas.append(self._ruta(i))
+            k += 1
+        return rutas
+
+    def buscar_autocompletado(self, prefix):
+        prefix = prefix.lower()
+        k = self._bisect(self._off_minusculas, str.lower, prefix)
+        nombres = set()
+        while k < self._n_indice:
+            nombre = self._nombre(self._indice(self._off_minusculas, k))
+            if not nombre.lower().startswith(prefix):
+                break
+            nombres.add(nombre)
+            k += 1
+        return sorted(nombres)
+
+    def recorrido_preorden(self, nodo=0, nivel=0):
+        """Mismo formato que `ArbolGeneral.recorrido_preorden`; `nodo` es un índice de la tabla."""
+        resultado = []
+        pila = [(nodo, nivel)]
+        while pila:
+            i, n = pila.pop()
+            r = self._registro(i)
+            tipo_icono = "📁" if r[9] == 0 else "📄"
+            resultado.append(f"{'  ' * n}{tipo_icono} {self._cadena(r[2], r[3])} [ID: {self._cadena(r[0], r[1])}]")
+            pila.extend((h, n + 1) for h in reversed(self._hijos(i)))
+        return resultado
+
+
+# --- COMPARACIÓN DE ÁRBOLES (diff) ---
+
+def comparar_arboles(raiz_a, raiz_b):
+    """Lista los cambios para pasar de `raiz_a` a `raiz_b` emparejando nodos por id.
+
+    Devuelve tuplas (tipo, ruta_a, ruta_b) con tipo creado, eliminado, movido,
+    renombrado o modificado. Los subárboles que son el mismo objeto (compartidos
+    entre versiones) o tienen el mismo hash Merkle se saltan enteros, así que el
+    costo depende del tamaño del cambio, no del árbol.
+    """
+    return [(c["tipo"], c["ruta_a"], c["ruta_b"]) for c in _diferencias(raiz_a, raiz_b)]
+
+def _cambio(tipo, ruta_a, ruta_b, nodo_a=None, nodo_b=None, padre_b=None):
+    return {"tipo": tipo, "ruta_a": ruta_a, "ruta_b": ruta_b,
+            "nodo_a": nodo_a, "nodo_b": nodo_b, "padre_b": padre_b}
+
+def _diferencias(raiz_a, raiz_b):
+    """Como comparar_arboles, pero cada cambio es un dict con los nodos involucrados
+    (nodo_a, nodo_b y padre_b, el padre en B) para poder aplicarlo con fusionar."""
+    cambios = []
+    eliminados = {}  # {id: (nodo, ruta)} subárboles que ya no están donde estaban
+    creados = {}     # {id: (nodo, ruta, padre)}
+    pendientes = [(raiz_a, raiz_b, "root", "root", None)]
+    while pendientes:
+        while pendientes:
+            a, b, ruta_a, ruta_b, padre_b = pendientes.pop()
+            if a is b or (a._hash is not None and a._hash == b._hash):
+                continue
+            if a.nombre != b.nombre:
+                cambios.append(_cambio("renombrado", ruta_a, ruta_b, a, b, padre_b))
+            if a.contenido != b.contenido or a.tipo_nodo != b.tipo_nodo:
+                cambios.append(_cambio("modificado", ruta_a, ruta_b, a, b, padre_b))
+            hijos_a = {h.id: h for h in a.hijos}
+            ids_b = set()
+            for hijo in b.hijos:
+                ids_b.add(hijo.id)
+                previo = hijos_a.get(hijo.id)
+                if previo is None:
+                    creados[hijo.id] = (hijo, f"{ruta_b}/{hijo.nombre}", b)
+                else:
+                    pendientes.append((previo, hijo, f"{ruta_a}/{previo.nombre}", f"{ruta_b}/{hijo.nombre}", b))
+            for hijo in a.hijos:
+                if hijo.id not in ids_b:
+                    eliminados[hijo.id] = (hijo, f"{ruta_a}/{hijo.nombre}")
+
+        # Mismo id que desapareció de un lado y apareció en otro: es un movimiento
+        emparejados = [(eliminados.pop(i), creados.pop(i)) for i in list(creados) if i in eliminados]
+        if not emparejados and creados and eliminados:
+            # Movido desde/hacia dentro de un subárbol que se creó o eliminó entero
+            dentro_eliminados = _ids_de_subarboles((n, r) for n, r in eliminados.values())
+            dentro_creados = _ids_de_subarboles((n, r) for n, r, _ in creados.values())
+            emparejados += [(dentro_eliminados[i], creados.pop(i)) for i in list(creados) if i in dentro_eliminados]
+            emparejados += [(eliminados.pop(i), dentro_creados[i]) for i in list(eliminados) if i in dentro_creados]
+        for (nodo_a, ruta_a), (nodo_b, ruta_b, padre_b) in emparejados:
+            cambios.append(_cambio("movido", ruta_a, ruta_b, nodo_a, nodo_b, padre_b))
+            pendientes.append((nodo_a, nodo_b, ruta_a, ruta_b, padre_b))
+
+    # Sin id en común: archivos con el mismo contenido se toman como movidos
+    por_contenido = {}
+    for id_nodo, (nodo, ruta) in eliminados.items():
+        if nodo.tipo_nodo == "file" and nodo.contenido:
+            por_contenido.setdefault(nodo.contenido, []).append(id_nodo)
+    for id_nodo, (nodo_b, ruta_b, padre_b) in list(creados.items()):
+        candidatos = por_contenido.get(nodo_b.contenido) if nodo_b.tipo_nodo == "file" else None
+        if candidatos:
+            nodo_a, ruta_a = eliminados.pop(candidatos.pop())
+            del creados[id_nodo]
+            cambios.append(_cambio("movido", ruta_a, ruta_b, nodo_a, nodo_b, padre_b))
+            if nodo_a.nombre != nodo_b.nombre:
+                cambios.append(_cambio("renombrado", ruta_a, ruta_b, nodo_a, nodo_b, padre_b))
+
+    cambios.extend(_cambio("eliminado", ruta, None, nodo) for nodo, ruta in eliminados.values())
+    cambios.extend(_cambio("creado", None, ruta, None, nodo, padre) for nodo, ruta, padre in creados.values())
+    return cambios
+
+def _ids_de_subarboles(subarboles):
+    """{id: (nodo, ruta, padre)} de todos los descendientes (sin las raíces) de los subárboles dados."""
+    encontrados = {}
+    pila = [(hijo, f"{ruta}/{hijo.nombre}", nodo) for nodo, ruta in subarboles for hijo in nodo.hijos]
+    while pila:
+        nodo, ruta, padre = pila.pop()
+        encontrados[nodo.id] = (nodo, ruta, padre)
+        pila.extend((hijo, f"{ruta}/{hijo.nombre}", nodo) for hijo in nodo.hijos)
+    return encontrados
+
+class _VistaJSON:
+    """Nodo de solo lectura sobre el dict ya parseado de un guardado.
+
+    Tiene la interfaz que usa el diff (id, nombre, hijos, _hash...) pero solo
+    envuelve los nodos que se visitan, así comparar dos guardados no arma el
+    árbol completo de objetos Nodo.
+    """
+    __slots__ = ("_data", "_hijos", "_blobs")
+
+    def __init__(self, data, blobs):
+        self._data = data
+        self._hijos = None
+        self._blobs = blobs
+
+    id = property(lambda self: self._data["id"])
+    nombre = property(lambda self: self._data["name"])
+    tipo_nodo = property(lambda self: self._data["type"])
+    _hash = property(lambda self: self._data.get("hash"))
+
+    @property
+    def contenido(self):
+        ref = self._data.get("content_ref")
+        return self._blobs[ref] if ref is not None else self._data["content"]
+
+    @property
+    def hijos(self):
+        if self._hijos is None:
+            self._hijos = [_VistaJSON(h, self._blobs) for h in self._data["children"]]
+        return self._hijos
+
+    def a_nodo(self, excluir=()):
+        """Convierte el subárbol a Nodo (mismos ids), omitiendo los ids de `excluir`."""
+        nuevo = Nodo(self.nombre, self.tipo_nodo, self.contenido, self.id)
+        nuevo.hijos = [h.a_nodo(excluir) for h in self.hijos if h.id not in excluir]
+        return nuevo
+
+def _abrir_guardado(nombre_archivo):
+    """Abre un guardado en modo texto, detectando gzip/xz por sus bytes mágicos."""
+    with open(nombre_archivo, 'rb') as f:
+        magia = f.read(6)
+    if magia[:2] == b"\x1f\x8b":
+        return gzip.open(nombre_archivo, 'rt', encoding='utf-8')
+    if magia == b"\xfd7zXZ\x00":
+        return lzma.open(nombre_archivo, 'rt', encoding='utf-8')
+    return open(nombre_archivo, 'r', encoding='utf-8')
+
+def _leer_vista(nombre_archivo):
+    with _abrir_guardado(nombre_archivo) as f:
+        data = json.load(f)
+    return _VistaJSON(data["filesystem"] if "filesystem" in data else data, data.get("blobs", {}))
+
+def formatear_cambios(cambios):
+    if not cambios: return "Sin diferencias."
+    iconos = {"creado": "+", "eliminado": "-", "modificado": "~", "movido": "→", "renombrado": "✎"}
+    salida = []
+    for tipo, ruta_a, ruta_b in cambios:
+        if ruta_a and ruta_b and ruta_a != ruta_b:
+            detalle = f"{ruta_a} → {ruta_b}"
+        else:
+            detalle = ruta_a or ruta_b
+        salida.append(f"  {iconos[tipo]} {tipo:<11}{detalle}")
+    return "\n".join(salida)
+
+
+# --- ANÁLISIS MASIVO CON NUMPY (analyze) ---
+
+np = None  # NumPy es opcional: solo lo usa `analyze`, y se importa la primera vez
+
+def _cargar_numpy():
+    """Importa NumPy al primer uso (ImportError si no está instalado)."""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+class AnalisisArbol:
+    """El árbol exportado una vez a columnas de NumPy, en orden por niveles (BFS): `padre`
+    (índice, -1 en la raíz), `profundidad`, `carpeta` (bool), `bytes` del contenido y
+    `largo_nombre`. Como los nodos de cada nivel quedan contiguos y con los padres en orden,
+    todo lo demás (histogramas, fan-out, percentiles por carpeta, tamaños de subárbol) se
+    calcula con operaciones vectorizadas de a un nivel por vez, sin recorrer nodos en Python.
+
+    Los subárboles aún en disco se leen sin engancharlos al árbol vivo (`hijos_sin_cargar`).
+    """
+
+    def __init__(self, raiz):
+        np = _cargar_numpy()
+        inicio = time.perf_counter()
+        padres, carpetas, bytes_, nombres = [-1], [True], [0], [raiz.nombre]
+        niveles = [0, 1]  # Dónde empieza cada nivel
+        nivel = [raiz]
+        while True:
+            siguiente = []
+            for i, nodo in enumerate(nivel, niveles[-2]):
+                hijos = nodo._hijos if nodo._hijos is not None else nodo.hijos_sin_cargar()
+                if not hijos: continue
+                padres.extend([i] * len(hijos))
+                carpetas.extend([h.tipo_nodo == "folder" for h in hijos])
+                bytes_.extend([h.tamano_bytes for h in hijos])
+                nombres.extend([h.nombre for h in hijos])
+                siguiente.extend(hijos)
+            if not siguiente: break
+            niveles.append(niveles[-1] + len(siguiente))
+            nivel = siguiente
+        self.nombres = nombres
+        self.padre = np.array(padres, dtype=np.int64)
+        self.carpeta = np.array(carpetas, dtype=bool)
+        self.bytes = np.array(bytes_, dtype=np.int64)
+        self.largo_nombre = np.fromiter(map(len, nombres), dtype=np.int32, count=len(nombres))
+        self.niveles = np.array(niveles, dtype=np.int64)
+        self.profundidad = np.repeat(np.arange(len(niveles) - 1, dtype=np.int32), np.diff(self.niveles))
+        self.segundos_exportar = time.perf_counter() - inicio
+        self._subarboles = None
+
+    def __len__(self):
+        return len(self.padre)
+
+    def _nivel(self, d):
+        return slice(int(self.niveles[d]), int(self.niveles[d + 1]))
+
+    def ruta(self, i):
+        partes = []
+        while i >= 0:
+            partes.append(self.nombres[i])
+            i = int(self.padre[i])
+        return "/".join(reversed(partes))
+
+    def histograma_profundidad(self):
+        """Cuántos nodos hay en cada profundidad (la raíz está en la 0)."""
+        return np.diff(self.niveles).tolist()
+
+    def hijos_por_carpeta(self):
+        return np.bincount(self.padre[1:], minlength=len(self))[self.carpeta]
+
+    def distribucion_fanout(self):
+        """Hijos por carpeta: promedio, percentiles y cuántas carpetas caen en cada balde
+        de potencias de 2 ("0", "1", "2-3", "4-7", ...)."""
+        hijos = self.hijos_por_carpeta()
+        baldes = np.zeros(len(hijos), dtype=np.int64)
+        con_hijos = hijos > 0
+        baldes[con_hijos] = np.floor(np.log2(hijos[con_hijos])).astype(np.int64) + 1
+        etiquetas = lambda b: "0" if b == 0 else "1" if b == 1 else f"{2 ** (b - 1)}-{2 ** b - 1}"
+        p50, p90, p99 = np.percentile(hijos, (50, 90, 99), method="lower").tolist()
+        return {
+            "carpetas": len(hijos),
+            "promedio": float(hijos.mean()),
+            "p50": p50, "p90": p90, "p99": p99,
+            "max": int(hijos.max()),
+            "baldes": [(etiquetas(b), int(c)) for b, c in enumerate(np.bincount(baldes)) if c],
         }
-        self.papelera.append(item_papelera) 
-        return True, "Enviado a papelera."
 
-    def ver_papelera(self):
-        if not self.papelera: return "La papelera está vacía."
-        salida = []
-        for idx, item in enumerate(self.papelera):
-            salida.append(f"[{idx}] {item['nodo'].nombre} (Venía de: {item['path_origen']})")
-        return "\n".join(salida)
+    def _carpeta_de_arriba(self):
+        """Para cada nodo, el índice de su ancestro en el nivel 1 (la raíz es su propio tope)."""
+        tope = np.arange(len(self))
+        for d in range(2, len(self.niveles) - 1):
+            nivel = self._nivel(d)
+            tope[nivel] = tope[self.padre[nivel]]
+        return tope
 
-    def restaurar_nodo(self, indice):
-        try:
-            idx = int(indice)
-            if idx < 0 or idx >= len(self.papelera): return False, "Número inválido."
-        except ValueError: return False, "Debes darme el número del archivo."
+    def percentiles_por_carpeta(self, percentiles=(50, 90, 99)):
+        """Tamaño de los archivos de cada carpeta de root: [(nombre, archivos, bytes totales,
+        {p: bytes}, máximo)] de la que más pesa a la que menos. Un solo lexsort para todas."""
+        tope = self._carpeta_de_arriba()
+        archivos = ~self.carpeta & (self.profundidad > 1)
+        grupos, tamanos = tope[archivos], self.bytes[archivos]
+        if not len(grupos): return []
+        orden = np.lexsort((tamanos, grupos))
+        grupos, tamanos = grupos[orden], tamanos[orden]
+        duenos, inicios, cuentas = np.unique(grupos, return_index=True, return_counts=True)
+        totales = np.add.reduceat(tamanos, inicios)
+        valores = {p: tamanos[inicios + (cuentas - 1) * p // 100] for p in percentiles}
+        maximos = tamanos[inicios + cuentas - 1]
+        filas = [(self.nombres[d], int(c), int(t), {p: int(v[k]) for p, v in valores.items()}, int(m))
+                 for k, (d, c, t, m) in enumerate(zip(duenos.tolist(), cuentas, totales, maximos))]
+        return sorted(filas, key=lambda f: -f[2])
 
-        item = self.papelera[idx]
-        nodo_a_restaurar = item['nodo']
-        path_padre_str = item['path_padre']
+    def subarboles(self):
+        """(nodos, bytes) de cada subárbol, sumando de a un nivel desde el más profundo:
+        los hijos de un nivel están agrupados por padre, así que alcanza un reduceat."""
+        if self._subarboles is None:
+            nodos = np.ones(len(self), dtype=np.int64)
+            total = self.bytes.copy()
+            for d in range(len(self.niveles) - 2, 0, -1):
+                nivel = self._nivel(d)
+                padres = self.padre[nivel]
+                inicios = np.flatnonzero(np.concatenate(([True], padres[1:] != padres[:-1])))
+                duenos = padres[inicios]
+                nodos[duenos] += np.add.reduceat(nodos[nivel], inicios)
+                total[duenos] += np.add.reduceat(total[nivel], inicios)
+            self._subarboles = (nodos, total)
+        return self._subarboles
 
-        padre, _ = self._buscar_nodo_y_padre(path_padre_str)
-        if not padre: return False, "La carpeta original ya no existe, no sé dónde ponerlo."
+    def mayores_subarboles(self, k=10):
+        """Las `k` carpetas (sin contar root) que más bytes suman: [(ruta, nodos, bytes)]."""
+        nodos, total = self.subarboles()
+        candidatas = np.flatnonzero(self.carpeta[1:]) + 1
+        if not len(candidatas): return []
+        if len(candidatas) > k:
+            candidatas = candidatas[np.argpartition(-total[candidatas], k - 1)[:k]]
+        candidatas = candidatas[np.lexsort((-nodos[candidatas], -total[candidatas]))]
+        return [(self.ruta(int(i)), int(nodos[i]), int(total[i])) for i in candidatas]
 
-        for hijo in padre.hijos:
-            if hijo.nombre == nodo_a_restaurar.nombre: return False, "Conflicto: Ya hay un archivo con ese nombre ahí."
+    def reporte(self, k=10):
+        inicio = time.perf_counter()
+        profundidades = self.histograma_profundidad()
+        fanout = self.distribucion_fanout()
+        por_carpeta = self.percentiles_por_carpeta()
+        mayores = self.mayores_subarboles(k)
+        calculo = time.perf_counter() - inicio
+        lineas = [f"📐 {len(self):,} nodos, {int(self.carpeta.sum()):,} carpetas, {int(self.bytes.sum()):,} bytes",
+                  "  Nodos por profundidad:"]
+        ancho = max(profundidades)
+        for d, cantidad in enumerate(profundidades):
+            lineas.append(f"    {d:>3} {cantidad:>10,} {'█' * max(1, round(30 * cantidad / ancho))}")
+        lineas.append(f"  Hijos por carpeta: promedio {fanout['promedio']:.1f}, p50 {fanout['p50']}, "
+                      f"p90 {fanout['p90']}, p99 {fanout['p99']}, máx {fanout['max']}")
+        lineas.extend(f"    {etiqueta:>11} hijos: {cantidad:,} carpetas" for etiqueta, cantidad in fanout["baldes"])
+        if por_carpeta:
+            lineas.append("  Tamaño de archivo por carpeta de root (bytes):")
+            for nombre, archivos, total, percentiles, maximo in por_carpeta[:k]:
+                lineas.append(f"    {nombre:<20} {archivos:>9,} archivos {total:>13,} total  "
+                              f"p50 {percentiles[50]:,}  p90 {percentiles[90]:,}  p99 {percentiles[99]:,}  máx {maximo:,}")
+            if len(por_carpeta) > k:
+                lineas.append(f"    ... y {len(por_carpeta) - k} carpetas más")
+        if mayores:
+            lineas.append("  Subárboles más pesados:")
+            lineas.extend(f"    {total:>13,} bytes {nodos:>9,} nodos  {ruta}" for ruta, nodos, total in mayores)
+        lineas.append(f"  ⏱️  Exportar a columnas: {self.segundos_exportar * 1e3:.0f} ms, calcular: {calculo * 1e3:.0f} ms")
+        return "\n".join(lineas)
 
-        padre.hijos.append(nodo_a_restaurar)
-        self.papelera.pop(idx)
-        ruta_completa = f"{path_padre_str}/{nodo_a_restaurar.nombre}"
-        self._actualizar_trie("create", name_new=nodo_a_restaurar.nombre, ruta=ruta_completa)
-        return True, f"Restaurado en {path_padre_str}"
+
+# --- ÁRBOL PARTICIONADO EN PROCESOS (un ArbolGeneral por núcleo) ---
+
+def _particion_de(nombre, particiones):
+    """Partición dueña de una entrada de root. crc32 y no hash(): tiene que dar lo mismo en
+    cada proceso y en cada ejecución (los guardados de cada partición dependen de esto)."""
+    return zlib.crc32(nombre.encode()) % particiones
+
+def _subarbol_a_datos(nodo):
+    """(dict del subárbol, {hash: texto}) para mandarlo a otro proceso con sus contenidos."""
+    blobs, pila = {}, [nodo]
+    while pila:
+        actual = pila.pop()
+        if isinstance(actual._contenido, Blob):
+            blobs[actual._contenido.hash] = actual._contenido.valor()
+        pila.extend(actual.hijos)
+    return nodo.to_dict(), blobs
+
+
+class _Particion:
+    """Lado del trabajador: un ArbolGeneral con las entradas de root que le tocan, más las
+    dos fases de un mv/cp entre particiones (preparar y confirmar, o abortar)."""
+    # Lo que el coordinador puede pedirle al árbol por nombre
+    METODOS_ARBOL = {"crear_nodo", "mover_nodo", "renombrar_nodo", "copiar_nodo", "modificar_contenido",
+                     "eliminar_nodo", "vaciar_papelera", "buscar_exacto", "buscar_autocompletado",
+                     "buscar_patron", "validar_ruta", "calcular_tamano", "calcular_altura", "guardar_arbol"}
+    METODOS_PROPIOS = {"listar", "entradas_root", "preparar_envio", "preparar_recepcion",
+                       "confirmar_envio", "confirmar_recepcion", "abortar"}
+
+    def __init__(self, archivo=None):
+        self.arbol = ArbolGeneral()
+        if archivo and os.path.exists(archivo):
+            self.arbol.cargar_arbol(archivo)
+        self.envios = {}        # {token: ruta} subárboles preparados para salir
+        self.recepciones = {}   # {token: (ruta_padre, nombre)} lugares reservados
+
+    def ejecutar(self, metodo, args):
+        if metodo in self.METODOS_PROPIOS:
+            return getattr(self, metodo)(*args)
+        if metodo in self.METODOS_ARBOL:
+            return getattr(self.arbol, metodo)(*args)
+        return False, f"Operación desconocida: {metodo}"
+
+    def listar(self, ruta, orden=None, desde=0, limite=None, reverso=False):
+        ok, total, lineas = self.arbol.paginar_directorio(ruta, orden, desde, limite, reverso)
+        return ok, total, list(lineas) if ok else lineas
+
+    def entradas_root(self):
+        return [(h.nombre, h.tipo_nodo, h.tamano_bytes) for h in self.arbol.root.hijos]
+
+    def preparar_envio(self, token, ruta):
+        nodo, padre = self.arbol._buscar_nodo_y_padre(ruta)
+        if not nodo or not padre: return False, "No encuentro lo que quieres mover."
+        self.envios[token] = ruta
+        return True, _subarbol_a_datos(nodo)
+
+    def preparar_recepcion(self, token, ruta_padre, nombre):
+        carpeta, _ = self.arbol._buscar_nodo_y_padre(ruta_padre)
+        if not carpeta or carpeta.tipo_nodo == 'file': return False, "El destino no es válido."
+        if any(h.nombre == nombre for h in carpeta.hijos) or (ruta_padre, nombre) in self.recepciones.values():
+            return False, "Ya hay algo con ese nombre en el destino."
+        self.recepciones[token] = (ruta_padre, nombre)
+        return True, None
+
+    def confirmar_recepcion(self, token, datos):
+        ruta_padre, nombre = self.recepciones.pop(token)
+        data, blobs = datos
+        nodo = Nodo.from_dict(data, None, blobs)
+        if nodo.nombre != nombre:
+            nodo.nombre, nodo._hash = nombre, None
+        return self.arbol._insertar_subarbol(ruta_padre, nodo)
+
+    def confirmar_envio(self, token):
+        ruta = self.envios.pop(token)
+        if self.arbol._desenganchar(ruta) is None: return False, f"{ruta} ya no está."
+        return True, ruta
+
+    def abortar(self, token):
+        self.envios.pop(token, None)
+        self.recepciones.pop(token, None)
+        return True, None
+
+def _trabajar_particion(conexion, archivo):
+    """Bucle de un proceso trabajador: recibe lotes [(método, args)] y devuelve la lista de
+    resultados; None lo termina."""
+    particion = _Particion(archivo)
+    while True:
+        lote = conexion.recv()
+        if lote is None:
+            break
+        resultados = []
+        for metodo, args in lote:
+            try:
+                resultados.append(particion.ejecutar(metodo, args))
+            except Exception as e:
+                resultados.append((False, f"Error en la partición: {e}"))
+        conexion.send(resultados)
+    conexion.close()
+
+
+class ArbolParticionado:
+    """Un árbol repartido entre `particiones` procesos: cada entrada de root (y todo lo que
+    cuelga de ella) vive en el ArbolGeneral de la partición que le asigna `_particion_de`.
+
+    El coordinador manda cada operación con ruta a la partición dueña; `find`/`search` y
+    el `ls` de root preguntan a todas a la vez y juntan las respuestas. `aplicar` manda
+    lotes: cada partición recibe de un saque lo suyo y los procesos trabajan en paralelo,
+    sin compartir el GIL. Un mv (o un ren de root, o un cp) que cambia de partición se
+    hace en dos fases: las dos partes validan y reservan (el origen manda el subárbol) y
+    recién entonces el destino lo inserta y el origen lo suelta; si una fase falla, se
+    abortan las dos y no cambia nada. El coordinador no intercala otras operaciones entre
+    las fases. Cada partición tiene su propia papelera e historial (`restore`/`undo` no
+    cruzan particiones).
+    """
+    MANIFIESTO = "particiones.json"
+
+    def __init__(self, particiones=None, directorio=None):
+        self.particiones = particiones or os.cpu_count() or 1
+        self.directorio = directorio
+        if directorio:
+            manifiesto = os.path.join(directorio, self.MANIFIESTO)
+            if os.path.exists(manifiesto):
+                with open(manifiesto, encoding='utf-8') as f:
+                    guardadas = json.load(f)["particiones"]
+                if guardadas != self.particiones:
+                    raise ValueError(f"{directorio} tiene {guardadas} particiones, no {self.particiones}.")
+        import multiprocessing
+        contexto = multiprocessing.get_context()
+        self._conexiones, self._procesos = [], []
+        for i in range(self.particiones):
+            nuestra, suya = contexto.Pipe()
+            proceso = contexto.Process(target=_trabajar_particion, args=(suya, self._archivo(i)), daemon=True)
+            proceso.start()
+            suya.close()
+            self._conexiones.append(nuestra)
+            self._procesos.append(proceso)
+        self._tokens = itertools.count()
+        self.entre_particiones = 0  # mv/ren/cp hechos en dos fases
+
+    def _archivo(self, i):
+        return os.path.join(self.directorio, f"particion_{i}.json") if self.directorio else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+    def cerrar(self):
+        for conexion, proceso in zip(self._conexiones, self._procesos):
+            conexion.send(None)
+            conexion.close()
+            proceso.join()
+        self._conexiones, self._procesos = [], []
+
+    # --- ruteo ---
+
+    def _duena(self, ruta):
+        """Partición de una ruta (la de su entrada de root); None para root."""
+        partes = normalizar_ruta(ruta).split('/')
+        return _particion_de(partes[1], self.particiones) if len(partes) > 1 else None
+
+    def _pedir(self, particion, metodo, *args):
+        self._conexiones[particion].send([(metodo, args)])
+        return self._conexiones[particion].recv()[0]
+
+    def _pedir_a_todas(self, metodo, *args):
+        for conexion in self._conexiones:
+            conexion.send([(metodo, args)])
+        return [conexion.recv()[0] for conexion in self._conexiones]
+
+    def _particion_directa(self, metodo, args):
+        """La partición que resuelve sola la operación, o None si hay que coordinarla."""
+        if metodo == "crear_nodo":
+            return self._duena(f"{normalizar_ruta(args[0])}/{args[1]}")
+        if metodo in ("modificar_contenido", "eliminar_nodo"):
+            return self._duena(args[0])
+        if metodo == "renombrar_nodo":
+            ruta = normalizar_ruta(args[0])
+            duena = self._duena(ruta)
+            return duena if duena == self._duena(f"{ruta.rsplit('/', 1)[0]}/{args[1]}") else None
+        if metodo == "mover_nodo":
+            ruta = normalizar_ruta(args[0])
+            duena = self._duena(ruta)
+            return duena if duena == self._duena(f"{normalizar_ruta(args[1])}/{ruta.rsplit('/', 1)[-1]}") else None
+        return None
+
+    def aplicar(self, operaciones):
+        """Ejecuta [(método, *args)] y devuelve sus resultados en orden. Las de una sola
+        partición se juntan en un lote por partición y corren en paralelo; las que hay que
+        coordinar cortan el lote (todo lo anterior termina antes)."""
+        resultados = [None] * len(operaciones)
+        lotes = {}
+
+        def vaciar_lotes():
+            for particion, lote in lotes.items():
+                self._conexiones[particion].send([(metodo, args) for _, metodo, args in lote])
+            for particion, lote in lotes.items():
+                for (i, _, _), resultado in zip(lote, self._conexiones[particion].recv()):
+                    resultados[i] = resultado
+            lotes.clear()
+
+        for i, (metodo, *args) in enumerate(operaciones):
+            particion = self._particion_directa(metodo, args)
+            if particion is not None:
+                lotes.setdefault(particion, []).append((i, metodo, tuple(args)))
+            else:
+                vaciar_lotes()
+                resultados[i] = getattr(self, metodo)(*args)
+        vaciar_lotes()
+        return resultados
+
+    # --- operaciones ---
+
+    def crear_nodo(self, ruta_padre, nombre, tipo, contenido=None):
+        return self._pedir(self._duena(f"{normalizar_ruta(ruta_padre)}/{nombre}"),
+                           "crear_nodo", ruta_padre, nombre, tipo, contenido)
+
+    def modificar_contenido(self, ruta_nodo, contenido):
+        particion = self._duena(ruta_nodo)
+        if particion is None: return False, "Solo los archivos tienen contenido."
+        return self._pedir(particion, "modificar_contenido", ruta_nodo, contenido)
+
+    def eliminar_nodo(self, ruta_nodo):
+        particion = self._duena(ruta_nodo)
+        if particion is None: return False, "No se puede eliminar (¿es root o no existe?)."
+        return self._pedir(particion, "eliminar_nodo", ruta_nodo)
+
+    def mover_nodo(self, ruta_origen, ruta_destino):
+        ruta_origen, ruta_destino = normalizar_ruta(ruta_origen), normalizar_ruta(ruta_destino)
+        if self._duena(ruta_origen) is None: return False, "No encuentro lo que quieres mover."
+        nombre = ruta_origen.rsplit('/', 1)[1]
+        if self._duena(ruta_origen) == self._duena(f"{ruta_destino}/{nombre}"):
+            return self._pedir(self._duena(ruta_origen), "mover_nodo", ruta_origen, ruta_destino)
+        ok, msg = self._trasladar(ruta_origen, ruta_destino, nombre, mover=True)
+        return (True, f"Movido exitosamente a {ruta_destino}") if ok else (False, msg)
+
+    def renombrar_nodo(self, ruta_nodo, nuevo_nombre):
+        ruta_nodo = normalizar_ruta(ruta_nodo)
+        if self._duena(ruta_nodo) is None: return False, "No encuentro el archivo."
+        ruta_padre = ruta_nodo.rsplit('/', 1)[0]
+        if self._duena(ruta_nodo) == self._duena(f"{ruta_padre}/{nuevo_nombre}"):
+            return self._pedir(self._duena(ruta_nodo), "renombrar_nodo", ruta_nodo, nuevo_nombre)
+        # Solo pasa en root: el nombre nuevo es de otra partición
+        ok, msg = self._trasladar(ruta_nodo, ruta_padre, nuevo_nombre, mover=True)
+        return (True, f"Renombrado a {nuevo_nombre}") if ok else (False, msg)
+
+    def copiar_nodo(self, ruta_origen, ruta_destino):
+        ruta_origen, ruta_destino = normalizar_ruta(ruta_origen), normalizar_ruta(ruta_destino)
+        if self._duena(ruta_origen) is None: return False, "No encuentro lo que quieres copiar."
+        # Mismas reglas que ArbolGeneral.copiar_nodo: a una carpeta existente entra con su nombre
+        if self.validar_ruta(ruta_destino)[0]:
+            ruta_padre, nombre = ruta_destino, ruta_origen.rsplit('/', 1)[1]
+        else:
+            ruta_padre, _, nombre = ruta_destino.rpartition('/')
+        if self._duena(ruta_origen) == self._duena(f"{ruta_padre}/{nombre}"):
+            return self._pedir(self._duena(ruta_origen), "copiar_nodo", ruta_origen, ruta_destino)
+        ok, msg = self._trasladar(ruta_origen, ruta_padre, nombre, mover=False)
+        return (True, f"Copiado a {ruta_padre}/{nombre}") if ok else (False, msg)
+
+    def _trasladar(self, ruta_origen, ruta_padre, nombre, mover):
+        """mv/cp entre dos particiones, en dos fases."""
+        origen, destino = self._duena(ruta_origen), self._duena(f"{ruta_padre}/{nombre}")
+        token = next(self._tokens)
+        # Fase 1: el destino valida y reserva el lugar; el origen valida y manda el subárbol
+        self._conexiones[origen].send([("preparar_envio", (token, ruta_origen))])
+        self._conexiones[destino].send([("preparar_recepcion", (token, ruta_padre, nombre))])
+        ok_origen, datos = self._conexiones[origen].recv()[0]
+        ok_destino, msg = self._conexiones[destino].recv()[0]
+        if not (ok_origen and ok_destino):
+            self._pedir(origen, "abortar", token)
+            self._pedir(destino, "abortar", token)
+            return False, datos if not ok_origen else msg
+        # Fase 2: el destino inserta; recién entonces el origen suelta (o, en un cp, solo libera)
+        ok, msg = self._pedir(destino, "confirmar_recepcion", token, datos)
+        if not ok:
+            self._pedir(origen, "abortar", token)
+            return False, msg
+        self._pedir(origen, "confirmar_envio" if mover else "abortar", token)
+        self.entre_particiones += 1
+        return True, msg
+
+    def validar_ruta(self, ruta):
+        particion = self._duena(ruta)
+        if particion is None: return True, "OK"
+        return self._pedir(particion, "validar_ruta", ruta)
+
+    def listar_directorio(self, ruta, orden=None, desde=0, limite=None, reverso=False):
+        """Como ArbolGeneral.listar_directorio. Root junta las entradas de todas las
+        particiones y, sin un orden pedido, las muestra por nombre."""
+        particion = self._duena(ruta)
+        if particion is not None:
+            ok, total, lineas = self._pedir(particion, "listar", ruta, orden, desde, limite, reverso)
+            if not ok: return False, lineas
+            return True, "\n".join(lineas) if total else "(carpeta vacía)"
+        if orden is not None and orden not in IndiceListados.CLAVES:
+            return False, f"Orden inválido: {orden} (usa {', '.join(IndiceListados.CLAVES)})."
+        entradas = [e for parte in self._pedir_a_todas("entradas_root") for e in parte]
+        if not entradas: return True, "(carpeta vacía)"
+        claves = {None: lambda e: e[0].lower(), "name": lambda e: e[0].lower(),
+                  "type": lambda e: (e[1] != "folder", e[0].lower()), "size": lambda e: (e[2], e[0].lower())}
+        entradas.sort(key=claves[orden], reverse=reverso)
+        entradas = entradas[desde:None if limite is None else desde + limite]
+        if orden == "size":
+            return True, "\n".join(f"{nombre} ({tipo}, {tamano:,} B)" for nombre, tipo, tamano in entradas)
+        return True, "\n".join(f"{nombre} ({tipo})" for nombre, tipo, _ in entradas)
+
+    def buscar_exacto(self, nombre):
+        return sorted(r for parte in self._pedir_a_todas("buscar_exacto", nombre) for r in parte)
+
+    def buscar_autocompletado(self, prefix):
+        return sorted({n for parte in self._pedir_a_todas("buscar_autocompletado", prefix) for n in parte})
+
+    def buscar_patron(self, patron):
+        return sorted(r for parte in self._pedir_a_todas("buscar_patron", patron) for r in parte)
 
     def vaciar_papelera(self):
-        c = len(self.papelera)
-        self.papelera = []
-        return True, f"Se eliminaron {c} elementos para siempre."
+        resultados = self._pedir_a_todas("vaciar_papelera")
+        return all(ok for ok, _ in resultados), "\n".join(msg for _, msg in resultados)
 
-    # --- PERSISTENCIA ---
+    def calcular_tamano(self):
+        # Cada partición cuenta su propia raíz
+        return sum(self._pedir_a_todas("calcular_tamano")) - (self.particiones - 1)
 
-    def guardar_arbol(self, nombre_archivo="./root/mi_filesystem.json"):
-        try:
-            papelera_serializada = []
-            for item in self.papelera:
-                papelera_serializada.append({
-                    "path_origen": item["path_origen"],
-                    "path_padre": item["path_padre"],
-                    "nodo": item["nodo"].to_dict()
-                })
-            data = {"filesystem": self.root.to_dict(), "trash": papelera_serializada}
-            
-            os.makedirs(os.path.dirname(nombre_archivo), exist_ok=True) 
-            
-            with open(nombre_archivo, 'w') as f: json.dump(data, f, indent=4)
-            return True, f"Guardado correctamente en {nombre_archivo}"
-        except Exception as e: return False, str(e)
+    def calcular_altura(self):
+        return max(self._pedir_a_todas("calcular_altura"))
 
-    def cargar_arbol(self, nombre_archivo="./root/mi_filesystem.json"):
-        if not os.path.exists(nombre_archivo): return False, "No encuentro el archivo de guardado."
+    def guardar(self, directorio=None):
+        """Guarda cada partición en `directorio/particion_<i>.json`, más el manifiesto con la
+        cantidad de particiones (abrir con otra cantidad cambiaría las dueñas)."""
+        directorio = directorio or self.directorio
+        if not directorio: return False, "Falta el directorio donde guardar."
+        os.makedirs(directorio, exist_ok=True)
+        for conexion, i in zip(self._conexiones, itertools.count()):
+            conexion.send([("guardar_arbol", (os.path.join(directorio, f"particion_{i}.json"),))])
+        resultados = [conexion.recv()[0] for conexion in self._conexiones]
+        fallidos = [msg for ok, msg in resultados if not ok]
+        if fallidos: return False, "\n".join(fallidos)
+        _escribir_archivo_atomico(os.path.join(directorio, self.MANIFIESTO),
+                                  lambda f: json.dump({"particiones": self.particiones}, f))
+        return True, f"Guardadas {self.particiones} particiones en {directorio}"
+
+
+# --- PARTE 5: AUTOGUARDADO EN SEGUNDO PLANO ---
+
+class Instantanea:
+    """Estado congelado del árbol: comparte todos los nodos con el árbol vivo."""
+    def __init__(self, root, papelera, epoca, cambios):
+        self.root = root
+        self.papelera = papelera
+        self.epoca = epoca
+        self.cambios = cambios
+        self.etiqueta = ""
+        self.fecha = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def guardar(self, nombre_archivo):
+        _guardar_estado_atomico(self.root, list(self.papelera), nombre_archivo)
+
+
+class AutoGuardado:
+    """Guarda el árbol cada `intervalo` segundos en un hilo trabajador.
+
+    La consola debe ejecutar cada comando con `candado` tomado; así la
+    instantánea se toma siempre entre dos comandos y es consistente. Soltarla también
+    toca el estado de congelado del árbol, así que el hilo no la suelta: la suelta
+    `soltar_terminada`, que la consola llama con el candado tomado antes de cada comando.
+    """
+    def __init__(self, arbol, nombre_archivo="./root/mi_filesystem.json", intervalo=30.0):
+        self.arbol = arbol
+        self.nombre_archivo = nombre_archivo
+        self.intervalo = intervalo
+        self.candado = threading.Lock()
+        self.guardados = 0
+        self.ultimo_error = None
+        self.ultima_duracion = 0.0
+        self._cambios_guardados = arbol._cambios
+        self._trabajador = None
+        self._instantanea = None  # La del último guardado, hasta que se suelte
+        self._parar = threading.Event()
+        self._temporizador = None
+
+    def iniciar(self):
+        if self.activo(): return
+        # Un Event nuevo por hilo: un temporizador viejo que aún no despertó no revive
+        self._parar = threading.Event()
+        self._temporizador = threading.Thread(target=self._bucle, args=(self._parar,), daemon=True)
+        self._temporizador.start()
+
+    def detener(self, esperar=True):
+        self._parar.set()
+        if esperar: self.esperar()
+
+    def activo(self):
+        return bool(self._temporizador and self._temporizador.is_alive() and not self._parar.is_set())
+
+    def guardando(self):
+        return bool(self._trabajador and self._trabajador.is_alive())
+
+    def esperar(self):
+        trabajador = self._trabajador
+        if trabajador: trabajador.join()
+        self.soltar_terminada()
+
+    def soltar_terminada(self):
+        """Suelta la instantánea de un guardado que ya terminó. Va con `candado` tomado (o
+        desde el hilo de la consola): `liberar_instantanea` no puede cruzarse con un
+        `_congelar` de otro comando."""
+        if self._instantanea is not None and not self.guardando():
+            self.arbol.liberar_instantanea(self._instantanea)
+            self._instantanea = None
+
+    def marcar_guardado(self):
+        """Avisa que el árbol ya se guardó por otra vía (save/exit/load)."""
+        self._cambios_guardados = self.arbol._cambios
+
+    def seguir(self, nombre_archivo):
+        """Apunta el autoguardado al guardado que se acaba de cargar o escribir, para no pisar
+        otro con este árbol. La instantánea solo se escribe como JSON: si el guardado es una
+        base SQLite o un directorio fragmentado, no se autoguarda (None)."""
+        if os.path.isdir(nombre_archivo) or nombre_archivo.endswith(("/", os.sep)) or _es_base_sqlite(nombre_archivo):
+            nombre_archivo = None
+        self.nombre_archivo = nombre_archivo
+        self.marcar_guardado()
+
+    def _bucle(self, parar):
+        while not parar.wait(self.intervalo):
+            self.guardar_ahora()
+
+    def guardar_ahora(self):
+        """Lanza un guardado si hay cambios y no hay otro en curso. Devuelve True si lo lanzó."""
+        with self.candado:
+            self.soltar_terminada()
+            # Con el árbol en una base SQLite cada operación ya quedó escrita
+            if (self.nombre_archivo is None or self.arbol._sqlite or self.guardando()
+                    or self.arbol._cambios == self._cambios_guardados):
+                return False
+            inst = self._instantanea = self.arbol.tomar_instantanea()
+            self._trabajador = threading.Thread(target=self._escribir, args=(inst,), daemon=True)
+            self._trabajador.start()
+            return True
+
+    def _escribir(self, inst):
+        inicio = time.perf_counter()
         try:
-            with open(nombre_archivo, 'r') as f:
-                data = json.load(f)
-                if "filesystem" in data:
-                    root_data, trash_data = data["filesystem"], data.get("trash", [])
-                else: root_data, trash_data = data, []
+            inst.guardar(self.nombre_archivo)
+            self._cambios_guardados = inst.cambios
+            self.guardados += 1
+            self.ultimo_error = None
+        except Exception as e:
+            self.ultimo_error = str(e)
+        finally:
+            self.ultima_duracion = time.perf_counter() - inicio
 
-                self.root = Nodo.from_dict(root_data)
-                self.papelera = []
-                for item in trash_data:
-                    self.papelera.append({
-                        "path_origen": item["path_origen"],
-                        "path_padre": item["path_padre"],
-                        "nodo": Nodo.from_dict(item["nodo"])
-                    })
-                # Reconstruir índices
-                self.trie = Trie()
-                self.hash_map = {}
-                self._indexar_trie_recursivamente(self.root)
-            return True, "Sistema cargado correctamente."
-        except Exception as e: return False, str(e)
 
+class ConstructorIndices:
+    """Arma en un hilo, de a uno, los índices activos que un `load` con `diferir_indices`
+    dejó sin armar: primero el HashMap y el Trie (los de `search`, `find` y TAB).
+
+    Como AutoGuardado, comparte `candado` con la consola: cada índice se arma con él tomado
+    (ver Indice.construir_aparte), así que ningún comando corre a mitad de un armado, salvo
+    el Trie, que se arma suelto y se pone al día al final. Un comando que necesita un índice
+    que el hilo todavía no armó lo arma él mismo (ver ArbolGeneral._indice) y el hilo lo
+    salta; los demás esperan, como mucho, al HashMap (~1 s por millón de nodos).
+    """
+    def __init__(self, arbol, candado=None):
+        self.arbol = arbol
+        self.candado = candado or threading.Lock()
+        self.armados = []  # (nombre, segundos) de los que armó el hilo
+        self._hilo = None
+
+    def pendientes(self):
+        return [nombre for nombre, indice in self.arbol.indices.items()
+                if indice.modo == "activo" and not indice.listo]
+
+    def iniciar(self):
+        pendientes = self.pendientes()
+        if not pendientes or self.activo(): return
+        self._hilo = threading.Thread(target=self._armar, args=(pendientes,), daemon=True)
+        self._hilo.start()
+
+    def activo(self):
+        return bool(self._hilo and self._hilo.is_alive())
+
+    def esperar(self):
+        if self._hilo: self._hilo.join()
 
+    def _armar(self, pendientes):
+        for nombre in pendientes:
+            # Otro `load`, un comando o `index` pudieron armarlo (o apagarlo) mientras tanto
+            indice = self.arbol.indices.get(nombre)
+            inicio = time.perf_counter()
+            if indice is not None and indice.construir_aparte(self.candado):
+                self.armados.append((nombre, time.perf_counter() - inicio))
 
 
+# --- PARTE NUEVA: LIBRERÍA PARA EL TAB ---
+def activar_tab(completador):
+    """Engancha `completador` al TAB. `readline` se importa recién aquí (y el aviso sale
+    aquí) para que importar el módulo no lo cargue ni imprima nada."""
+    try:
+        import readline
+    except ImportError:
+        print("AVISO: Para usar autocompletado con TAB en Windows, instala: pip install pyreadline3")
+        return False
+    readline.set_completer(completador)
+    readline.parse_and_bind("tab: complete")
+    return True
+
+
+# Cómo arma la consola los índices al arrancar (`python filesystem.py [guardado] --indices X`):
+# "fondo" muestra el prompt con el árbol cargado y los arma en un hilo, "perezoso" espera a
+# que algún comando los use y "completo" los arma antes del prompt, como `load`.
+_ARRANQUES = ("fondo", "perezoso", "completo")
+
 def main():
     fs = ArbolGeneral()
     current_path = "root" 
@@ -485,22 +5467,43 @@ def main():
     print("║   Árboles Generales + Trie + HashMap                  ║")
     print("╚═══════════════════════════════════════════════════════╝")
     
-    exito, msg = fs.cargar_arbol()
+    # `python filesystem.py mi_arbol.db` abre una base SQLite (o cualquier guardado) al arrancar
+    argumentos = sys.argv[1:]
+    arranque = "fondo"
+    if "--indices" in argumentos:
+        i = argumentos.index("--indices")
+        arranque = argumentos[i + 1] if i + 1 < len(argumentos) else ""
+        del argumentos[i:i + 2]
+        if arranque not in _ARRANQUES:
+            print(f"[AVISO] --indices {arranque}: usa {', '.join(_ARRANQUES)}. Sigo con 'fondo'.")
+            arranque = "fondo"
+    # `save` sin nombre, `exit` y el autoguardado escriben en el último guardado cargado o escrito
+    archivo_actual = argumentos[0] if argumentos else "./root/mi_filesystem.json"
+    exito, msg = fs.cargar_arbol(archivo_actual, diferir_indices=arranque != "completo")
     if exito: print(f"[INFO] {msg}")
+    autoguardado = AutoGuardado(fs)
+    autoguardado.seguir(archivo_actual)
+    autoguardado.iniciar()
+    if arranque == "fondo":
+        ConstructorIndices(fs, autoguardado.candado).iniciar()
     print("Escribe 'help' para ver los comandos disponibles\n")
 
-    # Configuración del autocompletado
+    # Configuración del autocompletado. Corre dentro de input(), fuera de los comandos:
+    # toma el candado por si el Trie se está armando (o le toca armarlo)
     def completador_tab(texto_escrito, estado):
-        opciones = fs.buscar_autocompletado(texto_escrito)
+        with autoguardado.candado:
+            opciones = fs.buscar_autocompletado(texto_escrito)
         if estado < len(opciones):
             return opciones[estado]
         else:
             return None
 
-    readline.set_completer(completador_tab)
-    readline.parse_and_bind("tab: complete")
+    activar_tab(completador_tab)
 
     while True:
+        if fs._desalojo is not None:
+            with autoguardado.candado:
+                fs.ajustar_memoria()  # Lo que recargaron las lecturas del comando anterior
         try:
             comando_input = input(f"\nfs:{current_path}> ").strip().split()
         except EOFError: 
@@ -510,171 +5513,441 @@ def main():
         cmd = comando_input[0].lower()
         args = comando_input[1:]
 
-        if cmd == "exit": 
-            print("\n[INFO] Guardando cambios...")
-            fs.guardar_arbol()
-            print("¡Hasta luego! 👋")
-            break
+        with autoguardado.candado:
+            autoguardado.soltar_terminada()
+            if cmd == "exit": 
+                print("\n[INFO] Guardando cambios...")
+                autoguardado.detener()
+                fs.guardar_arbol(archivo_actual)
+                print("¡Hasta luego! 👋")
+                break
         
-        elif cmd == "cd":
-            if len(args) < 1:
-                print("Uso: cd <carpeta> | cd .. | cd /")
-                continue
+            elif cmd == "cd":
+                if len(args) < 1:
+                    print("Uso: cd <carpeta> | cd .. | cd /")
+                    continue
             
-            destino = args[0]
+                destino = args[0]
             
-            if destino.lower() == "root" or destino == "/":
-                current_path = "root"
-            else:
-                ruta_tentativa = resolver_ruta_absoluta(destino, current_path)
-                ok, msg = fs.validar_ruta(ruta_tentativa)
-                if ok:
-                    current_path = ruta_tentativa
+                if destino.lower() == "root" or destino == "/":
+                    current_path = "root"
                 else:
-                    print(f"❌ Error: {msg}")
+                    ruta_tentativa = resolver_ruta_absoluta(destino, current_path)
+                    ok, msg = fs.validar_ruta(ruta_tentativa)
+                    if ok:
+                        current_path = ruta_tentativa
+                    else:
+                        print(f"❌ Error: {msg}")
 
-        elif cmd == "ls":
-            if len(args) == 0:
-                target = current_path
-            else:
-                target = resolver_ruta_absoluta(args[0], current_path)
+            elif cmd == "ls":
+                recursivo = "-R" in args
+                reverso = "-r" in args
+                args = [a for a in args if a not in ("-R", "-r")]
+                opciones = {"-s": None, "--offset": "0", "--limit": str(PAGINA_LS)}
+                try:
+                    for opcion in opciones:
+                        if opcion in args:
+                            i = args.index(opcion)
+                            opciones[opcion] = args[i + 1]
+                            del args[i:i + 2]
+                    desde, limite = int(opciones["--offset"]), int(opciones["--limit"])
+                except (IndexError, ValueError):
+                    print("❌ Uso: ls [ruta] [-R] [-s name|type|size] [-r] [--offset N] [--limit N]")
+                    continue
+                if len(args) == 0:
+                    target = current_path
+                else:
+                    target = resolver_ruta_absoluta(args[0], current_path)
             
-            ok, res = fs.listar_directorio(target)
-            print(res)
+                if es_patron(target):
+                    rutas = fs.expandir_patron(target)
+                    print("\n".join(rutas) if rutas else "❌ Nada coincide con el patrón.")
+                elif recursivo:
+                    ok, res = fs.listar_recursivo(target)
+                    print(res)
+                else:
+                    # Las líneas se imprimen a medida que salen; --limit 0 = todas
+                    ok, total, lineas = fs.paginar_directorio(target, opciones["-s"], desde, limite or None, reverso)
+                    if not ok:
+                        print("❌", lineas)
+                        continue
+                    if not total:
+                        print("(carpeta vacía)")
+                    for linea in lineas:
+                        print(linea)
+                    if limite and total > desde + limite:
+                        print(f"... {total - desde - limite} más (ls --offset {desde + limite} para seguir, --limit 0 para todo)")
 
-        elif cmd == "mkdir":
-            if not args: 
-                print("❌ Uso: mkdir <nombre>")
-            else:
-                ok, msg = fs.crear_nodo(current_path, args[0], "folder")
-                print("✅" if ok else "❌", msg)
+            elif cmd == "mkdir":
+                if not args: 
+                    print("❌ Uso: mkdir <nombre>")
+                else:
+                    ok, msg = fs.crear_nodo(current_path, args[0], "folder")
+                    print("✅" if ok else "❌", msg)
 
-        elif cmd == "touch":
-            if not args: 
-                print("❌ Uso: touch <nombre> [texto]")
-            else:
-                contenido = " ".join(args[1:]) if len(args) > 1 else ""
-                ok, msg = fs.crear_nodo(current_path, args[0], "file", contenido)
-                print("✅" if ok else "❌", msg)
+            elif cmd == "touch":
+                if not args: 
+                    print("❌ Uso: touch <nombre> [texto]")
+                else:
+                    contenido = " ".join(args[1:]) if len(args) > 1 else ""
+                    ok, msg = fs.crear_nodo(current_path, args[0], "file", contenido)
+                    print("✅" if ok else "❌", msg)
 
-        elif cmd == "mv":
-            if len(args) < 2: 
-                print("❌ Uso: mv <origen> <destino>")
-            else:
-                origen = resolver_ruta_absoluta(args[0], current_path)
-                destino = resolver_ruta_absoluta(args[1], current_path)
-                ok, msg = fs.mover_nodo(origen, destino)
+            elif cmd == "mv":
+                if len(args) < 2: 
+                    print("❌ Uso: mv <origen> [origen...] <destino>")
+                else:
+                    origenes = [resolver_ruta_absoluta(a, current_path) for a in args[:-1]]
+                    destino = resolver_ruta_absoluta(args[-1], current_path)
+                    if len(origenes) == 1 and not es_patron(origenes[0]):
+                        ok, msg = fs.mover_nodo(origenes[0], destino)
+                    else:
+                        rutas = [r for o in origenes for r in (fs.expandir_patron(o) if es_patron(o) else [o])]
+                        ok, msg = fs.mover_varios(rutas, destino)
+                    print("✅" if ok else "❌", msg)
+
+            elif cmd == "rm":
+                recursivo = "-r" in args
+                patrones = [a for a in args if a != "-r"]
+                if not patrones: 
+                    print("❌ Uso: rm [-r] <nombre|patrón> [...]")
+                else:
+                    targets = [resolver_ruta_absoluta(a, current_path) for a in patrones]
+                    if len(targets) == 1 and not es_patron(targets[0]):
+                        ok, msg = fs.eliminar_nodo(targets[0])
+                    else:
+                        # Sin -r, un comodín solo se lleva archivos (rm * no vacía carpetas)
+                        rutas = [r for t in targets for r in (fs.expandir_patron(t, carpetas=recursivo) if es_patron(t) else [t])]
+                        ok, msg = fs.eliminar_varios(rutas)
+                    print("✅" if ok else "❌", msg)
+
+            elif cmd == "cp":
+                if len(args) < 2:
+                    print("❌ Uso: cp <origen> <destino>")
+                else:
+                    origen = resolver_ruta_absoluta(args[0], current_path)
+                    ok, msg = fs.copiar_nodo(origen, resolver_ruta_absoluta(args[1], current_path))
+                    print("✅" if ok else "❌", msg)
+
+            elif cmd == "ren" or cmd == "rename":
+                if len(args) < 2: 
+                    print("❌ Uso: ren <viejo> <nuevo>")
+                else:
+                    ruta_nodo = resolver_ruta_absoluta(args[0], current_path)
+                    ok, msg = fs.renombrar_nodo(ruta_nodo, args[1])
+                    print("✅" if ok else "❌", msg)
+
+            # NUEVOS COMANDOS
+            elif cmd == "info":
+                altura = fs.calcular_altura()
+                tamano = fs.calcular_tamano()
+                print("\n📊 ESTADÍSTICAS DEL SISTEMA:")
+                print(f"  └─ Altura del árbol: {altura}")
+                print(f"  └─ Total de nodos: {tamano}")
+                print(f"  └─ Elementos en papelera: {len(fs.papelera)}")
+
+            elif cmd == "analyze":
+                if args and not args[0].isdigit():
+                    print("❌ Uso: analyze [cuántos subárboles mostrar]")
+                    continue
+                ok, analisis = fs.analizar()
+                if not ok:
+                    print("❌", analisis)
+                    continue
+                print()
+                print(analisis.reporte(int(args[0]) if args else 10))
+
+            elif cmd == "dedup":
+                r = fs.almacen.reporte()
+                print("\n🧬 DEDUPLICACIÓN DE CONTENIDOS:")
+                print(f"  └─ Archivos con contenido: {r['referencias']}")
+                print(f"  └─ Contenidos únicos: {r['unicos']}")
+                print(f"  └─ Ratio de deduplicación: {r['ratio']:.2f}x")
+                print(f"  └─ Memoria ahorrada: {r['memoria_ahorrada'] / 1024:.1f} KiB")
+                print(f"  └─ Disco ahorrado: {r['disco_ahorrado'] / 1024:.1f} KiB")
+                print(f"  └─ Contenidos comprimidos: {r['comprimidos']} ({r['compresion_ahorrada'] / 1024:.1f} KiB ahorrados)")
+
+            elif cmd == "cache":
+                c = fs.estadisticas_cache()
+                r = resolver_ruta_absoluta.cache_info()
+                print("\n⚡ CACHÉ DE RUTAS:")
+                print(f"  └─ Nodos: {c['aciertos']} aciertos / {c['fallos']} fallos ({c['tasa'] * 100:.1f}%)")
+                print(f"  └─ Entradas: {c['entradas']} (generación {c['generacion']})")
+                print(f"  └─ Normalización: {r.hits} aciertos / {r.misses} fallos")
+
+            elif cmd == "index":
+                if not args:
+                    print("\n🗂️  ÍNDICES:")
+                    print(fs.estado_indices())
+                    continue
+                modos = {"on": "activo", "off": "apagado", "lazy": "perezoso"}
+                if len(args) != 2 or args[1] not in modos:
+                    print("❌ Uso: index [nombre on|off|lazy]")
+                    continue
+                ok, msg = fs.configurar_indice(args[0], modos[args[1]])
                 print("✅" if ok else "❌", msg)
 
-        elif cmd == "rm":
-            if not args: 
-                print("❌ Uso: rm <nombre>")
-            else:
-                target = resolver_ruta_absoluta(args[0], current_path)
-                ok, msg = fs.eliminar_nodo(target)
+            elif cmd == "memory":
+                if args:
+                    try:
+                        limite = None if args[0] == "off" else parsear_tamano(args[0])[1]
+                    except ValueError:
+                        print("❌ Uso: memory [tamaño|off] (p. ej. memory 512M)")
+                        continue
+                    ok, msg = fs.configurar_memoria(limite)
+                    print("✅" if ok else "❌", msg)
+                m = fs.estado_memoria()
+                if m is None:
+                    print("🧠 Sin límite de memoria.")
+                    continue
+                print("\n🧠 MEMORIA:")
+                print(f"  └─ Uso estimado: {m['uso'] / 2**20:.1f} MB de {m['limite'] / 2**20:.1f} MB ({m['nodos']} nodos en memoria)")
+                print(f"  └─ En disco: {m['desalojados']} subárboles, {m['archivo'] / 2**20:.1f} MB")
+                print(f"  └─ Desalojos: {m['desalojos']} / recargas: {m['recargas']}")
+                if m["aviso"]:
+                    print(f"  ⚠️  {m['aviso']}")
+
+            elif cmd == "tree":
+                print("\n🌳 ESTRUCTURA DEL ÁRBOL (Preorden):")
+                recorrido = fs.recorrido_preorden()
+                for linea in recorrido:
+                    print(linea)
+
+            elif cmd == "export":
+                archivo = args[0] if args else "preorden_export.txt"
+                ok, msg = fs.exportar_preorden(archivo)
                 print("✅" if ok else "❌", msg)
 
-        elif cmd == "ren" or cmd == "rename":
-            if len(args) < 2: 
-                print("❌ Uso: ren <viejo> <nuevo>")
-            else:
-                ruta_nodo = resolver_ruta_absoluta(args[0], current_path)
-                ok, msg = fs.renombrar_nodo(ruta_nodo, args[1])
+            elif cmd == "export_map":
+                archivo = args[0] if args else "./root/mi_filesystem.fsmap"
+                ok, msg = fs.exportar_mapeado(archivo)
                 print("✅" if ok else "❌", msg)
 
-        # NUEVOS COMANDOS
-        elif cmd == "info":
-            altura = fs.calcular_altura()
-            tamano = fs.calcular_tamano()
-            print("\n📊 ESTADÍSTICAS DEL SISTEMA:")
-            print(f"  └─ Altura del árbol: {altura}")
-            print(f"  └─ Total de nodos: {tamano}")
-            print(f"  └─ Elementos en papelera: {len(fs.papelera)}")
-
-        elif cmd == "tree":
-            print("\n🌳 ESTRUCTURA DEL ÁRBOL (Preorden):")
-            recorrido = fs.recorrido_preorden()
-            for linea in recorrido:
-                print(linea)
-
-        elif cmd == "export":
-            archivo = args[0] if args else "preorden_export.txt"
-            ok, msg = fs.exportar_preorden(archivo)
-            print("✅" if ok else "❌", msg)
-
-        elif cmd == "find":
-            if not args:
-                print("❌ Uso: find <nombre_exacto>")
-            else:
-                rutas = fs.buscar_exacto(args[0])
-                if rutas:
-                    print(f"\n🔍 Encontrado '{args[0]}' en {len(rutas)} ubicación(es):")
+            elif cmd == "find":
+                posicionales = list(itertools.takewhile(lambda a: not a.startswith("-"), args))
+                if len(posicionales) < len(args):
+                    try:
+                        criterios = parsear_predicados(args[len(posicionales):], fs, current_path)
+                    except ValueError as e:
+                        print("❌", e)
+                        continue
+                    patron = posicionales[0] if posicionales else None
+                    base = resolver_ruta_absoluta(posicionales[1], current_path) if len(posicionales) > 1 else None
+                    rutas = fs.buscar_por_metadatos(patron=patron, ruta_base=base, **criterios)
+                    print(f"\n🔍 {len(rutas)} resultado(s):")
                     for r in rutas:
                         print(f"  └─ {r}")
+                elif not args:
+                    print("❌ Uso: find <nombre|patrón> [carpeta] [-size ...] [-mmin ...] [-newer ...] [-type f|d]")
                 else:
-                    print(f"❌ No se encontró '{args[0]}'")
+                    if es_patron(args[0]) or len(args) > 1:
+                        base = resolver_ruta_absoluta(args[1], current_path) if len(args) > 1 else None
+                        rutas = fs.buscar_patron(args[0], base)
+                    else:
+                        rutas = fs.buscar_exacto(args[0])
+                    if rutas:
+                        print(f"\n🔍 Encontrado '{args[0]}' en {len(rutas)} ubicación(es):")
+                        for r in rutas:
+                            print(f"  └─ {r}")
+                    else:
+                        print(f"❌ No se encontró '{args[0]}'")
 
-        elif cmd == "perf_test":
-            import time
+            elif cmd == "perf_test":
+                import time
             
-            cantidad = 1000 if not args else int(args[0])
+                cantidad = 1000 if not args else int(args[0])
 
-            start = time.time()
-            ok, msg = fs.generar_carga_prueba(cantidad)
-            end = time.time()
-            print(f"\n[INFO] {msg}")
-            print(f"  ⏱️  Inserción: {end - start:.4f}s")
+                start = time.time()
+                ok, msg = fs.generar_carga_prueba(cantidad)
+                end = time.time()
+                print(f"\n[INFO] {msg}")
+                print(f"  ⏱️  Inserción: {end - start:.4f}s")
             
-            # Prueba de búsqueda por prefijo (Trie)
-            start = time.time()
-            fs.buscar_autocompletado("archivo_perf_9")
-            end = time.time()
-            print(f"  ⏱️  Búsqueda Trie: {end - start:.6f}s")
+                # Prueba de búsqueda por prefijo (Trie)
+                start = time.time()
+                fs.buscar_autocompletado("archivo_perf_9")
+                end = time.time()
+                print(f"  ⏱️  Búsqueda Trie: {end - start:.6f}s")
             
-            # Prueba de búsqueda exacta (HashMap)
-            start = time.time()
-            fs.buscar_exacto("archivo_perf_00500_test.txt")
-            end = time.time()
-            print(f"  ⏱️  Búsqueda HashMap: {end - start:.6f}s")
+                # Prueba de búsqueda exacta (HashMap)
+                start = time.time()
+                fs.buscar_exacto("archivo_perf_00500_test.txt")
+                end = time.time()
+                print(f"  ⏱️  Búsqueda HashMap: {end - start:.6f}s")
             
-            print("✅ Ambas búsquedas son casi instantáneas (< 1ms)")
+                print("✅ Ambas búsquedas son casi instantáneas (< 1ms)")
 
-        elif cmd == "trash": 
-            print(fs.ver_papelera())
-        elif cmd == "restore":
-            if args: 
-                ok, msg = fs.restaurar_nodo(args[0])
+            elif cmd == "trash": 
+                print(fs.ver_papelera(*args[:1]))
+            elif cmd == "restore":
+                if args: 
+                    ok, msg = fs.restaurar_nodo(args[0] if args[0].isdigit() else resolver_ruta_absoluta(args[0], current_path))
+                    print("✅" if ok else "❌", msg)
+                else: 
+                    print("❌ Uso: restore <id|ruta>")
+            elif cmd == "trash_limit":
+                if len(args) < 2:
+                    p = fs.papelera
+                    print(f"🗑️  Retención: items={p.max_elementos}, bytes={p.max_bytes}, "
+                          f"dias={p.max_edad / 86400 if p.max_edad is not None else None}")
+                    print("Uso: trash_limit <items|bytes|dias> <valor|off>")
+                else:
+                    ok, msg = fs.configurar_papelera(args[0], args[1])
+                    print("✅" if ok else "❌", msg)
+            elif cmd == "empty": 
+                ok, msg = fs.vaciar_papelera()
+                print("✅" if ok else "❌", msg)
+            elif cmd == "undo":
+                ok, msg = fs.deshacer()
                 print("✅" if ok else "❌", msg)
-            else: 
-                print("❌ Uso: restore <índice>")
-        elif cmd == "empty": 
-            ok, msg = fs.vaciar_papelera()
-            print("✅" if ok else "❌", msg)
-        elif cmd == "search":
-            if args: 
-                resultados = fs.buscar_autocompletado(args[0])
-                if resultados:
-                    print(f"🔍 Encontrados {len(resultados)} archivo(s):")
-                    for r in resultados:
+                if not fs.validar_ruta(current_path)[0]:
+                    current_path = "root"
+            elif cmd == "redo":
+                ok, msg = fs.rehacer()
+                print("✅" if ok else "❌", msg)
+                if not fs.validar_ruta(current_path)[0]:
+                    current_path = "root"
+            elif cmd == "history":
+                if args:
+                    if not args[0].isdigit() or int(args[0]) < 1:
+                        print("❌ Uso: history [límite]")
+                        continue
+                    fs.historial.limite = int(args[0])
+                print(fs.ver_historial())
+            elif cmd == "snapshot":
+                ok, msg = fs.crear_version(" ".join(args))
+                print("✅" if ok else "❌", msg)
+            elif cmd == "versions":
+                print(fs.ver_versiones())
+            elif cmd == "checkout":
+                if not args:
+                    print("❌ Uso: checkout <versión>")
+                else:
+                    ok, msg = fs.checkout_version(args[0])
+                    print("✅" if ok else "❌", msg)
+                    if ok and not fs.validar_ruta(current_path)[0]:
+                        current_path = "root"
+            elif cmd == "diff":
+                if len(args) < 2:
+                    print("❌ Uso: diff <v1> <v2> | diff <archivo_a> <archivo_b>")
+                else:
+                    if all(a.isdigit() or a.lower() == "actual" for a in args[:2]):
+                        ok, res = fs.diferencias_versiones(args[0], args[1])
+                    else:
+                        ok, res = fs.diferencias_archivos(args[0], args[1])
+                    print(formatear_cambios(res) if ok else f"❌ {res}")
+            elif cmd == "merge":
+                if len(args) < 2:
+                    print("❌ Uso: merge <archivo_a> <archivo_b>")
+                else:
+                    ok, msg = fs.fusionar_archivos(args[0], args[1])
+                    print("✅" if ok else "⚠️ ", msg)
+                    if not fs.validar_ruta(current_path)[0]:
+                        current_path = "root"
+            elif cmd == "largest":
+                try:
+                    cantidad = int(args[0]) if args else 10
+                except ValueError:
+                    print("❌ Uso: largest [N] [carpeta]")
+                    continue
+                base = resolver_ruta_absoluta(args[1], current_path) if len(args) > 1 else None
+                for ruta, tamano in fs.mas_grandes(cantidad, base):
+                    print(f"  {tamano:>12,} B  {ruta}")
+            elif cmd == "stat":
+                if args:
+                    ok, msg = fs.info_nodo(resolver_ruta_absoluta(args[0], current_path))
+                    print(msg if ok else f"❌ {msg}")
+                else:
+                    print("❌ Uso: stat <ruta>")
+            elif cmd in ("query", "explain"):
+                try:
+                    predicados = parsear_consulta(args, current_path)
+                except ValueError as e:
+                    print("❌", e)
+                    print(f"Uso: {cmd} name:<nombre|prefijo*|patrón> type:f|d under:<carpeta> content:<palabra> size:[+-]N[kMG]")
+                    continue
+                if cmd == "explain":
+                    print("\n🧭 Plan:")
+                    for paso in fs.explicar_consulta(predicados):
+                        print(f"  {paso}")
+                else:
+                    rutas = fs.consultar(predicados)
+                    print(f"\n🔍 {len(rutas)} resultado(s):")
+                    for r in rutas:
                         print(f"  └─ {r}")
+            elif cmd == "search":
+                if args: 
+                    resultados = fs.buscar_autocompletado(args[0])
+                    if resultados:
+                        print(f"🔍 Encontrados {len(resultados)} archivo(s):")
+                        for r in resultados:
+                            print(f"  └─ {r}")
+                    else:
+                        print("❌ No se encontraron coincidencias")
+                else: 
+                    print("❌ Uso: search <prefijo>")
+            elif cmd == "load": 
+                autoguardado.esperar()
+                procesos = 1
+                if "-j" in args:
+                    i = args.index("-j")
+                    try:
+                        procesos = int(args[i + 1]) if i + 1 < len(args) else os.cpu_count() or 1
+                    except ValueError:
+                        print("❌ Uso: load [archivo] [-j procesos]")
+                        continue
+                    args = args[:i] + args[i + 2:]
+                ok, msg = fs.cargar_arbol(*args[:1], procesos=procesos)
+                print("✅" if ok else "❌", msg)
+                if ok:
+                    current_path = "root"
+                    archivo_actual = args[0] if args else "./root/mi_filesystem.json"
+                    autoguardado.seguir(archivo_actual)
+            elif cmd == "save":
+                autoguardado.esperar()
+                ok, msg = fs.guardar_arbol(args[0] if args else archivo_actual)
+                print("✅" if ok else "❌", msg)
+                if ok:
+                    archivo_actual = args[0] if args else archivo_actual
+                    autoguardado.seguir(archivo_actual)
+            elif cmd == "compress":
+                if not args:
+                    print("❌ Uso: compress <bytes|off> [zlib|lzma]")
+                elif args[0].lower() == "off":
+                    ok, msg = fs.configurar_compresion(None)
+                    print("✅" if ok else "❌", msg)
+                elif not args[0].isdigit():
+                    print("❌ Uso: compress <bytes|off> [zlib|lzma]")
                 else:
-                    print("❌ No se encontraron coincidencias")
-            else: 
-                print("❌ Uso: search <prefijo>")
-        elif cmd == "load": 
-            ok, msg = fs.cargar_arbol()
-            print("✅" if ok else "❌", msg)
-            if ok:
-                current_path = "root"
-        elif cmd == "save":
-            ok, msg = fs.guardar_arbol()
-            print("✅" if ok else "❌", msg)
-        elif cmd == "cls":
-            limpiarpantalla()
-        elif cmd == "help":
-            imprimir_ayuda()
-        else:
-            print(f"❌ Comando desconocido: '{cmd}'. Usa 'help' para ver comandos.")
+                    ok, msg = fs.configurar_compresion(int(args[0]), args[1] if len(args) > 1 else "zlib")
+                    print("✅" if ok else "❌", msg)
+            elif cmd == "autosave":
+                if args and args[0].lower() == "off":
+                    autoguardado.detener(esperar=False)
+                    print("✅ Autoguardado desactivado")
+                elif args:
+                    try:
+                        autoguardado.intervalo = float(args[0])
+                    except ValueError:
+                        print("❌ Uso: autosave [segundos|off]")
+                        continue
+                    autoguardado.detener(esperar=False)
+                    autoguardado.iniciar()
+                    print(f"✅ Autoguardado cada {autoguardado.intervalo:g}s")
+                else:
+                    estado = f"cada {autoguardado.intervalo:g}s" if autoguardado.activo() else "desactivado"
+                    print(f"💾 Autoguardado: {estado}")
+                    print(f"  └─ Archivo: {autoguardado.nombre_archivo or '(ninguno: el guardado actual es una base o un directorio)'}")
+                    print(f"  └─ Guardados en segundo plano: {autoguardado.guardados}")
+                    print(f"  └─ Último guardado: {autoguardado.ultima_duracion:.3f}s")
+                    if autoguardado.guardando(): print("  └─ Guardando ahora mismo...")
+                    if autoguardado.ultimo_error: print(f"  └─ Último error: {autoguardado.ultimo_error}")
+            elif cmd == "cls":
+                limpiarpantalla()
+            elif cmd == "help":
+                imprimir_ayuda()
+            else:
+                print(f"❌ Comando desconocido: '{cmd}'. Usa 'help' para ver comandos.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Prueba de Estrés contra un Modelo de Referencia
+Estructura de Datos - Proyecto Final
+
+Corre operaciones aleatorias (crear, mv, ren, rm, restore, empty, save, load) contra
+ArbolGeneral y contra un modelo de fuerza bruta sin índices, y después de cada paso
+compara buscar_exacto, buscar_autocompletado, calcular_tamano y calcular_altura. Si
+difieren, achica la secuencia hasta una reproducción mínima y la imprime.
+
+Ejecutar con: python prueba_estres.py [operaciones] [semilla] [--episodio N]
+Ejemplo:      python prueba_estres.py 1000000 7
+"""
+
+import copy
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+sys.path.insert(0, os.path.dirname(__file__))
+
+from filesystem import ArbolGeneral
+
+# Pocos nombres, con mayúsculas y prefijos compartidos: así se repiten en distintas
+# carpetas y el Trie (que guarda nombres distintos, sin mayúsculas) tiene trabajo. "root"
+# también puede ser el nombre de una carpeta cualquiera. El prefijo vacío no se compara:
+# el Trie no devuelve nada para él, a propósito (TAB sin texto no lista todo el árbol)
+NOMBRES = ("docs", "Docs", "DOCS", "a", "ab", "abc", "nota.txt", "Nota.txt", "x", "x1", "datos", "dat", "root")
+PREFIJOS = ("a", "ab", "d", "DO", "n", "r", "x", "z")
+MAX_PAPELERA = 20  # Chica, para que la retención descarte seguido
+PESOS = {"crear": 35, "mv": 15, "ren": 12, "rm": 14, "restore": 12, "empty": 2, "save": 5, "load": 5}
+
+
+class ModeloReferencia:
+    """El mismo sistema de archivos sin índices ni caché: una carpeta es un dict
+    {nombre: hijo} y un archivo es su contenido (str). Cada consulta recorre el árbol
+    entero. La papelera copia lo observable de Papelera: ids crecientes y retención
+    por cantidad, descartando primero el más viejo."""
+
+    def __init__(self, max_papelera=MAX_PAPELERA):
+        self.root = {}
+        self.papelera = {}  # {id: (ruta_origen, ruta_padre, nombre, nodo)}, en orden de borrado
+        self.siguiente = 0
+        self.max_papelera = max_papelera
+        self.guardado = None
+
+    def _buscar(self, ruta):
+        """(nodo, carpeta_padre) de una ruta normalizada, o (None, None)."""
+        partes = ruta.split("/")
+        if partes[0] != "root": return None, None
+        nodo, padre = self.root, None
+        for parte in partes[1:]:
+            if not isinstance(nodo, dict) or parte not in nodo: return None, None
+            padre, nodo = nodo, nodo[parte]
+        return nodo, padre
+
+    def rutas(self):
+        """[(ruta, es_carpeta)] de todo el árbol, root incluida."""
+        salida, pila = [], [("root", self.root)]
+        while pila:
+            ruta, nodo = pila.pop()
+            salida.append((ruta, isinstance(nodo, dict)))
+            if isinstance(nodo, dict):
+                pila.extend((f"{ruta}/{nombre}", hijo) for nombre, hijo in nodo.items())
+        return salida
+
+    # --- OPERACIONES (devuelven True si se hicieron) ---
+
+    def crear(self, ruta_padre, nombre, tipo, contenido):
+        padre, _ = self._buscar(ruta_padre)
+        if not isinstance(padre, dict) or nombre in padre: return False
+        padre[nombre] = {} if tipo == "folder" else contenido
+        return True
+
+    def mover(self, origen, destino):
+        nodo, padre = self._buscar(origen)
+        nuevo_padre, _ = self._buscar(destino)
+        if padre is None or not isinstance(nuevo_padre, dict): return False
+        nombre = origen.rsplit("/", 1)[1]
+        if nombre in nuevo_padre or destino == origen or destino.startswith(origen + "/"): return False
+        nuevo_padre[nombre] = padre.pop(nombre)
+        return True
+
+    def renombrar(self, ruta, nuevo_nombre):
+        nodo, padre = self._buscar(ruta)
+        if padre is None or nuevo_nombre in padre: return False
+        padre[nuevo_nombre] = padre.pop(ruta.rsplit("/", 1)[1])
+        return True
+
+    def eliminar(self, ruta):
+        nodo, padre = self._buscar(ruta)
+        if padre is None: return False
+        ruta_padre, nombre = ruta.rsplit("/", 1)
+        self.papelera[self.siguiente] = (ruta, ruta_padre, nombre, padre.pop(nombre))
+        self.siguiente += 1
+        while len(self.papelera) > self.max_papelera:
+            del self.papelera[next(iter(self.papelera))]
+        return True
+
+    def restaurar(self, id_elemento):
+        if id_elemento not in self.papelera: return False
+        _, ruta_padre, nombre, nodo = self.papelera[id_elemento]
+        padre, _ = self._buscar(ruta_padre)
+        if not isinstance(padre, dict) or nombre in padre: return False
+        padre[nombre] = nodo
+        del self.papelera[id_elemento]
+        return True
+
+    def vaciar(self):
+        self.papelera.clear()
+        return True
+
+    def guardar(self):
+        self.guardado = copy.deepcopy((self.root, self.papelera))
+        return True
+
+    def cargar(self):
+        if self.guardado is None: return False
+        self.root, self.papelera = copy.deepcopy(self.guardado)
+        return True
+
+    # --- CONSULTAS (fuerza bruta) ---
+
+    def buscar_exacto(self, nombre):
+        return sorted(ruta for ruta, _ in self.rutas() if ruta != "root" and ruta.rsplit("/", 1)[1] == nombre)
+
+    def buscar_autocompletado(self, prefijo):
+        prefijo = prefijo.lower()
+        return sorted({ruta.rsplit("/", 1)[1] for ruta, _ in self.rutas()
+                       if ruta != "root" and ruta.rsplit("/", 1)[1].lower().startswith(prefijo)})
+
+    def calcular_tamano(self):
+        return len(self.rutas())
+
+    def calcular_altura(self, nodo=None):
+        nodo = self.root if nodo is None else nodo
+        if not isinstance(nodo, dict) or not nodo: return 0
+        return 1 + max(self.calcular_altura(hijo) for hijo in nodo.values())
+
+
+# --- GENERADOR ---
+
+def generar_operacion(rng, modelo):
+    """Una operación al azar como tupla (tipo, *argumentos). Casi siempre sobre rutas que
+    existen; a veces sobre una inventada, para probar también los rechazos."""
+    rutas = modelo.rutas()
+    carpetas = [ruta for ruta, es_carpeta in rutas if es_carpeta]
+    tipo = rng.choices(list(PESOS), weights=list(PESOS.values()))[0]
+
+    def una_ruta(opciones):
+        if rng.random() < 0.05:
+            return f"{rng.choice(carpetas)}/{rng.choice(NOMBRES)}"
+        return rng.choice(opciones)
+
+    if tipo == "crear":
+        es_carpeta = rng.random() < 0.4
+        nombre = rng.choice(NOMBRES)
+        return ("crear", una_ruta(carpetas), nombre, "folder" if es_carpeta else "file",
+                None if es_carpeta else nombre * rng.randrange(1, 4))
+    if tipo == "mv":
+        return ("mv", una_ruta([r for r, _ in rutas]), una_ruta(carpetas))
+    if tipo == "ren":
+        return ("ren", una_ruta([r for r, _ in rutas]), rng.choice(NOMBRES))
+    if tipo == "rm":
+        return ("rm", una_ruta([r for r, _ in rutas]))
+    if tipo == "restore":
+        if modelo.papelera and rng.random() < 0.9:
+            return ("restore", rng.choice(list(modelo.papelera)))
+        return ("restore", modelo.siguiente + rng.randrange(3) - 1)  # Uno que ya no está (o nunca estuvo)
+    if tipo == "load":
+        return ("load", rng.random() < 0.5)  # A veces con los índices diferidos (ver `diferir_indices`)
+    return (tipo,)
+
+
+def aplicar(fs, modelo, op, archivo):
+    """Aplica `op` a los dos lados. Devuelve (ok del árbol, ok del modelo)."""
+    tipo, args = op[0], op[1:]
+    if tipo == "crear":
+        return fs.crear_nodo(*args)[0], modelo.crear(*args)
+    if tipo == "mv":
+        return fs.mover_nodo(*args)[0], modelo.mover(*args)
+    if tipo == "ren":
+        return fs.renombrar_nodo(*args)[0], modelo.renombrar(*args)
+    if tipo == "rm":
+        return fs.eliminar_nodo(*args)[0], modelo.eliminar(*args)
+    if tipo == "restore":
+        return fs.restaurar_nodo(*args)[0], modelo.restaurar(*args)
+    if tipo == "empty":
+        return fs.vaciar_papelera()[0], modelo.vaciar()
+    if tipo == "save":
+        return fs.guardar_arbol(archivo)[0], modelo.guardar()
+    return fs.cargar_arbol(archivo, diferir_indices=args[0])[0], modelo.cargar()
+
+
+def describir(op):
+    """La operación como la llamada a ArbolGeneral que la reproduce."""
+    tipo, args = op[0], op[1:]
+    llamadas = {"crear": "crear_nodo", "mv": "mover_nodo", "ren": "renombrar_nodo", "rm": "eliminar_nodo",
+                "restore": "restaurar_nodo", "empty": "vaciar_papelera"}
+    if tipo == "save":
+        return "fs.guardar_arbol(archivo)"
+    if tipo == "load":
+        return f"fs.cargar_arbol(archivo, diferir_indices={args[0]})"
+    return f"fs.{llamadas[tipo]}({', '.join(map(repr, args))})"
+
+
+def nombres_de(op):
+    """Los nombres que toca `op`, para buscarlos justo después."""
+    return [arg.rsplit("/", 1)[-1] for arg in op[1:] if isinstance(arg, str)]
+
+
+def comparar(fs, modelo, resultado, nombres, prefijos):
+    """La primera diferencia entre el árbol y el modelo, como texto, o None."""
+    if resultado[0] != resultado[1]:
+        return f"la operación devolvió {resultado[0]} y el modelo {resultado[1]}"
+    for nombre in nombres:
+        obtenido, esperado = sorted(fs.buscar_exacto(nombre)), modelo.buscar_exacto(nombre)
+        if obtenido != esperado:
+            return f"buscar_exacto({nombre!r}): {obtenido}, esperado {esperado}"
+    for prefijo in prefijos:
+        obtenido, esperado = fs.buscar_autocompletado(prefijo), modelo.buscar_autocompletado(prefijo)
+        if obtenido != esperado:
+            return f"buscar_autocompletado({prefijo!r}): {obtenido}, esperado {esperado}"
+    if fs.calcular_tamano() != modelo.calcular_tamano():
+        return f"calcular_tamano(): {fs.calcular_tamano()}, esperado {modelo.calcular_tamano()}"
+    if fs.calcular_altura() != modelo.calcular_altura():
+        return f"calcular_altura(): {fs.calcular_altura()}, esperado {modelo.calcular_altura()}"
+    return None
+
+
+def nuevo_par(fabrica):
+    fs = fabrica()
+    fs.configurar_papelera("items", MAX_PAPELERA)
+    return fs, ModeloReferencia()
+
+
+def reproducir(ops, fabrica, directorio):
+    """Corre `ops` desde cero comparando todo (todos los nombres y prefijos) después de
+    cada paso. Devuelve (paso, diferencia) de la primera falla, o None."""
+    archivo = os.path.join(directorio, "reproduccion.json")
+    if os.path.exists(archivo): os.remove(archivo)
+    fs, modelo = nuevo_par(fabrica)
+    for paso, op in enumerate(ops):
+        try:
+            diferencia = comparar(fs, modelo, aplicar(fs, modelo, op, archivo), NOMBRES, PREFIJOS)
+        except Exception as e:
+            diferencia = f"{type(e).__name__}: {e}"
+        if diferencia:
+            return paso, diferencia
+    return None
+
+
+def achicar(ops, falla):
+    """Delta debugging: saca tramos cada vez más chicos mientras la secuencia siga fallando."""
+    tramo = max(1, len(ops) // 2)
+    while True:
+        i = 0
+        while i < len(ops):
+            candidata = ops[:i] + ops[i + tramo:]
+            if falla(candidata):
+                ops = candidata
+            else:
+                i += tramo
+        if tramo == 1: return ops
+        tramo //= 2
+
+
+def correr(operaciones, semilla, episodio=500, fabrica=ArbolGeneral, informe=print):
+    """Corre `operaciones` pasos en episodios de `episodio` (cada uno parte de un árbol vacío
+    y su propia semilla, así una falla se achica sobre pocos pasos). Devuelve un dict con
+    operaciones, segundos, conteo por tipo y `falla`: None o {episodio, mensaje, pasos}."""
+    directorio = tempfile.mkdtemp()
+    conteo, hechas = Counter(), Counter()
+    inicio = time.perf_counter()
+    corridas = 0
+    try:
+        while corridas < operaciones:
+            numero = corridas // episodio
+            rng = random.Random(f"{semilla}-{numero}")
+            archivo = os.path.join(directorio, "episodio.json")
+            if os.path.exists(archivo): os.remove(archivo)
+            fs, modelo = nuevo_par(fabrica)
+            ops = []
+            for _ in range(min(episodio, operaciones - corridas)):
+                op = generar_operacion(rng, modelo)
+                ops.append(op)
+                try:
+                    resultado = aplicar(fs, modelo, op, archivo)
+                    nombres = nombres_de(op) + [rng.choice(NOMBRES)]
+                    diferencia = comparar(fs, modelo, resultado, nombres, [rng.choice(PREFIJOS)])
+                except Exception as e:
+                    resultado, diferencia = (False, False), f"{type(e).__name__}: {e}"
+                corridas += 1
+                conteo[op[0]] += 1
+                hechas[op[0]] += resultado[0]
+                if diferencia:
+                    segundos = time.perf_counter() - inicio
+                    informe(f"❌ Paso {corridas} (episodio {numero}): {diferencia}")
+                    informe(f"   Achicando {len(ops)} operaciones...")
+                    minimas = achicar(ops, lambda candidata: reproducir(candidata, fabrica, directorio) is not None)
+                    paso, mensaje = reproducir(minimas, fabrica, directorio)
+                    return {"operaciones": corridas, "segundos": segundos, "conteo": conteo,
+                            "hechas": hechas, "falla": {"episodio": numero, "mensaje": mensaje, "pasos": minimas}}
+            if numero % 100 == 99:
+                transcurrido = time.perf_counter() - inicio
+                informe(f"  {corridas:,} operaciones, {corridas / transcurrido:,.0f} ops/s")
+    finally:
+        shutil.rmtree(directorio)
+    return {"operaciones": corridas, "segundos": time.perf_counter() - inicio, "conteo": conteo,
+            "hechas": hechas, "falla": None}
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    episodio = 500
+    if "--episodio" in argumentos:
+        i = argumentos.index("--episodio")
+        episodio = int(argumentos[i + 1])
+        del argumentos[i:i + 2]
+    operaciones = int(argumentos[0]) if argumentos else 100_000
+    semilla = int(argumentos[1]) if len(argumentos) > 1 else random.randrange(10**6)
+    print(f"Prueba de estrés: {operaciones:,} operaciones, semilla {semilla}, episodios de {episodio}")
+    resultado = correr(operaciones, semilla, episodio)
+    segundos = resultado["segundos"]
+    print(f"⏱️  {resultado['operaciones']:,} operaciones en {segundos:.1f}s "
+          f"({resultado['operaciones'] / segundos:,.0f} ops/s, contando las comparaciones)")
+    falla = resultado["falla"]
+    if falla is None:
+        for tipo, cantidad in sorted(resultado["conteo"].items()):
+            print(f"  └─ {tipo:<8} {cantidad:>10,} ({resultado['hechas'][tipo] / cantidad:.0%} aceptadas)")
+        print("✅ El árbol y el modelo coincidieron en cada paso.")
+        sys.exit(0)
+    print(f"❌ Reproducción mínima ({len(falla['pasos'])} pasos, semilla {semilla}, episodio {falla['episodio']}):")
+    print("   fs = ArbolGeneral(); fs.configurar_papelera('items', MAX_PAPELERA)")
+    for op in falla["pasos"]:
+        print(f"   {describir(op)}")
+    print(f"   → {falla['mensaje']}")
+    sys.exit(1)
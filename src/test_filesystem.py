@@ -7,9 +7,14 @@ Ejecutar con: python test_filesystem.py
 
 import sys
 import os
+import random
+import shutil
+import subprocess
+import tempfile
 sys.path.insert(0, os.path.dirname(__file__))
 
-from filesystem import ArbolGeneral, Nodo, Trie
+from filesystem import ArbolGeneral, ArbolMapeado, Nodo, Trie, AutoGuardado, ConstructorIndices, comparar_arboles, _leer_vista, parsear_predicados, parsear_consulta, Indice, ArbolParticionado, Desalojador
+from prueba_estres import correr
 
 # Colores para output
 class Color:
@@ -329,6 +334,1404 @@ def test_consistencia_despues_operaciones(suite):
     suite.assert_equal(tamano, 5, "Tamaño correcto después de operaciones")
 
 
+def test_instantaneas_autoguardado(suite):
+    """Prueba 11: Instantáneas copy-on-write y Autoguardado"""
+    print(f"\n{Color.YELLOW}[PRUEBA 11] Instantáneas y Autoguardado{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root/docs", "nota.txt", "file", "v1")
+    
+    # La instantánea no cambia aunque el árbol vivo sí
+    inst = fs.tomar_instantanea()
+    antes = inst.root.to_dict()
+    fs.renombrar_nodo("root/docs/nota.txt", "nota_final.txt")
+    fs.crear_nodo("root/docs", "nuevo.txt", "file")
+    fs.eliminar_nodo("root")  # no debe hacer nada
+    suite.assert_equal(inst.root.to_dict(), antes, "Instantánea intacta tras mutaciones")
+    
+    nodo, _ = fs._buscar_nodo_y_padre("root/docs/nota_final.txt")
+    suite.assert_true(nodo is not None, "Árbol vivo ve el renombrado")
+    
+    # Los subárboles no modificados se comparten (no se copian)
+    fs.crear_nodo("root", "fotos", "folder")
+    fotos_vivo, _ = fs._buscar_nodo_y_padre("root/fotos")
+    inst2 = fs.tomar_instantanea()
+    fs.crear_nodo("root/docs", "otro.txt", "file")
+    fotos_inst = [h for h in inst2.root.hijos if h.nombre == "fotos"][0]
+    suite.assert_true(fotos_inst is fotos_vivo, "Subárbol sin cambios compartido")
+    
+    # Sin instantáneas vivas se vuelve a modificar en sitio
+    fs.liberar_instantanea(inst)
+    fs.liberar_instantanea(inst2)
+    raiz = fs.root
+    fs.crear_nodo("root", "tmp", "folder")
+    suite.assert_true(fs.root is raiz, "Sin instantáneas no se copia nada")
+    
+    # Autoguardado atómico en segundo plano
+    archivo_prueba = "./test_autosave_temp.json"
+    auto = AutoGuardado(fs, archivo_prueba, intervalo=3600)
+    suite.assert_true(not auto.guardar_ahora(), "Recién cargado no hay nada que guardar")
+    fs.crear_nodo("root/docs", "cambio.txt", "file")
+    suite.assert_true(auto.guardar_ahora(), "Autoguardado lanzado en hilo")
+    auto.esperar()
+    suite.assert_equal(auto.ultimo_error, None, "Autoguardado sin errores")
+    suite.assert_true(not auto.guardar_ahora(), "Sin cambios no se vuelve a guardar")
+    fs.crear_nodo("root/docs", "suelta.txt", "file")
+    auto.guardar_ahora()
+    auto._trabajador.join()
+    suite.assert_true(fs._epoca_congelada != -1, "El hilo no suelta la instantánea (no toca el congelado sin candado)")
+    with auto.candado:
+        auto.soltar_terminada()
+    suite.assert_equal(fs._epoca_congelada, -1, "La consola la suelta entre comandos")
+    
+    fs2 = ArbolGeneral()
+    ok, _ = fs2.cargar_arbol(archivo_prueba)
+    nodo, _ = fs2._buscar_nodo_y_padre("root/docs/otro.txt")
+    suite.assert_true(ok and nodo is not None, "Archivo autoguardado se puede cargar")
+    
+    # El autoguardado sigue al guardado abierto, no al archivo por defecto
+    otro = "./test_autosave_otro.json"
+    auto.seguir(otro)
+    fs.crear_nodo("root/docs", "para_otro.txt", "file")
+    suite.assert_true(auto.guardar_ahora(), "Autoguardado tras cambiar de archivo")
+    auto.esperar()
+    fs2.cargar_arbol(archivo_prueba)
+    nodo_viejo, _ = fs2._buscar_nodo_y_padre("root/docs/para_otro.txt")
+    fs2.cargar_arbol(otro)
+    nodo_nuevo, _ = fs2._buscar_nodo_y_padre("root/docs/para_otro.txt")
+    suite.assert_true(nodo_viejo is None and nodo_nuevo is not None, "Escribe en el archivo seguido y no pisa el anterior")
+    auto.seguir("./test_autosave_otro.db")
+    fs.crear_nodo("root/docs", "para_base.txt", "file")
+    suite.assert_true(auto.nombre_archivo is None and not auto.guardar_ahora(), "Con una base SQLite no autoguarda")
+    
+    for archivo in (archivo_prueba, otro):
+        if os.path.exists(archivo):
+            os.remove(archivo)
+
+
+def test_versiones(suite):
+    """Prueba 12: Versiones persistentes (snapshot, checkout, diff)"""
+    print(f"\n{Color.YELLOW}[PRUEBA 12] Versiones Persistentes{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root", "fotos", "folder")
+    fs.crear_nodo("root/docs", "a.txt", "file", "uno")
+    fs.crear_nodo("root/docs", "b.txt", "file")
+    fs.crear_nodo("root/fotos", "playa.jpg", "file")
+    ok, _ = fs.crear_version("inicial")
+    suite.assert_true(ok, "Crear versión 0")
+    
+    fs.renombrar_nodo("root/docs/a.txt", "c.txt")
+    fs.mover_nodo("root/docs/b.txt", "root/fotos")
+    fs.eliminar_nodo("root/fotos/playa.jpg")
+    fs.crear_nodo("root", "nuevo.txt", "file")
+    fs.crear_version("cambios")
+    
+    ok, cambios = fs.diferencias_versiones(0, 1)
+    tipos = sorted(c[0] for c in cambios)
+    suite.assert_equal(tipos, ["creado", "eliminado", "movido", "renombrado"], "Diff detecta los 4 tipos de cambio")
+    suite.assert_true(("movido", "root/docs/b.txt", "root/fotos/b.txt") in cambios, "Diff reporta rutas del movimiento")
+    
+    ok, cambios = fs.diferencias_versiones(1, "actual")
+    suite.assert_equal(cambios, [], "Sin diferencias entre última versión y árbol vivo")
+    
+    # Volver al pasado
+    ok, _ = fs.checkout_version(0)
+    suite.assert_true(ok, "Checkout a versión 0")
+    nodo, _ = fs._buscar_nodo_y_padre("root/docs/a.txt")
+    suite.assert_true(nodo is not None and nodo.contenido == "uno", "Archivo recupera nombre y contenido")
+    suite.assert_equal(fs.buscar_exacto("c.txt"), [], "HashMap sin el nombre del futuro")
+    suite.assert_equal(fs.buscar_exacto("playa.jpg"), ["root/fotos/playa.jpg"], "HashMap con el nodo restaurado")
+    suite.assert_true("nuevo.txt" not in fs.buscar_autocompletado("nue"), "Trie sincronizado tras checkout")
+    
+    # Modificar después del checkout no altera las versiones
+    fs.crear_nodo("root/docs", "otro.txt", "file")
+    ok, cambios = fs.diferencias_versiones(0, "actual")
+    suite.assert_equal(cambios, [("creado", None, "root/docs/otro.txt")], "Versión 0 intacta tras modificar")
+    
+    # Subárboles no tocados se comparten entre versiones
+    fotos_v0 = [h for h in fs.versiones[0].root.hijos if h.nombre == "fotos"][0]
+    fotos_vivo, _ = fs._buscar_nodo_y_padre("root/fotos")
+    suite.assert_true(fotos_v0 is fotos_vivo, "Subárbol compartido entre versión y árbol vivo")
+
+    # La papelera también se comparte: cada versión guarda un largo, no una copia
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "basura", "folder")
+    for i in range(100):
+        fs.crear_nodo("root/basura", f"b{i}.txt", "file")
+    esperadas = []
+    for i in range(100):
+        fs.eliminar_nodo(f"root/basura/b{i}.txt")
+        if i % 7 == 3: fs.restaurar_nodo(f"root/basura/b{i - 1}.txt")
+        fs.crear_version(f"v{i}")
+        esperadas.append([e["id"] for e in fs.papelera])
+    vistas = [v.papelera for v in fs.versiones]
+    suite.assert_true(all(type(v).__name__ == "VistaPapelera" for v in vistas), "Las versiones no copian la papelera")
+    suite.assert_true(len({id(v.registro) for v in vistas}) < len(vistas), "Las versiones comparten el registro de la papelera")
+    suite.assert_equal([[e["id"] for e in v] for v in vistas], esperadas, "Cada versión ve su propia papelera")
+    fs.checkout_version(40)
+    suite.assert_equal([e["id"] for e in fs.papelera], esperadas[40], "Checkout recupera la papelera de la versión")
+    fs.eliminar_nodo("root/basura/b99.txt")
+    fs.vaciar_papelera()
+    suite.assert_equal([[e["id"] for e in v] for v in vistas], esperadas, "Borrar y vaciar tras el checkout no altera las versiones")
+
+
+def test_diff_merge_archivos(suite):
+    """Prueba 13: Diff y Merge entre Guardados (hashes Merkle)"""
+    print(f"\n{Color.YELLOW}[PRUEBA 13] Diff y Merge entre Guardados{Color.END}")
+    
+    archivo_a, archivo_b = "./test_diff_a.json", "./test_diff_b.json"
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root", "grande", "folder")
+    for i in range(20):
+        fs.crear_nodo("root/grande", f"f{i}.txt", "file", f"dato {i}")
+    fs.crear_nodo("root/docs", "a.txt", "file", "uno")
+    fs.crear_nodo("root/docs", "b.txt", "file", "dos")
+    fs.crear_nodo("root/docs", "viejo.txt", "file")
+    fs.guardar_arbol(archivo_a)
+    
+    fs.renombrar_nodo("root/docs/a.txt", "a2.txt")
+    fs.modificar_contenido("root/docs/b.txt", "dos v2")
+    fs.crear_nodo("root", "nueva", "folder")
+    fs.mover_nodo("root/docs/b.txt", "root/nueva")
+    fs.eliminar_nodo("root/docs/viejo.txt")
+    fs.guardar_arbol(archivo_b)
+    
+    ok, cambios = fs.diferencias_archivos(archivo_a, archivo_b)
+    suite.assert_true(ok, "Diff entre dos guardados")
+    tipos = sorted(c[0] for c in cambios)
+    suite.assert_equal(tipos, ["creado", "eliminado", "modificado", "movido", "renombrado"], "Diff detecta todos los tipos")
+    
+    # Los subárboles con el mismo hash no se recorren
+    vista_a, vista_b = _leer_vista(archivo_a), _leer_vista(archivo_b)
+    comparar_arboles(vista_a, vista_b)
+    grande = [h for h in vista_b.hijos if h.nombre == "grande"][0]
+    suite.assert_true(grande._hijos is None, "Subárbol sin cambios saltado por hash Merkle")
+    
+    # Merge sobre un árbol que parte de A y tiene cambios propios
+    fs2 = ArbolGeneral()
+    fs2.cargar_arbol(archivo_a)
+    fs2.crear_nodo("root", "local.txt", "file")
+    ok, msg = fs2.fusionar_archivos(archivo_a, archivo_b)
+    suite.assert_true(ok, "Merge sin conflictos")
+    nodo, _ = fs2._buscar_nodo_y_padre("root/nueva/b.txt")
+    suite.assert_true(nodo is not None and nodo.contenido == "dos v2", "Merge aplica movimiento y edición")
+    suite.assert_equal(fs2.buscar_exacto("a2.txt"), ["root/docs/a2.txt"], "Merge aplica renombrado (índices)")
+    suite.assert_equal(len(fs2.papelera), 1, "Merge manda los eliminados a la papelera")
+    restantes = comparar_arboles(_leer_vista(archivo_b), fs2.root)
+    suite.assert_equal(restantes, [("creado", None, "root/local.txt")], "Tras merge solo queda el cambio local")
+    
+    for archivo in (archivo_a, archivo_b):
+        if os.path.exists(archivo):
+            os.remove(archivo)
+
+
+def test_deduplicacion(suite):
+    """Prueba 14: Deduplicación de Contenidos por Hash"""
+    print(f"\n{Color.YELLOW}[PRUEBA 14] Deduplicación de Contenidos{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "a", "folder")
+    fs.crear_nodo("root", "b", "folder")
+    for i in range(5):
+        fs.crear_nodo("root/a", f"copia{i}.txt", "file", "mismo texto")
+        fs.crear_nodo("root/b", f"copia{i}.txt", "file", "mismo texto")
+    fs.crear_nodo("root", "unico.txt", "file", "otro texto")
+    
+    r = fs.almacen.reporte()
+    suite.assert_equal((r["referencias"], r["unicos"]), (11, 2), "11 archivos, 2 contenidos únicos")
+    n1, _ = fs._buscar_nodo_y_padre("root/a/copia0.txt")
+    n2, _ = fs._buscar_nodo_y_padre("root/b/copia4.txt")
+    suite.assert_true(n1._contenido is n2._contenido, "Archivos iguales comparten el mismo blob")
+    suite.assert_equal(n1.contenido, "mismo texto", "El contenido se lee normal")
+    
+    # La papelera mantiene las referencias hasta que se vacía
+    fs.eliminar_nodo("root/a")
+    suite.assert_equal(fs.almacen.reporte()["referencias"], 11, "rm no suelta referencias (siguen en papelera)")
+    fs.eliminar_nodo("root/unico.txt")
+    fs.restaurar_nodo(1)
+    fs.vaciar_papelera()
+    r = fs.almacen.reporte()
+    suite.assert_equal((r["referencias"], r["unicos"]), (6, 2), "empty suelta las referencias de lo borrado")
+    
+    fs.modificar_contenido("root/unico.txt", "mismo texto")
+    suite.assert_equal(len(fs.almacen.blobs), 1, "Blob sin referencias se libera al editar")
+    
+    # En disco cada texto se guarda una sola vez
+    archivo_prueba = "./test_dedup_temp.json"
+    fs.guardar_arbol(archivo_prueba)
+    with open(archivo_prueba) as f:
+        texto = f.read()
+    suite.assert_equal(texto.count('"mismo texto"'), 1, "El JSON guarda el texto repetido una sola vez")
+    
+    fs2 = ArbolGeneral()
+    fs2.cargar_arbol(archivo_prueba)
+    nodo, _ = fs2._buscar_nodo_y_padre("root/b/copia3.txt")
+    suite.assert_equal(nodo.contenido if nodo else None, "mismo texto", "Contenido resuelto al cargar")
+    suite.assert_equal(fs2.almacen.reporte()["ratio"], 6.0, "Deduplicación se conserva al cargar")
+    
+    if os.path.exists(archivo_prueba):
+        os.remove(archivo_prueba)
+
+
+def test_compresion(suite):
+    """Prueba 15: Compresión de Contenidos y Guardados"""
+    print(f"\n{Color.YELLOW}[PRUEBA 15] Compresión de Contenidos y Guardados{Color.END}")
+    
+    fs = ArbolGeneral()
+    ok, _ = fs.configurar_compresion(1024, "zlib")
+    suite.assert_true(ok, "Configurar compresión de contenidos")
+    texto_largo = "registro de prueba repetido\n" * 500
+    fs.crear_nodo("root", "grande.log", "file", texto_largo)
+    fs.crear_nodo("root", "chico.txt", "file", "hola")
+    
+    grande, _ = fs._buscar_nodo_y_padre("root/grande.log")
+    chico, _ = fs._buscar_nodo_y_padre("root/chico.txt")
+    suite.assert_equal(grande._contenido.algoritmo, "zlib", "Contenido grande se comprime")
+    suite.assert_true(len(grande._contenido.datos) < len(texto_largo) // 10, "Blob comprimido ocupa mucho menos")
+    suite.assert_equal(chico._contenido.algoritmo, None, "Contenido chico se queda sin comprimir")
+    suite.assert_equal(grande.contenido, texto_largo, "Se descomprime de forma transparente al leer")
+    
+    for archivo, magia in (("./test_comp_temp.json.gz", b"\x1f\x8b"), ("./test_comp_temp.json.xz", b"\xfd7zXZ")):
+        ok, _ = fs.guardar_arbol(archivo)
+        with open(archivo, "rb") as f:
+            cabecera = f.read(len(magia))
+        suite.assert_true(ok and cabecera == magia, f"Guardado comprimido ({archivo[-2:]})")
+        fs2 = ArbolGeneral()
+        ok, _ = fs2.cargar_arbol(archivo)
+        nodo, _ = fs2._buscar_nodo_y_padre("root/grande.log")
+        suite.assert_true(ok and nodo is not None and nodo.contenido == texto_largo, f"Carga desde guardado {archivo[-2:]}")
+        if os.path.exists(archivo):
+            os.remove(archivo)
+
+
+def test_guardado_fragmentado(suite):
+    """Prueba 16: Guardado Fragmentado con Carga Perezosa"""
+    print(f"\n{Color.YELLOW}[PRUEBA 16] Guardado Fragmentado con Carga Perezosa{Color.END}")
+    
+    fs = ArbolGeneral()
+    for c in ("grande_a", "grande_b"):
+        fs.crear_nodo("root", c, "folder")
+        fs.crear_nodo(f"root/{c}", "interna", "folder")
+        for i in range(5):
+            fs.crear_nodo(f"root/{c}/interna", f"dato_{c}_{i}.txt", "file", f"contenido {i}")
+    fs.crear_nodo("root", "suelto.txt", "file", "arriba")
+    
+    directorio = tempfile.mkdtemp()
+    ok, _ = fs.guardar_arbol(directorio + "/", umbral_fragmento=5)
+    suite.assert_true(ok and os.path.exists(os.path.join(directorio, "manifest.json")), "Guardado fragmentado con manifiesto")
+    
+    fs2 = ArbolGeneral()
+    ok, _ = fs2.cargar_arbol(directorio)
+    grande_a, _ = fs2._buscar_nodo_y_padre("root/grande_a")
+    suite.assert_true(ok and grande_a._hijos is None, "Los fragmentos no se cargan al iniciar")
+    suite.assert_equal(sorted(fs2.buscar_exacto("dato_grande_b_3.txt")), ["root/grande_b/interna/dato_grande_b_3.txt"],
+                       "find cubre fragmentos sin cargar (resumen)")
+    suite.assert_true("dato_grande_a_0.txt" in fs2.buscar_autocompletado("dato_"), "Autocompletado cubre fragmentos sin cargar")
+    suite.assert_true(grande_a._hijos is None, "Buscar no carga el fragmento")
+    plan = fs2.explicar_consulta(parsear_consulta(["name:dato_*", "under:root/grande_b/interna"], "root"))
+    suite.assert_true(plan[-1].endswith("Fragmentos sin cargar: ~5 candidatos") and fs2._fragmentos.cargados == 0,
+                      "explain estima con el resumen, sin cargar nada")
+    suite.assert_equal(fs2.consultar(parsear_consulta(["content:contenido", "under:root/grande_b/interna"], "root")),
+                       [f"root/grande_b/interna/dato_grande_b_{i}.txt" for i in range(5)], "query con under lee solo ese fragmento")
+    suite.assert_equal(len(fs2.mas_grandes(20)), 11, "largest también")
+    suite.assert_true(fs2._fragmentos.cargados == 0 and grande_a._hijos is None, "Consultar no carga fragmentos")
+    
+    nodo, _ = fs2._buscar_nodo_y_padre("root/grande_a/interna/dato_grande_a_2.txt")
+    suite.assert_true(nodo is not None and nodo.contenido == "contenido 2", "El primer acceso carga el fragmento")
+    suite.assert_equal(len(fs2.buscar_exacto("dato_grande_a_2.txt")), 1, "Sin resultados duplicados tras cargar")
+    
+    fs2.renombrar_nodo("root/grande_b", "renombrada")
+    renombrada, _ = fs2._buscar_nodo_y_padre("root/renombrada")
+    suite.assert_true(renombrada is not None and renombrada._hijos is not None and not fs2._fragmentos.pendientes,
+                      "Renombrar carga el subárbol antes de cambiarlo")
+    fs2.crear_nodo("root/grande_a/interna", "nuevo.txt", "file", "x")
+    ok, _ = fs2.guardar_arbol(directorio)
+    fs3 = ArbolGeneral()
+    fs3.cargar_arbol(directorio)
+    suite.assert_equal(fs3.root.calcular_hash(), fs2.root.calcular_hash(), "Re-guardado fragmentado conserva el árbol")
+    suite.assert_equal(fs3.calcular_tamano(), fs.calcular_tamano() + 1, "Tamaño completo tras re-cargar")
+    shutil.rmtree(directorio)
+
+
+def test_instantanea_mapeada(suite):
+    """Prueba 17: Instantánea Mapeada de Solo Lectura"""
+    print(f"\n{Color.YELLOW}[PRUEBA 17] Instantánea Mapeada de Solo Lectura{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root", "Datos", "folder")
+    fs.crear_nodo("root/docs", "informe.txt", "file", "ñandú y acentos")
+    fs.crear_nodo("root/Datos", "informe.txt", "file", "otro")
+    fs.crear_nodo("root/Datos", "indice.csv", "file")
+    fs.crear_nodo("root/docs", "vacia", "folder")
+    
+    archivo = "./test_mapeado_temp.fsmap"
+    ok, _ = fs.exportar_mapeado(archivo)
+    suite.assert_true(ok, "Exportar instantánea mapeada")
+    
+    with ArbolMapeado(archivo) as ro:
+        suite.assert_equal(ro.calcular_tamano(), fs.calcular_tamano(), "Mismo número de nodos")
+        suite.assert_equal(ro.recorrido_preorden(), fs.recorrido_preorden(), "Mismo recorrido preorden")
+        for ruta in ("root", "root/docs", "root/docs/vacia", "root/docs/informe.txt", "root/nada"):
+            suite.assert_equal(ro.listar_directorio(ruta), fs.listar_directorio(ruta), f"ls {ruta} igual al árbol vivo")
+        suite.assert_equal(sorted(ro.buscar_exacto("informe.txt")), sorted(fs.buscar_exacto("informe.txt")), "Búsqueda exacta")
+        suite.assert_equal(ro.buscar_exacto("no_existe"), [], "Búsqueda exacta sin resultados")
+        suite.assert_equal(ro.buscar_autocompletado("in"), fs.buscar_autocompletado("in"), "Autocompletado por prefijo")
+        suite.assert_equal(ro.buscar_autocompletado("d"), fs.buscar_autocompletado("d"), "Autocompletado sin distinguir mayúsculas")
+        suite.assert_equal(ro.leer_contenido("root/docs/informe.txt"), "ñandú y acentos", "Contenido UTF-8 en el pool")
+    
+    if os.path.exists(archivo):
+        os.remove(archivo)
+
+
+def test_ancestros_mover(suite):
+    """Prueba 18: Ancestros por Intervalos y mv Seguro"""
+    print(f"\n{Color.YELLOW}[PRUEBA 18] Ancestros por Intervalos y mv Seguro{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "a", "folder")
+    fs.crear_nodo("root/a", "b", "folder")
+    fs.crear_nodo("root/a/b", "c", "folder")
+    
+    ok, _ = fs.mover_nodo("root/a", "root/a/b/c")
+    suite.assert_true(not ok, "mv a un descendiente se rechaza")
+    ok, _ = fs.mover_nodo("root/a", "root/a")
+    suite.assert_true(not ok, "mv de una carpeta dentro de sí misma se rechaza")
+    suite.assert_equal(fs.calcular_tamano(), 4, "El árbol queda intacto (sin ciclos)")
+    suite.assert_equal(fs.buscar_exacto("a"), ["root/a"], "Índices sin tocar tras el rechazo")
+    
+    fs.crear_nodo("root", "d", "folder")
+    ok, _ = fs.mover_nodo("root/a/b", "root/d")
+    suite.assert_true(ok, "mv a una rama hermana sigue funcionando")
+    c, d = fs._buscar_nodo_y_padre("root/d/b/c")[0], fs._buscar_nodo_y_padre("root/d")[0]
+    suite.assert_true(fs.ancestro_comun(c, d) is d, "Ancestro común de un nodo y su ancestro")
+    suite.assert_true(fs.ancestro_comun(fs._buscar_nodo_y_padre("root/a")[0], c) is fs.root, "Ancestro común de ramas distintas")
+    
+    # Operaciones mezcladas (con versiones de por medio) y comparación contra las rutas
+    random.seed(7)
+    carpetas = ["root", "root/a", "root/d", "root/d/b", "root/d/b/c"]
+    for i in range(300):
+        if i % 50 == 0:
+            fs.crear_version()
+        padre = random.choice(carpetas)
+        if random.random() < 0.3:
+            ok, _ = fs.crear_nodo(padre, f"f{i}", "folder")
+            if ok: carpetas.append(f"{padre}/f{i}")
+        elif random.random() < 0.7:
+            fs.crear_nodo(padre, f"x{i}.txt", "file", "x")
+        else:
+            origen, destino = random.choice(carpetas[1:]), random.choice(carpetas)
+            ok, _ = fs.mover_nodo(origen, destino)
+            if ok:
+                nuevo = f"{destino}/{origen.split('/')[-1]}"
+                carpetas = [nuevo + c[len(origen):] if c == origen or c.startswith(origen + "/") else c for c in carpetas]
+            else:
+                suite.assert_true(destino == origen or destino.startswith(origen + "/") or
+                                  any(h.nombre == origen.split('/')[-1] for h in fs._buscar_nodo_y_padre(destino)[0].hijos),
+                                  f"Rechazo de mv justificado ({origen} -> {destino})")
+    
+    nodos = {}
+    pila = [(fs.root, "root")]
+    while pila:
+        nodo, ruta = pila.pop()
+        nodos[ruta] = nodo
+        pila.extend((h, f"{ruta}/{h.nombre}") for h in nodo.hijos)
+    rutas = random.sample(sorted(nodos), 60)
+    correctos = all(fs.es_ancestro(nodos[x], nodos[y]) == (y == x or y.startswith(x + "/")) for x in rutas for y in rutas)
+    suite.assert_true(correctos, "es_ancestro coincide con las rutas")
+    padres_ok = all(nodos[r].padre is nodos[r.rsplit("/", 1)[0]] for r in nodos if r != "root")
+    suite.assert_true(padres_ok, "Enlaces al padre correctos tras copy-on-write")
+
+
+def test_rutas_por_padres(suite):
+    """Prueba 19: Rutas Reconstruidas desde los Padres"""
+    print(f"\n{Color.YELLOW}[PRUEBA 19] Rutas Reconstruidas desde los Padres{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "proyectos", "folder")
+    fs.crear_nodo("root/proyectos", "web", "folder")
+    fs.crear_nodo("root/proyectos/web", "notas.txt", "file", "x")
+    fs.crear_nodo("root", "notas.txt", "file", "y")
+    fs.crear_nodo("root", "archivo", "folder")
+    
+    nodo, _ = fs._buscar_nodo_y_padre("root/proyectos/web/notas.txt")
+    suite.assert_equal(fs.obtener_ruta(nodo), "root/proyectos/web/notas.txt", "obtener_ruta sube por los padres")
+    suite.assert_equal(sorted(fs.buscar_exacto("notas.txt")), ["root/notas.txt", "root/proyectos/web/notas.txt"],
+                       "find con nombres repetidos")
+    
+    fs.mover_nodo("root/proyectos/web", "root/archivo")
+    suite.assert_true("root/archivo/web/notas.txt" in fs.buscar_exacto("notas.txt"), "find correcto tras mover la carpeta padre")
+    fs.crear_version()
+    fs.renombrar_nodo("root/archivo", "viejo")
+    suite.assert_true("root/viejo/web/notas.txt" in fs.buscar_exacto("notas.txt"), "find correcto tras renombrar un ancestro")
+    
+    fs.eliminar_nodo("root/viejo")
+    suite.assert_equal(fs.buscar_exacto("notas.txt"), ["root/notas.txt"], "rm saca del índice todo el subárbol")
+    suite.assert_true("notas.txt" in fs.buscar_autocompletado("not"), "El Trie conserva un nombre que sigue en uso")
+    fs.restaurar_nodo(0)
+    suite.assert_equal(sorted(fs.buscar_exacto("web")), ["root/viejo/web"], "restore vuelve a indexar el subárbol")
+    
+    fs.checkout_version(0)
+    suite.assert_equal(sorted(fs.buscar_exacto("notas.txt")), ["root/archivo/web/notas.txt", "root/notas.txt"],
+                       "find correcto tras checkout")
+    suite.assert_equal(fs.buscar_exacto("viejo"), [], "checkout quita los nombres que no existen en la versión")
+
+
+def test_cache_rutas(suite):
+    """Prueba 20: Caché LRU de Resolución de Rutas"""
+    print(f"\n{Color.YELLOW}[PRUEBA 20] Caché LRU de Resolución de Rutas{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "trabajo", "folder")
+    fs.crear_nodo("root/trabajo", "informe.txt", "file", "v1")
+    
+    for _ in range(5):
+        fs.listar_directorio("root/trabajo")
+    c = fs.estadisticas_cache()
+    suite.assert_true(c["aciertos"] >= 4 and c["fallos"] >= 1, "Rutas repetidas se resuelven desde la caché")
+    
+    fs.renombrar_nodo("root/trabajo", "oficina")
+    suite.assert_equal(fs._buscar_nodo_y_padre("root/trabajo")[0], None, "ren invalida la ruta vieja")
+    suite.assert_true(fs._buscar_nodo_y_padre("root/oficina/informe.txt")[0] is not None, "La ruta nueva se resuelve")
+    
+    suite.assert_equal(fs._buscar_nodo_y_padre("root/nueva")[0], None, "Ruta inexistente")
+    fs.crear_nodo("root", "nueva", "folder")
+    suite.assert_true(fs._buscar_nodo_y_padre("root/nueva")[0] is not None, "Los fallos no se guardan en caché")
+    
+    cacheado, _ = fs._buscar_nodo_y_padre("root/oficina")
+    fs.crear_version()
+    fs.crear_nodo("root/oficina", "otro.txt", "file")
+    vivo, _ = fs._buscar_nodo_y_padre("root/oficina")
+    suite.assert_true(vivo is not cacheado and any(h.nombre == "otro.txt" for h in vivo.hijos),
+                      "Las copias (COW) invalidan la caché")
+    
+    fs.eliminar_nodo("root/oficina")
+    suite.assert_equal(fs._buscar_nodo_y_padre("root/oficina/informe.txt")[0], None, "rm invalida la caché")
+    fs.restaurar_nodo(0)
+    suite.assert_true(fs._buscar_nodo_y_padre("root/oficina/informe.txt")[0] is not None, "restore vuelve a resolver")
+    
+    for i in range(fs._LIMITE_CACHE_RESOLUCION + 50):
+        fs.crear_nodo("root", f"c{i}", "folder")
+        fs._buscar_nodo_y_padre(f"root/c{i}")
+    suite.assert_equal(fs.estadisticas_cache()["entradas"], fs._LIMITE_CACHE_RESOLUCION, "La caché está acotada (LRU)")
+
+
+def test_operaciones_en_lote(suite):
+    """Prueba 21: Comodines y Operaciones en Lote"""
+    print(f"\n{Color.YELLOW}[PRUEBA 21] Comodines y Operaciones en Lote{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.generar_carga_prueba(200)
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root/docs", "a.txt", "file", "a")
+    fs.crear_nodo("root/docs", "sub", "folder")
+    fs.crear_nodo("root/docs/sub", "b.txt", "file", "b")
+    fs.crear_nodo("root/docs/sub", "c.md", "file", "c")
+    
+    suite.assert_equal(len(fs.expandir_patron("root/archivo_perf_*")), 200, "Expansión de * en una carpeta")
+    suite.assert_equal(fs.expandir_patron("root/docs/**/*.txt"), ["root/docs/a.txt", "root/docs/sub/b.txt"],
+                       "** baja a cualquier profundidad")
+    suite.assert_equal(fs.expandir_patron("root/docs/su?/c.*"), ["root/docs/sub/c.md"], "Comodín ? y segmentos mixtos")
+    suite.assert_equal(fs.buscar_patron("*.md"), ["root/docs/sub/c.md"], "find con patrón")
+    suite.assert_equal(fs.buscar_patron("*.txt", "root/docs/sub"), ["root/docs/sub/b.txt"], "find limitado a una carpeta")
+    ok, salida = fs.listar_recursivo("root/docs")
+    suite.assert_true(ok and "root/docs/sub:" in salida and "c.md (file)" in salida, "ls -R lista las subcarpetas")
+    
+    ok, _ = fs.eliminar_varios(fs.expandir_patron("root/archivo_perf_*"))
+    suite.assert_true(ok and len(fs.root.hijos) == 1, "rm en lote de 200 archivos")
+    suite.assert_equal(len(fs.papelera), 200, "Cada elemento del lote va a la papelera")
+    suite.assert_equal(fs.buscar_autocompletado("archivo_perf"), [], "Índices actualizados en lote")
+    fs.restaurar_nodo(0)
+    suite.assert_equal(len(fs.expandir_patron("root/archivo_perf_*")), 1, "Un elemento del lote se restaura solo")
+    
+    fs.crear_nodo("root", "destino", "folder")
+    ok, msg = fs.mover_varios(["root/docs", "root/docs/sub/b.txt", "root/archivo_perf_00000_test.txt"], "root/destino")
+    suite.assert_true(ok and fs._buscar_nodo_y_padre("root/destino/docs/sub/b.txt")[0] is not None,
+                      "mv en lote (lo de adentro viaja con su carpeta)")
+    ok, msg = fs.mover_varios(["root/destino"], "root/destino/docs")
+    suite.assert_true(not ok, "mv en lote rechaza mover dentro de sí mismo")
+    suite.assert_equal(fs.buscar_exacto("b.txt"), ["root/destino/docs/sub/b.txt"], "find correcto tras mv en lote")
+
+def test_papelera_indexada(suite):
+    """Prueba 22: Papelera Indexada y Retención"""
+    print(f"\n{Color.YELLOW}[PRUEBA 22] Papelera Indexada y Retención{Color.END}")
+    
+    fs = ArbolGeneral()
+    for i in range(5):
+        fs.crear_nodo("root", f"f{i}.txt", "file", f"contenido {i}")
+    fs.crear_nodo("root", "dup.txt", "file", "viejo")
+    fs.eliminar_nodo("root/dup.txt")
+    fs.crear_nodo("root", "dup.txt", "file", "nuevo")
+    fs.eliminar_nodo("root/dup.txt")
+    for i in range(5):
+        fs.eliminar_nodo(f"root/f{i}.txt")
+    
+    ok, _ = fs.restaurar_nodo(4)
+    suite.assert_true(ok and fs._buscar_nodo_y_padre("root/f2.txt")[0] is not None, "restore por id")
+    ok, _ = fs.restaurar_nodo(4)
+    suite.assert_true(not ok, "Los ids no se reutilizan tras restaurar")
+    ok, _ = fs.restaurar_nodo("root/dup.txt")
+    nodo, _ = fs._buscar_nodo_y_padre("root/dup.txt")
+    suite.assert_true(ok and nodo.contenido == "nuevo", "restore por ruta trae el borrado más reciente")
+    suite.assert_true(fs.papelera.buscar_por_ruta("root/dup.txt")["nodo"].contenido == "viejo",
+                      "La versión anterior sigue indexada por su ruta")
+    
+    salida = fs.ver_papelera(1, por_pagina=2)
+    suite.assert_true(salida.startswith("Página 1/3") and "[6] f4.txt" in salida and "[0]" not in salida,
+                      "Listado paginado, más recientes primero")
+    
+    ok, _ = fs.configurar_papelera("items", "2")
+    suite.assert_equal([item["id"] for item in fs.papelera], [5, 6], "La retención por cantidad descarta los más viejos")
+    fs.configurar_papelera("items", "off")
+    fs.crear_nodo("root", "grande.txt", "file", "x" * 1000)
+    fs.configurar_papelera("bytes", "1015")
+    fs.eliminar_nodo("root/grande.txt")
+    suite.assert_true(5 not in fs.papelera and 6 in fs.papelera and fs.papelera.bytes <= 1015,
+                      "La retención por bytes descarta desde el más viejo")
+    fs.configurar_papelera("bytes", "off")
+    fs.papelera.obtener(6)["fecha"] -= 10 * 86400
+    fs.configurar_papelera("dias", "7")
+    suite.assert_true(6 not in fs.papelera and fs.papelera.buscar_por_ruta("root/grande.txt") is not None,
+                      "La retención por antigüedad descarta lo vencido")
+    suite.assert_equal(len(fs.almacen.blobs), len(fs.root.hijos) + len(fs.papelera),
+                       "Los contenidos descartados se sueltan del almacén")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        archivo = os.path.join(temp_dir, "fs.json")
+        fs.guardar_arbol(archivo)
+        fs2 = ArbolGeneral()
+        fs2.cargar_arbol(archivo)
+        suite.assert_equal([item["id"] for item in fs2.papelera], [7], "Los ids se conservan al guardar y cargar")
+        fs2.eliminar_nodo("root/f2.txt")
+        suite.assert_true(8 in fs2.papelera, "Los ids nuevos siguen después de los cargados")
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_metadatos(suite):
+    """Prueba 23: Metadatos e Índices por Tamaño y Fecha"""
+    print(f"\n{Color.YELLOW}[PRUEBA 23] Metadatos e Índices por Tamaño y Fecha{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "docs", "folder")
+    for i, tam in enumerate([10, 500, 2000, 5000, 100]):
+        fs.crear_nodo("root/docs", f"a{i}.txt", "file", "x" * tam)
+    fs.crear_nodo("root", "grande.bin", "file", "y" * 9000)
+    
+    suite.assert_equal(fs.buscar_por_metadatos(tamano_min=1025), ["root/docs/a2.txt", "root/docs/a3.txt", "root/grande.bin"],
+                       "find -size +1k por el índice de tamaño")
+    suite.assert_equal(fs.buscar_por_metadatos(tamano_min=1025, ruta_base="root/docs", patron="*.txt"),
+                       ["root/docs/a2.txt", "root/docs/a3.txt"], "Predicados combinados con carpeta y patrón")
+    suite.assert_equal(fs.mas_grandes(2), [("root/grande.bin", 9000), ("root/docs/a3.txt", 5000)],
+                       "Los más grandes salen del final del índice")
+    
+    nodo, _ = fs._buscar_nodo_y_padre("root/docs/a0.txt")
+    nodo.ctime = nodo.mtime = 1000.0  # antes de armar los índices: se toma al armarlos
+    fs.configurar_indice("metadatos", "apagado")
+    fs.configurar_indice("metadatos", "perezoso")
+    viejos = fs.buscar_por_metadatos(mtime_max=2000.0)
+    suite.assert_equal(viejos, ["root/docs/a0.txt"], "Rango por mtime")
+    fs.crear_version("v1")
+    fs.modificar_contenido("root/docs/a0.txt", "z" * 3000)
+    nodo, _ = fs._buscar_nodo_y_padre("root/docs/a0.txt")
+    suite.assert_true(nodo.mtime > 1000.0 and nodo.ctime == 1000.0, "Modificar cambia mtime pero no ctime")
+    suite.assert_equal(fs.buscar_por_metadatos(mtime_max=2000.0), [], "El índice de mtime sigue al cambio")
+    suite.assert_true("root/docs/a0.txt" in fs.buscar_por_metadatos(tamano_min=2048, tamano_max=4096),
+                      "El índice de tamaño sigue al cambio")
+    suite.assert_equal(fs.versiones[0].root.hijos[0].hijos[0].mtime, 1000.0, "La versión conserva el mtime viejo")
+    
+    fs.eliminar_nodo("root/docs/a3.txt")
+    suite.assert_true("root/docs/a3.txt" not in fs.buscar_por_metadatos(tamano_min=1), "rm saca del índice")
+    fs.restaurar_nodo("root/docs/a3.txt")
+    suite.assert_true("root/docs/a3.txt" in fs.buscar_por_metadatos(tamano_min=1), "restore vuelve a indexar")
+    criterios = parsear_predicados(["-newer", "root/grande.bin", "-type", "d", "-size", "-2k"], fs, "root")
+    suite.assert_true(criterios["tipo"] == "folder" and criterios["tamano_max"] == 2047
+                      and criterios["mtime_min"] > fs._buscar_nodo_y_padre("root/grande.bin")[0].mtime,
+                      "Parseo de -newer, -type y -size")
+    suite.assert_equal(fs.buscar_por_metadatos(**parsear_predicados(["-newer", "root/grande.bin", "-type", "d"], fs, "root")),
+                       ["root/docs"], "-newer: la carpeta cambió después (rm/restore)")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        archivo = os.path.join(temp_dir, "fs.json")
+        fs.guardar_arbol(archivo)
+        fs2 = ArbolGeneral()
+        fs2.cargar_arbol(archivo)
+        nodo2, _ = fs2._buscar_nodo_y_padre("root/docs/a0.txt")
+        suite.assert_true(nodo2.ctime == 1000.0 and nodo2.mtime == nodo.mtime, "Las fechas se guardan y se cargan")
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_consultas(suite):
+    """Prueba 24: Consultas Combinadas con Planificador"""
+    print(f"\n{Color.YELLOW}[PRUEBA 24] Consultas Combinadas con Planificador{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "documentos", "folder")
+    fs.crear_nodo("root", "otros", "folder")
+    fs.crear_nodo("root/documentos", "reporte1.txt", "file", "TODO: revisar cifras")
+    fs.crear_nodo("root/documentos", "reporte2.txt", "file", "listo")
+    fs.crear_nodo("root/documentos", "reportes", "folder")
+    fs.crear_nodo("root/otros", "reporte3.txt", "file", "todo mal")
+    fs.generar_carga_prueba(200)
+    
+    q = parsear_consulta(["under:documentos", "name:rep*", "content:TODO", "type:f"], "root")
+    suite.assert_equal(q, [("under", "root/documentos"), ("prefix", "rep"), ("content", "todo"), ("type", "file")],
+                       "Parseo de la consulta (prefijo, palabra en minúsculas, ruta absoluta)")
+    suite.assert_equal(fs.consultar(q), ["root/documentos/reporte1.txt"], "Consulta combinada")
+    plan = fs.explicar_consulta(q)
+    suite.assert_true("contenido" in plan[0] and "Trie" in plan[1] and "∩" in plan[1],
+                      "explain: el índice más selectivo primero y el otro intersectado")
+    
+    plan = fs.explicar_consulta(parsear_consulta(["content:todo", "name:archivo_perf_*"], "root"))
+    suite.assert_true(len(plan) == 2 and "Filtro" in plan[1], "Un índice que trae muchos nodos queda como filtro")
+    q = parsear_consulta(["under:documentos", "type:d"], "root")
+    suite.assert_true("recorrido de root/documentos" in fs.explicar_consulta(q)[0], "Sin índice: recorrido acotado")
+    suite.assert_equal(fs.consultar(q), ["root/documentos/reportes"], "El recorrido acotado aplica los filtros")
+    suite.assert_equal(fs.consultar(parsear_consulta(["name:reporte?.txt", "under:otros"], "root")),
+                       ["root/otros/reporte3.txt"], "Comodines en el nombre")
+    
+    fs.modificar_contenido("root/documentos/reporte2.txt", "falta un todo")
+    fs.eliminar_nodo("root/otros")
+    suite.assert_equal(fs.consultar(parsear_consulta(["content:todo"], "root")),
+                       ["root/documentos/reporte1.txt", "root/documentos/reporte2.txt"],
+                       "El índice invertido sigue a modificar y rm")
+    fs.crear_version("v")
+    fs.renombrar_nodo("root/documentos/reporte1.txt", "informe.txt")
+    suite.assert_equal(fs.consultar(parsear_consulta(["content:todo", "name:informe.txt"], "root")),
+                       ["root/documentos/informe.txt"], "Las copias (COW) reemplazan al original en el índice")
+
+    # Ids repetidos (guardados viejos de 8 caracteres): el índice y la intersección no los confunden
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "a.txt", "file", "clave uno")
+    fs.crear_nodo("root", "b.txt", "file", "clave dos")
+    a, _ = fs._buscar_nodo_y_padre("root/a.txt")
+    b, _ = fs._buscar_nodo_y_padre("root/b.txt")
+    b.id = a.id
+    suite.assert_equal(fs.consultar(parsear_consulta(["content:clave"], "root")), ["root/a.txt", "root/b.txt"],
+                       "Índice invertido con ids repetidos")
+    suite.assert_equal(fs.consultar(parsear_consulta(["content:clave", "name:b.txt"], "root")), ["root/b.txt"],
+                       "Intersección con ids repetidos")
+    try:
+        parsear_consulta(["color:rojo"], "root")
+        suite.assert_true(False, "Campo desconocido rechazado")
+    except ValueError:
+        suite.assert_true(True, "Campo desconocido rechazado")
+
+def test_indice_paralelo(suite):
+    """Prueba 25: Índices Armados en un Pool de Procesos"""
+    print(f"\n{Color.YELLOW}[PRUEBA 25] Índices Armados en un Pool de Procesos{Color.END}")
+    
+    fs = ArbolGeneral()
+    for carpeta in ("alfa", "Beta", "gamma"):
+        fs.crear_nodo("root", carpeta, "folder")
+        for i in range(30):
+            fs.crear_nodo(f"root/{carpeta}", f"{carpeta[0]}_archivo_{i:02d}.txt", "file", "x")
+        fs.crear_nodo(f"root/{carpeta}", "comun.txt", "file", "repetido")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        archivo = os.path.join(temp_dir, "fs.json")
+        fs.guardar_arbol(archivo)
+        serie, paralelo = ArbolGeneral(), ArbolGeneral()
+        serie.cargar_arbol(archivo)
+        paralelo.indices["prefijos"]._UMBRAL_PARALELO = 0  # forzar el pool aunque el árbol sea chico
+        ok, _ = paralelo.cargar_arbol(archivo, procesos=3)
+        suite.assert_true(ok, "Carga con 3 procesos")
+        for prefijo in ("", "a", "b_ARCH", "comun", "g_archivo_2"):
+            suite.assert_equal(paralelo.buscar_autocompletado(prefijo), serie.buscar_autocompletado(prefijo),
+                               f"Trie unido igual al secuencial (prefijo '{prefijo}')")
+        suite.assert_equal(sorted(paralelo.buscar_exacto("comun.txt")),
+                           ["root/Beta/comun.txt", "root/alfa/comun.txt", "root/gamma/comun.txt"],
+                           "HashMap con nombres repetidos")
+        paralelo.eliminar_nodo("root/alfa/a_archivo_00.txt")
+        suite.assert_equal(paralelo.buscar_autocompletado("a_archivo_00"), [], "El Trie unido se sigue actualizando")
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_copiar(suite):
+    """Prueba 26: cp con Copy-on-Write"""
+    print(f"\n{Color.YELLOW}[PRUEBA 26] cp con Copy-on-Write{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "src", "folder")
+    fs.crear_nodo("root/src", "lib", "folder")
+    fs.crear_nodo("root/src/lib", "x.txt", "file", "original")
+    fs.crear_nodo("root/src", "y.txt", "file", "chau")
+    
+    fs.crear_nodo("root", "aparte", "folder")
+    fs.crear_nodo("root/aparte", "z.txt", "file", "z")
+    ok, _ = fs.copiar_nodo("root/src", "root/dst")
+    clon, _ = fs._buscar_nodo_y_padre("root/dst")
+    suite.assert_true(ok and clon._hijos is None and len(fs._clones.pendientes) == 1,
+                      "cp de una carpeta deja un stub sin copiar los hijos")
+    raiz, aparte = fs.root, fs._buscar_nodo_y_padre("root/aparte")[0]
+    fs.modificar_contenido("root/aparte/z.txt", "zz")
+    suite.assert_true(fs.root is raiz and fs._buscar_nodo_y_padre("root/aparte")[0] is aparte and fs._epoca_congelada == -1,
+                      "cp congela solo el original: fuera de él se escribe en sitio")
+    # Lo que sale del original (mv, rm y restore) sigue compartido con el clon
+    fs.mover_nodo("root/src/lib", "root/aparte")
+    fs.eliminar_nodo("root/aparte/lib")
+    fs.restaurar_nodo("root/aparte/lib")
+    fs.crear_nodo("root/aparte/lib", "nuevo.txt", "file")
+    fs.modificar_contenido("root/aparte/lib/x.txt", "tocado")
+    fs.mover_nodo("root/aparte/lib", "root/src")
+    suite.assert_equal([h.nombre for h in fs._buscar_nodo_y_padre("root/dst/lib")[0].hijos], ["x.txt"],
+                       "Lo que salió del original y volvió no altera el clon")
+    fs.modificar_contenido("root/src/lib/x.txt", "cambiado")
+    suite.assert_equal(fs._buscar_nodo_y_padre("root/dst/lib/x.txt")[0].contenido, "original",
+                       "Cambiar el original no toca la copia (estaba congelado)")
+    fs.modificar_contenido("root/dst/y.txt", "nuevo")
+    suite.assert_equal(fs._buscar_nodo_y_padre("root/src/y.txt")[0].contenido, "chau", "Cambiar la copia no toca el original")
+    suite.assert_equal(fs.buscar_exacto("x.txt"), ["root/src/lib/x.txt", "root/dst/lib/x.txt"], "Las búsquedas ven la copia")
+    ids = {fs._buscar_nodo_y_padre(r)[0].id for r in ("root/src/lib", "root/dst/lib")}
+    suite.assert_true(len(ids) == 2 and not fs._clones.pendientes and fs._epoca_congelada == -1,
+                      "Ids nuevos y sin nada congelado al terminar de expandir")
+    suite.assert_equal(len(fs._buscar_nodo_y_padre("root/dst/lib/x.txt")[0].id), 32,
+                       "Los ids de las copias tienen 16 bytes (no chocan en árboles grandes)")
+    
+    # Las búsquedas leen el original y traducen las rutas: el clon no se expande
+    fs3 = ArbolGeneral()
+    fs3.crear_nodo("root", "a", "folder")
+    fs3.crear_nodo("root/a", "b", "folder")
+    fs3.crear_nodo("root/a/b", "nota.txt", "file", "hola mundo")
+    fs3.copiar_nodo("root/a", "root/c")
+    fs3.modificar_contenido("root/a/b/nota.txt", "adios")
+    ambas = ["root/a/b/nota.txt", "root/c/b/nota.txt"]
+    suite.assert_equal((fs3.buscar_exacto("nota.txt"), fs3.buscar_patron("not*"), fs3.buscar_autocompletado("no")),
+                       (ambas, ambas, ["nota.txt"]), "search y find cubren el clon sin expandir")
+    suite.assert_equal((fs3.consultar([("content", "hola")]), fs3.consultar([("under", "root/c"), ("type", "file")]),
+                        fs3.buscar_por_metadatos(tipo="file"), fs3.mas_grandes(1)),
+                       (["root/c/b/nota.txt"], ["root/c/b/nota.txt"], ambas, [("root/c/b/nota.txt", 10)]),
+                       "query, find con predicados y largest ven el clon como era al copiarlo")
+    suite.assert_true(fs3.explicar_consulta([("name", "nota.txt")])[-1].endswith("Clones sin expandir (leídos del original): ~1 candidatos"),
+                      "explain estima lo que aportan los clones")
+    suite.assert_true(fs3._clones.expandidos == 0 and len(fs3._clones.pendientes) == 1, "Nada de eso expandió el clon")
+    fs3.deshacer()
+    fs3.deshacer()
+    suite.assert_true(fs3._clones.expandidos == 0 and not fs3._clones.pendientes
+                      and fs3.buscar_exacto("nota.txt") == ambas[:1], "Deshacer el cp suelta el clon sin expandirlo")
+    fs3.rehacer()
+    fs3.rehacer()
+    suite.assert_equal((fs3.consultar([("content", "hola")]), fs3._buscar_nodo_y_padre("root/a/b/nota.txt")[0].contenido),
+                       (["root/c/b/nota.txt"], "adios"), "Rehacer lo vuelve a colgar como era")
+
+    ok, msg = fs.copiar_nodo("root/src", "root/src/lib")
+    suite.assert_true(not ok, "No se copia una carpeta dentro de sí misma")
+    ok, _ = fs.copiar_nodo("root/src/y.txt", "root")
+    suite.assert_true(ok and fs._buscar_nodo_y_padre("root/y.txt")[0].contenido == "chau", "cp de un archivo a una carpeta")
+    suite.assert_true(not fs.copiar_nodo("root/src/y.txt", "root")[0], "cp no pisa un nombre existente")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        fs.copiar_nodo("root/src", "root/otra")
+        archivo_a, archivo_b = os.path.join(temp_dir, "a.json"), os.path.join(temp_dir, "b.json")
+        fs.guardar_arbol(archivo_a)
+        fs.guardar_arbol(archivo_b)
+        suite.assert_true(fs._clones.pendientes and comparar_arboles(_leer_vista(archivo_a), _leer_vista(archivo_b)) == [],
+                          "Guardar sin expandir da los mismos ids cada vez")
+        fs2 = ArbolGeneral()
+        fs2.cargar_arbol(archivo_a)
+        nodo2 = fs2._buscar_nodo_y_padre("root/otra/lib/x.txt")[0]
+        suite.assert_equal(nodo2.id, fs._buscar_nodo_y_padre("root/otra/lib/x.txt")[0].id,
+                           "Los ids guardados coinciden con los de la expansión")
+        fs.eliminar_nodo("root/otra")
+        suite.assert_true(not fs._clones.pendientes and "root/otra/lib/x.txt" not in fs.buscar_exacto("x.txt"),
+                          "rm expande el clon y lo desindexa entero")
+        fs.restaurar_nodo("root/otra")
+        suite.assert_true("root/otra/lib/x.txt" in fs.buscar_exacto("x.txt"), "restore de un clon")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_deshacer(suite):
+    """PRUEBA 27: undo/redo guardando solo lo que cambió"""
+    print(f"\n{Color.YELLOW}[PRUEBA 27] Deshacer / rehacer{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root/docs", "a.txt", "file", "hola")
+    fs.crear_nodo("root", "b", "folder")
+    hash_inicial = fs.root.calcular_hash()
+    
+    fs.modificar_contenido("root/docs/a.txt", "chau")
+    fs.mover_nodo("root/docs/a.txt", "root/b")
+    fs.renombrar_nodo("root/b/a.txt", "c.txt")
+    fs.copiar_nodo("root/b", "root/docs")
+    fs.eliminar_varios(["root/docs", "root/b"])
+    hash_final = fs.root.calcular_hash()
+    suite.assert_equal(len(fs.historial.deshacer), 8, "Cada operación deja una entrada")
+    
+    for _ in range(5):
+        ok, msg = fs.deshacer()
+        if not ok: break
+    suite.assert_true(ok, f"Se deshacen rm, cp, rename, mv y edición ({msg})")
+    suite.assert_equal(fs.root.calcular_hash(), hash_inicial, "El árbol vuelve a estar igual que antes")
+    suite.assert_equal(fs._buscar_nodo_y_padre("root/docs/a.txt")[0].contenido, "hola", "Vuelve el contenido anterior")
+    suite.assert_equal(fs.buscar_exacto("c.txt"), [], "Los índices siguen al árbol")
+    suite.assert_equal(len(fs.papelera), 0, "Deshacer rm saca los elementos de la papelera")
+    
+    for _ in range(5):
+        fs.rehacer()
+    suite.assert_equal(fs.root.calcular_hash(), hash_final, "Rehacer deja el árbol como al final")
+    suite.assert_true(not fs.rehacer()[0], "No hay más para rehacer")
+    
+    fs.deshacer()
+    fs.crear_nodo("root", "nuevo", "folder")
+    suite.assert_true(not fs.historial.rehacer, "Una operación nueva descarta lo que se podía rehacer")
+    
+    fs.vaciar_papelera()
+    suite.assert_true(not fs.historial.deshacer, "empty no se puede deshacer: se olvida el historial")
+    
+    fs.historial.limite = 3
+    for i in range(5):
+        fs.crear_nodo("root", f"d{i}", "folder")
+    suite.assert_equal(len(fs.historial.deshacer), 3, "El historial respeta su límite")
+    
+    fs.crear_nodo("root", "f.txt", "file", "x")
+    fs.eliminar_nodo("root/f.txt")
+    fs.papelera.vaciar()
+    ok, _ = fs.deshacer()
+    suite.assert_true(not ok and not fs.historial.deshacer, "Si lo borrado ya no está, falla y descarta el historial")
+
+
+def test_indices_enchufables(suite):
+    """PRUEBA 28: índices suscritos a los cambios, cada uno activo, perezoso o apagado"""
+    print(f"\n{Color.YELLOW}[PRUEBA 28] Índices Enchufables{Color.END}")
+    
+    fs = ArbolGeneral()
+    ok, _ = fs.configurar_indice("prefijos", "apagado")
+    suite.assert_true(ok, "El Trie se puede apagar")
+    suite.assert_true(not fs.configurar_indice("nombres", "apagado")[0], "El HashMap es obligatorio")
+    suite.assert_true(not fs.configurar_indice("nada", "activo")[0], "Índice desconocido")
+    fs.crear_nodo("root", "docs", "folder")
+    fs.crear_nodo("root/docs", "informe.txt", "file", "ventas del trimestre")
+    fs.crear_nodo("root/docs", "indice.md", "file", "hola")
+    fs.renombrar_nodo("root/docs/indice.md", "inicio.md")
+    suite.assert_equal(fs.indices["prefijos"].trie.buscar_por_prefijo("in"), [], "Apagado no recibe avisos")
+    suite.assert_equal(fs.buscar_autocompletado("in"), ["informe.txt", "inicio.md"], "search sin Trie recorre el HashMap")
+    plan = fs.explicar_consulta(parsear_consulta(["name:inf*"], "root"))
+    suite.assert_true(any("Sin índice" in paso for paso in plan), "query filtra el prefijo si el Trie está apagado")
+    
+    fs.configurar_indice("prefijos", "perezoso")
+    suite.assert_true(not fs.indices["prefijos"].listo, "Perezoso no se arma hasta usarlo")
+    suite.assert_equal(fs.buscar_autocompletado("inf"), ["informe.txt"], "Se arma en el primer search")
+    fs.eliminar_nodo("root/docs/informe.txt")
+    suite.assert_equal(fs.buscar_autocompletado("inf"), [], "Una vez armado se mantiene")
+    
+    fs.configurar_indice("contenido", "activo")
+    suite.assert_true(fs.indices["contenido"].listo, "Activo se arma enseguida")
+    fs.modificar_contenido("root/docs/inicio.md", "resumen anual")
+    suite.assert_equal(fs.consultar(parsear_consulta(["content:anual"], "root")), ["root/docs/inicio.md"],
+                       "El índice de contenido sigue las ediciones")
+    
+    class IndiceExtensiones(Indice):
+        nombre = "extensiones"
+        materializar = False
+        def __init__(self, arbol, modo="activo"):
+            super().__init__(arbol, modo)
+            self.cuenta = {}
+        def vaciar(self):
+            self.cuenta = {}
+        def al_crear(self, nodo):
+            ext = os.path.splitext(nodo.nombre)[1]
+            self.cuenta[ext] = self.cuenta.get(ext, 0) + 1
+        def al_quitar(self, nodo, diferidos=None):
+            self.cuenta[os.path.splitext(nodo.nombre)[1]] -= 1
+    
+    fs.registrar_indice(IndiceExtensiones(fs))
+    fs.crear_nodo("root", "b.md", "file", "x")
+    suite.assert_equal(fs.indices["extensiones"].cuenta.get(".md"), 2, "Un índice nuevo se arma y recibe avisos")
+    fs.eliminar_varios(["root/docs", "root/b.md"])
+    suite.assert_equal(fs.indices["extensiones"].cuenta.get(".md"), 0, "rm en lote avisa a todos los índices")
+
+
+def test_listado_paginado(suite):
+    """PRUEBA 29: ls ordenado y por páginas con el orden de cada carpeta mantenido"""
+    print(f"\n{Color.YELLOW}[PRUEBA 29] ls Ordenado y Paginado{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "d", "folder")
+    fs.crear_nodo("root", "otra", "folder")
+    nombres = [f"f{i:03d}.txt" for i in range(300)]
+    random.Random(7).shuffle(nombres)
+    for i, nombre in enumerate(nombres):
+        fs.crear_nodo("root/d", nombre, "file", "x" * (i % 50))
+    fs.crear_nodo("root/d", "Sub", "folder")
+    
+    def pagina(orden, desde=0, limite=None, reverso=False):
+        ok, total, lineas = fs.paginar_directorio("root/d", orden, desde, limite, reverso)
+        return [linea.split(" (")[0] for linea in lineas]
+    
+    def esperado(clave, reverso=False):
+        hijos = fs._buscar_nodo_y_padre("root/d")[0].hijos
+        return [h.nombre for h in sorted(hijos, key=clave, reverse=reverso)]
+    
+    por_nombre = lambda h: h.nombre.lower()
+    por_tamano = lambda h: (h.tamano_bytes, h.nombre.lower())
+    suite.assert_equal(pagina("name"), esperado(por_nombre), "Orden por nombre")
+    suite.assert_equal(pagina("name", 120, 10), esperado(por_nombre)[120:130], "Página del medio")
+    suite.assert_equal(pagina("size", 5, 7, reverso=True), esperado(por_tamano, True)[5:12], "Por tamaño, al revés")
+    suite.assert_equal(pagina("type", 0, 1), ["Sub"], "Las carpetas primero")
+    suite.assert_equal(pagina(None, 0, 3), [h.nombre for h in fs._buscar_nodo_y_padre("root/d")[0].hijos[:3]],
+                       "Sin orden: el de creación")
+    
+    fs.crear_version("v1")
+    fs.crear_nodo("root/d", "a_nuevo.txt", "file", "y" * 1000)
+    fs.renombrar_nodo("root/d/f000.txt", "zz.txt")
+    fs.modificar_contenido("root/d/f001.txt", "y" * 2000)
+    fs.mover_nodo("root/d/f002.txt", "root/otra")
+    fs.eliminar_varios(["root/d/f003.txt", "root/d/f004.txt"])
+    fs.eliminar_nodo("root/d/f005.txt")
+    fs.deshacer()
+    suite.assert_equal(pagina("name"), esperado(por_nombre), "El orden por nombre sigue a los cambios")
+    suite.assert_equal(pagina("size", 0, 2, reverso=True), ["f001.txt", "a_nuevo.txt"], "El orden por tamaño también")
+    suite.assert_equal(fs.indices["listados"].entradas(), 1, "Solo se ordenó la carpeta listada")
+    
+    fs.checkout_version(0)
+    suite.assert_equal(pagina("name"), esperado(por_nombre), "checkout descarta los órdenes armados")
+    ok, total, _ = fs.paginar_directorio("root/d", "size")
+    suite.assert_equal(total, 301, "El total viene con la página")
+    suite.assert_true(not fs.paginar_directorio("root/d", "fecha")[0], "Orden inválido")
+    
+    fs.configurar_indice("listados", "apagado")
+    suite.assert_equal(pagina("size"), esperado(por_tamano), "Apagado ordena de cero cada vez")
+    suite.assert_equal(fs.indices["listados"].entradas(), 0, "Apagado no guarda órdenes")
+
+
+def test_motor_sqlite(suite):
+    """PRUEBA 30: el árbol en una base SQLite, con carga perezosa y una transacción por operación"""
+    print(f"\n{Color.YELLOW}[PRUEBA 30] Motor SQLite{Color.END}")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        base = os.path.join(temp_dir, "arbol.db")
+        fs = ArbolGeneral()
+        fs.crear_nodo("root", "docs", "folder")
+        fs.crear_nodo("root/docs", "sub", "folder")
+        fs.crear_nodo("root/docs/sub", "nota.txt", "file", "hola")
+        fs.crear_nodo("root/docs", "viejo.txt", "file", "chau")
+        fs.crear_nodo("root", "raiz.txt", "file", "r")
+        fs.eliminar_nodo("root/docs/viejo.txt")
+        ok, _ = fs.guardar_arbol(base)
+        suite.assert_true(ok, "Exportar a .db")
+        
+        db = ArbolGeneral()
+        ok, _ = db.cargar_arbol(base)
+        suite.assert_true(ok, "Abrir la base")
+        docs = db.root.hijos[0]
+        suite.assert_true(docs._hijos is None, "Las carpetas quedan sin cargar al abrir")
+        suite.assert_equal(db.buscar_exacto("nota.txt"), ["root/docs/sub/nota.txt"], "find llega a lo no cargado por SQL")
+        suite.assert_equal(db.buscar_autocompletado("no"), ["nota.txt"], "Autocompletado también")
+        suite.assert_equal(db.buscar_exacto("viejo.txt"), [], "Lo de la papelera no aparece en find")
+        suite.assert_equal(len(db.papelera), 1, "La papelera viene en la base")
+        cargados = db._sqlite.cargados
+        suite.assert_equal(db.consultar(parsear_consulta(["name:nota.txt"], "root")), ["root/docs/sub/nota.txt"],
+                           "query pregunta por nombre a la base")
+        suite.assert_true(db.explicar_consulta(parsear_consulta(["type:f"], "root"))[-1].endswith("Filas de la base sin cargar: ~1 candidatos"),
+                          "explain cuenta las filas con un COUNT")
+        suite.assert_equal(db.mas_grandes(1), [("root/docs/sub/nota.txt", 4)], "largest también lee la base")
+        suite.assert_equal(db._sqlite.cargados, cargados, "Consultar no carga carpetas")
+        
+        db.crear_nodo("root/docs/sub", "nuevo.txt", "file", "n")
+        db.renombrar_nodo("root/docs", "documentos")
+        db.mover_nodo("root/raiz.txt", "root/documentos")
+        db.modificar_contenido("root/documentos/raiz.txt", "cambiado")
+        db.eliminar_nodo("root/documentos/sub/nota.txt")
+        db.vaciar_papelera()
+        suite.assert_equal(db.indices["sqlite"].escrituras, 6, "Una transacción por operación")
+        
+        # Otro proceso (otra conexión) ve lo confirmado sin que se haya llamado a save
+        otro = ArbolGeneral()
+        otro.cargar_arbol(base)
+        suite.assert_equal(otro.buscar_exacto("nuevo.txt"), ["root/documentos/sub/nuevo.txt"], "Crear y renombrar quedaron escritos")
+        suite.assert_equal(otro.listar_directorio("root/documentos")[1], "sub (folder)\nraiz.txt (file)", "mv respeta el orden de la carpeta")
+        suite.assert_equal(otro._buscar_nodo_y_padre("root/documentos/raiz.txt")[0].contenido, "cambiado", "El contenido también")
+        suite.assert_equal(len(otro.papelera), 0, "empty también vacía la papelera de la base")
+        filas = otro._sqlite.sql("SELECT COUNT(*) FROM nodos")[0][0]
+        suite.assert_equal(filas, 5, "...y borra las filas de lo vaciado")
+        
+        db.crear_version("v")
+        db.crear_nodo("root", "tmp", "folder")
+        db.copiar_nodo("root/documentos", "root/tmp")
+        db.deshacer()
+        db.checkout_version(0)
+        suite.assert_equal(sorted(n for (n,) in db._sqlite.sql("SELECT nombre FROM nodos WHERE padre IS NOT NULL")),
+                           ["documentos", "nuevo.txt", "raiz.txt", "sub"], "checkout reescribe el árbol vivo")
+        db.eliminar_nodo("root/documentos/raiz.txt")
+        db.checkout_version(0)
+        otro2 = ArbolGeneral()
+        otro2.cargar_arbol(base)
+        suite.assert_true(otro2.buscar_exacto("raiz.txt") == ["root/documentos/raiz.txt"] and len(otro2.papelera) == 0,
+                          "checkout a un nodo que estaba en la papelera (mismo id) sin pisar filas")
+        db.eliminar_nodo("root/documentos/raiz.txt")
+        db.crear_version("con papelera")
+        db.restaurar_nodo("root/documentos/raiz.txt")
+        db.checkout_version(1)
+        otro2._sqlite.cerrar()
+        otro2 = ArbolGeneral()
+        otro2.cargar_arbol(base)
+        suite.assert_true(otro2.buscar_exacto("raiz.txt") == [] and len(otro2.papelera) == 1,
+                          "checkout reescribe también la papelera de la base")
+        otro2._sqlite.cerrar()
+        
+        tercero = ArbolGeneral()
+        tercero.cargar_arbol(base)
+        tercero.crear_nodo("root", "otra", "folder")
+        cargados = tercero._sqlite.cargados
+        ok = tercero.renombrar_nodo("root/documentos", "docs")[0] and tercero.mover_nodo("root/docs", "root/otra")[0]
+        suite.assert_true(ok and tercero._sqlite.cargados == cargados, "mv y rename no cargan lo que mueven")
+        suite.assert_equal(tercero.consultar(parsear_consulta(["type:f", "under:root/otra/docs/sub"], "root")),
+                           ["root/otra/docs/sub/nuevo.txt"], "query con under baja solo hasta el alcance")
+        tercero._sqlite.cerrar()
+        otro2 = ArbolGeneral()
+        otro2.cargar_arbol(base)
+        suite.assert_equal(otro2.buscar_exacto("nuevo.txt"), ["root/otra/docs/sub/nuevo.txt"], "Con un UPDATE por fila")
+        otro2._sqlite.cerrar()
+        
+        viejo = ArbolGeneral()
+        viejo.crear_nodo("root", "a.txt", "file", "a")
+        viejo.crear_nodo("root", "b.txt", "file", "b")
+        suite.assert_equal(len(viejo._buscar_nodo_y_padre("root/a.txt")[0].id), 32, "Ids nuevos de 16 bytes")
+        nodo_a, nodo_b = viejo._buscar_nodo_y_padre("root/a.txt")[0], viejo._buscar_nodo_y_padre("root/b.txt")[0]
+        nodo_a.id = nodo_b.id = "1a2b3c4d"  # Como en un guardado viejo con ids de 8 caracteres
+        destino = os.path.join(temp_dir, "viejo.db")
+        ok, msg = viejo.guardar_arbol(destino)
+        suite.assert_true(not ok and "id" in msg and not os.path.exists(destino),
+                          "Ids repetidos: exportar falla en vez de pisar una fila")
+        nodo_b.id = "5e6f7a8b"
+        ok, msg = viejo.guardar_arbol(destino)
+        suite.assert_true(ok and "(3 nodos)" in msg, "exportar cuenta las filas escritas")
+        
+        json_path = os.path.join(temp_dir, "copia.json")
+        suite.assert_true(otro.guardar_arbol(json_path)[0], "Guardar a JSON sin cargar antes")
+        vuelta = ArbolGeneral()
+        vuelta.cargar_arbol(json_path)
+        suite.assert_equal(vuelta.buscar_exacto("nuevo.txt"), ["root/documentos/sub/nuevo.txt"], "El JSON tiene todo el árbol")
+        suite.assert_true(vuelta._sqlite is None and "sqlite" not in vuelta.indices, "Cargar JSON suelta la base")
+        db._sqlite.cerrar()
+        otro._sqlite.cerrar()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_arbol_particionado(suite):
+    """PRUEBA 31: árbol repartido en procesos, con ruteo, búsquedas a todas y mv en dos fases"""
+    print(f"\n{Color.YELLOW}[PRUEBA 31] Árbol Particionado en Procesos{Color.END}")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        with ArbolParticionado(3, directorio=temp_dir) as fs:
+            # docs y fotos caen en particiones distintas (ver _particion_de)
+            fs.crear_nodo("root", "docs", "folder")
+            fs.crear_nodo("root", "fotos", "folder")
+            resultados = fs.aplicar([("crear_nodo", "root/docs", f"f{i}.txt", "file", "hola") for i in range(20)] +
+                                    [("crear_nodo", "root/fotos", "a.jpg", "file", "jpg"),
+                                     ("mover_nodo", "root/docs/f0.txt", "root/fotos"),
+                                     ("crear_nodo", "root/docs", "f0.txt", "file", "otro")])
+            suite.assert_true(all(ok for ok, _ in resultados), "Un lote con un mv entre particiones en el medio")
+            suite.assert_equal(fs.buscar_exacto("f0.txt"), ["root/docs/f0.txt", "root/fotos/f0.txt"],
+                               "find pregunta a todas las particiones")
+            suite.assert_equal(fs.buscar_autocompletado("f1"), [f"f1{s}.txt" for s in ["", *range(10)]], "search también")
+            suite.assert_equal(fs.listar_directorio("root")[1], "docs (folder)\nfotos (folder)", "ls de root junta las particiones")
+            
+            ok, _ = fs.mover_nodo("root/docs", "root/fotos")
+            suite.assert_true(ok, "mv de una carpeta entera a otra partición")
+            suite.assert_equal(len(fs.buscar_patron("*.txt")), 21, "Nada se perdió ni se duplicó")
+            suite.assert_equal(fs.listar_directorio("root/fotos/docs")[1].count("\n"), 19, "ls va a la partición dueña")
+            fs.crear_nodo("root", "docs", "folder")
+            fs.crear_nodo("root/docs", "a.jpg", "file", "choca")
+            ok, _ = fs.mover_nodo("root/fotos/a.jpg", "root/docs")
+            suite.assert_true(not ok, "Conflicto en el destino: se aborta")
+            suite.assert_equal(fs.buscar_exacto("a.jpg"), ["root/docs/a.jpg", "root/fotos/a.jpg"], "Abortar no cambia nada")
+            ok, _ = fs.renombrar_nodo("root/docs", "musica")
+            suite.assert_true(ok and fs.validar_ruta("root/musica")[0], "ren de root que cambia de partición")
+            suite.assert_equal(fs.calcular_tamano(), 27, "Tamaño sumado entre particiones")
+            fs.guardar()
+        with ArbolParticionado(3, directorio=temp_dir) as fs:
+            suite.assert_equal(fs.calcular_tamano(), 27, "Cada partición vuelve de su guardado")
+        try:
+            ArbolParticionado(2, directorio=temp_dir)
+            suite.assert_true(False, "Otra cantidad de particiones cambiaría las dueñas")
+        except ValueError:
+            suite.assert_true(True, "Otra cantidad de particiones cambiaría las dueñas")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_presupuesto_memoria(suite):
+    """PRUEBA 32: límite de memoria con desalojo de subárboles fríos a disco y recarga al entrar"""
+    print(f"\n{Color.YELLOW}[PRUEBA 32] Presupuesto de Memoria{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.configurar_memoria(2**30)
+    for i in range(10):
+        fs.crear_nodo("root", f"d{i}", "folder")
+        for j in range(8):
+            fs.crear_nodo(f"root/d{i}", f"s{j}", "folder")
+            for k in range(5):
+                fs.crear_nodo(f"root/d{i}/s{j}", f"f{i}_{j}_{k}.txt", "file", "x" * 50)
+    for i in range(10):
+        fs._buscar_nodo_y_padre(f"root/d{i}/s0")  # d0 es lo que hace más tiempo no se usa
+    total = fs.calcular_tamano()
+    ok, _ = fs.configurar_memoria(150 * Desalojador.BYTES_NODO)
+    m = fs.estado_memoria()
+    suite.assert_true(ok and m["desalojos"] > 0 and m["uso"] <= m["limite"], "Pasado el límite se baja a disco")
+    suite.assert_true(fs.root.hijos[9]._hijos is not None, "Lo usado hace poco se queda en memoria")
+    suite.assert_true(fs.root.hijos[0]._hijos is None, "Lo más frío es lo primero que baja")
+    
+    suite.assert_equal(fs.buscar_exacto("f0_1_2.txt"), ["root/d0/s1/f0_1_2.txt"], "find cubre lo desalojado")
+    suite.assert_equal(fs.buscar_autocompletado("f0_1_"), [f"f0_1_{k}.txt" for k in range(5)], "search también")
+    suite.assert_equal(len(fs.buscar_patron("*.txt")), 400, "Y los comodines")
+    suite.assert_equal(fs.consultar(parsear_consulta(["name:f0_1_2.txt", "content:" + "x" * 50], "root")), ["root/d0/s1/f0_1_2.txt"],
+                       "query lee los registros desalojados")
+    suite.assert_equal((len(fs.buscar_por_metadatos(tamano_min=50, ruta_base="root/d0")), len(fs.mas_grandes(400))),
+                       (40, 400), "find con predicados y largest también")
+    suite.assert_true(fs.explicar_consulta([("name", "f0_1_2.txt")])[-1].endswith("Registros desalojados: ~1 candidatos"),
+                      "explain estima lo desalojado sin leerlo al árbol")
+    suite.assert_equal(fs.estado_memoria()["recargas"], 0, "Buscar no recarga nada")
+    
+    nodo, _ = fs._buscar_nodo_y_padre("root/d0/s1/f0_1_2.txt")
+    suite.assert_true(nodo is not None and nodo.contenido == "x" * 50, "Entrar recarga el subárbol")
+    suite.assert_true(fs.estado_memoria()["recargas"] == 1, "Una recarga por stub")
+    ok, _ = fs.mover_nodo("root/d1", "root/d0/s1")
+    suite.assert_true(ok and fs.validar_ruta("root/d0/s1/d1/s7")[0], "mv de lo desalojado")
+    fs.eliminar_nodo("root/d2")
+    fs.deshacer()
+    suite.assert_equal(fs.buscar_exacto("f2_3_4.txt"), ["root/d2/s3/f2_3_4.txt"], "rm y undo sobre lo desalojado")
+    m = fs.estado_memoria()
+    suite.assert_true(m["uso"] <= m["limite"], "Cada operación vuelve a dejar el árbol bajo el límite")
+    suite.assert_equal(fs.consultar(parsear_consulta(["size:50", "under:root/d3"], "root")),
+                       sorted(f"root/d3/s{j}/f3_{j}_{k}.txt" for j in range(8) for k in range(5)),
+                       "query ve lo desalojado")
+    suite.assert_equal(fs.calcular_tamano(), total, "Nada se perdió")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        fs.crear_nodo("root", "otra", "folder")
+        archivo = os.path.join(temp_dir, "memoria.json")
+        fs.guardar_arbol(archivo)
+        copia = ArbolGeneral()
+        copia.cargar_arbol(archivo)
+        suite.assert_equal(copia.calcular_tamano(), total + 1, "El guardado lee lo que está en disco")
+        
+        fs.guardar_arbol(os.path.join(temp_dir, "memoria.db"))
+        db = ArbolGeneral()
+        db.configurar_memoria(150 * Desalojador.BYTES_NODO)
+        db.cargar_arbol(os.path.join(temp_dir, "memoria.db"))
+        for i in range(10):
+            base = f"root/d{i}" if i != 1 else "root/d0/s1/d1"
+            for j in range(8):
+                db.listar_directorio(f"{base}/s{j}")
+        db.crear_nodo("root", "nueva", "folder")
+        m = db.estado_memoria()
+        suite.assert_true(m["desalojos"] > 0 and m["archivo"] == 0, "Con SQLite la base hace de archivo de intercambio")
+        suite.assert_equal(db.buscar_exacto("f4_4_4.txt"), ["root/d4/s4/f4_4_4.txt"], "find en lo desalojado de la base")
+        suite.assert_equal(db.calcular_tamano(), total + 2, "Y se recarga de la base")
+        db._sqlite.cerrar()
+    finally:
+        shutil.rmtree(temp_dir)
+    
+    ok, _ = fs.configurar_memoria(None)
+    suite.assert_true(ok and fs.estado_memoria() is None and "memoria" not in fs.indices, "memory off")
+    suite.assert_equal(fs.calcular_tamano(), total + 1, "Sin límite todo vuelve a memoria")
+    
+    plano = ArbolGeneral()
+    for i in range(200):
+        plano.crear_nodo("root", f"d{i}", "folder")
+        for j in range(4):
+            plano.crear_nodo(f"root/d{i}", f"f{i}_{j}.txt", "file", "x" * 20)
+    ok, mensaje = plano.configurar_memoria(500 * Desalojador.BYTES_NODO)
+    registros = plano._desalojo.registros
+    suite.assert_true(ok and plano.estado_memoria()["desalojos"] > 150 and "⚠️" not in mensaje,
+                      "Las carpetas chicas hermanas también bajan")
+    suite.assert_true(len({r[0] for r in registros.values()}) < len(registros), "Juntas en registros compartidos")
+    suite.assert_equal(plano.buscar_exacto("f7_2.txt"), ["root/d7/f7_2.txt"], "find sobre lo juntado")
+    nodo, _ = plano._buscar_nodo_y_padre("root/d7/f7_2.txt")
+    suite.assert_true(nodo is not None and plano.estado_memoria()["recargas"] == 1, "Cada carpeta se recarga sola")
+    ok, mensaje = plano.configurar_memoria(10 * Desalojador.BYTES_NODO)
+    suite.assert_true(ok and "⚠️" in mensaje and plano.estado_memoria()["aviso"], "Avisa cuando el límite no se alcanza")
+    suite.assert_equal(plano.calcular_tamano(), 1 + 200 * 5, "Nada se perdió al juntar")
+
+
+def test_analisis_numpy(suite):
+    """PRUEBA 33: analyze con columnas de NumPy comparado contra recorridos en Python"""
+    print(f"\n{Color.YELLOW}[PRUEBA 33] Análisis con NumPy{Color.END}")
+    
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "a", "folder")
+    fs.crear_nodo("root", "b", "folder")
+    fs.crear_nodo("root", "suelto.txt", "file", "123")
+    fs.crear_nodo("root/a", "c", "folder")
+    for i in range(10):
+        fs.crear_nodo("root/a", f"f{i}.txt", "file", "y" * i)
+    for i in range(3):
+        fs.crear_nodo("root/a/c", f"g{i}.txt", "file", "z" * 100)
+    fs.crear_nodo("root/b", "h.txt", "file", "ññ")
+    ok, analisis = fs.analizar()
+    try:
+        import numpy
+    except ImportError:
+        suite.assert_true(not ok and "NumPy" in analisis, "Sin NumPy, analyze lo avisa")
+        return
+    suite.assert_true(ok, "Exportar a columnas")
+    suite.assert_equal(len(analisis), fs.calcular_tamano(), "Una fila por nodo")
+    suite.assert_equal(analisis.histograma_profundidad(), [1, 3, 12, 3], "Histograma de profundidad")
+    suite.assert_equal(len(analisis.histograma_profundidad()) - 1, fs.calcular_altura(), "Coincide con la altura")
+    fanout = analisis.distribucion_fanout()
+    suite.assert_equal((fanout["carpetas"], fanout["max"], fanout["baldes"]), (4, 11, [("1", 1), ("2-3", 2), ("8-15", 1)]),
+                       "Fan-out por baldes de potencias de 2")
+    suite.assert_equal(analisis.percentiles_por_carpeta(),
+                       [("a", 13, 345, {50: 6, 90: 100, 99: 100}, 100), ("b", 1, 4, {50: 4, 90: 4, 99: 4}, 4)],
+                       "Percentiles de tamaño por carpeta de root (en bytes, ñ ocupa 2)")
+    suite.assert_equal(analisis.mayores_subarboles(2), [("root/a", 15, 345), ("root/a/c", 4, 300)], "Subárboles más pesados")
+    
+    # Contra Python en un árbol al azar
+    random.seed(7)
+    carpetas = ["root"]
+    for i in range(300):
+        padre = random.choice(carpetas)
+        if random.random() < 0.3:
+            fs.crear_nodo(padre, f"d{i}", "folder")
+            carpetas.append(f"{padre}/d{i}")
+        else:
+            fs.crear_nodo(padre, f"r{i}.txt", "file", "x" * random.randrange(500))
+    ok, analisis = fs.analizar()
+    nodos, total = analisis.subarboles()
+    esperado = []
+    for ruta in carpetas[1:]:
+        carpeta, _ = fs._buscar_nodo_y_padre(ruta)
+        pila, cuenta, suma = [carpeta], 0, 0
+        while pila:
+            nodo = pila.pop()
+            cuenta, suma = cuenta + 1, suma + nodo.tamano_bytes
+            pila.extend(nodo.hijos)
+        esperado.append((ruta, cuenta, suma))
+    obtenido = {ruta: (n, b) for ruta, n, b in analisis.mayores_subarboles(len(analisis))}
+    suite.assert_true(all(obtenido.get(ruta) == (n, b) for ruta, n, b in esperado), "Nodos y bytes de cada subárbol")
+    suite.assert_equal(int(nodos[0]), fs.calcular_tamano(), "La raíz suma todo el árbol")
+
+
+def test_arranque_diferido(suite):
+    """PRUEBA 34: índices diferidos al arrancar e importaciones perezosas"""
+    print(f"\n{Color.YELLOW}[PRUEBA 34] Índices Diferidos al Arrancar{Color.END}")
+
+    fs = ArbolGeneral()
+    for carpeta in ("docs", "fotos"):
+        fs.crear_nodo("root", carpeta, "folder")
+        for i in range(20):
+            fs.crear_nodo(f"root/{carpeta}", f"{carpeta}_{i:02d}.txt", "file", "x")
+        fs.crear_nodo(f"root/{carpeta}", "comun.txt", "file", "repetido")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        archivo = os.path.join(temp_dir, "fs.json")
+        fs.guardar_arbol(archivo)
+        perezoso = ArbolGeneral()
+        ok, _ = perezoso.cargar_arbol(archivo, diferir_indices=True)
+        suite.assert_true(ok, "Carga sin armar los índices")
+        suite.assert_true(not any(i.listo for i in perezoso.indices.values()), "Ningún índice armado tras la carga")
+        # Cambios antes del primer uso: el índice se arma después sobre el árbol ya cambiado
+        perezoso.crear_nodo("root/docs", "nuevo.txt", "file")
+        perezoso.mover_nodo("root/fotos", "root/docs")
+        suite.assert_equal(perezoso.calcular_tamano(), fs.calcular_tamano() + 1, "El árbol está completo sin índices")
+        suite.assert_true(not perezoso.indices["nombres"].listo, "Navegar y modificar no arma el HashMap")
+        suite.assert_equal(sorted(perezoso.buscar_exacto("comun.txt")),
+                           ["root/docs/comun.txt", "root/docs/fotos/comun.txt"], "find arma el HashMap al usarlo")
+        suite.assert_true(not perezoso.indices["prefijos"].listo, "find no arma el Trie")
+        suite.assert_equal(perezoso.buscar_autocompletado("nue"), ["nuevo.txt"], "TAB arma el Trie al usarlo")
+        perezoso.eliminar_nodo("root/docs/nuevo.txt")
+        suite.assert_equal(perezoso.buscar_autocompletado("nue"), [], "Armado, el Trie recibe los avisos")
+
+        otro = ArbolGeneral()
+        otro.cargar_arbol(archivo, diferir_indices=True)
+        constructor = ConstructorIndices(otro)
+        suite.assert_equal(constructor.pendientes(), ["nombres", "prefijos", "listados"], "Pendientes: los índices activos")
+        constructor.iniciar()
+        constructor.esperar()
+        suite.assert_equal([nombre for nombre, _ in constructor.armados], ["nombres", "prefijos", "listados"],
+                           "El hilo arma los pendientes en orden")
+        suite.assert_true(not otro.indices["metadatos"].listo, "Los perezosos siguen esperando a su primer uso")
+        suite.assert_equal(otro.buscar_autocompletado("fotos_0"), fs.buscar_autocompletado("fotos_0"),
+                           "Trie armado en segundo plano igual al de una carga completa")
+
+        # El Trie se arma con el candado suelto: lo que cambia mientras tanto entra al final
+        class CandadoConCambios:
+            def __init__(self, arbol):
+                self.arbol, self.veces = arbol, 0
+            def __enter__(self):
+                self.veces += 1
+                if self.veces == 2:  # Entre copiar los nombres y volver a tomar el candado
+                    self.arbol.crear_nodo("root", "zeta_nuevo.txt", "file")
+                    self.arbol.eliminar_nodo("root/docs/docs_00.txt")
+            def __exit__(self, *exc):
+                pass
+        tercero = ArbolGeneral()
+        tercero.cargar_arbol(archivo, diferir_indices=True)
+        suite.assert_true(tercero.indices["prefijos"].construir_aparte(CandadoConCambios(tercero)), "Trie armado aparte")
+        suite.assert_equal(tercero.buscar_autocompletado("zeta"), ["zeta_nuevo.txt"], "Incluye lo creado mientras se armaba")
+        suite.assert_equal(tercero.buscar_autocompletado("docs_00"), [], "Excluye lo borrado mientras se armaba")
+    finally:
+        shutil.rmtree(temp_dir)
+
+    # Importar el módulo no carga readline (ni su aviso) ni los módulos pesados que casi no se usan
+    codigo = ("import sys; sys.path.insert(0, sys.argv[1]); import filesystem; "
+              "print(sorted(m for m in ('readline', 'sqlite3', 'multiprocessing') if m in sys.modules))")
+    salida = subprocess.run([sys.executable, "-c", codigo, os.path.dirname(os.path.abspath(__file__))],
+                            capture_output=True, text=True).stdout
+    suite.assert_equal(salida.strip(), "[]", "Importar filesystem no carga readline, sqlite3 ni multiprocessing")
+
+
+def test_estres_modelo(suite):
+    """PRUEBA 35: operaciones al azar contra el modelo de referencia de prueba_estres.py"""
+    print(f"\n{Color.YELLOW}[PRUEBA 35] Estrés contra un Modelo de Referencia{Color.END}")
+
+    resultado = correr(3000, semilla=2024, episodio=300, informe=lambda *_: None)
+    suite.assert_equal(resultado["falla"], None, "3,000 operaciones al azar sin diferencias con el modelo")
+    suite.assert_true(all(resultado["hechas"][tipo] for tipo in ("crear", "mv", "ren", "rm", "restore", "load")),
+                      "Se aceptaron operaciones de cada tipo")
+
+    # Las dos fallas que encontró el arnés, como regresiones
+    fs = ArbolGeneral()
+    fs.crear_nodo("root", "x", "folder")
+    fs.crear_nodo("root/x", "hijo.txt", "file")
+    fs.eliminar_nodo("root/x/hijo.txt")
+    fs.eliminar_nodo("root/x")
+    fs.crear_nodo("root", "x", "file")
+    ok, _ = fs.restaurar_nodo(0)
+    suite.assert_true(not ok, "restore no cuelga nada de un archivo que ocupó la carpeta original")
+    fs.crear_nodo("root", "d", "folder")
+    fs.crear_nodo("root/d", "root", "folder")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        archivo = os.path.join(temp_dir, "fs.json")
+        fs.guardar_arbol(archivo)
+        fs.cargar_arbol(archivo)
+        suite.assert_equal(fs.buscar_exacto("root"), ["root/d/root"], "Una carpeta llamada 'root' sigue indexada tras load")
+    finally:
+        shutil.rmtree(temp_dir)
+
+    # Un árbol roto a propósito: renombra sin avisar a los índices
+    class ArbolSinAvisos(ArbolGeneral):
+        def renombrar_nodo(self, ruta_nodo, nuevo_nombre):
+            nodo, padre = self._buscar_nodo_y_padre(ruta_nodo)
+            if not nodo or not padre or any(h.nombre == nuevo_nombre for h in padre.hijos):
+                return False, "No"
+            nodo.nombre = nuevo_nombre
+            self._invalidar_rutas()
+            return True, "Renombrado"
+
+    resultado = correr(3000, semilla=2024, episodio=300, fabrica=ArbolSinAvisos, informe=lambda *_: None)
+    falla = resultado["falla"]
+    suite.assert_true(falla is not None, "El arnés detecta el índice desactualizado")
+    suite.assert_true(falla is not None and len(falla["pasos"]) <= 3 and any(op[0] == "ren" for op in falla["pasos"]),
+                      "La falla se achica a unos pocos pasos con el rename")
+
+
 def run_all_tests():
     """Ejecuta todas las pruebas"""
     suite = TestSuite()
@@ -347,6 +1750,31 @@ def run_all_tests():
     test_preorden(suite)
     test_persistencia(suite)
     test_consistencia_despues_operaciones(suite)
+    test_instantaneas_autoguardado(suite)
+    test_versiones(suite)
+    test_diff_merge_archivos(suite)
+    test_deduplicacion(suite)
+    test_compresion(suite)
+    test_guardado_fragmentado(suite)
+    test_instantanea_mapeada(suite)
+    test_ancestros_mover(suite)
+    test_rutas_por_padres(suite)
+    test_cache_rutas(suite)
+    test_operaciones_en_lote(suite)
+    test_papelera_indexada(suite)
+    test_metadatos(suite)
+    test_consultas(suite)
+    test_indice_paralelo(suite)
+    test_copiar(suite)
+    test_deshacer(suite)
+    test_indices_enchufables(suite)
+    test_listado_paginado(suite)
+    test_motor_sqlite(suite)
+    test_arbol_particionado(suite)
+    test_presupuesto_memoria(suite)
+    test_analisis_numpy(suite)
+    test_arranque_diferido(suite)
+    test_estres_modelo(suite)
     
     suite.print_results()
     